@@ -0,0 +1,235 @@
+# assembly_catalog.py
+"""組み合わせ項目 (例: 外壁シリコン塗装 = 高圧洗浄 + 下塗り + 中塗り + 上塗り + 養生) のカタログ
+
+- カタログはデータベースの assemblies / assembly_components に保存する (database_setup.ASSEMBLY_TABLES_SQL)。
+  構成要素は明細行 (名称・単価) か、入れ子の組み合わせ項目のどちらかで、数量は組み合わせ項目の数量 1 あたりで持つ。
+- 組み合わせ項目の数量 1 あたりの金額 (積み上げ単価) は、項目ごとにメモ化する。
+  構成要素の単価を変えたら、その項目と、それを入れ子で含む項目 (祖先) のメモだけを捨てる
+  (ほかの項目は計算し直さず、木を毎回たどり直さない)。
+- 明細に入れるときは、構成要素の明細行に展開する (入れ子も展開し、数量を掛け合わせる) か、
+  積み上げ単価の1行にまとめる (明細行に assembly_id を持ち、単価が変わったら更新できるようにする)。
+"""
+import sqlite3
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from number_format import to_decimal
+
+
+class AssemblyError(ValueError):
+    """組み合わせ項目の誤り (存在しない項目の参照・循環した入れ子)"""
+    pass
+
+
+class AssemblyComponent(NamedTuple):
+    """組み合わせ項目の構成要素 (child_id があれば入れ子の組み合わせ項目。名称・単価は使わない)"""
+    id: Optional[int]
+    name: str
+    specification: str
+    unit: str
+    quantity: Decimal                 # 組み合わせ項目の数量 1 あたりの数量
+    unit_price: Decimal = Decimal('0')
+    child_id: Optional[int] = None
+
+
+class Assembly(NamedTuple):
+    id: int
+    name: str
+    specification: str
+    unit: str
+    components: Tuple[AssemblyComponent, ...]
+
+
+class ExpandedLine(NamedTuple):
+    """組み合わせ項目を展開した明細行"""
+    name: str
+    specification: str
+    unit: str
+    quantity: Decimal
+    unit_price: Decimal
+    assembly_name: str                # この行を含む (いちばん内側の) 組み合わせ項目の名称
+
+
+class AssemblyCatalog:
+    """組み合わせ項目のカタログ (積み上げ単価は項目ごとにメモ化する)"""
+
+    def __init__(self, assemblies: Iterable[Assembly] = ()):
+        self._assemblies: Dict[int, Assembly] = {}
+        self._parents: Dict[int, Set[int]] = {}         # 入れ子の項目 -> それを含む項目
+        self._component_owners: Dict[int, int] = {}     # 構成要素の ID -> 項目
+        self._unit_costs: Dict[int, Decimal] = {}       # 積み上げ単価のメモ
+        for assembly in assemblies:
+            self.add(assembly)
+
+    def __len__(self) -> int:
+        return len(self._assemblies)
+
+    def __contains__(self, assembly_id: int) -> bool:
+        return assembly_id in self._assemblies
+
+    def assemblies(self) -> List[Assembly]:
+        """名称の順"""
+        return sorted(self._assemblies.values(), key=lambda assembly: (assembly.name, assembly.id))
+
+    def get(self, assembly_id: int) -> Assembly:
+        assembly = self._assemblies.get(assembly_id)
+        if assembly is None:
+            raise AssemblyError(f"組み合わせ項目 (ID: {assembly_id}) はありません")
+        return assembly
+
+    def add(self, assembly: Assembly):
+        """項目を登録する (同じ ID の項目があれば置き換える)"""
+        if assembly.id in self._assemblies:
+            self._unregister(self._assemblies[assembly.id])
+        self._assemblies[assembly.id] = assembly
+        for component in assembly.components:
+            if component.child_id is not None:
+                self._parents.setdefault(component.child_id, set()).add(assembly.id)
+            if component.id is not None:
+                self._component_owners[component.id] = assembly.id
+        self._invalidate(assembly.id)
+
+    def _unregister(self, assembly: Assembly):
+        for component in assembly.components:
+            if component.child_id is not None:
+                self._parents.get(component.child_id, set()).discard(assembly.id)
+            self._component_owners.pop(component.id, None)
+
+    # ------------------------------------------------------------------
+    # 積み上げ単価
+    # ------------------------------------------------------------------
+    def unit_cost(self, assembly_id: int) -> Decimal:
+        """数量 1 あたりの金額 (構成要素の数量 × 単価の合計。入れ子はその項目の積み上げ単価)"""
+        cost = self._unit_costs.get(assembly_id)
+        if cost is None:
+            cost = self._compute_unit_cost(assembly_id, set())
+        return cost
+
+    def _compute_unit_cost(self, assembly_id: int, visiting: Set[int]) -> Decimal:
+        cost = self._unit_costs.get(assembly_id)
+        if cost is not None:
+            return cost
+        if assembly_id in visiting:
+            raise AssemblyError(f"組み合わせ項目「{self.get(assembly_id).name}」が自分自身を含んでいます")
+        visiting.add(assembly_id)
+        cost = sum((self.component_cost(component, visiting) for component in self.get(assembly_id).components),
+                   Decimal('0'))
+        visiting.discard(assembly_id)
+        self._unit_costs[assembly_id] = cost
+        return cost
+
+    def component_cost(self, component: AssemblyComponent, visiting: Optional[Set[int]] = None) -> Decimal:
+        """構成要素の、組み合わせ項目の数量 1 あたりの金額"""
+        if component.child_id is None:
+            return component.quantity * component.unit_price
+        return component.quantity * self._compute_unit_cost(component.child_id, visiting if visiting is not None else set())
+
+    def set_component_price(self, component_id: int, unit_price: Decimal) -> Set[int]:
+        """構成要素の単価を変える。積み上げ単価が変わる項目 (その項目と祖先) の ID を返す"""
+        assembly_id = self._component_owners.get(component_id)
+        if assembly_id is None:
+            raise AssemblyError(f"構成要素 (ID: {component_id}) はありません")
+        assembly = self._assemblies[assembly_id]
+        components = tuple(component._replace(unit_price=unit_price) if component.id == component_id else component
+                           for component in assembly.components)
+        self._assemblies[assembly_id] = assembly._replace(components=components)
+        return self._invalidate(assembly_id)
+
+    def _invalidate(self, assembly_id: int) -> Set[int]:
+        """項目と祖先の積み上げ単価のメモを捨てる。捨てた項目の ID を返す"""
+        affected: Set[int] = set()
+        pending = [assembly_id]
+        while pending:
+            current = pending.pop()
+            if current in affected:
+                continue
+            affected.add(current)
+            self._unit_costs.pop(current, None)
+            pending.extend(self._parents.get(current, ()))
+        return affected
+
+    # ------------------------------------------------------------------
+    # 展開
+    # ------------------------------------------------------------------
+    def expand(self, assembly_id: int, quantity: Decimal) -> List[ExpandedLine]:
+        """数量 quantity の項目を明細行に展開する (入れ子も展開し、数量を掛け合わせる)"""
+        lines: List[ExpandedLine] = []
+        self._expand_into(lines, assembly_id, quantity, set())
+        return lines
+
+    def _expand_into(self, lines: List[ExpandedLine], assembly_id: int, quantity: Decimal, visiting: Set[int]):
+        if assembly_id in visiting:
+            raise AssemblyError(f"組み合わせ項目「{self.get(assembly_id).name}」が自分自身を含んでいます")
+        visiting.add(assembly_id)
+        assembly = self.get(assembly_id)
+        for component in assembly.components:
+            if component.child_id is None:
+                lines.append(ExpandedLine(component.name, component.specification, component.unit,
+                                          quantity * component.quantity, component.unit_price, assembly.name))
+            else:
+                self._expand_into(lines, component.child_id, quantity * component.quantity, visiting)
+        visiting.discard(assembly_id)
+
+    def component_label(self, component: AssemblyComponent) -> str:
+        """構成要素の表示名 (入れ子なら項目の名称)"""
+        return self.get(component.child_id).name if component.child_id is not None else component.name
+
+    def summary_text(self, assembly_id: int) -> str:
+        """項目の構成 (例: "高圧洗浄 + 下塗り + 上塗り")"""
+        return " + ".join(self.component_label(component) for component in self.get(assembly_id).components)
+
+
+# ----------------------------------------------------------------------
+# データベース
+# ----------------------------------------------------------------------
+def load_catalog(conn: sqlite3.Connection) -> AssemblyCatalog:
+    """データベースのカタログを読み込む (項目と構成要素をそれぞれ1回の SELECT で読む)"""
+    components: Dict[int, List[AssemblyComponent]] = {}
+    for (component_id, assembly_id, child_id, name, specification, unit, quantity, unit_price) in conn.execute("""
+            SELECT id, assembly_id, child_assembly_id, name_text, specification_text, unit_text,
+                   quantity_per_unit, unit_price
+            FROM assembly_components ORDER BY assembly_id, position"""):
+        components.setdefault(assembly_id, []).append(AssemblyComponent(
+            component_id, name or "", specification or "", unit or "", to_decimal(quantity), to_decimal(unit_price), child_id))
+    return AssemblyCatalog(
+        Assembly(assembly_id, name or "", specification or "", unit or "", tuple(components.get(assembly_id, ())))
+        for assembly_id, name, specification, unit
+        in conn.execute("SELECT id, name_text, specification_text, unit_text FROM assemblies"))
+
+
+def save_assembly(conn: sqlite3.Connection, catalog: AssemblyCatalog, name: str, specification: str, unit: str,
+                  components: Sequence[AssemblyComponent]) -> Assembly:
+    """新しい項目をデータベースに保存してカタログに登録する (入れ子の項目はカタログにあること)"""
+    for component in components:
+        if component.child_id is not None:
+            catalog.get(component.child_id)
+    now_iso = datetime.now().isoformat(sep=' ', timespec='seconds')
+    with conn:
+        cursor = conn.execute("""
+            INSERT INTO assemblies (name_text, specification_text, unit_text, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)""", (name, specification, unit, now_iso, now_iso))
+        assembly_id = cursor.lastrowid
+        saved_components = []
+        for position, component in enumerate(components):
+            cursor = conn.execute("""
+                INSERT INTO assembly_components (assembly_id, position, child_assembly_id, name_text,
+                                                 specification_text, unit_text, quantity_per_unit, unit_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (assembly_id, position, component.child_id, component.name, component.specification, component.unit,
+                 float(component.quantity), float(component.unit_price)))
+            saved_components.append(component._replace(id=cursor.lastrowid))
+    assembly = Assembly(assembly_id, name, specification, unit, tuple(saved_components))
+    catalog.add(assembly)
+    return assembly
+
+
+def update_component_price(conn: sqlite3.Connection, catalog: AssemblyCatalog, component_id: int,
+                           unit_price: Decimal) -> Set[int]:
+    """構成要素の単価をデータベースとカタログで変える。積み上げ単価が変わる項目の ID を返す"""
+    now_iso = datetime.now().isoformat(sep=' ', timespec='seconds')
+    with conn:
+        conn.execute("UPDATE assembly_components SET unit_price = ? WHERE id = ?", (float(unit_price), component_id))
+        conn.execute("""UPDATE assemblies SET updated_at = ?
+                        WHERE id = (SELECT assembly_id FROM assembly_components WHERE id = ?)""", (now_iso, component_id))
+    return catalog.set_component_price(component_id, unit_price)
@@ -0,0 +1,258 @@
+# assembly_dialog.py
+"""組み合わせ項目のダイアログ (カタログから選んで明細に入れる・選択行から登録する)"""
+import sqlite3
+from decimal import Decimal
+from typing import List, Optional, Set, Tuple
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (
+    QAbstractItemView, QDialog, QDialogButtonBox, QFormLayout, QHBoxLayout, QHeaderView, QLabel, QLineEdit,
+    QMessageBox, QRadioButton, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWidget
+)
+
+from assembly_catalog import AssemblyCatalog, AssemblyError, update_component_price
+from database_setup import migrate_database
+from number_format import CURRENCY_FORMAT, column_format, to_decimal
+
+# 木の項目に持たせるデータ: ("assembly", 項目の ID) または ("component", 項目の ID, 構成要素の位置)
+_NODE_ROLE = Qt.ItemDataRole.UserRole
+
+
+class AssemblyDialog(QDialog):
+    """組み合わせ項目を選んで、数量と入れ方 (展開する・1行にまとめる) を指定するダイアログ
+
+    構成要素 (明細行) の単価はこの画面で変更できる (ダブルクリック)。変更はすぐにデータベースに保存し、
+    積み上げ単価が変わった項目の ID を changed_assembly_ids に集める (明細の1行にまとめた行の更新に使う)。
+    """
+
+    TREE_HEADERS = ["名称", "仕様", "数量", "単位", "単価", "金額"]
+    COL_NAME, COL_SPECIFICATION, COL_QUANTITY, COL_UNIT, COL_UNIT_PRICE, COL_AMOUNT = range(6)
+
+    def __init__(self, catalog: AssemblyCatalog, db_file_path: str, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setWindowTitle("組み合わせ項目の挿入")
+        self.catalog = catalog
+        self.db_file_path = db_file_path
+        self.changed_assembly_ids: Set[int] = set()
+        self._build_ui()
+        self._populate()
+        self._update_preview()
+
+    def _build_ui(self):
+        self.tree = QTreeWidget()
+        self.tree.setColumnCount(len(self.TREE_HEADERS))
+        self.tree.setHeaderLabels(self.TREE_HEADERS)
+        self.tree.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.tree.header().setSectionResizeMode(self.COL_SPECIFICATION, QHeaderView.ResizeMode.Stretch)
+        self.tree.setColumnWidth(self.COL_NAME, 220)
+        self.quantity_edit = QLineEdit("1")
+        self.quantity_edit.setPlaceholderText("例: 120 (外壁の面積など)")
+        self.unit_label = QLabel()
+        quantity_row = QHBoxLayout()
+        quantity_row.addWidget(self.quantity_edit, 1)
+        quantity_row.addWidget(self.unit_label)
+        self.expand_radio = QRadioButton("構成要素の明細行に展開する")
+        self.collapse_radio = QRadioButton("1行にまとめる (積み上げ単価。構成要素の単価が変わったら更新できる)")
+        self.expand_radio.setChecked(True)
+        self.preview_label = QLabel()
+        form = QFormLayout()
+        form.addRow("数量:", quantity_row)
+        form.addRow("入れ方:", self.expand_radio)
+        form.addRow("", self.collapse_radio)
+        form.addRow("金額:", self.preview_label)
+        hint = QLabel("構成要素の単価はダブルクリックで変更できます (カタログに保存されます)。")
+        hint.setWordWrap(True)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        self.insert_button = self.button_box.addButton("挿入", QDialogButtonBox.ButtonRole.AcceptRole)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.tree, 1)
+        layout.addWidget(hint)
+        layout.addLayout(form)
+        layout.addWidget(self.button_box)
+        self.resize(820, 560)
+
+        self.tree.currentItemChanged.connect(self._update_preview)
+        self.tree.itemDoubleClicked.connect(self._edit_price)
+        self.tree.itemChanged.connect(self._on_item_changed)
+        self.quantity_edit.textChanged.connect(self._update_preview)
+
+    # ------------------------------------------------------------------
+    # 木の表示
+    # ------------------------------------------------------------------
+    def _populate(self):
+        self.tree.blockSignals(True)
+        self.tree.clear()
+        for assembly in self.catalog.assemblies():
+            item = QTreeWidgetItem([assembly.name, assembly.specification, "1", assembly.unit])
+            item.setData(self.COL_NAME, _NODE_ROLE, ("assembly", assembly.id))
+            self.tree.addTopLevelItem(item)
+            self._add_components(item, assembly.id, {assembly.id})
+        self.tree.blockSignals(False)
+        self._refresh_costs()
+        if self.tree.topLevelItemCount():
+            self.tree.setCurrentItem(self.tree.topLevelItem(0))
+
+    def _add_components(self, parent_item: QTreeWidgetItem, assembly_id: int, ancestors: Set[int]):
+        quantity_format = column_format("quantity")
+        for position, component in enumerate(self.catalog.get(assembly_id).components):
+            item = QTreeWidgetItem([self.catalog.component_label(component), component.specification,
+                                    quantity_format.format(component.quantity), component.unit])
+            item.setData(self.COL_NAME, _NODE_ROLE, ("component", assembly_id, position))
+            for col in (self.COL_QUANTITY, self.COL_UNIT_PRICE, self.COL_AMOUNT):
+                item.setTextAlignment(col, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            parent_item.addChild(item)
+            if component.child_id is not None and component.child_id not in ancestors: # 循環した入れ子は展開しない
+                self._add_components(item, component.child_id, ancestors | {component.child_id})
+
+    def _refresh_costs(self):
+        """単価・金額の表示を更新する (積み上げ単価はカタログのメモから取るので、変わった項目だけ計算される)"""
+        self.tree.blockSignals(True)
+        pending: List[QTreeWidgetItem] = [self.tree.topLevelItem(i) for i in range(self.tree.topLevelItemCount())]
+        while pending:
+            item = pending.pop()
+            pending.extend(item.child(i) for i in range(item.childCount()))
+            try:
+                unit_price, amount = self._costs(item.data(self.COL_NAME, _NODE_ROLE))
+            except AssemblyError as e:
+                item.setText(self.COL_AMOUNT, "エラー")
+                item.setToolTip(self.COL_AMOUNT, str(e))
+                continue
+            item.setText(self.COL_UNIT_PRICE, CURRENCY_FORMAT.format(unit_price))
+            item.setText(self.COL_AMOUNT, CURRENCY_FORMAT.format(amount))
+        self.tree.blockSignals(False)
+
+    def _costs(self, node: Tuple) -> Tuple[Decimal, Decimal]:
+        """(単価, 親の数量 1 あたりの金額)"""
+        if node[0] == "assembly":
+            unit_cost = self.catalog.unit_cost(node[1])
+            return unit_cost, unit_cost
+        component = self.catalog.get(node[1]).components[node[2]]
+        if component.child_id is None:
+            return component.unit_price, self.catalog.component_cost(component)
+        return self.catalog.unit_cost(component.child_id), self.catalog.component_cost(component)
+
+    # ------------------------------------------------------------------
+    # 構成要素の単価の変更
+    # ------------------------------------------------------------------
+    def _component_of(self, item: QTreeWidgetItem):
+        node = item.data(self.COL_NAME, _NODE_ROLE)
+        if not node or node[0] != "component":
+            return None
+        return self.catalog.get(node[1]).components[node[2]]
+
+    def _edit_price(self, item: QTreeWidgetItem, column: int):
+        component = self._component_of(item)
+        if component is None or component.child_id is not None or component.id is None:
+            return # 単価を変えられるのは明細行の構成要素だけ
+        self.tree.blockSignals(True)
+        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsEditable)
+        item.setText(self.COL_UNIT_PRICE, str(component.unit_price))
+        self.tree.blockSignals(False)
+        self.tree.editItem(item, self.COL_UNIT_PRICE)
+
+    def _on_item_changed(self, item: QTreeWidgetItem, column: int):
+        component = self._component_of(item)
+        if column != self.COL_UNIT_PRICE or component is None or component.id is None:
+            return
+        new_price = to_decimal(item.text(self.COL_UNIT_PRICE), None)
+        if new_price is None or new_price < 0 or new_price == component.unit_price:
+            if new_price is None:
+                QMessageBox.warning(self, "単価の変更", "単価は数値で入力してください。")
+            self._refresh_costs()
+            return
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_file_path)
+            migrate_database(conn)
+            self.changed_assembly_ids |= update_component_price(conn, self.catalog, component.id, new_price)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"単価の保存中にエラーが発生しました:\n{e}")
+        finally:
+            if conn:
+                conn.close()
+        self._refresh_costs()
+        self._update_preview()
+
+    # ------------------------------------------------------------------
+    # 選択
+    # ------------------------------------------------------------------
+    def selected_assembly_id(self) -> Optional[int]:
+        """選んだ項目 (構成要素を選んでいるときは、いちばん外側の項目)"""
+        item = self.tree.currentItem()
+        while item is not None and item.parent() is not None:
+            item = item.parent()
+        return item.data(self.COL_NAME, _NODE_ROLE)[1] if item is not None else None
+
+    def quantity(self) -> Optional[Decimal]:
+        quantity = to_decimal(self.quantity_edit.text(), None)
+        return quantity if quantity is not None and quantity > 0 else None
+
+    def is_collapsed(self) -> bool:
+        return self.collapse_radio.isChecked()
+
+    def _update_preview(self, *args):
+        assembly_id, quantity = self.selected_assembly_id(), self.quantity()
+        self.unit_label.setText(self.catalog.get(assembly_id).unit if assembly_id is not None else "")
+        self.insert_button.setEnabled(assembly_id is not None and quantity is not None)
+        if assembly_id is None:
+            self.preview_label.setText("カタログに組み合わせ項目がありません。明細の行を選んで「選択行を組み合わせ項目に登録」で登録してください。"
+                                       if not len(self.catalog) else "")
+            return
+        if quantity is None:
+            self.preview_label.setText("数量は正の数で入力してください。")
+            return
+        try:
+            amount = self.catalog.unit_cost(assembly_id) * quantity
+        except AssemblyError as e:
+            self.preview_label.setText(str(e))
+            self.insert_button.setEnabled(False)
+            return
+        self.preview_label.setText(f"{CURRENCY_FORMAT.format(amount)} (構成: {self.catalog.summary_text(assembly_id)})")
+
+
+class AssemblyRegisterDialog(QDialog):
+    """選択した明細行を組み合わせ項目としてカタログに登録するときの名称・単位・基準の数量"""
+
+    def __init__(self, row_count: int, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setWindowTitle("組み合わせ項目の登録")
+        self.name_edit = QLineEdit()
+        self.name_edit.setPlaceholderText("例: 外壁シリコン塗装")
+        self.specification_edit = QLineEdit()
+        self.unit_edit = QLineEdit("m2")
+        self.base_quantity_edit = QLineEdit("1")
+        message = QLabel(f"選択した {row_count} 行を構成要素として登録します。\n"
+                         "各行の数量は「基準の数量」の分として登録し、挿入するときの数量に比例させます。")
+        message.setWordWrap(True)
+        form = QFormLayout()
+        form.addRow("名称:", self.name_edit)
+        form.addRow("仕様:", self.specification_edit)
+        form.addRow("単位:", self.unit_edit)
+        form.addRow("基準の数量:", self.base_quantity_edit)
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+        layout = QVBoxLayout(self)
+        layout.addWidget(message)
+        layout.addLayout(form)
+        layout.addWidget(self.button_box)
+        for edit in (self.name_edit, self.base_quantity_edit):
+            edit.textChanged.connect(self._update_buttons)
+        self._update_buttons()
+
+    def base_quantity(self) -> Optional[Decimal]:
+        quantity = to_decimal(self.base_quantity_edit.text(), None)
+        return quantity if quantity is not None and quantity > 0 else None
+
+    def values(self) -> Tuple[str, str, str, Decimal]:
+        """(名称, 仕様, 単位, 基準の数量)"""
+        return (self.name_edit.text().strip(), self.specification_edit.text().strip(), self.unit_edit.text().strip(),
+                self.base_quantity())
+
+    def _update_buttons(self, *args):
+        self.button_box.button(QDialogButtonBox.StandardButton.Ok).setEnabled(
+            bool(self.name_edit.text().strip()) and self.base_quantity() is not None)
@@ -0,0 +1,69 @@
+# background.py
+"""時間のかかる計算 (版の比較など) をワーカースレッドで実行する
+
+- 計算は QThreadPool のスレッドで実行し、結果は GUI スレッドで受け取る
+  (シグナルのキュー接続。受け取る側は QObject のメソッドにする)。
+- ワーカースレッドでは Qt のウィジェットに触れない。データベースはスレッドの中で接続を開く
+  (sqlite3 の接続はスレッドをまたいで使えない)。
+- 結果を待っている間に条件が変わったときは、呼び出し側が BackgroundTask.cancel で古い結果を捨てる
+  (実行中の計算は止めない)。
+"""
+from typing import Any, Callable, Optional, Set
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+class _TaskSignals(QObject):
+    finished = Signal(object)
+    failed = Signal(str)
+
+
+class BackgroundTask(QRunnable):
+    """function(*args) をワーカースレッドで実行し、結果を finished / failed で知らせる"""
+
+    _running: Set["BackgroundTask"] = set() # 終わるまで参照を持っておく (シグナルの送り手が先に消えないように)
+
+    def __init__(self, function: Callable[..., Any], *args: Any):
+        super().__init__()
+        self.setAutoDelete(False)
+        self._function = function
+        self._args = args
+        self._cancelled = False
+        self.signals = _TaskSignals()
+        self.signals.finished.connect(self._release)
+        self.signals.failed.connect(self._release)
+
+    def cancel(self):
+        """結果を受け取らない (finished / failed を出さない)"""
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self):
+        try:
+            result = self._function(*self._args)
+        except Exception as e: # ワーカースレッドの例外は GUI スレッドに渡して表示する
+            self.signals.failed.emit(str(e) or type(e).__name__)
+        else:
+            self.signals.finished.emit(result)
+
+    def _release(self, *args):
+        BackgroundTask._running.discard(self)
+
+
+def run_in_background(function: Callable[..., Any], *args: Any,
+                      on_finished: Optional[Callable[[Any], None]] = None,
+                      on_failed: Optional[Callable[[str], None]] = None) -> BackgroundTask:
+    """function(*args) をワーカースレッドで実行する。on_finished / on_failed は GUI スレッドで呼ばれる
+
+    cancel した処理の on_finished / on_failed は呼ばない。
+    """
+    task = BackgroundTask(function, *args)
+    if on_finished is not None:
+        task.signals.finished.connect(lambda result: None if task.is_cancelled() else on_finished(result))
+    if on_failed is not None:
+        task.signals.failed.connect(lambda message: None if task.is_cancelled() else on_failed(message))
+    BackgroundTask._running.add(task)
+    QThreadPool.globalInstance().start(task)
+    return task
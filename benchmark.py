@@ -0,0 +1,263 @@
+# benchmark.py
+"""明細編集・保存・読み込みのホットパスのベンチマーク
+
+GUI を表示せずに (QT_QPA_PLATFORM=offscreen) 実行し、行数ごとの所要時間を JSON に書き出す。
+基準となる結果 (ベースライン) と比較して、性能の劣化をリリース前に検出できる。
+
+使い方:
+    python benchmark.py                                    # 100 / 1k / 10k / 100k 行で計測
+    python benchmark.py --sizes 100 1000 --output bench_result.json
+    python benchmark.py --output bench_baseline.json       # ベースラインの作成
+    python benchmark.py --compare bench_baseline.json      # ベースラインと比較 (劣化があれば終了コード 1)
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.20  # ベースラインより 20% 以上遅ければ劣化とみなす
+DEFAULT_MAX_BUILD_SECONDS = 120.0
+
+SAMPLE_NAMES = ["下地調整", "高圧洗浄", "シーラー塗布", "シリコン樹脂塗料 上塗り", "養生"]
+SAMPLE_UNITS = ["式", "m2", "m", "本", "個"]
+
+
+def _sample_rows(count: int) -> List[Dict]:
+    """ベンチマーク用の明細行 (内容は行番号から決まるので毎回同じ)"""
+    return [
+        {
+            "name": f"{SAMPLE_NAMES[i % len(SAMPLE_NAMES)]} {i + 1}",
+            "specification": f"H={1000 + i % 500}, W={2000 + i % 700}",
+            "quantity": float(1 + i % 50),
+            "unit": SAMPLE_UNITS[i % len(SAMPLE_UNITS)],
+            "unit_price": float(100 * (1 + i % 30)),
+            "summary": "",
+        }
+        for i in range(count)
+    ]
+
+
+def _measure(func: Callable[[], None], repeat: int,
+             setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """func を repeat 回実行し、中央値・最小・最大 (ms) を返す。setup は計測に含めない"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "max_ms": max(samples),
+        "repeat": repeat,
+    }
+
+
+class DetailPageBenchmark:
+    """1つの行数について DetailPageWidget の各操作を計測する"""
+
+    def __init__(self, app, size: int, repeat: int, work_dir: str):
+        from PySide6.QtGui import QUndoStack
+        self.app = app
+        self.size = size
+        self.repeat = repeat
+        self.db_path = os.path.join(work_dir, f"bench_{size}.db")
+        self.undo_stack = QUndoStack()
+        self.page = None
+        self.rows = _sample_rows(size)
+
+    def _flush(self):
+        self.page.flush_updates()
+        self.app.processEvents()
+
+    def _select_rows(self, rows: List[int]):
+        from PySide6.QtCore import QItemSelection, QItemSelectionModel
+        table = self.page.table
+        selection = QItemSelection()
+        model = table.model()
+        last_col = model.columnCount() - 1
+        for row in rows:
+            selection.select(model.index(row, 0), model.index(row, last_col))
+        table.selectionModel().select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)
+
+    def _build(self):
+        from detail_page_widget import DetailPageWidget
+        if self.page is not None:
+            self.page.deleteLater()
+            self.app.processEvents()
+        self.undo_stack.clear()
+        self.page = DetailPageWidget(self.undo_stack)
+        self.page.db_file_path = self.db_path
+        self.page.set_detail_rows(self.rows)
+        self._flush()
+
+    def run(self, max_build_seconds: float) -> Dict[str, Dict[str, float]]:
+        from commands import MoveMultipleRowsCommand
+        from database_setup import setup_database
+
+        results: Dict[str, Dict[str, float]] = {}
+        build_repeat = 1 if self.size >= 10000 else self.repeat
+        results["build"] = _measure(self._build, build_repeat)
+        if results["build"]["median_ms"] / 1000.0 > max_build_seconds:
+            results["build"]["aborted"] = True
+            return results
+
+        page = self.page
+        table = page.table
+        mid = self.size // 2
+
+        # --- 1セル編集 (セル押下 -> 値変更 -> 合計更新まで) ---
+        edit_values = iter(range(1, 10 ** 6))
+
+        def single_edit():
+            page._on_cell_pressed(mid, page.COL_QUANTITY)
+            table.item(mid, page.COL_QUANTITY).setText(str(next(edit_values)))
+            self._flush()
+        results["edit_cell"] = _measure(single_edit, self.repeat)
+
+        # 合計は差分で更新するので、全行の数え直しは合計を捨ててから計る (差分更新だけの経路は別に計る)
+        results["update_totals"] = _measure(page._update_detail_totals, self.repeat,
+                                            setup=page._invalidate_amount_sum)
+        results["update_totals_cached"] = _measure(page._update_detail_totals, self.repeat)
+
+        # --- 行操作とその Undo ---
+        def add_and_undo():
+            self._select_rows([mid])
+            table.setCurrentCell(mid, 0)
+            page.add_row()
+            self._flush()
+            self.undo_stack.undo()
+            self._flush()
+        results["add_row_undo"] = _measure(add_and_undo, self.repeat)
+
+        block = list(range(mid, min(self.size, mid + max(1, self.size // 100))))
+
+        def remove_and_undo():
+            self._select_rows(block)
+            page.remove_row()
+            self._flush()
+            self.undo_stack.undo()
+            self._flush()
+        results["remove_rows_undo"] = _measure(remove_and_undo, self.repeat)
+
+        def duplicate_and_undo():
+            self._select_rows(block)
+            page.duplicate_row()
+            self._flush()
+            self.undo_stack.undo()
+            self._flush()
+        results["duplicate_rows_undo"] = _measure(duplicate_and_undo, self.repeat)
+
+        def move_and_undo():
+            rows_data = [table._get_row_data_for_drag(row) for row in block]
+            command = MoveMultipleRowsCommand(table, block, rows_data, 0)
+            self.undo_stack.push(command)
+            self._flush()
+            self.undo_stack.undo()
+            self._flush()
+        results["move_rows_undo"] = _measure(move_and_undo, self.repeat)
+
+        # --- 保存と読み込み ---
+        setup_database(self.db_path)
+        page.update_header("ベンチマーク工事", "ベンチマーク様", "", "---", "---", "---")
+        results["save"] = _measure(page._execute_save_to_db, self.repeat)
+        estimate_id = page.current_estimate_id
+        results["load"] = _measure(lambda: (page.load_estimate(estimate_id), self._flush()), self.repeat)
+
+        page.deleteLater()
+        self.app.processEvents()
+        return results
+
+
+def run_benchmarks(sizes: List[int], repeat: int, max_build_seconds: float) -> Dict:
+    from PySide6.QtCore import qVersion
+    from PySide6.QtWidgets import QApplication
+    import perf
+
+    perf.recorder.set_enabled(False) # 計測層自体のオーバーヘッドは含めない
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory(prefix="estimate_bench_") as work_dir:
+        for size in sizes:
+            print(f"--- {size:,} 行 ---", flush=True)
+            size_results = DetailPageBenchmark(app, size, repeat, work_dir).run(max_build_seconds)
+            for name, result in size_results.items():
+                results.setdefault(name, {})[str(size)] = result
+                print(f"  {name:<22} {result['median_ms']:>12.2f} ms", flush=True)
+            if size_results["build"].get("aborted"):
+                print(f"  構築に {max_build_seconds:.0f} 秒以上かかったため、これより大きい行数は計測しません。")
+                break
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "qt": qVersion(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """ベースラインより threshold 以上遅くなった項目の一覧を返す"""
+    regressions = []
+    print(f"\n{'項目':<22} {'行数':>8} {'基準(ms)':>12} {'今回(ms)':>12} {'変化':>8}")
+    for name, by_size in current["results"].items():
+        for size, result in by_size.items():
+            base = baseline.get("results", {}).get(name, {}).get(size)
+            if not base or base.get("aborted") or result.get("aborted"):
+                continue
+            ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] > 0 else 1.0
+            mark = ""
+            if ratio > 1.0 + threshold:
+                mark = "  <-- 劣化"
+                regressions.append(f"{name} ({size} 行): {base['median_ms']:.2f} ms -> {result['median_ms']:.2f} ms")
+            print(f"{name:<22} {size:>8} {base['median_ms']:>12.2f} {result['median_ms']:>12.2f} {ratio - 1.0:>+8.0%}{mark}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="明細編集・保存・読み込みのベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="計測する行数")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="各操作の繰り返し回数")
+    parser.add_argument("--output", default="bench_result.json", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--compare", metavar="BASELINE", help="比較するベースラインの JSON ファイル")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="劣化とみなす中央値の増加率 (0.2 = 20%%)")
+    parser.add_argument("--max-build-seconds", type=float, default=DEFAULT_MAX_BUILD_SECONDS,
+                        help="構築にこれ以上かかった場合、より大きい行数の計測を打ち切る")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(sorted(args.sizes), args.repeat, args.max_build_seconds)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を '{args.output}' に書き出しました。")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(current, baseline, args.threshold)
+        if regressions:
+            print("\n性能の劣化が見つかりました:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nベースラインからの劣化はありません。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
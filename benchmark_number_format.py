@@ -0,0 +1,102 @@
+# benchmark_number_format.py
+"""数値の解析・整形のマイクロベンチマーク (従来の utils の実装との比較)
+
+使い方:
+    python benchmark_number_format.py
+    python benchmark_number_format.py --number 200000
+"""
+import argparse
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+import number_format
+from number_format import CURRENCY_FORMAT, QUANTITY_FORMAT
+
+
+# --- 比較対象: 変更前の utils.py の実装 (float を返し、int() で切り捨てる) ---
+def legacy_format_currency(value) -> str:
+    try:
+        return f"￥{int(value):,}"
+    except (ValueError, TypeError):
+        return "￥0"
+
+
+def legacy_format_quantity(value) -> str:
+    try:
+        return f"{float(value):.1f}"
+    except (ValueError, TypeError):
+        return "0.0"
+
+
+def legacy_parse_number(text: str) -> float:
+    if not isinstance(text, str):
+        return 0.0
+    cleaned_text = text.replace("￥", "").replace(",", "").strip()
+    try:
+        return float(cleaned_text or 0.0)
+    except ValueError:
+        return 0.0
+
+
+def legacy_to_decimal(text: str) -> Decimal:
+    """変更前の明細画面の Decimal 変換 (parse_number の float を文字列経由で Decimal にする)"""
+    return Decimal(str(legacy_parse_number(text)))
+
+
+def _sample_texts(count: int, seed: int = 1) -> list:
+    """明細の入力・表示で現れる文字列 (同じ値が繰り返し現れる)"""
+    rng = random.Random(seed)
+    prices = [rng.randrange(10, 50000, 10) for _ in range(500)]
+    return [f"￥{rng.choice(prices):,}" for _ in range(count)]
+
+
+def _run(label: str, stmt, number: int) -> float:
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    per_call_us = seconds / number * 1e6
+    print(f"  {label:<44} {per_call_us:>8.3f} µs/回")
+    return per_call_us
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="数値の解析・整形のマイクロベンチマーク")
+    parser.add_argument("--number", type=int, default=100000, help="1計測あたりの呼び出し回数")
+    parser.add_argument("--batch", type=int, default=10000, help="一括処理の件数")
+    args = parser.parse_args(argv)
+    n = args.number
+
+    print("解析 (文字列 -> 数値):")
+    for text in ["1234", "￥12,345", "１２，３４５円"]:
+        print(f" 入力 {text!r}: 従来 {legacy_parse_number(text)!r} / 新 {number_format.to_decimal(text, None)!r}")
+        _run("従来 parse_number (float)", lambda: legacy_parse_number(text), n)
+        _run("従来 Decimal(str(parse_number()))", lambda: legacy_to_decimal(text), n)
+        number_format.clear_caches()
+        _run("新 to_decimal (キャッシュあり)", lambda: number_format.to_decimal(text), n)
+        _run("新 to_decimal (キャッシュなし)", lambda: number_format._parse_cached.__wrapped__(text), n)
+
+    print("\n整形 (数値 -> 文字列):")
+    value = Decimal("12345.6")
+    _run("従来 format_currency", lambda: legacy_format_currency(value), n)
+    _run("新 format_number (金額, キャッシュあり)", lambda: number_format.format_number(value, CURRENCY_FORMAT), n)
+    _run("従来 format_quantity", lambda: legacy_format_quantity(value), n)
+    _run("新 format_number (数量, キャッシュあり)", lambda: number_format.format_number(value, QUANTITY_FORMAT), n)
+    _run("新 format_number (キャッシュなし)",
+         lambda: number_format._format_cached.__wrapped__(value, CURRENCY_FORMAT), n)
+
+    print(f"\n一括処理 ({args.batch:,} 件, 取り込み・貼り付け相当):")
+    texts = _sample_texts(args.batch)
+    batch_number = max(1, n // args.batch)
+    legacy = _run("従来 [legacy_to_decimal(t) for t in texts]", lambda: [legacy_to_decimal(t) for t in texts], batch_number)
+    number_format.clear_caches()
+    new = _run("新 parse_many(texts)", lambda: number_format.parse_many(texts), batch_number)
+    values = number_format.parse_many(texts)
+    _run("従来 [format_currency(v) for v in values]", lambda: [legacy_format_currency(v) for v in values], batch_number)
+    _run("新 format_many(values)", lambda: number_format.format_many(values, CURRENCY_FORMAT), batch_number)
+    print(f"\n一括解析の速度比: {legacy / new:.1f} 倍")
+    print(f"キャッシュ: {number_format.cache_info()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
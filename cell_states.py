@@ -0,0 +1,162 @@
+# cell_states.py
+"""明細のセルの状態 (入力エラー・検査のエラー/警告・検索の一致・保存後の変更) を行ごとのビットフラグで持つ
+
+- 行 ID -> int のビットフラグ。ビットの位置は「状態 * STATE_BITS + 列番号」で、1行の全列の全状態を1つの int に持つ。
+  行 ID で持つので、行の移動・並べ替え・絞り込みでは付け直さない。
+- 状態を変えてもテーブルのアイテムは書き換えない (setBackground などで dataChanged を出さない)。
+  変えたら changed を1回だけ出し、受け取った側がビューポートを1回再描画する。
+  数千行の印を付け直しても、フラグの更新と1回の再描画で済む。
+- 色はデリゲート (CellStateDelegate) が描画のたびにフラグを読んで決める。
+"""
+from typing import Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+from PySide6.QtCore import QModelIndex, QObject, QPointF, Signal
+from PySide6.QtGui import QBrush, QColor, QPolygonF
+from PySide6.QtWidgets import QStyledItemDelegate
+
+from constants import (
+    COLOR_CHANGED_MARK, COLOR_CURRENT_MATCH_BG, COLOR_ERROR_BG, COLOR_ERROR_FG, COLOR_MATCH_BG,
+    COLOR_PROBLEM_ERROR_BG, COLOR_PROBLEM_WARNING_BG
+)
+
+# 状態 (ビットの組の番号)
+INVALID = 0          # 入力エラー (計算できない計算式など)
+PROBLEM_ERROR = 1    # 明細の検査のエラー
+PROBLEM_WARNING = 2  # 明細の検査の警告
+SEARCH_MATCH = 3     # 検索に一致したセル
+SEARCH_CURRENT = 4   # 選択中の一致
+CHANGED = 5          # 保存 (読み込み) 後に変えたセル
+STATE_COUNT = 6
+STATE_BITS = 8       # 1つの状態に使うビット数 (列数以上)
+
+_STATE_MASKS = [((1 << STATE_BITS) - 1) << (state * STATE_BITS) for state in range(STATE_COUNT)]
+
+Cell = Tuple[int, int] # (行 ID, 列番号)
+
+
+def cell_bit(state: int, col: int) -> int:
+    return 1 << (state * STATE_BITS + col)
+
+
+class CellStates(QObject):
+    """セルの状態のビットフラグ (行 ID ごと)"""
+    changed = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._flags: Dict[int, int] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._flags)
+
+    def flags(self, row_id: int) -> int:
+        """行の全列の状態のビットフラグ (cell_bit で調べる)"""
+        return self._flags.get(row_id, 0)
+
+    def has(self, row_id: int, col: int, state: int) -> bool:
+        return bool(self._flags.get(row_id, 0) & cell_bit(state, col))
+
+    def count(self, state: int) -> int:
+        """状態が付いているセルの数"""
+        mask = _STATE_MASKS[state]
+        return sum(bin(flags & mask).count("1") for flags in self._flags.values())
+
+    def set_cell(self, row_id: int, col: int, state: int, on: bool = True):
+        """1つのセルの状態を付ける (on が False なら外す)。変わったときだけ changed を出す"""
+        flags = self._flags.get(row_id, 0)
+        new_flags = flags | cell_bit(state, col) if on else flags & ~cell_bit(state, col)
+        if new_flags != flags:
+            self._store(row_id, new_flags)
+            self.changed.emit()
+
+    def set_cells(self, state: int, cells: Iterable[Cell]):
+        """複数のセルに状態を付ける (changed は1回だけ出す)"""
+        flags = self._flags
+        changed = False
+        for row_id, col in cells:
+            bit = cell_bit(state, col)
+            old = flags.get(row_id, 0)
+            if not old & bit:
+                flags[row_id] = old | bit
+                changed = True
+        if changed:
+            self.changed.emit()
+
+    def replace(self, cells_by_state: Mapping[int, Iterable[Cell]]):
+        """状態ごとに、付いているセルをすべて cells に置き換える (changed は1回だけ出す)"""
+        clear_mask = 0
+        for state in cells_by_state:
+            clear_mask |= _STATE_MASKS[state]
+        new_flags = {row_id: flags & ~clear_mask for row_id, flags in self._flags.items() if flags & ~clear_mask}
+        for state, cells in cells_by_state.items():
+            for row_id, col in cells:
+                new_flags[row_id] = new_flags.get(row_id, 0) | cell_bit(state, col)
+        if new_flags != self._flags:
+            self._flags = new_flags
+            self.changed.emit()
+
+    def clear(self, *states: int):
+        """states の状態を外す (指定しなければすべて外す)"""
+        if not self._flags:
+            return
+        if states:
+            self.replace({state: () for state in states})
+        else:
+            self._flags = {}
+            self.changed.emit()
+
+    def _store(self, row_id: int, flags: int):
+        if flags:
+            self._flags[row_id] = flags
+        else:
+            self._flags.pop(row_id, None)
+
+
+class CellStateDelegate(QStyledItemDelegate):
+    """セルの状態のビットフラグを読んで、背景・文字色・変更の印を描画時に付けるデリゲート
+
+    背景は 選択中の一致 > 検索の一致 > 入力エラー > 検査のエラー > 検査の警告 の順に1色だけ塗る。
+    入力エラーは文字を赤にし、保存後に変えたセルは左上に小さな三角の印を付ける。
+    """
+    _BACKGROUNDS = ((SEARCH_CURRENT, COLOR_CURRENT_MATCH_BG), (SEARCH_MATCH, COLOR_MATCH_BG), (INVALID, COLOR_ERROR_BG),
+                    (PROBLEM_ERROR, COLOR_PROBLEM_ERROR_BG), (PROBLEM_WARNING, COLOR_PROBLEM_WARNING_BG))
+    MARK_SIZE = 6 # 変更の印の大きさ (px)
+
+    def __init__(self, states: CellStates, row_id_of: Callable[[QModelIndex], Optional[int]], parent=None):
+        super().__init__(parent)
+        self._states = states
+        self._row_id_of = row_id_of # セルの行 ID (名称セルの ROW_ID_ROLE)
+        self._brushes = {state: QBrush(QColor(color)) for state, color in self._BACKGROUNDS}
+        self._error_foreground = QBrush(QColor(COLOR_ERROR_FG))
+        self._mark_color = QColor(COLOR_CHANGED_MARK)
+
+    def _cell_flags(self, index: QModelIndex) -> Tuple[int, int]:
+        """(行のフラグ, 列番号)。状態が1つもなければ行 ID を読まずに 0 を返す"""
+        if not self._states:
+            return 0, index.column()
+        return self._states.flags(self._row_id_of(index)), index.column()
+
+    def initStyleOption(self, option, index: QModelIndex):
+        super().initStyleOption(option, index)
+        flags, col = self._cell_flags(index)
+        if not flags:
+            return
+        for state, _ in self._BACKGROUNDS:
+            if flags & cell_bit(state, col):
+                option.backgroundBrush = self._brushes[state]
+                break
+        if flags & cell_bit(INVALID, col):
+            option.palette.setBrush(option.palette.ColorRole.Text, self._error_foreground)
+
+    def paint(self, painter, option, index: QModelIndex):
+        super().paint(painter, option, index)
+        flags, col = self._cell_flags(index)
+        if flags & cell_bit(CHANGED, col):
+            rect = option.rect
+            size = self.MARK_SIZE
+            painter.save()
+            painter.setPen(self._mark_color)
+            painter.setBrush(self._mark_color)
+            painter.drawPolygon(QPolygonF([QPointF(rect.left(), rect.top()), QPointF(rect.left() + size, rect.top()),
+                                           QPointF(rect.left(), rect.top() + size)]))
+            painter.restore()
@@ -5,12 +5,33 @@ import pickle # pickle をインポート
 from PySide6.QtGui import QUndoCommand # QUndoCommand のみ QtGui から
 from PySide6.QtWidgets import QTableWidget, QTableWidgetItem, QApplication, QComboBox, QHeaderView # QComboBox, QHeaderView をインポート
 from PySide6.QtCore import Qt # Qt をインポート
-from typing import List, Optional, Callable, Tuple, Type, Dict, Any, Union
+from typing import List, Optional, Callable, Sequence, Tuple, Type, Dict, Any, Union
 from typing import TYPE_CHECKING
 
+from constants import VALUE_ROLE, FORMULA_ROLE, ROW_ID_ROLE, ASSEMBLY_ROLE, LINE_KEY_ROLE
+from formula import FormulaError
+from perf import timed
+
 if TYPE_CHECKING:
     from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
 
+# 行の移動・複写・削除の Undo で、表示文字列と一緒に保存・復元するアイテムの独自データ
+ITEM_DATA_ROLES = {'value': VALUE_ROLE, 'formula': FORMULA_ROLE, 'row_id': ROW_ID_ROLE, 'assembly_id': ASSEMBLY_ROLE,
+                   'line_key': LINE_KEY_ROLE}
+
+
+def snapshot_item_data(item: QTableWidgetItem) -> Dict[str, Any]:
+    """アイテムの独自データ (数値・計算式・行 ID) を辞書にする"""
+    return {key: item.data(role) for key, role in ITEM_DATA_ROLES.items()}
+
+
+def restore_item_data(item: QTableWidgetItem, data_cell: Dict[str, Any]):
+    """snapshot_item_data で保存した独自データをアイテムに戻す"""
+    for key, role in ITEM_DATA_ROLES.items():
+        if data_cell.get(key) is not None:
+            item.setData(role, data_cell[key])
+
+
 class AddRowCommand(QUndoCommand):
     """行を追加するコマンド"""
     def __init__(self, table: QTableWidget, initialize_row_func: Callable[[int], None], description: str = "行追加"):
@@ -19,6 +40,7 @@ class AddRowCommand(QUndoCommand):
         self.row_index = table.rowCount()
         self.initialize_row_func = initialize_row_func
 
+    @timed()
     def redo(self):
         self.table.blockSignals(True)
         self.table.insertRow(self.row_index)
@@ -26,6 +48,7 @@ class AddRowCommand(QUndoCommand):
             self.initialize_row_func(self.row_index)
         self.table.blockSignals(False)
 
+    @timed()
     def undo(self):
         self.table.blockSignals(True)
         self.table.removeRow(self.row_index)
@@ -39,6 +62,7 @@ class InsertRowCommand(QUndoCommand):
         self.row_index = row_index
         self.initialize_row_func = initialize_row_func
 
+    @timed()
     def redo(self):
         self.table.blockSignals(True)
         self.table.insertRow(self.row_index)
@@ -46,6 +70,7 @@ class InsertRowCommand(QUndoCommand):
             self.initialize_row_func(self.row_index)
         self.table.blockSignals(False)
 
+    @timed()
     def undo(self):
         self.table.blockSignals(True)
         self.table.removeRow(self.row_index)
@@ -59,11 +84,13 @@ class RemoveRowCommand(QUndoCommand):
         self.row_index = row_index
         self.row_data_saved = row_data
 
+    @timed()
     def redo(self):
         self.table.blockSignals(True)
         self.table.removeRow(self.row_index)
         self.table.blockSignals(False)
 
+    @timed()
     def undo(self):
         self.table.blockSignals(True)
         self.table.insertRow(self.row_index)
@@ -71,14 +98,7 @@ class RemoveRowCommand(QUndoCommand):
             if isinstance(saved_data, QTableWidgetItem):
                 self.table.setItem(self.row_index, col, saved_data.clone())
             elif isinstance(saved_data, tuple) and len(saved_data) == 2 and isinstance(saved_data[0], type) and issubclass(saved_data[0], QComboBox):
-                widget_class, properties = saved_data
-                parent_widget = self.table.parent()
-                if hasattr(parent_widget, '_create_unit_combobox') and callable(parent_widget._create_unit_combobox):
-                    combo = parent_widget._create_unit_combobox()
-                    combo.setCurrentText(properties.get('currentText', ''))
-                    self.table.setCellWidget(self.row_index, col, combo)
-                else:
-                    self.table.setItem(self.row_index, col, QTableWidgetItem("復元エラー"))
+                self.table.setItem(self.row_index, col, unit_item(saved_data))
             elif saved_data is None:
                 self.table.setItem(self.row_index, col, QTableWidgetItem(""))
             else:
@@ -86,6 +106,52 @@ class RemoveRowCommand(QUndoCommand):
         self.table.blockSignals(False)
 
 
+def _detail_page_of(table: QTableWidget) -> Optional['DetailPageWidget']:
+    parent_widget = table.parent()
+    return parent_widget if hasattr(parent_widget, 'COL_NAME') else None
+
+
+def format_cell_text(detail_page: Optional['DetailPageWidget'], col: int, text: str) -> str:
+    """数値列 (数量・単価・金額) のテキストを表示形式に整形する (それ以外の列はそのまま)"""
+    if not detail_page: return text
+    try:
+        if col not in detail_page.NUMBER_FORMAT_NAMES:
+            return text
+        return detail_page._number_format(col).format(text)
+    except (ValueError, TypeError, AttributeError):
+        return text
+
+
+def unit_item(unit_cell: Tuple[Type[QComboBox], Dict]) -> QTableWidgetItem:
+    """行のデータの単位のセル (QComboBox, {'currentText': ...}) からアイテムを作る
+
+    単位はアイテムの文字列で持ち、コンボボックスは編集するときだけデリゲートが作る。
+    この形は、以前の行のデータ (編集の記録など) を読むためのもの。
+    """
+    return QTableWidgetItem(unit_cell[1].get('currentText', ''))
+
+
+def apply_cell_text(table: QTableWidget, detail_page: Optional['DetailPageWidget'], row: int, col: int, text: str):
+    """セルにテキストを反映する (数量・単価は計算式の評価と金額の再計算も行う)"""
+    item = table.item(row, col)
+    if item is None and detail_page and col == detail_page.COL_UNIT:
+        item = QTableWidgetItem("")
+        table.setItem(row, col, item)
+    if item and detail_page and col in (detail_page.COL_QUANTITY, detail_page.COL_UNIT_PRICE):
+        # 数量・単価は計算式なら評価し直して表示・保持値・式を設定する
+        try:
+            detail_page._apply_numeric_input(item, col, text)
+        except FormulaError:
+            pass # 解釈できない式は入力のまま残す (保持値は 0)
+        # 数量・単価の変更は金額にも反映する (Undo/Redo でも金額と保持値が食い違わないように)
+        detail_page._recalculate_row_amount(row)
+    elif item:
+        was_blocked = table.signalsBlocked()
+        table.blockSignals(True)
+        item.setText(format_cell_text(detail_page, col, text))
+        table.blockSignals(was_blocked)
+
+
 class ChangeItemCommand(QUndoCommand):
     """テーブルアイテムの内容を変更するコマンド"""
     CHANGE_ITEM_ID = 1001
@@ -97,56 +163,15 @@ class ChangeItemCommand(QUndoCommand):
         self.col = col
         self.old_text = old_text
         self.new_text = new_text
-        parent_widget = table.parent()
-        self.detail_page: Optional['DetailPageWidget'] = parent_widget if hasattr(parent_widget, 'COL_ITEM') else None
-
-    def _format_text(self, text: str) -> str:
-        if not self.detail_page: return text
-        try:
-            if self.col == self.detail_page.COL_UNIT:
-                return text
-            cleaned_text = text.replace(",", "").replace("￥", "").strip()
-            value = float(cleaned_text or 0.0)
-            if self.col == self.detail_page.COL_QUANTITY:
-                return f"{value:,.1f}"
-            elif self.col == self.detail_page.COL_UNIT_PRICE or self.col == self.detail_page.COL_AMOUNT:
-                return f"{int(value):,}"
-            else:
-                return text
-        except (ValueError, TypeError, AttributeError):
-            return text
+        self.detail_page: Optional['DetailPageWidget'] = _detail_page_of(table)
 
+    @timed()
     def redo(self):
-        is_unit_column = self.detail_page and self.col == self.detail_page.COL_UNIT
-        formatted_text = self._format_text(self.new_text)
-
-        if is_unit_column:
-            widget = self.table.cellWidget(self.row, self.col)
-            if isinstance(widget, QComboBox):
-                was_blocked = widget.signalsBlocked()
-                widget.blockSignals(True)
-                widget.setCurrentText(formatted_text) # QComboBoxにはフォーマット前のテキストが良い場合もある
-                widget.blockSignals(was_blocked)
-        else:
-            item = self.table.item(self.row, self.col)
-            if item:
-                item.setText(formatted_text)
+        apply_cell_text(self.table, self.detail_page, self.row, self.col, self.new_text)
 
+    @timed()
     def undo(self):
-        is_unit_column = self.detail_page and self.col == self.detail_page.COL_UNIT
-        formatted_text = self._format_text(self.old_text)
-
-        if is_unit_column:
-            widget = self.table.cellWidget(self.row, self.col)
-            if isinstance(widget, QComboBox):
-                was_blocked = widget.signalsBlocked()
-                widget.blockSignals(True)
-                widget.setCurrentText(self.old_text) # QComboBoxは元のテキストをそのまま戻す
-                widget.blockSignals(was_blocked)
-        else:
-            item = self.table.item(self.row, self.col)
-            if item:
-                item.setText(formatted_text)
+        apply_cell_text(self.table, self.detail_page, self.row, self.col, self.old_text)
 
     def id(self) -> int:
         return self.CHANGE_ITEM_ID + self.row * self.table.columnCount() + self.col
@@ -158,6 +183,97 @@ class ChangeItemCommand(QUndoCommand):
         return False
 
 
+class ChangeMultipleItemsCommand(QUndoCommand):
+    """複数のセルの内容をまとめて変更するコマンド (1回の Undo ですべて元に戻す)
+
+    変更はセルごとのコマンドを作らずに (行, 列, 変更前, 変更後) のタプルだけで持ち、
+    金額・合計の再計算は最後に1回だけ行う。
+    """
+    def __init__(self, table: QTableWidget, changes: List[Tuple[int, int, str, str]], description: str = "複数セル編集"):
+        super().__init__(description)
+        self.table = table
+        self.changes: Tuple[Tuple[int, int, str, str], ...] = tuple(changes) # (行, 列, 変更前のテキスト, 変更後のテキスト)
+        self.detail_page: Optional['DetailPageWidget'] = _detail_page_of(table)
+
+    def _apply(self, undoing: bool):
+        table, detail_page = self.table, self.detail_page
+        changes = reversed(self.changes) if undoing else self.changes
+        for row, col, old_text, new_text in changes:
+            if undoing:
+                apply_cell_text(table, detail_page, row, col, old_text)
+            else:
+                apply_cell_text(table, detail_page, row, col, new_text)
+
+    def _run(self, undoing: bool):
+        if self.detail_page is None:
+            self._apply(undoing)
+            return
+        with self.detail_page.update_scheduler.batch(): # 各セルの再計算要求を最後にまとめて反映する
+            self._apply(undoing)
+
+    @timed()
+    def redo(self):
+        self._run(undoing=False)
+
+    @timed()
+    def undo(self):
+        self._run(undoing=True)
+
+
+class FillCellsCommand(QUndoCommand):
+    """1つの列の複数の行に同じ値を入力するコマンド (下へコピー・選択行に一括入力)
+
+    変更後の値は1つだけ持ち、変更前の値は行番号と同じ順のタプルで持つ (同じ文字列は1つのオブジェクトを共有する)。
+    セルごとのモデルの dataChanged は止めて最後に範囲で1回だけ送り、金額・合計の再計算も最後に1回だけ行う。
+    """
+    def __init__(self, table: QTableWidget, col: int, rows: Sequence[int], old_texts: Sequence[str], new_text: str,
+                 description: str = "一括入力"):
+        super().__init__(description)
+        self.table = table
+        self.col = col
+        self.rows: Tuple[int, ...] = tuple(rows)
+        interned: Dict[str, str] = {}
+        self.old_texts: Tuple[str, ...] = tuple(interned.setdefault(text, text) for text in old_texts)
+        self.new_text = new_text
+        self.detail_page: Optional['DetailPageWidget'] = _detail_page_of(table)
+
+    def _apply(self, undoing: bool):
+        table, detail_page, col = self.table, self.detail_page, self.col
+        if undoing:
+            cells = zip(reversed(self.rows), reversed(self.old_texts))
+        else:
+            cells = ((row, self.new_text) for row in self.rows)
+        model = table.model()
+        was_blocked = model.signalsBlocked()
+        model.blockSignals(True)
+        try:
+            for row, text in cells:
+                apply_cell_text(table, detail_page, row, col, text)
+        finally:
+            model.blockSignals(was_blocked)
+        if was_blocked or not self.rows:
+            return
+        first_col = last_col = col
+        if detail_page is not None and col in (detail_page.COL_QUANTITY, detail_page.COL_UNIT_PRICE):
+            first_col, last_col = min(col, detail_page.COL_AMOUNT), max(col, detail_page.COL_AMOUNT)
+        model.dataChanged.emit(model.index(min(self.rows), first_col), model.index(max(self.rows), last_col))
+
+    def _run(self, undoing: bool):
+        if self.detail_page is None:
+            self._apply(undoing)
+            return
+        with self.detail_page.update_scheduler.batch(): # 各セルの再計算要求を最後にまとめて反映する
+            self._apply(undoing)
+
+    @timed()
+    def redo(self):
+        self._run(undoing=False)
+
+    @timed()
+    def undo(self):
+        self._run(undoing=True)
+
+
 class DuplicateRowCommand(QUndoCommand):
     """指定した行を複製して、その下に挿入するコマンド (単一行用、現在はDuplicateMultipleRowsCommandに統合されることが多い)"""
     def __init__(self, table: QTableWidget, source_row: int, row_data_to_copy: List[Optional[Union[QTableWidgetItem, Tuple[Type[QComboBox], Dict]]]], description: str = "行複写"):
@@ -167,6 +283,7 @@ class DuplicateRowCommand(QUndoCommand):
         self.insert_row = source_row + 1
         self.row_data_to_copy = row_data_to_copy
 
+    @timed()
     def redo(self):
         self.table.blockSignals(True)
         try:
@@ -182,16 +299,10 @@ class DuplicateRowCommand(QUndoCommand):
                         item.setFlags(Qt.ItemFlags(data_cell['flags']))
                     if 'textAlignment' in data_cell and data_cell['textAlignment'] is not None:
                         item.setTextAlignment(data_cell['textAlignment'])
+                    restore_item_data(item, data_cell)
                     self.table.setItem(self.insert_row, col, item)
                 elif isinstance(data_cell, tuple) and len(data_cell) == 2 and isinstance(data_cell[0], type) and issubclass(data_cell[0], QComboBox):
-                    widget_class, properties = data_cell
-                    parent_widget = self.table.parent()
-                    if hasattr(parent_widget, '_create_unit_combobox') and callable(parent_widget._create_unit_combobox):
-                        combo = parent_widget._create_unit_combobox()
-                        combo.setCurrentText(properties.get('currentText', ''))
-                        self.table.setCellWidget(self.insert_row, col, combo)
-                    else:
-                        self.table.setItem(self.insert_row, col, QTableWidgetItem("復元エラー"))
+                    self.table.setItem(self.insert_row, col, unit_item(data_cell))
                 else: # None やその他の場合
                     self.table.setItem(self.insert_row, col, QTableWidgetItem(""))
         except Exception as e:
@@ -202,6 +313,7 @@ class DuplicateRowCommand(QUndoCommand):
             self.table.blockSignals(False)
         self.table.selectRow(self.insert_row)
 
+    @timed()
     def undo(self):
         self.table.blockSignals(True)
         self.table.removeRow(self.insert_row)
@@ -239,13 +351,10 @@ class MoveMultipleRowsCommand(QUndoCommand):
     def _get_row_data_from_table(self, row_index: int) -> List[Any]:
         row_data = []
         for col in range(self.table.columnCount()):
-            widget = self.table.cellWidget(row_index, col)
             item = self.table.item(row_index, col)
-            if widget and isinstance(widget, QComboBox):
-                row_data.append((type(widget), {'currentText': widget.currentText()}))
-            elif item:
+            if item:
                 # print(f"DEBUG MoveCmd._get_row_data_from_table: row={row_index}, col={col}, item.text()='{item.text()}', type={type(item.text())}")
-                row_data.append({'text': item.text(), 'flags': item.flags().value, 'textAlignment': item.textAlignment()})
+                row_data.append({'text': item.text(), 'flags': item.flags().value, 'textAlignment': item.textAlignment(), **snapshot_item_data(item)})
             else:
                 row_data.append(None)
         return row_data
@@ -265,22 +374,17 @@ class MoveMultipleRowsCommand(QUndoCommand):
                     item.setFlags(Qt.ItemFlags(data_cell['flags']))
                 if 'textAlignment' in data_cell and data_cell['textAlignment'] is not None:
                     item.setTextAlignment(data_cell['textAlignment'])
+                restore_item_data(item, data_cell)
                 self.table.setItem(row_index, col, item)
             elif isinstance(data_cell, tuple) and len(data_cell) == 2 and isinstance(data_cell[0], type) and issubclass(data_cell[0], QComboBox):
-                widget_class, properties = data_cell
-                parent_widget = self.table.parent()
-                if hasattr(parent_widget, '_create_unit_combobox') and callable(parent_widget._create_unit_combobox):
-                    combo = parent_widget._create_unit_combobox()
-                    combo.setCurrentText(properties.get('currentText', ''))
-                    self.table.setCellWidget(row_index, col, combo)
-                else:
-                    self.table.setItem(row_index, col, QTableWidgetItem("[Widget Placeholder]"))
+                self.table.setItem(row_index, col, unit_item(data_cell))
             elif data_cell is None:
                 self.table.setItem(row_index, col, None)
             else: # フォールバックとして文字列に変換
                 self.table.setItem(row_index, col, QTableWidgetItem(str(data_cell)))
 
 
+    @timed()
     def redo(self):
         if self.is_noop:
             self.setText(f"{self.text()} (変更なし)")
@@ -312,6 +416,7 @@ class MoveMultipleRowsCommand(QUndoCommand):
             self._set_row_data_to_table(current_insert_row, self.rows_data_to_move[i])
         self.table.blockSignals(False)
 
+    @timed()
     def undo(self):
         if self.is_noop:
             return
@@ -329,6 +434,44 @@ class MoveMultipleRowsCommand(QUndoCommand):
         self.table.blockSignals(False)
 
 
+class InsertRowsCommand(QUndoCommand):
+    """指定した位置に複数の行をまとめて挿入するコマンド (組み合わせ項目の展開など)
+
+    行はモデルに1回で挿入し (rowsInserted は1回)、各行のアイテムは保持しているものの複製を設定する。
+    rows_data の各行は DetailPageWidget._get_row_data と同じ形 (アイテムの内容、または以前の形の単位のセル)。
+    """
+    def __init__(self, table: QTableWidget, position: int,
+                 rows_data: List[List[Optional[Union[QTableWidgetItem, Tuple[Type[QComboBox], Dict]]]]],
+                 description: str = "行挿入"):
+        super().__init__(description)
+        self.table = table
+        self.position = position
+        self.rows_data = rows_data
+
+    @timed()
+    def redo(self):
+        table = self.table
+        table.blockSignals(True)
+        try:
+            table.model().insertRows(self.position, len(self.rows_data))
+            for row, row_data in enumerate(self.rows_data, self.position):
+                for col, data_cell in enumerate(row_data):
+                    if isinstance(data_cell, QTableWidgetItem):
+                        table.setItem(row, col, data_cell.clone())
+                    elif isinstance(data_cell, tuple):
+                        table.setItem(row, col, unit_item(data_cell))
+                    else:
+                        table.setItem(row, col, QTableWidgetItem(""))
+        finally:
+            table.blockSignals(False)
+
+    @timed()
+    def undo(self):
+        self.table.blockSignals(True)
+        self.table.model().removeRows(self.position, len(self.rows_data))
+        self.table.blockSignals(False)
+
+
 class DuplicateMultipleRowsCommand(QUndoCommand):
     def __init__(self, table: QTableWidget,
                  source_rows_data_map: Dict[int, List[Optional[Union[QTableWidgetItem, Tuple[Type[QComboBox], Dict]]]]],
@@ -340,6 +483,7 @@ class DuplicateMultipleRowsCommand(QUndoCommand):
         self.source_indices_asc = sorted(source_rows_data_map.keys())
         self.inserted_row_indices_in_redo: List[int] = []
 
+    @timed()
     def redo(self):
         self.table.blockSignals(True)
         self.inserted_row_indices_in_redo.clear()
@@ -366,22 +510,17 @@ class DuplicateMultipleRowsCommand(QUndoCommand):
                             item.setFlags(Qt.ItemFlags(data['flags']))
                         if 'textAlignment' in data and data['textAlignment'] is not None:
                             item.setTextAlignment(data['textAlignment'])
+                        restore_item_data(item, data)
                         self.table.setItem(current_insert_pos, col, item)
                     # --- ここまで ---
                     elif isinstance(data, tuple) and len(data) == 2 and isinstance(data[0], type) and issubclass(data[0], QComboBox):
-                        widget_class, properties = data
-                        parent_widget = self.table.parent()
-                        if hasattr(parent_widget, '_create_unit_combobox') and callable(parent_widget._create_unit_combobox):
-                            combo = parent_widget._create_unit_combobox()
-                            combo.setCurrentText(properties.get('currentText', ''))
-                            self.table.setCellWidget(current_insert_pos, col, combo)
-                        else:
-                            self.table.setItem(current_insert_pos, col, QTableWidgetItem("復元エラー"))
+                        self.table.setItem(current_insert_pos, col, unit_item(data))
                     else:
                         self.table.setItem(current_insert_pos, col, QTableWidgetItem(""))
         finally:
             self.table.blockSignals(False)
 
+    @timed()
     def undo(self):
         self.table.blockSignals(True)
         for row_to_remove in sorted(self.inserted_row_indices_in_redo, reverse=True):
@@ -397,12 +536,14 @@ class RemoveMultipleRowsCommand(QUndoCommand):
         self.rows_descending = sorted(rows, reverse=True)
         self.rows_data_saved = rows_data # ここで渡される rows_data の形式に注意
 
+    @timed()
     def redo(self):
         self.table.blockSignals(True)
         for row in self.rows_descending:
             self.table.removeRow(row)
         self.table.blockSignals(False)
 
+    @timed()
     def undo(self):
         self.table.blockSignals(True)
         for row in self.rows_ascending:
@@ -422,16 +563,122 @@ class RemoveMultipleRowsCommand(QUndoCommand):
                         item.setFlags(Qt.ItemFlags(saved_data['flags']))
                     if 'textAlignment' in saved_data and saved_data['textAlignment'] is not None:
                         item.setTextAlignment(saved_data['textAlignment'])
+                    restore_item_data(item, saved_data)
                     self.table.setItem(row, col, item)
                 # --- ここまで ---
                 elif isinstance(saved_data, tuple) and len(saved_data) == 2 and isinstance(saved_data[0], type) and issubclass(saved_data[0], QComboBox):
-                    widget_class, properties = saved_data
-                    parent_widget = self.table.parent()
-                    if hasattr(parent_widget, '_create_unit_combobox') and callable(parent_widget._create_unit_combobox):
-                        combo = parent_widget._create_unit_combobox()
-                        combo.setCurrentText(properties.get('currentText', ''))
-                        self.table.setCellWidget(row, col, combo)
-                    else: self.table.setItem(row, col, QTableWidgetItem("復元エラー"))
+                    self.table.setItem(row, col, unit_item(saved_data))
                 else:
                     self.table.setItem(row, col, QTableWidgetItem(""))
         self.table.blockSignals(False)
+
+
+def apply_row_order(table: QTableWidget, detail_page: Optional['DetailPageWidget'], order: Sequence[int]):
+    """行を行 ID の並び order の順に並べ替える
+
+    アイテムは作り直さず、隠した作業列に各行の移動先を入れてモデルの sort で行ごと移動する。
+    order にない行は、今の順のまま最後に置く。
+    """
+    if detail_page is None:
+        return
+    detail_page.input_order.sync() # 並べ替えの前までの行の追加・移動を入力順に反映しておく
+    current = detail_page.formula_engine.row_ids()
+    position = {row_id: index for index, row_id in enumerate(order)}
+    keys = [position.get(row_id, len(order) + row) for row, row_id in enumerate(current)]
+    if all(keys[row] < keys[row + 1] for row in range(len(keys) - 1)):
+        return # 並びは変わらない
+    key_col = table.columnCount()
+    table.insertColumn(key_col)
+    table.setColumnHidden(key_col, True)
+    model = table.model()
+    was_blocked = model.blockSignals(True) # 作業列の値の設定はビューや集計に通知しない
+    try:
+        for row, key in enumerate(keys):
+            key_item = QTableWidgetItem()
+            key_item.setData(Qt.ItemDataRole.DisplayRole, key)
+            table.setItem(row, key_col, key_item)
+    finally:
+        model.blockSignals(was_blocked)
+    table.sortItems(key_col, Qt.SortOrder.AscendingOrder)
+    table.removeColumn(key_col)
+    detail_page.input_order.reordered()
+
+
+class ReorderRowsCommand(QUndoCommand):
+    """行の並べ替え (並べ替え前後の行 ID の並びだけを持ち、アイテムは作り直さない)"""
+    def __init__(self, table: QTableWidget, old_order: Sequence[int], new_order: Sequence[int], description: str = "並べ替え"):
+        super().__init__(description)
+        self.table = table
+        self.old_order: Tuple[int, ...] = tuple(old_order)
+        self.new_order: Tuple[int, ...] = tuple(new_order)
+        self.detail_page: Optional['DetailPageWidget'] = _detail_page_of(table)
+
+    @timed()
+    def redo(self):
+        apply_row_order(self.table, self.detail_page, self.new_order)
+
+    @timed()
+    def undo(self):
+        apply_row_order(self.table, self.detail_page, self.old_order)
+
+
+class ReplayCommand(QUndoCommand):
+    """記録した操作 (コマンドのやり直し・元に戻す) を順に適用するコマンド (編集の記録からの復元用)
+
+    operations は (元に戻すか, コマンド) の並び。同じコマンドのやり直しと元に戻すが続くこともある。
+    行の追加のたびに行 ID を振り直させて、記録したときと同じ行 ID になるようにする。
+    元に戻す・やり直すと行 ID の振られる順が最初と変わるので、最初に適用したときの各操作の後の行 ID に揃える
+    (後の操作の並べ替えなどは行 ID で行を指す)。
+    """
+    def __init__(self, table: QTableWidget, operations: Sequence[Tuple[bool, QUndoCommand]],
+                 description: str = "編集の復元"):
+        super().__init__(description)
+        self.table = table
+        self.operations: Tuple[Tuple[bool, QUndoCommand], ...] = tuple(operations)
+        self.detail_page: Optional['DetailPageWidget'] = _detail_page_of(table)
+        self._row_ids: Optional[List[List[int]]] = None # 最初の適用の前と各操作の後の行 ID (変わらなければ同じリスト)
+
+    @staticmethod
+    def _run(undoing: bool, command: QUndoCommand):
+        if undoing:
+            command.undo()
+        else:
+            command.redo()
+
+    def _apply_first(self):
+        engine = self.detail_page.formula_engine
+        row_ids = [engine.row_ids()]
+        for undoing, command in self.operations:
+            self._run(undoing, command)
+            row_ids.append(engine.row_ids())
+        self._row_ids = row_ids
+
+    def _apply(self, steps: Sequence[Tuple[bool, QUndoCommand, List[int]]]):
+        """(元に戻すか, コマンド, 適用後の行 ID) を順に適用する"""
+        engine = self.detail_page.formula_engine
+        for undoing, command, row_ids in steps:
+            self._run(undoing, command)
+            engine.assign_row_ids(row_ids)
+
+    @timed()
+    def redo(self):
+        if self.detail_page is None:
+            for undoing, command in self.operations:
+                self._run(undoing, command)
+            return
+        with self.detail_page.update_scheduler.batch():
+            if self._row_ids is None:
+                self._apply_first()
+            else:
+                self._apply([(undoing, command, self._row_ids[index + 1])
+                             for index, (undoing, command) in enumerate(self.operations)])
+
+    @timed()
+    def undo(self):
+        if self.detail_page is None:
+            for undoing, command in reversed(self.operations):
+                self._run(not undoing, command)
+            return
+        with self.detail_page.update_scheduler.batch():
+            self._apply([(not undoing, command, self._row_ids[index])
+                         for index, (undoing, command) in reversed(list(enumerate(self.operations)))])
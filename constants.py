@@ -16,6 +16,15 @@ COLOR_LIGHT_GRAY = "lightgray"
 COLOR_LIGHT_BLUE = "#ddebf7"  # 合計(税込)ラベル背景
 COLOR_EDIT_DISABLED = "#f0f0f0"  # ReadOnlyのLineEdit背景
 COLOR_ERROR_BG = "pink"       # 入力エラー時の背景色
+COLOR_ERROR_FG = "red"        # 入力エラー時の文字色
+COLOR_MATCH_BG = "#fff2a8"          # 検索に一致したセルの背景
+COLOR_CURRENT_MATCH_BG = "#ffc94d"  # 選択中の一致の背景
+COLOR_CHANGED_MARK = "#e69500"      # 保存後に変えたセルの印 (左上の三角)
+COLOR_PROBLEM_ERROR_BG = "#f8d7da"   # 明細の検査: エラーのあるセル
+COLOR_PROBLEM_WARNING_BG = "#fff3cd" # 明細の検査: 警告のあるセル
+COLOR_DIFF_ADDED_BG = "#e2f0d9"   # 版の比較: 追加した行
+COLOR_DIFF_REMOVED_BG = "#fbe2e2" # 版の比較: 削除した行
+COLOR_DIFF_CHANGED_BG = "#fff2cc" # 版の比較: 変更した行
 STYLE_NO_BORDER = "border: none;"
 
 # 印影画像のパス
@@ -30,68 +39,24 @@ WINDOW_HEIGHT = 768
 
  # データベースファイル名
 DATABASE_FILE_NAME = "estimates.db"
+# 保存していない編集の記録ファイル名 (異常終了の後の復元用。edit_journal.py)
+JOURNAL_FILE_NAME = "estimates.journal"
 
-# ウィジェット共通スタイル
-WIDGET_BASE_STYLE = f"""
-    QWidget {{
-        font-family: '{APP_FONT_FAMILY}';
-        background-color: {COLOR_WHITE}; /* デフォルト背景を白に */
-        font-size: {APP_FONT_SIZE}pt;
-    }}
-    QTableWidget {{
-        background-color: {COLOR_WHITE};
-        {STYLE_NO_BORDER}
-        gridline-color: transparent; /* グリッド線が見えないように */
-    }}
-    QTableWidget::item {{
-        /* {STYLE_NO_BORDER} セルのデフォルト罫線を削除 - テーブル全体で非表示にしているので不要かも */
-        color: black; /* テーブルアイテムのデフォルト文字色を黒に再指定 */
-    }}
-    QTableWidget::item:selected {{
-        background-color: #cceeff; /* 選択行の背景色 (薄い水色) */
-        /* color: black; */       /* 選択行の文字色指定を削除 (setForegroundを優先させる) */
-    }}
-    QTableWidget::item:selected:focus {{ /* 選択かつフォーカスがある場合 */
-        background-color: #cceeff; /* 選択行と同じ背景色を指定 */
-        /* 必要なら文字色も指定: color: black; */
-    }}
-    QLineEdit, QDateEdit {{
-        background-color: {COLOR_WHITE};
-        color: black;
-        border-top: none;
-        border-left: none;
-        border-right: none;
-        border-bottom: 2px solid gray; /* 下線のみ表示 (色はgrayなどお好みで) */
-        padding: 2px; /* 少し内側に余白を持たせると見栄えが良いです */
-    }}
-    QLabel {{
-        color: black; /* 文字色を黒に再指定 */
-        background-color: transparent; /* デフォルト背景を透明に */
-    }}
-    QTextEdit {{ /* QTextEdit (備考欄など) は枠線ありのままにする場合 */
-        background-color: {COLOR_WHITE};
-        color: black;
-        border: 1px solid gray;
-    }}
-    QDateEdit::drop-down {{ /* QDateEdit のドロップダウンボタンの枠線も調整が必要な場合 */
-        border: none; /* ボタンの枠線を消すか、下線に合わせる */
-        /* background-color: transparent; */ /* ボタンの背景を透明にするなど */
-    }}
-    QCheckBox::indicator {{
-         width: 15px;
-         height: 15px;
-         border: 1px solid gray;
-         background-color: {COLOR_LIGHT_GRAY}; /* チェックなしのデフォルト */
-    }}
-    QCheckBox::indicator:checked {{
-         background-color: {COLOR_WHITE}; /* チェックあり */
-         /* image: url(checked.png); なども可能 */
-    }}
-    QHeaderView::section {{ /* テーブルヘッダーのスタイル */
-        background-color: #f0f0f0; /* ヘッダー背景色 (少しグレーに) */
-        color: black;             /* 文字色を黒に */
-        padding: 4px;             /* 内側の余白 */
-        border: 1px solid #d0d0d0; /* 枠線 (少し薄いグレー) */
-        font-weight: bold        /* 文字を太字に (任意) */
-    }}
-"""
+# 明細テーブルのアイテムに保持する独自データのロール (Qt.ItemDataRole.UserRole = 0x0100 を基準)
+VALUE_ROLE = 0x0100  # 数量・単価・金額セルの数値 (Decimal)。表示文字列 "￥1,000" を再パースしないために保持する
+FORMULA_ROLE = VALUE_ROLE + 1  # 数量・単価セルの計算式 ("=12.5*2.8*2-1.8*0.9")。数値で入力したセルは None
+ROW_ID_ROLE = VALUE_ROLE + 2   # 名称セルに保持する行 ID (行の移動・挿入・削除で変わらない。計算式の参照に使う)
+ASSEMBLY_ROLE = VALUE_ROLE + 3 # 名称セルに保持する組み合わせ項目の ID (1行にまとめて入れた行だけ。単価の更新に使う)
+LINE_KEY_ROLE = VALUE_ROLE + 4 # 名称セルに保持する明細行のキー (保存時に付け、複製・改訂版に引き継ぐ。版の比較で行を対応付ける)
+
+# 明細の並べ替えの種類 ((基準, 降順か) -> 表示名)。"input" は入力順 (読み込み・追加した順 = 行 ID の順) に戻す
+DETAIL_SORT_ORDERS = {
+    ("name", False): "名称順",
+    ("unit_price", True): "単価の高い順",
+    ("unit_price", False): "単価の安い順",
+    ("amount", True): "金額の大きい順",
+    ("amount", False): "金額の小さい順",
+    ("input", False): "入力順",
+}
+
+# ウィジェット共通スタイルは theme.py (アプリ全体のスタイルシート) に移動
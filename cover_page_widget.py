@@ -13,11 +13,11 @@ from PySide6.QtGui import QFont, QMouseEvent, QKeyEvent # QKeyEvent をインポ
 # 定数とカスタムウィジェットをインポート
 from constants import (
     APP_FONT_FAMILY, APP_FONT_SIZE, TABLE_ROWS, TABLE_COLS,
-    DEFAULT_COL_WIDTH, DEFAULT_ROW_HEIGHT, TAX_RATE, WIDGET_BASE_STYLE, STYLE_BORDER_BLACK, COLOR_ERROR_BG, # COLOR_ERROR_BG をインポート
-    COLOR_WHITE, COLOR_LIGHT_BLUE, COLOR_EDIT_DISABLED, # 色定数をインポート
+    DEFAULT_COL_WIDTH, DEFAULT_ROW_HEIGHT, TAX_RATE,
     HANKO_IMAGE_PATH # HANKO_IMAGE_PATH は widgets.py で使われるが念のため
 )
 from widgets import ConstructionPeriodWidget, DraggableLabel
+import theme
 
 # --------------------------------------------------------------------------
 # 編集不可セルの選択を防ぐテーブルウィジェット
@@ -144,11 +144,11 @@ class CoverPageWidget(QWidget):
     def __init__(self):
         super().__init__()
         self.resize(900, 550) # ウィジェットの推奨サイズ
+        # 見た目はアプリ全体のスタイルシート (theme.py) で、この objectName を範囲として指定する
+        self.setObjectName(theme.COVER_PAGE_NAME)
 
         # --- 初期化処理の呼び出し ---
         self._setup_table()        # QTableWidget の基本設定
-        self._define_styles()      # スタイルシート文字列の定義
-        self._apply_base_style()   # 基本スタイルをウィジェット全体に適用
         self._create_widgets()     # 個々のウィジェット(ラベル、入力欄など)を作成
         self._setup_layout()       # 作成したウィジェットをテーブルに配置
         self._connect_signals()    # ウィジェットのシグナルとスロットを接続
@@ -168,8 +168,8 @@ class CoverPageWidget(QWidget):
         self.setLayout(main_layout)
 
         # --- 初期状態の必須項目チェック ---
-        self._validate_required_field(self.no_edit.text())
-        self._validate_required_field(self.client_edit.text())
+        self._set_required_error(self.no_edit, not self.no_edit.text().strip())
+        self._set_required_error(self.client_edit, not self.client_edit.text().strip())
 
     # --------------------------------------------------------------------------
     # UI構築ヘルパーメソッド群
@@ -190,37 +190,10 @@ class CoverPageWidget(QWidget):
         for r in range(self.table.rowCount()):
             self.table.setRowHeight(r, DEFAULT_ROW_HEIGHT)
 
-    def _define_styles(self):
-        """個別ウィジェット用のスタイルシート文字列を定義"""
-        self.style_title = f"font-family: '{APP_FONT_FAMILY}'; font-size: 26pt; font-weight: bold;"
-        self.style_client = f"font-family: '{APP_FONT_FAMILY}'; font-size: 18pt; font-weight: bold;"
-
-        # background-color の重複を修正済み
-        self.style_total_label = f"""
-            font-family: '{APP_FONT_FAMILY}'; font-size: 20pt; font-weight: bold;
-            background-color: {COLOR_LIGHT_BLUE}; /* 定数を使用 */
-            border: {STYLE_BORDER_BLACK};
-            padding: 2px;
-        """
-        # background-color の重複を修正済み
-        self.style_total_edit = f"""
-            font-family: '{APP_FONT_FAMILY}'; font-size: 24pt; font-weight: bold;
-            background-color: {COLOR_EDIT_DISABLED}; /* 定数を使用 */
-            border: {STYLE_BORDER_BLACK};
-            padding: 2px;
-        """
-        self.style_price_tax_edit = f"font-family: '{APP_FONT_FAMILY}'; font-size: 12pt; padding: 1px;"
-        self.style_remarks_box = f"border: {STYLE_BORDER_BLACK}; background-color: {COLOR_WHITE};"
-        self.style_border_cell = f"border:{STYLE_BORDER_BLACK}; background-color: {COLOR_WHITE};"
-
-    def _apply_base_style(self):
-        """ウィジェット全体に基本スタイルシートを適用"""
-        self.setStyleSheet(WIDGET_BASE_STYLE)
-
     def _create_widgets(self):
         """主要なウィジェットの作成と初期設定"""
         # --- ヘッダー情報 ---
-        self.title_label = self._create_label("御　見　積　書", align=Qt.AlignCenter, style=self.style_title)
+        self.title_label = self._create_label("御　見　積　書", align=Qt.AlignCenter, role="title")
         self.no_label = self._create_label("見積 No")
         self.no_edit = QLineEdit()
         self.date_label = self._create_label("　見積日")
@@ -234,6 +207,7 @@ class CoverPageWidget(QWidget):
         # --- 宛先 ---
         self.client_edit = QLineEdit()
         self.client_edit.setPlaceholderText("ー　相手先名　ー")
+        theme.set_role(self.client_edit, "client")
         # 宛名は必須項目
         self.client_edit.setProperty("required", True)
         self.client_edit.setProperty("has_error", False) # 初期状態はエラーなし
@@ -241,30 +215,26 @@ class CoverPageWidget(QWidget):
         self.greeting_label = self._create_label("下記の通りお見積り申し上げます。", align=Qt.AlignLeft | Qt.AlignVCenter)
 
         # --- 金額欄 ---
-        style_to_apply_label = getattr(self, 'style_total_label', '')
-        self.total_label = self._create_label("合計(税込)", align=Qt.AlignCenter, style=style_to_apply_label)
+        self.total_label = self._create_label("合計(税込)", align=Qt.AlignCenter, role="totalLabel")
         self.total_label.setAutoFillBackground(True) # 背景色有効化（重複削除済み）
 
-        style_to_apply_edit = getattr(self, 'style_total_edit', '')
         self.total_edit = QLineEdit("￥0")
         self.total_edit.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
         self.total_edit.setReadOnly(True)
-        self.total_edit.setStyleSheet(style_to_apply_edit) # スタイル適用
+        theme.set_role(self.total_edit, "totalEdit")
 
         # --- 工事金額・消費税額 ---
         self.price_label = self._create_label("工事金額")
         self.price_edit = QLineEdit()
         self.price_edit.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
         self.price_edit.setReadOnly(True) # ★★★ この行を追加 ★★★
-        if hasattr(self, 'style_price_tax_edit'):
-            self.price_edit.setStyleSheet(self.style_price_tax_edit)
+        theme.set_role(self.price_edit, "amount")
 
         self.tax_label = self._create_label("消費税額")
         self.tax_edit = QLineEdit()
         self.tax_edit.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
         self.tax_edit.setReadOnly(True)
-        if hasattr(self, 'style_price_tax_edit'):
-             self.tax_edit.setStyleSheet(self.style_price_tax_edit)
+        theme.set_role(self.tax_edit, "amount")
 
         # --- 工事項目 ---
         self.project_name_label = self._create_label("工 事 名", align=Qt.AlignCenter)
@@ -287,13 +257,7 @@ class CoverPageWidget(QWidget):
     # --- 備考欄 ---
         self.remarks_label = self._create_label("備考")
         self.remarks_box = QTextEdit()
-
-    # ↓↓↓ スタイル適用部分を一時的に書き換え ↓↓↓
-    # if hasattr(self, 'style_remarks_box'):
-    #     self.remarks_box.setStyleSheet(self.style_remarks_box)
-    # 上記の代わりに、直接シンプルなスタイルを適用してみる
-        self.remarks_box.setStyleSheet("border: 1px solid black;") # 太くて赤い枠線（目立つように）
-    # ↑↑↑ スタイル適用部分を一時的に書き換え ↑↑↑
+        theme.set_role(self.remarks_box, "remarks")
 
         # --- 会社情報 ---
         self.corp_box = QLabel()
@@ -367,15 +331,8 @@ class CoverPageWidget(QWidget):
         if hasattr(self, 'no_edit'):
             self.no_edit.textChanged.connect(self._validate_required_field)
         if hasattr(self, 'client_edit'):
+            # 未入力時の文字色も has_error プロパティでスタイルシート側が切り替える
             self.client_edit.textChanged.connect(self._validate_required_field)
-            # client_edit はテキスト有無で色も変えるので、スタイル適用も接続
-            self.client_edit.textChanged.connect(self._apply_client_style)
-
-        # 初期スタイル適用 (接続後に行う)
-        if hasattr(self, 'client_edit'):
-            self._apply_client_style() # client_edit の初期スタイル
-        if hasattr(self, 'no_edit'):
-            self._apply_required_style(self.no_edit) # no_edit の初期スタイル
 
         # もし上記の処理も全てコメントアウト/削除していてメソッド内が空になる場合は、
         # 以下のように pass を記述します。
@@ -387,45 +344,17 @@ class CoverPageWidget(QWidget):
 
     @Slot(str)
     def _validate_required_field(self, text: str):
-        """必須項目フィールドの入力値を検証し、スタイルを更新するスロット"""
+        """必須項目フィールドの入力値を検証し、エラー状態を更新するスロット"""
         sender_widget = self.sender()
         if not isinstance(sender_widget, QLineEdit) or not sender_widget.property("required"):
             return # QLineEdit 以外、または必須項目でない場合は無視
 
-        is_empty = not text.strip()
-        has_error_property = sender_widget.property("has_error")
-
-        if is_empty != has_error_property: # エラー状態が変わった場合のみスタイル更新
-            sender_widget.setProperty("has_error", is_empty)
-            if sender_widget == self.client_edit:
-                # client_edit は色変更もあるので専用メソッドでスタイル適用
-                self._apply_client_style()
-            else:
-                # その他の必須項目は共通メソッドでスタイル適用
-                self._apply_required_style(sender_widget)
-
-    def _apply_client_style(self):
-        """client_edit のスタイル（枠線と文字色）を適用する"""
-        if not hasattr(self, 'client_edit'): return
-
-        style = self.style_client # 基本スタイル
-        is_empty = not self.client_edit.text().strip()
-        has_error = self.client_edit.property("has_error")
-
-        if has_error:
-            style += f" border: 1px solid {COLOR_ERROR_BG};" # エラー時は赤い枠線
-            style += " color: lightgray;" # プレースホルダーの色
-        else:
-            # style += " border: 1px solid gray;" # 通常時の枠線 (任意、デフォルトに任せるなら不要)
-            style += f" color: {'lightgray' if is_empty else 'black'};" # テキスト有無で色変更
+        # エラー状態が変わったときだけ再ポリッシュされる (キー入力ごとのスタイル再計算はしない)
+        self._set_required_error(sender_widget, not text.strip())
 
-        self.client_edit.setStyleSheet(style)
-
-    def _apply_required_style(self, widget: QLineEdit):
-        """必須項目QLineEditの枠線スタイルを適用する"""
-        has_error = widget.property("has_error")
-        border_style = f"border: 1px solid {COLOR_ERROR_BG};" if has_error else "" # エラー時のみ赤枠
-        widget.setStyleSheet(border_style)
+    def _set_required_error(self, widget: QLineEdit, has_error: bool):
+        """必須項目のエラー状態 (枠線・文字色はスタイルシートの has_error セレクターで指定)"""
+        theme.set_state(widget, "has_error", has_error)
 
     def _update_totals(self):
         """工事金額入力完了時に消費税額と税込合計を計算・表示"""
@@ -477,6 +406,13 @@ class CoverPageWidget(QWidget):
         return self.period_widget.period_text() if hasattr(self, 'period_widget') else ""
 
     # --- データ設定用メソッド (main.py から呼ばれる) ---
+    def set_project_info(self, project_name: str, client_name: str):
+        """読み込んだ見積の工事名・相手先名を設定する"""
+        if hasattr(self, 'project_name_edit'):
+            self.project_name_edit.setText(project_name or "")
+        if hasattr(self, 'client_edit'):
+            self.client_edit.setText(client_name or "")
+
     def set_totals(self, subtotal: str, tax: str, total: str):
         """明細画面から受け取った金額を設定する"""
         if hasattr(self, 'price_edit'):
@@ -489,8 +425,8 @@ class CoverPageWidget(QWidget):
     # ユーティリティメソッド
     # --------------------------------------------------------------------------
 
-    def _create_label(self, text, align=Qt.AlignLeft, bold=False, font_size=None, style=None) -> QLabel:
-        """QLabel を作成して返すユーティリティ"""
+    def _create_label(self, text, align=Qt.AlignLeft, bold=False, font_size=None, role=None) -> QLabel:
+        """QLabel を作成して返すユーティリティ (role はスタイルシートの themeRole セレクター)"""
         lbl = QLabel(text)
         lbl.setAlignment(align | Qt.AlignVCenter)
         f = lbl.font()
@@ -499,8 +435,8 @@ class CoverPageWidget(QWidget):
         if bold:
             f.setBold(True)
         lbl.setFont(f)
-        if style:
-            lbl.setStyleSheet(style) # Apply specific style if provided
+        if role:
+            theme.set_role(lbl, role)
         return lbl
 
     def _set_widget(self, row, col, widget, span=(1, 1)):
@@ -523,14 +459,8 @@ class CoverPageWidget(QWidget):
         frame.setFrameShape(QFrame.NoFrame)
         # frame.setFrameShadow(QFrame.Plain) # NoFrame の場合 Shadow は影響しないはず
 
-        # スタイルシートで背景色と枠線の両方を定義
-        # (定数 STYLE_BORDER_BLACK と STYLE_BG_WHITE を利用)
-        frame.setStyleSheet(f"""
-            QFrame {{
-                background-color: {COLOR_WHITE}; /* 定数を使用 */
-                border: {STYLE_BORDER_BLACK};
-            }}
-        """)
+        # 背景色と枠線はスタイルシート (theme.py の borderCell) で指定
+        theme.set_role(frame, "borderCell")
         # background-color が確実に描画されるようにする
         frame.setAutoFillBackground(True)
 
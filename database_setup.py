@@ -3,6 +3,48 @@
 import sqlite3
 from constants import DATABASE_FILE_NAME # constants.py からインポート
 
+# 後から追加した details の列 (既存のデータベースには migrate_database で追加する)
+DETAILS_ADDED_COLUMNS = [
+    ("quantity_formula", "TEXT"),   # 数量の計算式 (例: "=12.5*2.8*2-1.8*0.9")。数値で入力した行は NULL
+    ("unit_price_formula", "TEXT"), # 単価の計算式
+    ("assembly_id", "INTEGER"),     # 1行にまとめて入れた組み合わせ項目 (assemblies.id)。通常の行は NULL
+    ("line_key", "TEXT"),           # 明細行のキー。見積の複製・改訂版でも同じ値のまま (版の比較で行を対応付ける)
+]
+
+# 後から追加した estimates の列
+ESTIMATES_ADDED_COLUMNS = [
+    ("is_template", "INTEGER NOT NULL DEFAULT 0"), # 1 ならテンプレート (新しい見積の元にする雛形。project_name がテンプレート名)
+]
+
+# 組み合わせ項目 (例: 外壁シリコン塗装 = 高圧洗浄 + 下塗り + 中塗り + 上塗り + 養生) のカタログ
+# 構成要素は明細行 (名称・単価) か、入れ子の組み合わせ項目 (child_assembly_id) のどちらか。
+# quantity_per_unit は組み合わせ項目の数量 1 (例: 1 m2) あたりの数量
+ASSEMBLY_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS assemblies (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           name_text TEXT NOT NULL,
+           specification_text TEXT,
+           unit_text TEXT,
+           created_at TEXT,
+           updated_at TEXT
+       );""",
+    """CREATE TABLE IF NOT EXISTS assembly_components (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           assembly_id INTEGER NOT NULL,
+           position INTEGER NOT NULL,
+           child_assembly_id INTEGER,
+           name_text TEXT,
+           specification_text TEXT,
+           unit_text TEXT,
+           quantity_per_unit REAL NOT NULL DEFAULT 1,
+           unit_price REAL,
+           FOREIGN KEY (assembly_id) REFERENCES assemblies (id),
+           FOREIGN KEY (child_assembly_id) REFERENCES assemblies (id)
+       );""",
+    """CREATE INDEX IF NOT EXISTS idx_assembly_components_assembly
+           ON assembly_components (assembly_id, position);""",
+]
+
 def create_connection(db_file):
     """ データベースファイルへの接続を作成する """
     conn = None
@@ -22,9 +64,25 @@ def create_table(conn, create_table_sql):
     except sqlite3.Error as e:
         print(f"テーブル作成エラー: {e}")
 
-def setup_database():
+def migrate_database(conn):
+    """ 既存のデータベースに、後から追加した列・テーブルがなければ追加する """
+    existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(details)")}
+    if not existing_columns: # details テーブルがまだない (setup_database で作成される)
+        return
+    for column_name, column_type in DETAILS_ADDED_COLUMNS:
+        if column_name not in existing_columns:
+            conn.execute(f"ALTER TABLE details ADD COLUMN {column_name} {column_type}")
+    existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(estimates)")}
+    for column_name, column_type in ESTIMATES_ADDED_COLUMNS:
+        if column_name not in existing_columns:
+            conn.execute(f"ALTER TABLE estimates ADD COLUMN {column_name} {column_type}")
+    for create_sql in ASSEMBLY_TABLES_SQL:
+        conn.execute(create_sql)
+    conn.commit()
+
+def setup_database(db_file=DATABASE_FILE_NAME):
     """ データベースとテーブルをセットアップする """
-    conn = create_connection(DATABASE_FILE_NAME)
+    conn = create_connection(db_file)
 
     if conn is not None:
         # estimates テーブル作成 SQL (金額カラムの型を REAL に変更)
@@ -40,6 +98,7 @@ def setup_database():
                                             total_amount REAL,
                                             created_at TEXT,
                                             updated_at TEXT,
+                                            is_template INTEGER NOT NULL DEFAULT 0, /* 1 ならテンプレート */
                                             FOREIGN KEY (base_estimate_id) REFERENCES estimates (id)
                                         ); """
 
@@ -55,12 +114,24 @@ def setup_database():
                                         unit_price REAL,
                                         amount REAL,
                                         summary_text TEXT,       /* 「摘要」 - remarks_text から変更 */
+                                        quantity_formula TEXT,   /* 数量の計算式 (数値で入力した場合は NULL) */
+                                        unit_price_formula TEXT, /* 単価の計算式 */
+                                        assembly_id INTEGER,     /* 1行にまとめた組み合わせ項目 */
+                                        line_key TEXT,           /* 明細行のキー (複製・改訂版に引き継ぐ) */
                                         FOREIGN KEY (estimate_id) REFERENCES estimates (id)
                                     );"""
 
+        # 見積を開くときの明細の取得 (WHERE estimate_id = ? ORDER BY row_order) 用のインデックス
+        sql_create_details_index = """CREATE INDEX IF NOT EXISTS idx_details_estimate_row
+                                       ON details (estimate_id, row_order);"""
+
         create_table(conn, sql_create_estimates_table)
         create_table(conn, sql_create_details_table)
-        print(f"データベース '{DATABASE_FILE_NAME}' とテーブルが正常にセットアップされました。")
+        create_table(conn, sql_create_details_index)
+        for create_sql in ASSEMBLY_TABLES_SQL:
+            create_table(conn, create_sql)
+        migrate_database(conn) # 以前のバージョンで作成したデータベース用
+        print(f"データベース '{db_file}' とテーブルが正常にセットアップされました。")
         conn.close()
     else:
         print("エラー！データベース接続を作成できませんでした。")
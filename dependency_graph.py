@@ -0,0 +1,128 @@
+# dependency_graph.py
+"""セル間の依存関係 (計算式の参照) を表す有向グラフ
+
+変更されたセルから下流 (そのセルを参照しているセル) だけを集め、トポロジカル順に並べる。
+循環参照になっているセルは循環を断ち切った位置に並べ、循環上のノードとして別にも返す。
+"""
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+Node = Hashable
+ExtraDependents = Optional[Callable[[Node], Iterable[Node]]]
+
+
+class DependencyGraph:
+    """ノード -> 依存先 (参照しているノード) と、その逆向き (依存元) の両方を保持するグラフ
+
+    extra_dependents には、グラフに辺として持たない暗黙の依存 (例: 数量 -> 同じ行の金額) を返す関数を渡せる。
+    """
+
+    def __init__(self):
+        self._dependencies: Dict[Node, Set[Node]] = {}
+        self._dependents: Dict[Node, Set[Node]] = {}
+
+    def __len__(self) -> int:
+        return len(self._dependencies)
+
+    def __contains__(self, node: Node) -> bool:
+        return node in self._dependencies
+
+    def clear(self):
+        self._dependencies.clear()
+        self._dependents.clear()
+
+    def dependencies(self, node: Node) -> Set[Node]:
+        return self._dependencies.get(node, set())
+
+    def dependents(self, node: Node) -> Set[Node]:
+        return self._dependents.get(node, set())
+
+    def set_dependencies(self, node: Node, dependencies: Iterable[Node]):
+        """node の依存先を置き換える (空なら node をグラフから外す)"""
+        new_dependencies = set(dependencies)
+        old_dependencies = self._dependencies.pop(node, set())
+        for dependency in old_dependencies - new_dependencies:
+            dependents = self._dependents.get(dependency)
+            if dependents is not None:
+                dependents.discard(node)
+                if not dependents:
+                    del self._dependents[dependency]
+        for dependency in new_dependencies - old_dependencies:
+            self._dependents.setdefault(dependency, set()).add(node)
+        if new_dependencies:
+            self._dependencies[node] = new_dependencies
+
+    def _downstream(self, node: Node, extra_dependents: ExtraDependents) -> Iterable[Node]:
+        downstream = self._dependents.get(node, ())
+        if extra_dependents is None:
+            return downstream
+        return [*downstream, *extra_dependents(node)]
+
+    def is_in_cycle(self, node: Node, extra_dependents: ExtraDependents = None) -> bool:
+        """node から依存元をたどって node 自身に戻るかどうか"""
+        stack = list(self._downstream(node, extra_dependents))
+        visited = set()
+        while stack:
+            current = stack.pop()
+            if current == node:
+                return True
+            if current in visited:
+                continue
+            visited.add(current)
+            stack.extend(self._downstream(current, extra_dependents))
+        return False
+
+    def affected_order(self, changed: Iterable[Node],
+                       extra_dependents: ExtraDependents = None) -> Tuple[List[Node], Set[Node]]:
+        """changed と、その下流のノードを計算順 (トポロジカル順) に返す
+
+        戻り値は (計算順のノード, 循環参照になっているノード)。循環上のノードも計算順に含め、
+        その下流 (循環の外側) のノードは循環上のノードの後に並べる。
+        """
+        # 1. 影響を受けるノードを集める
+        affected = set()
+        stack = list(changed)
+        while stack:
+            node = stack.pop()
+            if node in affected:
+                continue
+            affected.add(node)
+            stack.extend(self._downstream(node, extra_dependents))
+
+        # 2. 影響範囲の中だけで入次数を数え、Kahn 法で並べる
+        in_degree = dict.fromkeys(affected, 0)
+        for node in affected:
+            for dependent in self._downstream(node, extra_dependents):
+                in_degree[dependent] += 1
+        order: List[Node] = []
+        placed: Set[Node] = set()
+        cyclic: Set[Node] = set()
+        queue = deque(node for node, degree in in_degree.items() if degree == 0)
+
+        def release(node: Node):
+            for dependent in self._downstream(node, extra_dependents):
+                if dependent in placed:
+                    continue
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+
+        while True:
+            while queue:
+                node = queue.popleft()
+                order.append(node)
+                placed.add(node)
+                release(node)
+            if len(placed) == len(affected):
+                break
+            # 3. 残ったノードは循環上か、その下流。循環上のノードを並べてから下流を続けて並べる
+            cycle_nodes = [node for node in affected
+                           if node not in placed and self.is_in_cycle(node, extra_dependents)]
+            if not cycle_nodes:
+                break
+            order.extend(cycle_nodes)
+            placed.update(cycle_nodes)
+            cyclic.update(cycle_nodes)
+            for node in cycle_nodes:
+                release(node)
+        return order, cyclic
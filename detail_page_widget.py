@@ -4,6 +4,7 @@ import os
 import csv
 import pickle
 import sqlite3
+import uuid
 from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation # InvalidOperation もインポート
 
@@ -18,22 +19,44 @@ from PySide6.QtCore import (
 )
 from PySide6.QtGui import (
     QPalette, QColor, QDropEvent, QDragEnterEvent, QDragMoveEvent,
-    QContextMenuEvent, QAction, QKeySequence, QBrush, QDrag, QMouseEvent, QKeyEvent
+    QContextMenuEvent, QAction, QKeySequence, QDrag, QMouseEvent, QKeyEvent
 )
 
-from typing import List, Optional, Callable, Union, Type, Dict, Any, Tuple
+from typing import List, Optional, Callable, Set, Dict, Any, Tuple
 
 from constants import (
-    WIDGET_BASE_STYLE, COLOR_LIGHT_GRAY, COLOR_WHITE, COLOR_ERROR_BG,
-    DATABASE_FILE_NAME, TAX_RATE
+    DATABASE_FILE_NAME, DETAIL_SORT_ORDERS, VALUE_ROLE, FORMULA_ROLE, ROW_ID_ROLE, ASSEMBLY_ROLE,
+    LINE_KEY_ROLE
 )
 from commands import (
-    AddRowCommand, InsertRowCommand, RemoveRowCommand, ChangeItemCommand,
+    AddRowCommand, InsertRowCommand, RemoveRowCommand, ChangeItemCommand, ChangeMultipleItemsCommand,
     DuplicateRowCommand, RemoveMultipleRowsCommand, DuplicateMultipleRowsCommand,
-    MoveMultipleRowsCommand
+    MoveMultipleRowsCommand, ReorderRowsCommand, FillCellsCommand, InsertRowsCommand, format_cell_text,
+    snapshot_item_data
 )
 
-from utils import format_currency, format_quantity, parse_number
+from utils import format_currency
+from number_format import NumberFormat, column_format, format_many, parse_many, to_decimal
+from formula import FormulaError, evaluate_many, has_references, is_formula
+from formula_engine import FormulaEngine
+from assembly_catalog import (
+    Assembly, AssemblyCatalog, AssemblyComponent, AssemblyError, load_catalog, save_assembly
+)
+from price_adjustment import PriceAdjustment
+from quantity_takeoff import QuantityTakeoff
+from find_replace import FindReplaceBar
+from row_filter import RowFilterBar
+from text_index import TextIndex
+from input_order import InputOrder
+from database_setup import migrate_database
+from estimate_repricing import estimate_totals
+from update_scheduler import UpdateFlag, UpdateScheduler
+from selection_summary import SelectionSummary
+from validation import ERROR, RowValidator
+from cell_states import CHANGED, INVALID, PROBLEM_ERROR, PROBLEM_WARNING, CellStateDelegate, CellStates
+from edit_journal import EditJournal
+from perf import timed
+import theme
 
 # (DraggableTableWidget クラスは変更なしのため、ここでは省略します)
 # (もし DraggableTableWidget が別ファイルなら、このファイルから削除しても構いません)
@@ -54,27 +77,25 @@ class DraggableTableWidget(QTableWidget):
         self.setDragDropMode(QAbstractItemView.DragDropMode.DragDrop)
         self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-    def _get_row_data_for_drag(self, row: int) -> List[Optional[Union[QTableWidgetItem, Tuple[Type[QComboBox], Dict[str, Any]]]]]:
+    def _get_row_data_for_drag(self, row: int) -> List[Optional[Dict[str, Any]]]:
         data = []
         for col in range(self.columnCount()):
-            widget = self.cellWidget(row, col)
             item = self.item(row, col)
-            if widget and isinstance(widget, QComboBox):
-                data.append((type(widget), {'currentText': widget.currentText()}))
-            elif item:
+            if item:
                 try:
                     flags_val = item.flags().value
                     alignment_val = item.textAlignment()
-                    data.append({'text': item.text(), 'flags': flags_val, 'textAlignment': alignment_val})
+                    data.append({'text': item.text(), 'flags': flags_val, 'textAlignment': alignment_val, **snapshot_item_data(item)})
                 except TypeError: # エラー処理は簡略化
-                    data.append({'text': item.text(), 'flags': None, 'textAlignment': None})
+                    data.append({'text': item.text(), 'flags': None, 'textAlignment': None, **snapshot_item_data(item)})
             else:
                 data.append(None)
         return data
     def startDrag(self, supportedActions: Qt.DropAction):
         selected_indexes = self.selectedIndexes()
         if not selected_indexes: return
-        selected_rows_indices = sorted(list(set(idx.row() for idx in selected_indexes)))
+        # 絞り込みで隠れている行はドラッグしない
+        selected_rows_indices = sorted(set(idx.row() for idx in selected_indexes if not self.isRowHidden(idx.row())))
         if not selected_rows_indices: return
         drag_data_payload = [self._get_row_data_for_drag(row_idx) for row_idx in selected_rows_indices]
         mime_data = QMimeData()
@@ -147,7 +168,7 @@ class DraggableTableWidget(QTableWidget):
         else: super().keyPressEvent(event)
     def contextMenuEvent(self, event: QContextMenuEvent):
         from PySide6.QtWidgets import QMenu
-        menu = QMenu(self); menu.setStyleSheet("color: black;")
+        menu = QMenu(self)
         index = self.indexAt(event.pos())
         clicked_row = index.row() if index.isValid() else -1
         add_action = QAction("行追加", self); remove_action = QAction("行削除", self); duplicate_action = QAction("複写", self)
@@ -162,10 +183,57 @@ class DraggableTableWidget(QTableWidget):
 # --------------------------------------------------------------------------
 # 明細ページウィジェット
 # --------------------------------------------------------------------------
+class FormulaItemDelegate(CellStateDelegate):
+    """数量・単価セルの編集時に、計算結果ではなく計算式を編集欄に表示するデリゲート"""
+    def __init__(self, display_text: Callable[[str], str], states: CellStates,
+                 row_id_of: Callable[[QModelIndex], Optional[int]], parent=None):
+        super().__init__(states, row_id_of, parent)
+        self._display_text = display_text # 行 ID による参照を行番号の形にする
+
+    def setEditorData(self, editor: QWidget, index: QModelIndex):
+        formula_text = index.data(FORMULA_ROLE)
+        if formula_text and isinstance(editor, QLineEdit):
+            editor.setText(self._display_text(formula_text))
+            return
+        super().setEditorData(editor, index)
+
+
+class UnitItemDelegate(CellStateDelegate):
+    """単位セルの編集時だけ、単位の一覧から選べるコンボボックスを出すデリゲート"""
+    def __init__(self, create_editor: Callable[[QWidget], QComboBox], states: CellStates,
+                 row_id_of: Callable[[QModelIndex], Optional[int]], parent=None):
+        super().__init__(states, row_id_of, parent)
+        self._create_editor = create_editor
+
+    def createEditor(self, parent: QWidget, option, index: QModelIndex) -> QWidget:
+        combo = self._create_editor(parent)
+        combo.activated.connect(lambda: self._commit_and_close(combo)) # 一覧から選んだらすぐ反映する
+        return combo
+
+    def _commit_and_close(self, editor: QComboBox):
+        self.commitData.emit(editor)
+        self.closeEditor.emit(editor)
+
+    def setEditorData(self, editor: QWidget, index: QModelIndex):
+        if isinstance(editor, QComboBox):
+            editor.setCurrentText(index.data() or "")
+            return
+        super().setEditorData(editor, index)
+
+    def setModelData(self, editor: QWidget, model, index: QModelIndex):
+        if isinstance(editor, QComboBox):
+            if editor.currentText() != (index.data() or ""): # 変わらなければ cellChanged を出さない
+                model.setData(index, editor.currentText())
+            return
+        super().setModelData(editor, model, index)
+
+
 class DetailPageWidget(QWidget):
     cover_requested = Signal()
-    status_message_requested = Signal(str)
+    status_message_requested = Signal(str, int) # (メッセージ, 表示時間ms。0 なら消去されるまで表示)
     screen_flash_requested = Signal()
+    totals_changed = Signal(str, str, str) # (工事金額, 消費税額, 合計) 表紙への反映用
+    action_states_changed = Signal()
 
     # --- 列定義の変更 ---
     COL_NAME = 0
@@ -178,34 +246,73 @@ class DetailPageWidget(QWidget):
     NUM_COLS = 7
 
     HEADERS = ["名称", "仕様", "数量", "単位", "単価", "金額", "摘要"]
+    # 数値列の表示形式の名前 (number_format.column_format で桁数などを取得する)
+    NUMBER_FORMAT_NAMES = {COL_QUANTITY: "quantity", COL_UNIT_PRICE: "unit_price", COL_AMOUNT: "amount"}
     INITIAL_WIDTHS = [180, 220, 70, 60, 90, 100, 180] # 幅を調整
 
     def __init__(self, undo_stack, parent=None):
         super().__init__(parent)
+        # 見た目はアプリ全体のスタイルシート (theme.py) で、この objectName を範囲として指定する
+        self.setObjectName(theme.DETAIL_PAGE_NAME)
         self.undo_stack = undo_stack
         self.is_editing = False
         self.current_editing_cell: Optional[Tuple[int, int]] = None
         self.old_text: Optional[str] = None
         self.db_file_path = os.path.join(os.getcwd(), DATABASE_FILE_NAME)
+        self._migrated_db_paths = set() # 後から追加した列を確認済みのデータベース
         self.current_estimate_id: Optional[int] = None
-        self.last_error_info = None
+        # 組み合わせ項目のカタログ (最初に使うときに db_file_path から読む。積み上げ単価のメモもここに持つ)
+        self._assembly_catalog: Optional[AssemblyCatalog] = None
+        self._assembly_catalog_path: Optional[str] = None
         self.unit_list = self._load_units()
+        # (合計, 工事金額, 消費税額) の表示用文字列。再計算時にのみ更新する
+        self._totals_text: Tuple[str, str, str] = ("---", "---", "---")
+        # 金額の合計 (金額の変更は差分で加減算する。None なら次の集計で全行を数え直す)
+        self._amount_sum: Optional[Decimal] = None
+
+        # --- 再計算・再描画のスケジューラ ---
+        # 変更のたびに合計を計算し直すのではなく、ダーティフラグを立てて
+        # イベントループ1周 (またはバッチ終了時) に1回だけ反映する
+        self.update_scheduler = UpdateScheduler(self)
+        self.update_scheduler.add_handler(UpdateFlag.FORMULAS, self._recalculate_formulas)
+        self.update_scheduler.add_handler(UpdateFlag.TOTALS, self._update_detail_totals)
+        self.update_scheduler.add_handler(UpdateFlag.HEADER, self._render_header_totals)
+        self.update_scheduler.add_handler(UpdateFlag.COVER_TOTALS, self._emit_totals_changed)
+        self.update_scheduler.add_handler(UpdateFlag.ACTION_STATES, self.action_states_changed.emit)
+        self.update_scheduler.add_handler(UpdateFlag.SELECTION_STATUS, self._emit_selection_status)
+        self.update_scheduler.add_handler(UpdateFlag.CHANGED_CELLS, self._mark_changed_cells)
+        # 値を変えたセルの範囲 (先頭行, 末尾行, 先頭列, 末尾列)。次の更新で行 ID に直して印を付ける
+        self._changed_ranges: List[Tuple[int, int, int, int]] = []
+        self._selection_status_shown = False
+        if self.undo_stack:
+            # push/undo/redo いずれでも indexChanged が発行されるので、ここでまとめて再計算を予約する
+            self.undo_stack.indexChanged.connect(self._on_undo_stack_index_changed)
 
         palette = self.palette()
         palette.setColor(QPalette.ColorRole.Window, QColor('white'))
         self.setPalette(palette)
         self.setAutoFillBackground(True)
 
-        detail_page_style = WIDGET_BASE_STYLE + f"""
-                QTableWidget {{
-                    alternate-background-color: {COLOR_LIGHT_GRAY};
-                }}
-        """
-        self.setStyleSheet(detail_page_style)
-
+        # 保存していない編集の記録 (異常終了の後の復元用)。記録を始めるのは main が前回の記録を確かめた後
+        self.edit_journal = EditJournal(self)
         self._setup_ui()
+        # 絞り込み中は表示中の行の小計も合計と一緒に計算し直す
+        self.update_scheduler.add_handler(UpdateFlag.TOTALS, self.row_filter.update_summary)
+        # 選択状態は差分で集計する (selectedIndexes() を毎回作らない)
+        self.selection_summary = SelectionSummary(self.table, self.COL_AMOUNT, self._amount_value_at_row, self)
+        self.selection_summary.changed.connect(self._on_selection_summary_changed)
+        # 明細の検査 (入力漏れ・数量 0・単価の外れ値・重複行)。ワーカースレッドで行い、結果はセルの状態の印にする
+        self.row_validator = RowValidator(self)
+        self.row_validator.reset(self.db_file_path, self.current_estimate_id)
+        self.row_validator.changed.connect(self._on_validation_changed)
         self.table.cellPressed.connect(self._on_cell_pressed)
         self.table.cellChanged.connect(self._on_cell_changed)
+        model = self.table.model()
+        model.dataChanged.connect(self._on_model_data_changed) # 保存後に変えたセルの印
+        if self.undo_stack is not None: # Undo で保存した時点に戻ったら印を消す
+            self.undo_stack.cleanChanged.connect(self._on_clean_changed)
+        for structural_signal in (model.rowsInserted, model.rowsRemoved, model.modelReset):
+            structural_signal.connect(self._invalidate_amount_sum)
 
         if hasattr(self, 'table'):
             self.table.context_action_requested.connect(self._handle_context_action)
@@ -228,12 +335,31 @@ class DetailPageWidget(QWidget):
         header_frame = self._create_header_widget()
         self.table = DraggableTableWidget() # DraggableTableWidget を使用
         self.table.undo_stack = self.undo_stack
+        # 行 ID の管理と、他の行を参照する計算式の再計算
+        self.formula_engine = FormulaEngine(self)
+        # 拾い出しモード (仕様の寸法から数量を求める。既定では無効)
+        self.quantity_takeoff = QuantityTakeoff(self)
+        # セルの状態 (入力エラー・検査の結果・検索の一致・保存後の変更) のビットフラグ。デリゲートが描画時に読む
+        self.cell_states = CellStates(self)
+        self.cell_states.changed.connect(self.table.viewport().update)
+        self._tracking_changes = True # False の間 (読み込み中) は変えたセルに印を付けない
+        # 文字列・数値の列の検索用インデックス (検索と置換・絞り込み表示で共用する)
+        self.text_index = TextIndex(self, (self.COL_NAME, self.COL_SPECIFICATION, self.COL_SUMMARY),
+                                    (self.COL_QUANTITY, self.COL_UNIT_PRICE, self.COL_AMOUNT))
+        # 並べ替えの「入力順」で戻す行の順 (追加・複写・移動は反映し、名称順などの並べ替えでは変えない)
+        self.input_order = InputOrder(self)
+        # 検索と置換 (Ctrl+F / Ctrl+H で表示する)
+        self.find_bar = FindReplaceBar(self)
+        # 絞り込み表示 (Ctrl+Shift+L で表示する。条件に合わない行を隠すだけで、行は変えない)
+        self.row_filter = RowFilterBar(self)
         self._configure_table()
 
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(5, 5, 5, 5)
         main_layout.setSpacing(10)
         main_layout.addWidget(header_frame)
+        main_layout.addWidget(self.find_bar)
+        main_layout.addWidget(self.row_filter)
         main_layout.addWidget(self.table)
         self.setLayout(main_layout)
 
@@ -247,6 +373,17 @@ class DetailPageWidget(QWidget):
             header.resizeSection(i, width)
 
         self.table.setAlternatingRowColors(True)
+        # セルの状態 (入力エラー・検索の一致など) の背景・文字色・印はデリゲートが描画時に付ける
+        self.item_delegate = CellStateDelegate(self.cell_states, self._row_id_at, self.table)
+        self.table.setItemDelegate(self.item_delegate)
+        # 単位は文字列のアイテムで持ち、編集するときだけコンボボックスを出す (行ごとにウィジェットを作らない)
+        self.unit_delegate = UnitItemDelegate(self._create_unit_combobox, self.cell_states, self._row_id_at, self.table)
+        self.table.setItemDelegateForColumn(self.COL_UNIT, self.unit_delegate)
+        # 数量・単価は計算式で入力できる (編集時は計算式を表示する)
+        self.formula_delegate = FormulaItemDelegate(self.formula_engine.display_text, self.cell_states, self._row_id_at,
+                                                    self.table)
+        self.table.setItemDelegateForColumn(self.COL_QUANTITY, self.formula_delegate)
+        self.table.setItemDelegateForColumn(self.COL_UNIT_PRICE, self.formula_delegate)
         # DraggableTableWidget側で設定済みなので不要
         # self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.table.horizontalHeader().setVisible(True)
@@ -257,38 +394,93 @@ class DetailPageWidget(QWidget):
             {"name": "テスト名称2", "specification": "標準品", "quantity": 5.0, "unit": "個", "unit_price": 500.0, "summary": ""},
         ]
 
-        self.table.setRowCount(len(test_data)) # 初期行数をテストデータに合わせる
+        self.set_detail_rows(test_data) # 初期行数をテストデータに合わせる
+        self.edit_journal.restart(None, test_data)
+
+    def set_detail_rows(self, detail_rows: List[Dict[str, Any]]):
+        """明細テーブルの内容を detail_rows で置き換える
+
+        各要素は name / specification / quantity / unit / unit_price / summary を持つ辞書。
+        quantity_formula / unit_price_formula があれば、その計算式の結果を数量・単価にする。
+        """
+        # 数値列はまとめて解析・整形する (同じ値の整形・同じ式の解析はキャッシュされる)
+        quantity_formulas = [data_row.get("quantity_formula") for data_row in detail_rows]
+        unit_price_formulas = [data_row.get("unit_price_formula") for data_row in detail_rows]
+        quantities = self._evaluate_column(detail_rows, "quantity", quantity_formulas, self.COL_QUANTITY)
+        unit_prices = self._evaluate_column(detail_rows, "unit_price", unit_price_formulas, self.COL_UNIT_PRICE)
+        amounts = [quantity * unit_price for quantity, unit_price in zip(quantities, unit_prices)]
+        quantity_texts = format_many(quantities, self._number_format(self.COL_QUANTITY))
+        unit_price_texts = format_many(unit_prices, self._number_format(self.COL_UNIT_PRICE))
+        amount_texts = format_many(amounts, self._number_format(self.COL_AMOUNT))
+
+        self.row_filter.reset()
+        self.text_index.clear() # 検索用インデックスは次の検索で作り直す
+        self.input_order.reset()
+        self.cell_states.clear()
+        self._changed_ranges = []
+        self.find_bar.reset()
+        self._tracking_changes = False
+        self.table.setRowCount(len(detail_rows))
+        self._amount_sum = None
+        row_ids = self.formula_engine.reset(len(detail_rows))
+        reference_cells = [] # 他の行を参照する計算式のセル (全行を設定した後に依存関係の順に計算する)
         self.table.blockSignals(True)
-        for row, data_row in enumerate(test_data): # 変数名変更
-            name_item = QTableWidgetItem(data_row["name"])
-            specification_item = QTableWidgetItem(data_row["specification"])
-            quantity_item = QTableWidgetItem(format_quantity(data_row["quantity"])) # utils.format_quantity を使用
-            unit_price_item = QTableWidgetItem(format_currency(data_row["unit_price"])) # utils.format_currency を使用
-            summary_item = QTableWidgetItem(data_row["summary"])
+        for row, data_row in enumerate(detail_rows): # 変数名変更
+            name_item = QTableWidgetItem(data_row.get("name") or "")
+            name_item.setData(ROW_ID_ROLE, row_ids[row])
+            if data_row.get("assembly_id") is not None:
+                name_item.setData(ASSEMBLY_ROLE, data_row["assembly_id"])
+            if data_row.get("line_key") is not None:
+                name_item.setData(LINE_KEY_ROLE, data_row["line_key"])
+            specification_item = QTableWidgetItem(data_row.get("specification") or "")
+            quantity_item = QTableWidgetItem(quantity_texts[row])
+            quantity_item.setData(VALUE_ROLE, quantities[row])
+            if quantity_formulas[row]:
+                quantity_item.setData(FORMULA_ROLE, quantity_formulas[row])
+                if has_references(quantity_formulas[row]):
+                    reference_cells.append((row, self.COL_QUANTITY))
+            unit_price_item = QTableWidgetItem(unit_price_texts[row])
+            unit_price_item.setData(VALUE_ROLE, unit_prices[row])
+            if unit_price_formulas[row]:
+                unit_price_item.setData(FORMULA_ROLE, unit_price_formulas[row])
+                if has_references(unit_price_formulas[row]):
+                    reference_cells.append((row, self.COL_UNIT_PRICE))
+            summary_item = QTableWidgetItem(data_row.get("summary") or "")
 
             quantity_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
             unit_price_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
 
-            # 金額計算 (Decimalで行うのが望ましいが、ここではfloatで)
-            try:
-                amount_val = Decimal(str(data_row["quantity"])) * Decimal(str(data_row["unit_price"]))
-            except InvalidOperation:
-                amount_val = Decimal('0')
-            amount_item = QTableWidgetItem(format_currency(amount_val))
+            # 金額計算はDecimalで行う
+            amount_val = amounts[row]
+            amount_item = QTableWidgetItem(amount_texts[row])
+            amount_item.setData(VALUE_ROLE, amount_val)
             amount_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
             amount_item.setFlags(amount_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
 
             self.table.setItem(row, self.COL_NAME, name_item)
             self.table.setItem(row, self.COL_SPECIFICATION, specification_item)
             self.table.setItem(row, self.COL_QUANTITY, quantity_item)
-            unit_combo = self._create_unit_combobox()
-            unit_combo.setCurrentText(data_row.get("unit", ""))
-            self.table.setCellWidget(row, self.COL_UNIT, unit_combo)
+            self.table.setItem(row, self.COL_UNIT, QTableWidgetItem(data_row.get("unit") or ""))
             self.table.setItem(row, self.COL_UNIT_PRICE, unit_price_item)
             self.table.setItem(row, self.COL_AMOUNT, amount_item)
             self.table.setItem(row, self.COL_SUMMARY, summary_item)
         self.table.blockSignals(False)
-        self._update_detail_totals() # 初期データ設定後に合計を更新
+        if reference_cells:
+            self.formula_engine.load_formulas(reference_cells)
+        self._tracking_changes = True
+        self.request_update(UpdateFlag.TOTALS) # 初期データ設定後に合計を更新
+        self.quantity_takeoff.request_all() # 拾い出しモードなら全行を少しずつ拾い出す
+
+    def _evaluate_column(self, detail_rows: List[Dict[str, Any]], key: str,
+                         formulas: List[Optional[str]], col: int) -> List[Decimal]:
+        """数値列の値をまとめて求める (計算式があれば計算し、表示桁数に丸める)"""
+        values = parse_many(data_row.get(key) for data_row in detail_rows)
+        if any(formulas):
+            number_format = self._number_format(col)
+            for row, result in enumerate(evaluate_many(formulas)):
+                if result is not None: # 計算できない式は保存されている値を使う
+                    values[row] = number_format.round(result)
+        return values
 
     def _create_header_widget(self) -> QWidget:
         # (変更なしのため省略 - 前回のコードを参照)
@@ -305,9 +497,8 @@ class DetailPageWidget(QWidget):
         self.subtotal_value = QLabel("---")
         self.tax_label = QLabel("消費税額:")
         self.tax_value = QLabel("---")
-        value_style = "font-weight: bold;"
         for label_widget in [self.project_name_value, self.client_name_value, self.period_value, self.total_value, self.subtotal_value, self.tax_value]:
-            label_widget.setStyleSheet(value_style)
+            theme.set_role(label_widget, "headerValue") # 太字 (theme.py)
         main_h_layout = QHBoxLayout(); main_h_layout.setContentsMargins(0,0,0,5); main_h_layout.setSpacing(20)
         left_v_layout = QVBoxLayout(); left_v_layout.setSpacing(5)
         for label_widget, value_widget in [(self.project_name_label, self.project_name_value), (self.client_name_label, self.client_name_value), (self.period_label, self.period_value)]:
@@ -331,43 +522,23 @@ class DetailPageWidget(QWidget):
         self.subtotal_value.setText(subtotal if subtotal else "---") # main.py から "---" が渡される
         self.tax_value.setText(tax if tax else "---") # main.py から "---" が渡される
 
-    def _create_unit_combobox(self) -> QComboBox:
-        # (変更なしのため省略 - 前回のコードを参照)
-        combo = QComboBox(); combo.addItems(self.unit_list); combo.setEditable(True)
+    def _create_unit_combobox(self, parent: Optional[QWidget] = None) -> QComboBox:
+        """単位セルの編集用のコンボボックス (UnitItemDelegate が編集を始めたときに作る)"""
+        combo = QComboBox(parent); combo.addItems(self.unit_list); combo.setEditable(True)
         combo.setInsertPolicy(QComboBox.InsertPolicy.NoInsert); completer = QCompleter(self.unit_list)
         completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive); completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        combo.setCompleter(completer); combo.view().setStyleSheet("color: black; background-color: white;"); combo.setStyleSheet("color: black;")
-        combo.currentTextChanged.connect(self._on_unit_changed)
+        combo.setCompleter(completer)
+        # 文字色・ポップアップの色はアプリ全体のスタイルシート (theme.py) で指定する
+        # (編集のたびに setStyleSheet すると、そのたびにスタイルシートの解析が走る)
         return combo
 
     @Slot(int, int)
     def _on_cell_pressed(self, row, col):
         # (変更なしのため省略 - 前回のコードを参照)
         self.current_editing_cell = (row, col); self.is_editing = True
-        if col == self.COL_UNIT:
-            widget = self.table.cellWidget(row, col)
-            if isinstance(widget, QComboBox): self.old_text = widget.currentText()
-        else:
-            item = self.table.item(row, col)
-            if item and (item.flags() & Qt.ItemFlag.ItemIsEditable): self.old_text = item.text()
-            else: self.is_editing = False; self.current_editing_cell = None
-
-    @Slot(str)
-    def _on_unit_changed(self, new_text: str):
-        # (変更なしのため省略 - 前回のコードを参照)
-        sender_combo = self.sender()
-        if not isinstance(sender_combo, QComboBox) or not self.is_editing: return
-        row = -1
-        for r in range(self.table.rowCount()):
-            if self.table.cellWidget(r, self.COL_UNIT) == sender_combo: row = r; break
-        if row == -1 or self.current_editing_cell != (row, self.COL_UNIT): return
-        if hasattr(self, 'old_text') and self.old_text is not None and self.old_text != new_text:
-            command = ChangeItemCommand(self.table, row, self.COL_UNIT, self.old_text, new_text)
-            if self.undo_stack: self.undo_stack.push(command)
-            else: command.redo()
-        # _on_cell_changed が呼ばれるので、そこで _update_detail_totals() がトリガーされるはず
-        # もし QComboBox の変更が _on_cell_changed をトリガーしない場合は、ここで直接呼ぶ
-        self._update_detail_totals()
+        item = self.table.item(row, col)
+        if item and (item.flags() & Qt.ItemFlag.ItemIsEditable): self.old_text = item.data(FORMULA_ROLE) or item.text()
+        else: self.is_editing = False; self.current_editing_cell = None
 
 
     @Slot(str, int)
@@ -379,23 +550,20 @@ class DetailPageWidget(QWidget):
             self.add_row()
         elif action_name == 'remove':
             if row >= 0:
-                selected_indexes = self.table.selectedIndexes()
-                is_clicked_row_selected = any(idx.row() == row for idx in selected_indexes)
+                is_clicked_row_selected = self.selection_summary.is_row_selected(row)
                 if not is_clicked_row_selected: self.table.clearSelection(); self.table.selectRow(row)
                 self.remove_row()
         elif action_name == 'duplicate':
             if row >= 0:
-                selected_indexes = self.table.selectedIndexes()
-                is_clicked_row_selected = any(idx.row() == row for idx in selected_indexes)
+                is_clicked_row_selected = self.selection_summary.is_row_selected(row)
                 if not is_clicked_row_selected: self.table.clearSelection(); self.table.selectRow(row)
                 self.duplicate_row()
 
 
     @Slot(int, int)
+    @timed()
     def _on_cell_changed(self, row, col):
-        # 編集中でない、または編集対象セルと一致しない場合は早期リターン
-        # ただし、QComboBox(単位列)の場合は is_editing が先にFalseになることがあるので、
-        # current_editing_cell が一致していれば処理を続けるようにする
+        # 編集中でない、かつ編集対象セルと一致しない場合は早期リターン
         if not self.is_editing and self.current_editing_cell != (row, col):
             # プログラムによる変更で、かつ合計更新が必要な列の場合のみ対応するなどの考慮も可能
             # ここでは、ユーザー起因でない変更は基本的に無視するか、別途ハンドリング
@@ -405,12 +573,6 @@ class DetailPageWidget(QWidget):
                  pass # 今回はユーザー編集起因の問題に絞る
             return
 
-        if col == self.COL_UNIT: # 単位列の変更は _on_unit_changed で処理済みと仮定
-            self.is_editing = False
-            self.current_editing_cell = None
-            # _on_unit_changed で _update_detail_totals が呼ばれていることを確認
-            return
-
         item = self.table.item(row, col)
         if not item: return
 
@@ -424,51 +586,31 @@ class DetailPageWidget(QWidget):
         is_valid_input = True
 
         if col == self.COL_QUANTITY or col == self.COL_UNIT_PRICE:
+            row_id = self.formula_engine.row_id(row)
+            had_error = self.cell_states.has(row_id, col, INVALID)
             try:
-                # utils.parse_number を使って文字列を数値(float)に変換
-                value = parse_number(current_text_in_item)
-                # ここで value に対する追加のバリデーション（例: マイナス値でないか等）も可能
-
-                # エラー表示をクリア (バリデーション成功時)
-                default_bg_brush = self.table.palette().base()
-                default_fg_brush = self.table.palette().text()
-                item.setBackground(default_bg_brush)
-                item.setForeground(default_fg_brush)
-                if self.last_error_info and self.last_error_info[:2] == (row, col):
-                    self.last_error_info = None
-                    self.status_message_requested.emit("", 100) # 短時間でクリアメッセージ
+                # 数値 (全角数字・「￥」・カンマなどは正規化) または計算式を評価して、
+                # 表示文字列・保持値・計算式をセルに設定する。コマンドには数値なら整形後の文字列、計算式なら式を渡す
+                # (エラー表示はセルの状態の INVALID で付け外しする)
+                new_text_for_command = self._apply_numeric_input(item, col, current_text_in_item)
+                # ここで値に対する追加のバリデーション（例: マイナス値でないか等）も可能
 
-                # 表示用テキストをフォーマット
-                if col == self.COL_QUANTITY:
-                    formatted_display_text = format_quantity(value)
-                elif col == self.COL_UNIT_PRICE:
-                    formatted_display_text = format_currency(value) # 「￥」付きになる
-
-                # UI上のセルのテキストをフォーマット済みのものに更新
-                # この setText が再度 _on_cell_changed をトリガーするのを防ぐため、
-                # テキストが実際に変更される場合のみ実行し、かつ blockSignals を使用する
-                if item.text() != formatted_display_text:
-                    self.table.blockSignals(True)
-                    item.setText(formatted_display_text)
-                    self.table.blockSignals(False)
-                
-                new_text_for_command = formatted_display_text # コマンドにもフォーマット済みテキストを渡す
+                if had_error: # このセルのエラーのメッセージを消す
+                    self.status_message_requested.emit("", 100) # 短時間でクリアメッセージ
 
-            except ValueError as e: # parse_number がエラーを出すか、追加バリデーションで発生
-                error_bg_color = QColor(COLOR_ERROR_BG)
-                error_fg_color = QColor("red")
-                item.setBackground(error_bg_color)
-                item.setForeground(QBrush(error_fg_color))
+            except ValueError as e: # 計算式の誤り (FormulaError) や追加バリデーションで発生
+                self.cell_states.set_cell(row_id, col, INVALID)
                 error_message = f"行 {row + 1}, 列 '{self.HEADERS[col]}' の入力が無効です: '{current_text_in_item}' ({e})"
                 self.status_message_requested.emit(error_message, 7000)
-                self.last_error_info = (row, col, error_message)
                 # self.screen_flash_requested.emit() # 必要に応じて
                 is_valid_input = False
                 new_text_for_command = current_text_in_item # エラーの場合は元の入力テキストをコマンドに
 
         # 数量と単価列は右寄せ（フォーマット後にも適用されるように）
         if col == self.COL_QUANTITY or col == self.COL_UNIT_PRICE:
+            self.table.blockSignals(True)
             item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.table.blockSignals(False)
 
         # Undo/Redoコマンドの処理
         # old_text は _on_cell_pressed で取得した、編集前のフォーマット済みテキストのはず
@@ -482,71 +624,189 @@ class DetailPageWidget(QWidget):
                 # command.redo() を呼ぶと、コマンド側でもUI更新が行われる場合、二重更新になるか、
                 # コマンド側がフォーマット済みテキストを持っているので問題ない。
                 command.redo() # データモデルのみ更新するか、UIも更新するかはコマンドの実装による
+            if col == self.COL_SPECIFICATION: # 拾い出しモードなら、次のイベントループでこの行の数量を拾い出す
+                self.quantity_takeoff.request_row(row, previous_spec=self.old_text)
+            elif col == self.COL_UNIT:
+                self.quantity_takeoff.request_row(row, previous_unit=self.old_text)
 
         # 金額列の計算と表示更新 (数量または単価が妥当な場合)
         if is_valid_input and (col == self.COL_QUANTITY or col == self.COL_UNIT_PRICE):
-            quantity_item = self.table.item(row, self.COL_QUANTITY)
-            unit_price_item = self.table.item(row, self.COL_UNIT_PRICE)
-            
-            # 金額計算には、フォーマットされた表示テキストから再度パースする
-            quantity_val = parse_number(quantity_item.text() if quantity_item else "0")
-            unit_price_val = parse_number(unit_price_item.text() if unit_price_item else "0")
-
-            try:
-                # 計算はDecimalで行う
-                amount = Decimal(str(quantity_val)) * Decimal(str(unit_price_val))
-            except InvalidOperation:
-                amount = Decimal('0')
-
-            amount_item = self.table.item(row, self.COL_AMOUNT)
-            if amount_item is None:
-                amount_item = QTableWidgetItem()
-                self.table.setItem(row, self.COL_AMOUNT, amount_item)
-                amount_item.setFlags(amount_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
-                amount_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-            
-            self.table.blockSignals(True)
-            amount_item.setText(format_currency(amount)) # utils.format_currency を使用
-            self.table.blockSignals(False)
+            self._recalculate_row_amount(row)
         
         # 編集状態をリセット
         self.is_editing = False
         self.current_editing_cell = None
         self.old_text = None # 次の編集のためにクリア
         
-        self._update_detail_totals() # 全体の合計を更新
+        self.request_update(UpdateFlag.TOTALS) # 全体の合計の再計算を予約
+
 
+    @staticmethod
+    def _to_decimal(text: str) -> Decimal:
+        return to_decimal(text)
 
+    def _number_format(self, col: int) -> NumberFormat:
+        """数値列 (数量・単価・金額) の表示形式"""
+        return column_format(self.NUMBER_FORMAT_NAMES[col])
+
+    def _apply_numeric_input(self, item: QTableWidgetItem, col: int, source_text: str) -> str:
+        """数量・単価セルに入力 (数値または計算式) を反映し、Undo 用の入力テキストを返す
+
+        数値は表示桁数に丸めて整形する。計算式は結果を表示し、式を FORMULA_ROLE に保持する
+        (他の行への参照は行 ID に置き換える)。解釈できない計算式は入力のまま残し、
+        計算できない計算式 (循環参照など) は式を残して、どちらも保持値 0 で FormulaError を送出する。
+        """
+        row = item.row()
+        formula = None
+        try:
+            if is_formula(source_text):
+                formula = self.formula_engine.compile(row, col, source_text)
+            self.formula_engine.set_formula(row, col, formula)
+            if formula is not None:
+                value = self.formula_engine.evaluate(row, col, formula)
+            else:
+                value = self._number_format(col).round(to_decimal(source_text))
+        except FormulaError as e:
+            if formula is None:
+                self.formula_engine.set_formula(row, col, None)
+            self._show_numeric_result(item, col, Decimal('0'), formula.text if formula else None, str(e), source_text)
+            self.formula_engine.cell_changed(row, col)
+            raise
+        self._show_numeric_result(item, col, value, formula.text if formula else None)
+        self.formula_engine.cell_changed(row, col) # このセルを参照している計算式は次の更新で計算し直す
+        return formula.text if formula else item.text()
+
+    def _show_numeric_result(self, item: QTableWidgetItem, col: int, value: Decimal,
+                             formula_text: Optional[str], error: Optional[str] = None, source_text: str = ""):
+        """数量・単価セルに値 (と計算式) を表示する。error があれば式 (または入力のまま) をエラー表示にする"""
+        if error is None:
+            # 表示用テキスト (列ごとの桁数。単価は「￥」付きになる)
+            display_text = self._number_format(col).format(value)
+        else:
+            display_text = self.formula_engine.display_text(formula_text) if formula_text else source_text
+
+        # setText が再度 _on_cell_changed をトリガーするのを防ぐため blockSignals を使用する
+        was_blocked = self.table.signalsBlocked()
+        self.table.blockSignals(True)
+        if item.text() != display_text:
+            item.setText(display_text)
+        # 表示文字列とは別に数値を保持する (集計時に "￥" 付き文字列を再パースしないため)
+        item.setData(VALUE_ROLE, value)
+        item.setData(FORMULA_ROLE, formula_text)
+        if error is not None:
+            item.setToolTip(error)
+        elif item.toolTip(): # 計算できるようになったセルのエラー表示を戻す
+            item.setToolTip("")
+        self.table.blockSignals(was_blocked)
+        # エラーの色はアイテムに持たせず、セルの状態のフラグにする (デリゲートが描画時に塗る)
+        self.cell_states.set_cell(self.formula_engine.row_id(item.row()), col, INVALID, error is not None)
+
+    def _cell_value(self, row: int, col: int) -> Decimal:
+        """数量・単価・金額セルの数値を返す (保持値がなければ表示文字列から求める)"""
+        item = self.table.item(row, col)
+        if item is None:
+            return Decimal('0')
+        value = item.data(VALUE_ROLE)
+        if value is None:
+            return self._to_decimal(item.text())
+        return value
+
+    def _recalculate_row_amount(self, row: int):
+        """保持している数量・単価から指定行の金額を計算し直す"""
+        # 計算はDecimalで行う
+        amount = self._cell_value(row, self.COL_QUANTITY) * self._cell_value(row, self.COL_UNIT_PRICE)
+
+        amount_item = self.table.item(row, self.COL_AMOUNT)
+        if self._amount_sum is not None: # 合計は差分で更新する
+            self._amount_sum += amount - self._cell_value(row, self.COL_AMOUNT)
+        was_blocked = self.table.signalsBlocked()
+        self.table.blockSignals(True)
+        if amount_item is None:
+            amount_item = QTableWidgetItem()
+            self.table.setItem(row, self.COL_AMOUNT, amount_item)
+            amount_item.setFlags(amount_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
+            amount_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        amount_item.setText(self._number_format(self.COL_AMOUNT).format(amount))
+        amount_item.setData(VALUE_ROLE, amount)
+        self.table.blockSignals(was_blocked)
+        self.request_update(UpdateFlag.TOTALS)
+
+    def _recalculate_formulas(self):
+        self.formula_engine.recalculate()
+
+    def request_update(self, flags: UpdateFlag = UpdateFlag.TOTALS):
+        """再計算・再描画を予約する (同じイベントループ内の要求は1回にまとめられる)"""
+        self.update_scheduler.mark_dirty(flags)
+
+    def flush_updates(self):
+        """予約済みの再計算・再描画を直ちに反映する"""
+        self.update_scheduler.flush()
+
+    @Slot(int)
+    def _on_undo_stack_index_changed(self, index: int):
+        self.request_update(UpdateFlag.TOTALS | UpdateFlag.ACTION_STATES)
+
+    @timed()
     def _update_detail_totals(self):
-        subtotal = Decimal('0.0')
-        for row_idx in range(self.table.rowCount()):
-            amount_item = self.table.item(row_idx, self.COL_AMOUNT)
-            if amount_item and amount_item.text():
-                try:
-                    # parse_number は float を返すので、Decimal に変換
-                    parsed_val = parse_number(amount_item.text())
-                    subtotal += Decimal(str(parsed_val)) # floatからstr経由でDecimalへ
-                except (ValueError, TypeError, InvalidOperation): # parse_numberが0.0を返したり、Decimal変換失敗
-                    pass # 加算しない
+        """明細の合計を再計算し、ヘッダーと表紙への反映を予約する"""
+        # 税は丸める前の税抜合計から計算する (保存・単価の一括変更と同じ丸め方)
+        subtotal_rounded, tax_rounded, total_final_display = estimate_totals(self._amount_total())
 
-        tax_rate_decimal = Decimal(str(TAX_RATE)) # constantsから
-        
-        subtotal_rounded = subtotal.quantize(Decimal('0'), rounding=ROUND_HALF_UP)
-        tax_calculated = subtotal * tax_rate_decimal # 税は丸める前の税抜合計から計算
-        tax_rounded = tax_calculated.quantize(Decimal('0'), rounding=ROUND_HALF_UP)
-        # total_rounded = subtotal_rounded + tax_rounded # 請求書ベースの合計 (丸めた税抜 + 丸めた税)
-        total_exact = subtotal + tax_calculated # より正確な合計
-        total_final_display = total_exact.quantize(Decimal('0'), rounding=ROUND_HALF_UP) # 表示用合計
-
-
-        self.update_header(
-            self.project_name_value.text(),
-            self.client_name_value.text(),
-            self.period_value.text(),
+        totals_text = (
             format_currency(total_final_display),
             format_currency(subtotal_rounded),
             format_currency(tax_rounded)
         )
+        if totals_text != self._totals_text or self.total_value.text() != totals_text[0]:
+            self._totals_text = totals_text
+            self.request_update(UpdateFlag.HEADER | UpdateFlag.COVER_TOTALS)
+
+    def _amount_total(self) -> Decimal:
+        """明細金額の合計 (行の追加・削除・読み込みの後だけ全行を数え直し、ほかは差分で更新した値を使う)"""
+        if self._amount_sum is None:
+            amount_sum = Decimal('0.0')
+            for row_idx in range(self.table.rowCount()):
+                # 表示文字列ではなく保持している数値を合計する
+                amount_sum += self._cell_value(row_idx, self.COL_AMOUNT)
+            self._amount_sum = amount_sum
+        return self._amount_sum
+
+    def _invalidate_amount_sum(self, *args):
+        self._amount_sum = None
+
+    @Slot()
+    def _on_selection_summary_changed(self):
+        self.request_update(UpdateFlag.SELECTION_STATUS)
+
+    def _emit_selection_status(self):
+        """選択行の金額の合計・個数・平均をステータスバーに表示する (Excel と同様)"""
+        summary = self.selection_summary
+        count = summary.row_count()
+        if count < 2:
+            # 1行以下の選択では表示しない。表示中の集計だけを消し、他のメッセージは残す
+            if self._selection_status_shown:
+                self._selection_status_shown = False
+                self.status_message_requested.emit("", 0)
+            return
+        total = summary.selected_sum()
+        average = (total / count).quantize(Decimal('0'), rounding=ROUND_HALF_UP)
+        self._selection_status_shown = True
+        self.status_message_requested.emit(
+            f"金額　合計: {format_currency(total)}　データの個数: {count:,}　平均: {format_currency(average)}", 0
+        )
+
+    def _render_header_totals(self):
+        """計算済みの合計をヘッダーのラベルに反映する (変化したラベルのみ再描画される)"""
+        total_text, subtotal_text, tax_text = self._totals_text
+        for label_widget, text in ((self.total_value, total_text),
+                                   (self.subtotal_value, subtotal_text),
+                                   (self.tax_value, tax_text)):
+            if label_widget.text() != text:
+                label_widget.setText(text)
+
+    def _emit_totals_changed(self):
+        total_text, subtotal_text, tax_text = self._totals_text
+        self.totals_changed.emit(subtotal_text, tax_text, total_text)
 
     @Slot()
     def add_row(self):
@@ -555,16 +815,14 @@ class DetailPageWidget(QWidget):
         command = InsertRowCommand(self.table, insert_pos, self._initialize_row, description="行追加")
         if self.undo_stack: self.undo_stack.push(command)
         else: command.redo()
-        self._update_detail_totals()
+        self.request_update(UpdateFlag.TOTALS | UpdateFlag.ACTION_STATES)
 
 
-    def _get_row_data(self, row: int) -> List[Optional[Union[QTableWidgetItem, Tuple[Type[QComboBox], Dict[str, Any]]]]]:
-        # (変更なしのため省略 - 前回のコードを参照)
+    def _get_row_data(self, row: int) -> List[Optional[QTableWidgetItem]]:
         data = []
         for col in range(self.table.columnCount()):
-            widget = self.table.cellWidget(row, col); item = self.table.item(row, col)
-            if widget and isinstance(widget, QComboBox): data.append((type(widget), {'currentText': widget.currentText()}))
-            elif item: data.append(item.clone())
+            item = self.table.item(row, col)
+            if item: data.append(item.clone())
             else: data.append(None)
         return data
 
@@ -572,60 +830,386 @@ class DetailPageWidget(QWidget):
     @Slot()
     def remove_row(self):
         # (変更なしのため省略 - 前回のコードを参照)
-        selected_indexes = self.table.selectedIndexes();
-        if not selected_indexes: QMessageBox.warning(self, "行削除", "削除する行が選択されていません。"); return
-        selected_rows_asc = sorted(list(set(index.row() for index in selected_indexes if index.row() >= 0)))
+        if not self.selection_summary.has_selection(): QMessageBox.warning(self, "行削除", "削除する行が選択されていません。"); return
+        selected_rows_asc = self._selected_rows()
         if not selected_rows_asc: return
         rows_data_to_save = {row_idx: self._get_row_data(row_idx) for row_idx in selected_rows_asc}
         command = RemoveMultipleRowsCommand(self.table, selected_rows_asc, rows_data_to_save)
         if self.undo_stack: self.undo_stack.push(command)
         else: command.redo()
-        self._update_detail_totals()
+        self.request_update(UpdateFlag.TOTALS | UpdateFlag.ACTION_STATES)
 
 
     @Slot()
     def duplicate_row(self):
         # (変更なしのため省略 - 前回のコードを参照)
-        selected_indexes = self.table.selectedIndexes()
-        if not selected_indexes: QMessageBox.warning(self, "行複写", "複写する行が選択されていません。"); return
-        selected_rows = sorted(list(set(index.row() for index in selected_indexes if index.row() >= 0)))
+        if not self.selection_summary.has_selection(): QMessageBox.warning(self, "行複写", "複写する行が選択されていません。"); return
+        selected_rows = self._selected_rows()
         if not selected_rows: QMessageBox.warning(self, "行複写", "複写する行が選択されていません。"); return
         rows_data_to_duplicate = {row_idx: self._get_row_data(row_idx) for row_idx in selected_rows}
         if rows_data_to_duplicate:
             command = DuplicateMultipleRowsCommand(self.table, rows_data_to_duplicate)
             if self.undo_stack: self.undo_stack.push(command)
             else: command.redo()
-            self._update_detail_totals()
+            self.request_update(UpdateFlag.TOTALS | UpdateFlag.ACTION_STATES)
         else: QMessageBox.information(self, "行複写", "複写対象のデータがありませんでした。")
 
 
     def _initialize_row(self, row):
         self.table.blockSignals(True)
         # 金額列の初期化
-        amount_item = QTableWidgetItem(format_currency(0)) # format_currency を使用
+        amount_item = QTableWidgetItem(self._number_format(self.COL_AMOUNT).format(0))
+        amount_item.setData(VALUE_ROLE, Decimal('0'))
         amount_item.setFlags(amount_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
         amount_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
         self.table.setItem(row, self.COL_AMOUNT, amount_item)
         
-        # 単位列の初期化
-        self.table.setCellWidget(row, self.COL_UNIT, self._create_unit_combobox())
-
         # その他の列の初期化
         for col in range(self.NUM_COLS):
-            if col not in [self.COL_AMOUNT, self.COL_UNIT]: # 金額と単位以外
+            if col != self.COL_AMOUNT: # 金額以外
                 if self.table.item(row, col) is None:
                     self.table.setItem(row, col, QTableWidgetItem(""))
                 
                 current_item = self.table.item(row, col)
                 if col == self.COL_QUANTITY:
-                    current_item.setText(format_quantity(0.0)) # utils.format_quantity
+                    current_item.setText(self._number_format(col).format(0))
+                    current_item.setData(VALUE_ROLE, Decimal('0'))
                     current_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
                 elif col == self.COL_UNIT_PRICE:
-                    current_item.setText(format_currency(0)) # utils.format_currency
+                    current_item.setText(self._number_format(col).format(0))
+                    current_item.setData(VALUE_ROLE, Decimal('0'))
                     current_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
                 # COL_NAME, COL_SPECIFICATION, COL_SUMMARY は左寄せの空文字列でOK
         self.table.blockSignals(False)
 
+    def _selected_rows(self) -> List[int]:
+        """選択されている行 (昇順)。絞り込みで隠れている行は含めない"""
+        return self.row_filter.visible_rows(self.selection_summary.selected_rows())
+
+    def show_row_filter(self):
+        """絞り込み表示のバーを表示する"""
+        self.row_filter.open()
+
+    def show_find_replace(self, replace: bool = False):
+        """検索バーを表示する (replace なら置換欄も表示する)"""
+        self.find_bar.open(replace)
+
+    def _row_id_at(self, index: QModelIndex) -> Optional[int]:
+        """セルの行 ID (デリゲートがセルの状態を引くのに使う)"""
+        return index.siblingAtColumn(self.COL_NAME).data(ROW_ID_ROLE)
+
+    def _on_validation_changed(self):
+        """検査結果をセルの状態 (検査のエラー・警告) に置き換える (再描画は1回)"""
+        errors, warnings = [], []
+        for row_id, problems in self.row_validator.result.problems.items():
+            for problem in problems:
+                (errors if problem.severity == ERROR else warnings).append((row_id, problem.column))
+        self.cell_states.replace({PROBLEM_ERROR: errors, PROBLEM_WARNING: warnings})
+
+    @Slot(QModelIndex, QModelIndex, list)
+    def _on_model_data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex, roles=()):
+        """保存 (読み込み) 後に値を変えたセルの範囲を覚える (ツールチップなど表示以外の変更は除く)
+
+        行の追加中などは行 ID がまだ決まっていないので、印は次の更新 (_mark_changed_cells) で付ける。
+        """
+        if not self._tracking_changes or (roles and Qt.ItemDataRole.DisplayRole not in roles
+                                          and Qt.ItemDataRole.EditRole not in roles):
+            return
+        self._changed_ranges.append((top_left.row(), bottom_right.row(), top_left.column(), bottom_right.column()))
+        self.request_update(UpdateFlag.CHANGED_CELLS)
+
+    def _mark_changed_cells(self):
+        ranges, self._changed_ranges = self._changed_ranges, []
+        row_ids = self.formula_engine.row_ids()
+        self.cell_states.set_cells(CHANGED, ((row_ids[row], col) for top, bottom, left, right in ranges
+                                             for row in range(top, min(bottom + 1, len(row_ids)))
+                                             for col in range(left, right + 1)))
+
+    def mark_cell_changed(self, row: int, col: int):
+        """モデルを通らない変更 (単位のコンボボックス) のセルに、保存後に変えた印を付ける"""
+        if self._tracking_changes:
+            self.cell_states.set_cell(self.formula_engine.row_id(row), col, CHANGED)
+
+    @Slot(bool)
+    def _on_clean_changed(self, clean: bool):
+        if clean:
+            self._clear_changed_cells()
+
+    def _clear_changed_cells(self):
+        """(保存した時点) 変更の印をすべて消す"""
+        self._changed_ranges = [] # まだ印にしていない範囲も捨てる
+        self.cell_states.clear(CHANGED)
+
+    def go_to_cell(self, row: int, col: int):
+        """セルを選んで見える位置まで移動する (問題の一覧から使う)"""
+        self.table.setCurrentCell(row, col)
+        self.table.scrollTo(self.table.model().index(row, col))
+        self.table.setFocus()
+
+    def _unit_text(self, row: int) -> str:
+        unit_item = self.table.item(row, self.COL_UNIT)
+        return unit_item.text() if unit_item is not None else ""
+
+    def set_takeoff_enabled(self, enabled: bool):
+        """拾い出しモード (仕様の寸法から数量を求める) を切り替える"""
+        self.quantity_takeoff.set_enabled(enabled)
+
+    def is_takeoff_enabled(self) -> bool:
+        return self.quantity_takeoff.is_enabled()
+
+    def sort_rows(self, sort_key: str, descending: bool = False) -> bool:
+        """明細行を名称・単価・金額 ("name" / "unit_price" / "amount") で並べ替える (1つの Undo コマンド)
+
+        同じ値の行は今の順のまま (安定ソート)。"input" なら入力順 (読み込んだときの順に、その後の行の追加・複写・移動を
+        反映した順。InputOrder) に戻す。
+        並びが変わらなければ何もせずに False を返す。
+        """
+        old_order = list(self.text_index.row_ids())
+        if sort_key == "name": # 名称が空の行は最後にする
+            keys = [((text == "") != descending, text) for text in self.text_index.column_texts(self.COL_NAME)]
+        elif sort_key == "unit_price":
+            keys = self.text_index.column_values(self.COL_UNIT_PRICE)
+        elif sort_key == "amount":
+            keys = self.text_index.column_values(self.COL_AMOUNT)
+        else:
+            ranks = self.input_order.ranks()
+            keys = [ranks[row_id] for row_id in old_order]
+        new_order = [old_order[index] for index in sorted(range(len(old_order)), key=keys.__getitem__, reverse=descending)]
+        label = DETAIL_SORT_ORDERS.get((sort_key, descending), sort_key)
+        if new_order == old_order:
+            self.status_message_requested.emit(f"すでに{label}に並んでいます", 3000)
+            return False
+        command = ReorderRowsCommand(self.table, old_order, new_order, f"並べ替え ({label})")
+        if self.undo_stack: self.undo_stack.push(command)
+        else: command.redo()
+        self.request_update(UpdateFlag.TOTALS | UpdateFlag.ACTION_STATES)
+        self.status_message_requested.emit(f"{label}に並べ替えました", 3000)
+        return True
+
+    def fill_target_column(self) -> Optional[int]:
+        """下へコピー・一括入力の対象の列 (現在のセルの列。金額など入力できない列なら None)"""
+        col = self.table.currentColumn()
+        return col if 0 <= col < self.NUM_COLS and col != self.COL_AMOUNT else None
+
+    def _cell_input_text(self, row: int, col: int) -> str:
+        """セルの入力 (計算式なら式。Undo で戻すときの形)"""
+        item = self.table.item(row, col)
+        return (item.data(FORMULA_ROLE) or item.text()) if item is not None else ""
+
+    def fill_down(self) -> int:
+        """選択行の先頭の行のセルを、選択したほかの行の同じ列にコピーする (Ctrl+D)。変更したセル数を返す
+
+        1行だけ選択しているときは、上の行のセルをコピーする。絞り込みで隠れている行は対象にしない。
+        """
+        col = self.fill_target_column()
+        rows = self._selected_rows()
+        if col is None or not rows:
+            self.status_message_requested.emit("コピーする列のセルを選択してください (金額の列にはコピーできません)", 5000)
+            return 0
+        if len(rows) == 1:
+            source_row = rows[0] - 1
+            while source_row >= 0 and self.table.isRowHidden(source_row):
+                source_row -= 1
+            if source_row < 0:
+                return 0
+        else:
+            source_row, rows = rows[0], rows[1:]
+        return self.fill_cells(rows, col, self._cell_input_text(source_row, col), f"下へコピー ({self.HEADERS[col]})")
+
+    def set_selection_value(self, text: str) -> int:
+        """選択行の現在の列に同じ値を入力する。変更したセル数を返す"""
+        col = self.fill_target_column()
+        rows = self._selected_rows()
+        if col is None or not rows:
+            return 0
+        return self.fill_cells(rows, col, text, f"一括入力 ({self.HEADERS[col]})")
+
+    @timed()
+    def fill_cells(self, rows: List[int], col: int, text: str, description: str = "一括入力") -> int:
+        """rows の col 列に text を入力する (1つの Undo コマンド・再計算は1回)。変更したセル数を返す"""
+        # 数値はセルの表示と同じ形に整えてから比べる (値が変わらないセルはコマンドに入れない)
+        new_text = text if is_formula(text) or col == self.COL_UNIT else format_cell_text(self, col, text)
+        target_rows, old_texts = [], []
+        for row in rows:
+            old_text = self._cell_input_text(row, col)
+            if old_text != new_text:
+                target_rows.append(row)
+                old_texts.append(old_text)
+        if target_rows:
+            command = FillCellsCommand(self.table, col, target_rows, old_texts, text, description)
+            if self.undo_stack: self.undo_stack.push(command)
+            else: command.redo()
+            if col in (self.COL_SPECIFICATION, self.COL_UNIT) and self.quantity_takeoff.is_enabled():
+                for row, old_text in zip(target_rows, old_texts): # 拾い出しモードなら数量を拾い出し直す
+                    if col == self.COL_SPECIFICATION:
+                        self.quantity_takeoff.request_row(row, previous_spec=old_text)
+                    else:
+                        self.quantity_takeoff.request_row(row, previous_unit=old_text)
+        self.status_message_requested.emit(f"{len(target_rows)} 個のセルに入力しました ({description})", 5000)
+        return len(target_rows)
+
+    def adjust_unit_prices(self, adjustment: PriceAdjustment) -> int:
+        """選択行の単価を adjustment で一括調整する (1つの Undo コマンド)。変更した行数を返す
+
+        単価が 0 の行と、単価が計算式の行は変更しない。
+        """
+        rows = self._selected_rows()
+        if not rows:
+            QMessageBox.warning(self, "単価の一括調整", "調整する行が選択されていません。")
+            return 0
+        col = self.COL_UNIT_PRICE
+        target_rows = []
+        formula_rows = 0
+        for row in rows:
+            item = self.table.item(row, col)
+            if item is None:
+                continue
+            if item.data(FORMULA_ROLE):
+                formula_rows += 1
+            elif self._cell_value(row, col):
+                target_rows.append(row)
+        old_prices = [self._cell_value(row, col) for row in target_rows]
+        new_prices = adjustment.apply_many(old_prices)
+        price_format = self._number_format(col)
+        changes = [(row, col, self.table.item(row, col).text(), price_format.format(new_price))
+                   for row, old_price, new_price in zip(target_rows, old_prices, new_prices)
+                   if new_price != old_price]
+        if changes:
+            command = ChangeMultipleItemsCommand(self.table, changes, adjustment.describe())
+            if self.undo_stack: self.undo_stack.push(command)
+            else: command.redo()
+        message = f"{len(changes)} 行の単価を調整しました ({adjustment.describe()})"
+        if formula_rows:
+            message += f"。単価が計算式の {formula_rows} 行は変更していません"
+        self.status_message_requested.emit(message, 7000)
+        return len(changes)
+
+    # ------------------------------------------------------------------
+    # 組み合わせ項目
+    # ------------------------------------------------------------------
+    def assembly_catalog(self) -> AssemblyCatalog:
+        """組み合わせ項目のカタログ (最初に使うとき・保存先が変わったときに読む)。読めなければ sqlite3.Error"""
+        if self._assembly_catalog is None or self._assembly_catalog_path != self.db_file_path:
+            conn = self._connect_database()
+            try:
+                self._assembly_catalog = load_catalog(conn)
+            finally:
+                conn.close()
+            self._assembly_catalog_path = self.db_file_path
+        return self._assembly_catalog
+
+    def insert_assembly(self, assembly_id: int, quantity: Decimal, collapsed: bool = False) -> int:
+        """組み合わせ項目を現在の行の下に入れる (1つの Undo コマンド)。入れた行数を返す
+
+        collapsed なら積み上げ単価の1行にまとめ、そうでなければ構成要素の明細行に展開する。
+        入れ子が循環していれば AssemblyError。
+        """
+        catalog = self.assembly_catalog()
+        assembly = catalog.get(assembly_id)
+        if collapsed:
+            data_rows = [{"name": assembly.name, "specification": assembly.specification or catalog.summary_text(assembly_id),
+                          "quantity": quantity, "unit": assembly.unit, "unit_price": catalog.unit_cost(assembly_id),
+                          "summary": "", "assembly_id": assembly_id}]
+        else:
+            data_rows = [{"name": line.name, "specification": line.specification, "quantity": line.quantity,
+                          "unit": line.unit, "unit_price": line.unit_price, "summary": line.assembly_name}
+                         for line in catalog.expand(assembly_id, quantity)]
+        if not data_rows:
+            return 0
+        current_row = self.table.currentRow()
+        position = self.table.rowCount() if current_row < 0 else current_row + 1
+        command = InsertRowsCommand(self.table, position, [self._detail_row_data(data_row) for data_row in data_rows],
+                                    f"組み合わせ項目の挿入 ({assembly.name})")
+        if self.undo_stack: self.undo_stack.push(command)
+        else: command.redo()
+        self.request_update(UpdateFlag.TOTALS | UpdateFlag.ACTION_STATES)
+        self.status_message_requested.emit(f"「{assembly.name}」を {len(data_rows)} 行で挿入しました", 5000)
+        return len(data_rows)
+
+    def _detail_row_data(self, data_row: Dict[str, Any]) -> List[QTableWidgetItem]:
+        """明細行の辞書 (set_detail_rows と同じ形) から、InsertRowsCommand に渡す1行分のアイテムを作る"""
+        quantity = self._number_format(self.COL_QUANTITY).round(to_decimal(data_row.get("quantity")))
+        unit_price = self._number_format(self.COL_UNIT_PRICE).round(to_decimal(data_row.get("unit_price")))
+        row_data: List[Any] = [QTableWidgetItem("") for _ in range(self.NUM_COLS)]
+        row_data[self.COL_NAME].setText(data_row.get("name") or "")
+        if data_row.get("assembly_id") is not None:
+            row_data[self.COL_NAME].setData(ASSEMBLY_ROLE, data_row["assembly_id"])
+        row_data[self.COL_SPECIFICATION].setText(data_row.get("specification") or "")
+        row_data[self.COL_SUMMARY].setText(data_row.get("summary") or "")
+        row_data[self.COL_UNIT].setText(data_row.get("unit") or "")
+        for col, value in ((self.COL_QUANTITY, quantity), (self.COL_UNIT_PRICE, unit_price),
+                           (self.COL_AMOUNT, quantity * unit_price)):
+            item = row_data[col]
+            item.setText(self._number_format(col).format(value))
+            item.setData(VALUE_ROLE, value)
+            item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        amount_item = row_data[self.COL_AMOUNT]
+        amount_item.setFlags(amount_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
+        return row_data
+
+    def refresh_assembly_rows(self, assembly_ids: Optional[Set[int]] = None) -> int:
+        """1行にまとめた組み合わせ項目の行の単価を、カタログの積み上げ単価に更新する (1つの Undo コマンド)
+
+        assembly_ids を指定すればその項目の行だけ。単価を計算式にした行は変更しない。変更した行数を返す。
+        """
+        catalog = self.assembly_catalog()
+        col = self.COL_UNIT_PRICE
+        price_format = self._number_format(col)
+        changes = []
+        for row in range(self.table.rowCount()):
+            name_item = self.table.item(row, self.COL_NAME)
+            assembly_id = name_item.data(ASSEMBLY_ROLE) if name_item is not None else None
+            if assembly_id is None or assembly_id not in catalog or (assembly_ids is not None and assembly_id not in assembly_ids):
+                continue
+            item = self.table.item(row, col)
+            if item is None or item.data(FORMULA_ROLE):
+                continue
+            try:
+                new_price = price_format.round(catalog.unit_cost(assembly_id)) # 積み上げ単価はメモ化されている
+            except AssemblyError:
+                continue
+            if new_price != self._cell_value(row, col):
+                changes.append((row, col, item.text(), price_format.format(new_price)))
+        if changes:
+            command = ChangeMultipleItemsCommand(self.table, changes, "組み合わせ項目の単価を更新")
+            if self.undo_stack: self.undo_stack.push(command)
+            else: command.redo()
+            self.status_message_requested.emit(f"組み合わせ項目の {len(changes)} 行の単価を更新しました", 5000)
+        return len(changes)
+
+    def register_assembly_from_selection(self, name: str, specification: str, unit: str,
+                                         base_quantity: Decimal) -> Assembly:
+        """選択行を構成要素として、組み合わせ項目をカタログに登録する
+
+        各行の数量は base_quantity の分として、数量 1 あたりに直して登録する。1行にまとめた組み合わせ項目の行は
+        入れ子の項目として登録する。選択行がなければ AssemblyError、保存できなければ sqlite3.Error。
+        """
+        rows = self._selected_rows()
+        if not rows:
+            raise AssemblyError("登録する行が選択されていません")
+        catalog = self.assembly_catalog()
+        components = []
+        for row in rows:
+            name_item = self.table.item(row, self.COL_NAME)
+            spec_item = self.table.item(row, self.COL_SPECIFICATION)
+            child_id = name_item.data(ASSEMBLY_ROLE) if name_item is not None else None
+            components.append(AssemblyComponent(
+                None, name_item.text() if name_item else "", spec_item.text() if spec_item else "", self._unit_text(row),
+                self._cell_value(row, self.COL_QUANTITY) / base_quantity,
+                Decimal('0') if child_id in catalog else self._cell_value(row, self.COL_UNIT_PRICE),
+                child_id if child_id in catalog else None))
+        conn = self._connect_database()
+        try:
+            assembly = save_assembly(conn, catalog, name, specification, unit, components)
+        finally:
+            conn.close()
+        self.status_message_requested.emit(f"組み合わせ項目「{name}」を登録しました ({len(components)} 行)", 5000)
+        return assembly
+
+    def _amount_value_at_row(self, row: int) -> Decimal:
+        """指定行の金額を Decimal で返す (選択集計用)"""
+        return self._cell_value(row, self.COL_AMOUNT)
+
     def get_current_subtotal(self) -> str:
         # (変更なしのため省略 - 前回のコードを参照)
         return self.subtotal_value.text() if hasattr(self, 'subtotal_value') else ""
@@ -638,54 +1222,82 @@ class DetailPageWidget(QWidget):
         # (変更なしのため省略 - 前回のコードを参照)
         return self.total_value.text() if hasattr(self, 'total_value') else ""
     
+    def _connect_database(self) -> sqlite3.Connection:
+        """データベースに接続する (初回は後から追加した列がなければ追加する)"""
+        conn = sqlite3.connect(self.db_file_path)
+        if self.db_file_path not in self._migrated_db_paths:
+            migrate_database(conn)
+            self._migrated_db_paths.add(self.db_file_path)
+        return conn
+
+    def _cell_formula(self, row: int, col: int) -> Optional[str]:
+        item = self.table.item(row, col)
+        # 他の行への参照は保存時の行番号の形 ("R3.数量") で保存する
+        return self.formula_engine.display_text(item.data(FORMULA_ROLE)) if item else None
+
     def _get_current_header_data_for_save(self) -> Dict[str, Any]:
-        # (変更なしのため省略 - 前回のコードを参照)
+        # 合計は見出しの表示文字列ではなく明細金額の合計から求める (表示の更新が済んでいなくても正しい値になる)
+        subtotal, tax, total = estimate_totals(self._amount_total())
         return {
             "project_name": self.project_name_value.text(),
             "client_name": self.client_name_value.text(),
             "period_text": self.period_value.text(),
-            "subtotal_amount": parse_number(self.subtotal_value.text()), # floatが返る
-            "tax_amount": parse_number(self.tax_value.text()),       # floatが返る
-            "total_amount": parse_number(self.total_value.text()),     # floatが返る
+            "subtotal_amount": float(subtotal),
+            "tax_amount": float(tax),
+            "total_amount": float(total),
         }
 
     def _get_current_detail_data_for_save(self) -> List[Dict[str, Any]]:
         details = []
-        for row in range(self.table.rowCount()):
-            unit_widget = self.table.cellWidget(row, self.COL_UNIT)
-            unit_text = unit_widget.currentText() if isinstance(unit_widget, QComboBox) else ""
-            
-            name_item = self.table.item(row, self.COL_NAME)
-            name_text_val = name_item.text() if name_item else ""
-
-            spec_item = self.table.item(row, self.COL_SPECIFICATION) # 仕様列
-            spec_text_val = spec_item.text() if spec_item else ""
-
-            quantity_item = self.table.item(row, self.COL_QUANTITY)
-            quantity_val = parse_number(quantity_item.text() if quantity_item else "0")
-
-            unit_price_item = self.table.item(row, self.COL_UNIT_PRICE)
-            unit_price_val = parse_number(unit_price_item.text() if unit_price_item else "0")
-
-            amount_item = self.table.item(row, self.COL_AMOUNT)
-            amount_val = parse_number(amount_item.text() if amount_item else "0")
-
-            summary_item = self.table.item(row, self.COL_SUMMARY) # 摘要列
-            summary_text_val = summary_item.text() if summary_item else ""
-            
-            details.append({
-                "row_order": row,
-                "name_text": name_text_val,
-                "specification_text": spec_text_val, # 追加
-                "quantity": quantity_val,            # float
-                "unit_text": unit_text,
-                "unit_price": unit_price_val,        # float
-                "amount": amount_val,                # float
-                "summary_text": summary_text_val,
-            })
+        seen_line_keys = set()
+        model = self.table.model()
+        model.blockSignals(True) # 行のキーを付けても編集とみなさない (itemChanged を出さない)
+        try:
+            for row in range(self.table.rowCount()):
+                unit_text = self._unit_text(row)
+
+                name_item = self.table.item(row, self.COL_NAME)
+                name_text_val = name_item.text() if name_item else ""
+
+                spec_item = self.table.item(row, self.COL_SPECIFICATION) # 仕様列
+                spec_text_val = spec_item.text() if spec_item else ""
+
+                quantity_val = float(self._cell_value(row, self.COL_QUANTITY))
+                unit_price_val = float(self._cell_value(row, self.COL_UNIT_PRICE))
+                amount_val = float(self._cell_value(row, self.COL_AMOUNT))
+
+                summary_item = self.table.item(row, self.COL_SUMMARY) # 摘要列
+                summary_text_val = summary_item.text() if summary_item else ""
+
+                # 新しい行と、複製で同じキーを持つ2行目以降には新しいキーを付ける
+                line_key = name_item.data(LINE_KEY_ROLE) if name_item else None
+                if line_key is None or line_key in seen_line_keys:
+                    line_key = uuid.uuid4().hex
+                    if name_item:
+                        name_item.setData(LINE_KEY_ROLE, line_key)
+                seen_line_keys.add(line_key)
+
+                details.append({
+                    "row_order": row,
+                    "name_text": name_text_val,
+                    "specification_text": spec_text_val, # 追加
+                    "quantity": quantity_val,            # float
+                    "quantity_formula": self._cell_formula(row, self.COL_QUANTITY), # 計算式 (なければ None)
+                    "unit_text": unit_text,
+                    "unit_price": unit_price_val,        # float
+                    "unit_price_formula": self._cell_formula(row, self.COL_UNIT_PRICE),
+                    "amount": amount_val,                # float
+                    "summary_text": summary_text_val,
+                    "assembly_id": name_item.data(ASSEMBLY_ROLE) if name_item else None,
+                    "line_key": line_key,
+                })
+        finally:
+            model.blockSignals(False)
         return details
 
+    @timed()
     def _execute_save_to_db(self) -> bool:
+        self.flush_updates() # 予約中の計算式・金額の再計算を済ませてから保存する
         header_data = self._get_current_header_data_for_save()
         detail_data_list = self._get_current_detail_data_for_save()
 
@@ -695,7 +1307,7 @@ class DetailPageWidget(QWidget):
 
         conn = None
         try:
-            conn = sqlite3.connect(self.db_file_path)
+            conn = self._connect_database()
             cursor = conn.cursor()
 
             now_iso = datetime.now().isoformat(sep=' ', timespec='seconds')
@@ -724,29 +1336,16 @@ class DetailPageWidget(QWidget):
                 estimate_id_to_use = cursor.lastrowid
                 self.current_estimate_id = estimate_id_to_use
 
-            if detail_data_list:
-                details_to_insert = []
-                for detail in detail_data_list:
-                    details_to_insert.append((
-                        estimate_id_to_use,
-                        detail["row_order"],
-                        detail["name_text"],
-                        detail["specification_text"], # 追加
-                        detail["quantity"],
-                        detail["unit_text"],
-                        detail["unit_price"],
-                        detail["amount"],
-                        detail["summary_text"]
-                    ))
-                
-                cursor.executemany("""
-                    INSERT INTO details (estimate_id, row_order, name_text, specification_text,
-                                        quantity, unit_text, unit_price, amount, summary_text)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, details_to_insert)
+            self._insert_details(cursor, estimate_id_to_use, detail_data_list)
 
             conn.commit()
-            self.status_message_requested.emit(f"ファイル '{os.path.basename(self.db_file_path)}' に保存しました。")
+            if self.undo_stack:
+                self.undo_stack.setClean() # 保存した時点を未保存の編集がない状態とする
+            self._clear_changed_cells()
+            self.edit_journal.restart(estimate_id_to_use) # 保存した内容を起点にして記録し直す
+            if self.row_validator.estimate_id != estimate_id_to_use: # 初めて保存した見積は単価の目安から除く
+                self.row_validator.reset(self.db_file_path, estimate_id_to_use)
+            self.status_message_requested.emit(f"ファイル '{os.path.basename(self.db_file_path)}' に保存しました。", 3000)
             return True
 
         except sqlite3.Error as e:
@@ -758,6 +1357,137 @@ class DetailPageWidget(QWidget):
             if conn:
                 conn.close()
 
+    @staticmethod
+    def _insert_details(cursor: sqlite3.Cursor, estimate_id: int, detail_data_list: List[Dict[str, Any]]):
+        """_get_current_detail_data_for_save の明細行を見積 estimate_id の明細として挿入する"""
+        if not detail_data_list:
+            return
+        details_to_insert = []
+        for detail in detail_data_list:
+            details_to_insert.append((
+                estimate_id,
+                detail["row_order"],
+                detail["name_text"],
+                detail["specification_text"],
+                detail["quantity"],
+                detail["unit_text"],
+                detail["unit_price"],
+                detail["amount"],
+                detail["summary_text"],
+                detail["quantity_formula"],
+                detail["unit_price_formula"],
+                detail["assembly_id"],
+                detail["line_key"]
+            ))
+        cursor.executemany("""
+            INSERT INTO details (estimate_id, row_order, name_text, specification_text,
+                                quantity, unit_text, unit_price, amount, summary_text,
+                                quantity_formula, unit_price_formula, assembly_id, line_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, details_to_insert)
+
+    def save_as_template(self, name: str) -> Optional[int]:
+        """明細画面の内容 (見出しと明細) を、テンプレート名 name のテンプレートとして保存する
+
+        開いている見積は変えない。保存したテンプレートの ID を返す (失敗したら None)。
+        """
+        self.flush_updates() # 予約中の計算式・金額の再計算を済ませてから保存する
+        header_data = self._get_current_header_data_for_save()
+        detail_data_list = self._get_current_detail_data_for_save()
+        conn = None
+        try:
+            conn = self._connect_database()
+            cursor = conn.cursor()
+            now_iso = datetime.now().isoformat(sep=' ', timespec='seconds')
+            cursor.execute("""
+                INSERT INTO estimates (base_estimate_id, revision_number, project_name, client_name, period_text,
+                                    subtotal_amount, tax_amount, total_amount, created_at, updated_at, is_template)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+            """, (None, 0, name, header_data["client_name"], header_data["period_text"],
+                    header_data["subtotal_amount"], header_data["tax_amount"], header_data["total_amount"],
+                    now_iso, now_iso))
+            template_id = cursor.lastrowid
+            self._insert_details(cursor, template_id, detail_data_list)
+            conn.commit()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"テンプレートの保存中にエラーが発生しました:\n{e}")
+            if conn:
+                conn.rollback()
+            return None
+        finally:
+            if conn:
+                conn.close()
+        self.status_message_requested.emit(f"テンプレート「{name}」を保存しました ({len(detail_data_list)} 行)", 5000)
+        return template_id
+
+    def has_unsaved_changes(self) -> bool:
+        """読み込み・保存の後に編集したか"""
+        return self.undo_stack is not None and not self.undo_stack.isClean()
+
+    def open_copied_estimate(self, estimate_id: int, project_name: Optional[str] = None) -> bool:
+        """データベースの中で複写した見積 (開いている見積の複製・改訂版) を開く
+
+        画面の明細は (未保存の編集を元に戻せば) 複写した明細と同じなので、読み込み直さずに
+        開いている見積の ID と工事名だけを切り替える。保存した時点まで戻せなければ読み込む。
+        """
+        if self.has_unsaved_changes():
+            if self.undo_stack.cleanIndex() < 0:
+                return self.load_estimate(estimate_id)
+            self.undo_stack.setIndex(self.undo_stack.cleanIndex()) # 未保存の編集を元に戻す
+        self.current_estimate_id = estimate_id
+        if project_name is not None:
+            self.project_name_value.setText(project_name or "---")
+        if self.undo_stack:
+            self.undo_stack.clear() # 元の見積の編集履歴は持ち越さない
+        self.edit_journal.restart(estimate_id)
+        self.row_validator.reset(self.db_file_path, estimate_id)
+        return True
+
+    @timed()
+    def load_estimate(self, estimate_id: int) -> bool:
+        """保存済みの見積 (estimates / details) をデータベースから読み込んで表示する"""
+        conn = None
+        try:
+            conn = self._connect_database()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT project_name, client_name, period_text FROM estimates WHERE id = ?
+            """, (estimate_id,))
+            header_row = cursor.fetchone()
+            if header_row is None:
+                QMessageBox.warning(self, "読み込みエラー", f"見積 (ID: {estimate_id}) が見つかりません。")
+                return False
+            cursor.execute("""
+                SELECT name_text, specification_text, quantity, unit_text, unit_price, summary_text,
+                       quantity_formula, unit_price_formula, assembly_id, line_key
+                FROM details WHERE estimate_id = ? ORDER BY row_order
+            """, (estimate_id,))
+            detail_rows = [
+                {"name": name, "specification": spec, "quantity": quantity, "unit": unit,
+                 "unit_price": unit_price, "summary": summary,
+                 "quantity_formula": quantity_formula, "unit_price_formula": unit_price_formula,
+                 "assembly_id": assembly_id, "line_key": line_key}
+                for (name, spec, quantity, unit, unit_price, summary, quantity_formula, unit_price_formula, assembly_id,
+                     line_key) in cursor.fetchall()
+            ]
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"データの読み込み中にエラーが発生しました:\n{e}")
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+        project_name, client_name, period_text = header_row
+        self.current_estimate_id = estimate_id
+        self.update_header(project_name, client_name, period_text, "---", "---", "---")
+        self.set_detail_rows(detail_rows)
+        if self.undo_stack:
+            self.undo_stack.clear() # 読み込み前の編集履歴は無効になる
+        self.edit_journal.restart(estimate_id)
+        self.row_validator.reset(self.db_file_path, estimate_id) # 単価の目安は開いた見積を除いて読み直す
+        self.request_update(UpdateFlag.TOTALS | UpdateFlag.HEADER)
+        return True
+
     @Slot()
     def handle_save_file(self):
         # (変更なしのため省略 - 前回のコードを参照)
@@ -0,0 +1,451 @@
+# edit_journal.py
+"""保存していない編集の記録 (異常終了・停電の後に、最後に保存した内容に重ねて編集を復元する)
+
+- Undo スタックに積んだコマンドと Undo / Redo を、1行1件の JSON で記録ファイルに追記する。
+  1行目は記録の起点 (見積の ID とデータベース。保存していない見積なら起点の明細そのもの)。
+- 1件の書き込みは os.write 1回 (OS に渡すので、アプリが落ちても残る)。ディスクへの同期 (fsync) は
+  JOURNAL_SYNC_INTERVAL_MS ごとにまとめてワーカースレッドで行う (停電で失うのは最後の同期の後の編集だけ)。
+- 読み込み・保存のたびに記録を捨てて起点を付け直す。起点の後に編集するまではファイルを作らない。
+- コマンドは、やり直し・元に戻すに必要な値だけを記録する (アイテムは文字列と独自データにする)。
+  同じ記録の中で積んだコマンドの Undo / Redo は番号だけを書く。
+- 行 ID が記録したときと復元したときで同じになるように、記録のたびに行 ID を振り直させる
+  (行の追加・削除の後だけ実際に働く)。復元では ReplayCommand が操作ごとに同じことをする。
+"""
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from PySide6.QtCore import QObject, QTimer, Qt
+from PySide6.QtGui import QUndoCommand
+from PySide6.QtWidgets import QComboBox, QTableWidgetItem
+
+from background import BackgroundTask, run_in_background
+from commands import (
+    ITEM_DATA_ROLES, AddRowCommand, ChangeItemCommand, ChangeMultipleItemsCommand, DuplicateMultipleRowsCommand,
+    FillCellsCommand, InsertRowCommand, InsertRowsCommand, MoveMultipleRowsCommand, RemoveMultipleRowsCommand,
+    ReorderRowsCommand, ReplayCommand, restore_item_data, snapshot_item_data
+)
+from constants import JOURNAL_FILE_NAME
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+JOURNAL_VERSION = 1
+JOURNAL_SYNC_INTERVAL_MS = 1000   # ディスクへの同期 (fsync) をまとめる間隔
+JOURNAL_SET_ASIDE_SUFFIX = ".old" # 起動時に確かめた前回の記録は、この拡張子を付けて残す (次の起動で上書きする)
+
+
+def journal_path() -> str:
+    return os.path.join(os.getcwd(), JOURNAL_FILE_NAME)
+
+
+# --------------------------------------------------------------------------
+# セル・コマンドの記録
+# --------------------------------------------------------------------------
+def _int_value(value: Any) -> Optional[int]:
+    if value is None:
+        return None
+    return value.value if hasattr(value, 'value') else int(value)
+
+
+def _encode_cell(cell: Any) -> Any:
+    """行のデータのセル (アイテム・単位のコンボボックスの内容・辞書) を JSON にできる形にする"""
+    if cell is None:
+        return None
+    if isinstance(cell, tuple): # (QComboBox, {'currentText': ...})
+        return {"unit": cell[1].get('currentText', '')}
+    if isinstance(cell, QTableWidgetItem):
+        text, flags, alignment, data = cell.text(), cell.flags(), cell.textAlignment(), snapshot_item_data(cell)
+    else:
+        text, flags, alignment = cell.get('text', ''), cell.get('flags'), cell.get('textAlignment')
+        data = {key: cell.get(key) for key in ITEM_DATA_ROLES}
+    encoded = {"text": text, "flags": _int_value(flags), "align": _int_value(alignment)}
+    for key, value in data.items():
+        if value is not None:
+            encoded[key] = str(value) if isinstance(value, Decimal) else value
+    return encoded
+
+
+def _decode_cell(cell: Any) -> Any:
+    """_encode_cell の逆 (アイテムは MoveMultipleRowsCommand などと同じ辞書の形にする)"""
+    if cell is None:
+        return None
+    if "unit" in cell:
+        return (QComboBox, {'currentText': cell["unit"]})
+    decoded = {'text': cell.get("text", ""), 'flags': cell.get("flags"), 'textAlignment': cell.get("align")}
+    for key in ITEM_DATA_ROLES:
+        if cell.get(key) is not None:
+            decoded[key] = Decimal(cell[key]) if key == 'value' else cell[key]
+    return decoded
+
+
+def _decode_item_cell(cell: Any) -> Any:
+    """_encode_cell の逆 (アイテムは QTableWidgetItem にする。InsertRowsCommand 用)"""
+    decoded = _decode_cell(cell)
+    if not isinstance(decoded, dict):
+        return decoded
+    item = QTableWidgetItem(decoded['text'])
+    if decoded['flags'] is not None:
+        item.setFlags(Qt.ItemFlag(decoded['flags']))
+    if decoded['textAlignment'] is not None:
+        item.setTextAlignment(decoded['textAlignment'])
+    restore_item_data(item, decoded)
+    return item
+
+
+def _encode_rows(rows: List[List[Any]]) -> List[List[Any]]:
+    return [[_encode_cell(cell) for cell in row] for row in rows]
+
+
+def _decode_rows(rows: List[List[Any]], decode: Callable[[Any], Any] = _decode_cell) -> List[List[Any]]:
+    return [[decode(cell) for cell in row] for row in rows]
+
+
+def encode_command(command: QUndoCommand) -> Optional[Dict[str, Any]]:
+    """コマンドを記録の形にする (記録できないコマンドなら None)"""
+    record: Dict[str, Any]
+    if isinstance(command, ChangeItemCommand):
+        record = {"t": "change", "row": command.row, "col": command.col, "old": command.old_text, "new": command.new_text}
+    elif isinstance(command, ChangeMultipleItemsCommand):
+        record = {"t": "change_many", "changes": command.changes}
+    elif isinstance(command, FillCellsCommand):
+        record = {"t": "fill", "col": command.col, "rows": command.rows, "old": command.old_texts, "new": command.new_text}
+    elif isinstance(command, InsertRowCommand):
+        record = {"t": "insert_row", "row": command.row_index}
+    elif isinstance(command, AddRowCommand):
+        record = {"t": "add_row", "row": command.row_index}
+    elif isinstance(command, InsertRowsCommand):
+        record = {"t": "insert_rows", "position": command.position, "rows": _encode_rows(command.rows_data)}
+    elif isinstance(command, RemoveMultipleRowsCommand):
+        record = {"t": "remove_rows", "rows": command.rows_ascending,
+                  "data": [[row, [_encode_cell(cell) for cell in command.rows_data_saved.get(row, [])]]
+                           for row in command.rows_ascending]}
+    elif isinstance(command, DuplicateMultipleRowsCommand):
+        record = {"t": "duplicate_rows", "inserted": command.inserted_row_indices_in_redo,
+                  "data": [[row, [_encode_cell(cell) for cell in row_data]]
+                           for row, row_data in command.source_rows_data_map.items()]}
+    elif isinstance(command, MoveMultipleRowsCommand):
+        # 元に戻すときに使う値 (元の位置の行・挿入した位置) は redo で決まるので、それも記録する
+        record = {"t": "move_rows", "source": command.source_indices_asc, "dest": command.dest_row_before_removal,
+                  "rows": _encode_rows(command.rows_data_to_move),
+                  "original": _encode_rows(command.data_of_rows_at_original_source_positions),
+                  "insert_at": command.actual_dest_insertion_start_row_in_redo}
+    elif isinstance(command, ReorderRowsCommand):
+        record = {"t": "reorder", "old": command.old_order, "new": command.new_order}
+    elif isinstance(command, ReplayCommand):
+        operations = []
+        for undoing, inner in command.operations:
+            inner_record = encode_command(inner)
+            if inner_record is None:
+                return None
+            operations.append([undoing, inner_record])
+        record = {"t": "replay", "ops": operations}
+    else:
+        return None
+    record["text"] = command.text()
+    return record
+
+
+def decode_command(page: 'DetailPageWidget', record: Dict[str, Any]) -> Optional[QUndoCommand]:
+    """encode_command の逆 (復元できない記録なら None)"""
+    table = page.table
+    kind = record.get("t")
+    command: QUndoCommand
+    if kind == "change":
+        command = ChangeItemCommand(table, record["row"], record["col"], record["old"], record["new"])
+    elif kind == "change_many":
+        command = ChangeMultipleItemsCommand(table, [tuple(change) for change in record["changes"]])
+    elif kind == "fill":
+        command = FillCellsCommand(table, record["col"], record["rows"], record["old"], record["new"])
+    elif kind == "insert_row":
+        command = InsertRowCommand(table, record["row"], page._initialize_row)
+    elif kind == "add_row":
+        command = AddRowCommand(table, page._initialize_row)
+        command.row_index = record["row"]
+    elif kind == "insert_rows":
+        command = InsertRowsCommand(table, record["position"], _decode_rows(record["rows"], _decode_item_cell))
+    elif kind == "remove_rows":
+        command = RemoveMultipleRowsCommand(table, record["rows"],
+                                            {row: [_decode_cell(cell) for cell in cells] for row, cells in record["data"]})
+    elif kind == "duplicate_rows":
+        command = DuplicateMultipleRowsCommand(table, {row: [_decode_cell(cell) for cell in cells]
+                                                       for row, cells in record["data"]})
+        command.inserted_row_indices_in_redo = list(record["inserted"])
+    elif kind == "move_rows":
+        command = MoveMultipleRowsCommand(table, record["source"], _decode_rows(record["rows"]), record["dest"])
+        command.data_of_rows_at_original_source_positions = _decode_rows(record["original"])
+        command.actual_dest_insertion_start_row_in_redo = record["insert_at"]
+    elif kind == "reorder":
+        command = ReorderRowsCommand(table, record["old"], record["new"])
+    elif kind == "replay":
+        operations = []
+        for undoing, inner_record in record["ops"]:
+            inner = decode_command(page, inner_record)
+            if inner is None:
+                return None
+            operations.append((bool(undoing), inner))
+        command = ReplayCommand(table, operations)
+    else:
+        return None
+    if record.get("text"):
+        command.setText(record["text"])
+    return command
+
+
+# --------------------------------------------------------------------------
+# 記録ファイルの読み込み
+# --------------------------------------------------------------------------
+class JournalContents(NamedTuple):
+    header: Dict[str, Any]          # 記録の起点 (estimate_id / db / rows / started)
+    records: List[Dict[str, Any]]   # 操作の記録 (番号 n, 種類 op, コマンド cmd)
+
+    def describe(self) -> str:
+        estimate_id = self.header.get("estimate_id")
+        started = self.header.get("started", "")[:16].replace("T", " ")
+        target = f"見積 (ID: {estimate_id})" if estimate_id is not None else "保存していない見積"
+        return f"{target} の {started} からの編集 {len(self.records)} 件"
+
+
+def read_journal(path: str) -> Optional[JournalContents]:
+    """記録ファイルを読む (なければ None)。最後の行が書きかけなら、その前までを返す"""
+    if not os.path.exists(path):
+        return None
+    header: Optional[Dict[str, Any]] = None
+    records: List[Dict[str, Any]] = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError: # 書き込みの途中で止まった行
+                    break
+                if header is None:
+                    if record.get("v") != JOURNAL_VERSION:
+                        return None
+                    header = record
+                else:
+                    records.append(record)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"警告: 編集の記録 {path} を読み込めませんでした: {e}")
+        return None
+    return JournalContents(header, records) if header is not None else None
+
+
+def set_aside_journal(path: str):
+    """記録ファイルを消さずに脇へ置く (復元しなかったとき。前に脇へ置いたものは上書きする)"""
+    try:
+        os.replace(path, path + JOURNAL_SET_ASIDE_SUFFIX)
+    except OSError as e:
+        print(f"警告: 編集の記録 {path} を移動できませんでした: {e}")
+
+
+# --------------------------------------------------------------------------
+# 記録
+# --------------------------------------------------------------------------
+def _fsync_and_close(fd: int):
+    """(ワーカースレッド) 複製したファイル記述子を同期して閉じる"""
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EditJournal(QObject):
+    """明細ページの Undo スタックの操作を記録ファイルに追記する
+
+    activate されるまで (起動時に前回の記録を復元するか決めるまで) はファイルに触れない。
+    """
+
+    def __init__(self, page: 'DetailPageWidget', path: Optional[str] = None):
+        super().__init__(page)
+        self._page = page
+        self._stack = page.undo_stack
+        self.path = path or journal_path()
+        self._active = False
+        self._header: Optional[Dict[str, Any]] = None # 記録の起点 (最初の操作を書くときにファイルの1行目にする)
+        self._fd: Optional[int] = None
+        self._next_number = 1
+        self._first_number = 1 # 今の記録で最初のコマンドの番号 (より前のコマンドの Undo / Redo は内容ごと書く)
+        self._index = 0
+        self._sync_task: Optional[BackgroundTask] = None
+        self._sync_timer = QTimer(self)
+        self._sync_timer.setSingleShot(True)
+        self._sync_timer.setInterval(JOURNAL_SYNC_INTERVAL_MS)
+        self._sync_timer.timeout.connect(self.sync)
+        if self._stack is not None:
+            self._index = self._stack.index()
+            self._stack.indexChanged.connect(self._on_index_changed)
+
+    def activate(self):
+        """記録を始める (それまでに積んだコマンド、たとえば復元した編集も記録する)"""
+        if self._active:
+            return
+        self._active = True
+        if self._stack is None:
+            return
+        for index in range(self._stack.index()):
+            command = self._stack.command(index)
+            if getattr(command, '_journal_number', None) is None:
+                self._write("push", self._number(command), command)
+
+    def restart(self, estimate_id: Optional[int], base_rows: Optional[List[Dict[str, Any]]] = None):
+        """(読み込み・保存の後) 今の明細を起点にして記録をやり直す。保存していない見積なら base_rows が起点"""
+        self._close_file()
+        if self._active and os.path.exists(self.path):
+            self._remove_file()
+        self._header = {"v": JOURNAL_VERSION, "estimate_id": estimate_id, "db": self._page.db_file_path,
+                        "started": datetime.now().isoformat(timespec="seconds")}
+        if estimate_id is None:
+            self._header["rows"] = base_rows or []
+        self._first_number = self._next_number
+        if self._stack is not None:
+            self._index = self._stack.index()
+
+    def close(self):
+        """(終了時) 未保存の編集がなければ記録を消し、あればディスクに同期して残す。この後は記録しない
+
+        Undo スタックはメインウィンドウのもので明細ページより先に破棄され、破棄の途中でも indexChanged を出すので、
+        ここでつなぎを外しておく。
+        """
+        self._close_file()
+        if self._active and self._stack is not None and self._stack.isClean() and os.path.exists(self.path):
+            self._remove_file()
+        self._active = False
+        if self._stack is not None:
+            self._stack.indexChanged.disconnect(self._on_index_changed)
+            self._stack = None
+
+    def sync(self):
+        """書いた記録をディスクに同期する (ワーカースレッドで行う)
+
+        ワーカーには複製したファイル記述子を渡し、ワーカーが閉じる (同期の途中で記録を閉じても、
+        閉じた番号が別のファイルに使い回されて、そちらを同期・クローズすることがない)。
+        """
+        self._sync_timer.stop()
+        if self._fd is None or self._sync_task is not None:
+            return
+        try:
+            fd = os.dup(self._fd)
+        except OSError as e:
+            print(f"警告: 編集の記録をディスクに同期できませんでした: {e}")
+            return
+        self._sync_task = run_in_background(_fsync_and_close, fd, on_finished=self._on_synced,
+                                            on_failed=self._on_sync_failed)
+
+    def _on_synced(self, result):
+        self._sync_task = None
+
+    def _on_sync_failed(self, message: str):
+        self._sync_task = None
+        print(f"警告: 編集の記録をディスクに同期できませんでした: {message}")
+
+    def _number(self, command: QUndoCommand) -> int:
+        number = self._next_number
+        self._next_number += 1
+        command._journal_number = number
+        return number
+
+    def _on_index_changed(self, index: int):
+        previous, self._index = self._index, index
+        stack = self._stack
+        if not self._active or self._header is None or stack.count() == 0: # clear は読み込み側で restart する
+            return
+        self._page.formula_engine.row_ids() # 記録と復元で行 ID が同じになるように、ここで振り直させる
+        if index > previous: # 積んだ (番号のないコマンド) か Redo
+            for position in range(previous, index):
+                command = stack.command(position)
+                number = getattr(command, '_journal_number', None)
+                if number is None:
+                    self._write("push", self._number(command), command)
+                else:
+                    self._write("redo", number, command if number < self._first_number else None)
+        elif index < previous: # Undo
+            for position in range(previous - 1, index - 1, -1):
+                command = stack.command(position)
+                number = getattr(command, '_journal_number', None)
+                embed = number is None or number < self._first_number # 今の記録にないコマンドは内容ごと書く
+                self._write("undo", self._number(command) if number is None else number, command if embed else None)
+        elif index > 0: # 一番上のコマンドに続けて入力した内容がまとめられた (mergeWith)
+            command = stack.command(index - 1)
+            number = getattr(command, '_journal_number', None)
+            self._write("merge", number if number is not None else self._number(command), command)
+
+    def _write(self, op: str, number: int, command: Optional[QUndoCommand]):
+        record: Dict[str, Any] = {"n": number, "op": op}
+        if command is not None:
+            record["cmd"] = encode_command(command) or {"t": None, "text": command.text()}
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+                os.write(self._fd, self._encode_line(self._header))
+            os.write(self._fd, self._encode_line(record))
+        except OSError as e:
+            print(f"警告: 編集の記録 {self.path} に書き込めませんでした: {e}")
+            return
+        if not self._sync_timer.isActive():
+            self._sync_timer.start()
+
+    @staticmethod
+    def _encode_line(record: Dict[str, Any]) -> bytes:
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+    def _close_file(self):
+        self._sync_timer.stop()
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            os.fsync(fd)
+            os.close(fd)
+        except OSError as e:
+            print(f"警告: 編集の記録 {self.path} を閉じられませんでした: {e}")
+
+    def _remove_file(self):
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"警告: 編集の記録 {self.path} を削除できませんでした: {e}")
+
+    # ------------------------------------------------------------------
+    # 復元
+    # ------------------------------------------------------------------
+    def recover(self, contents: JournalContents) -> Tuple[int, int]:
+        """記録の起点 (最後に保存した内容) を開き、記録した操作を1つの Undo コマンドとして適用する
+
+        (適用した操作の数, 記録した操作の数) を返す。復元できない操作があれば、その前までを適用する。
+        起点を開けなければ (0, 記録した操作の数)。
+        """
+        page = self._page
+        header = contents.header
+        if header.get("db"):
+            page.db_file_path = header["db"]
+        estimate_id = header.get("estimate_id")
+        if estimate_id is not None:
+            if not page.load_estimate(estimate_id):
+                return 0, len(contents.records)
+        else:
+            page.current_estimate_id = None
+            page.set_detail_rows(header.get("rows") or [])
+            if self._stack is not None:
+                self._stack.clear()
+            self.restart(None, header.get("rows") or [])
+        commands: Dict[int, QUndoCommand] = {}
+        operations: List[Tuple[bool, QUndoCommand]] = []
+        for record in contents.records:
+            number, op = record.get("n"), record.get("op")
+            command = commands.get(number) if "cmd" not in record else None
+            if command is None:
+                command = decode_command(page, record["cmd"]) if record.get("cmd") else None
+                if command is None:
+                    break
+                commands[number] = command
+            operations.append((op == "undo", command))
+        if operations:
+            replay = ReplayCommand(page.table, operations, f"編集の復元 ({len(operations)} 件)")
+            if self._stack is not None:
+                self._stack.push(replay)
+            else:
+                replay.redo()
+        return len(operations), len(contents.records)
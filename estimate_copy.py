@@ -0,0 +1,123 @@
+# estimate_copy.py
+"""見積のデータベース上での複写 (複製・改訂版の作成・テンプレート)
+
+- 見積の複写は estimates と details をそれぞれ1つの INSERT ... SELECT で SQLite の中で行う
+  (明細行を Python に読み出してから1行ずつ挿入しない)。複写した見積は明細画面で一括で読み込む。
+- 明細の列は details の列一覧 (PRAGMA table_info) から取るので、後から追加した列 (計算式など) も複写される。
+- 改訂版は元の見積 (base_estimate_id) に結び付け、版番号 (revision_number) を 1 つ進める。
+  改訂版からさらに改訂版を作っても、base_estimate_id は最初の見積 (第1版) を指す。
+- テンプレートは estimates.is_template = 1 の見積。project_name をテンプレート名として使う。
+"""
+import sqlite3
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+_NOT_COPIED_DETAIL_COLUMNS = ("id", "estimate_id")
+
+
+class TemplateInfo(NamedTuple):
+    """テンプレートの一覧の1行"""
+    id: int
+    name: str
+    line_count: int
+    subtotal_amount: float
+    updated_at: str
+
+
+def _now_iso() -> str:
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+
+def _detail_columns(conn: sqlite3.Connection) -> List[str]:
+    return [row[1] for row in conn.execute("PRAGMA table_info(details)") if row[1] not in _NOT_COPIED_DETAIL_COLUMNS]
+
+
+def copy_estimate(conn: sqlite3.Connection, source_id: int, project_name: Optional[str] = None,
+                  is_template: bool = False, base_estimate_id: Optional[int] = None, revision_number: int = 0) -> int:
+    """見積 (見出しと明細) を複写し、新しい見積の ID を返す (コミットは呼び出し側で行う)
+
+    project_name が None なら元の工事名のまま。元の見積がなければ ValueError。
+    """
+    now_iso = _now_iso()
+    cursor = conn.execute("""
+        INSERT INTO estimates (base_estimate_id, revision_number, project_name, client_name, period_text,
+                               subtotal_amount, tax_amount, total_amount, created_at, updated_at, is_template)
+        SELECT ?, ?, COALESCE(?, project_name), client_name, period_text,
+               subtotal_amount, tax_amount, total_amount, ?, ?, ?
+        FROM estimates WHERE id = ?
+    """, (base_estimate_id, revision_number, project_name, now_iso, now_iso, int(is_template), source_id))
+    if cursor.rowcount != 1:
+        raise ValueError(f"見積 (ID: {source_id}) が見つかりません")
+    new_id = cursor.lastrowid
+    columns = ", ".join(_detail_columns(conn))
+    conn.execute(f"""
+        INSERT INTO details (estimate_id, {columns})
+        SELECT ?, {columns} FROM details WHERE estimate_id = ? ORDER BY row_order
+    """, (new_id, source_id))
+    return new_id
+
+
+COPY_NAME_SUFFIX = " (コピー)"
+
+
+def duplicate_estimate(conn: sqlite3.Connection, estimate_id: int, project_name: Optional[str] = None) -> int:
+    """見積を別の見積として複製する (元の見積とは結び付けない)。新しい見積の ID を返す
+
+    project_name が None なら元の工事名に COPY_NAME_SUFFIX を付ける。
+    """
+    with conn:
+        if project_name is None:
+            row = conn.execute("SELECT project_name FROM estimates WHERE id = ?", (estimate_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"見積 (ID: {estimate_id}) が見つかりません")
+            project_name = (row[0] or "") + COPY_NAME_SUFFIX
+        return copy_estimate(conn, estimate_id, project_name=project_name)
+
+
+def create_revision(conn: sqlite3.Connection, estimate_id: int) -> Tuple[int, int]:
+    """見積の改訂版を作る。(新しい見積の ID, 版番号) を返す"""
+    with conn:
+        row = conn.execute("SELECT COALESCE(base_estimate_id, id) FROM estimates WHERE id = ?", (estimate_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"見積 (ID: {estimate_id}) が見つかりません")
+        base_id = row[0]
+        (latest_revision,) = conn.execute("""
+            SELECT COALESCE(MAX(revision_number), 0) FROM estimates WHERE id = ? OR base_estimate_id = ?
+        """, (base_id, base_id)).fetchone()
+        revision_number = latest_revision + 1
+        new_id = copy_estimate(conn, estimate_id, base_estimate_id=base_id, revision_number=revision_number)
+    return new_id, revision_number
+
+
+# ----------------------------------------------------------------------
+# テンプレート
+# ----------------------------------------------------------------------
+def list_templates(conn: sqlite3.Connection) -> List[TemplateInfo]:
+    """テンプレートの一覧 (名前の順)"""
+    return [TemplateInfo(template_id, name or "", line_count, subtotal or 0.0, updated_at or "")
+            for template_id, name, line_count, subtotal, updated_at in conn.execute("""
+                SELECT e.id, e.project_name,
+                       (SELECT COUNT(*) FROM details d WHERE d.estimate_id = e.id),
+                       e.subtotal_amount, e.updated_at
+                FROM estimates e WHERE e.is_template = 1
+                ORDER BY e.project_name, e.id""")]
+
+
+def save_estimate_as_template(conn: sqlite3.Connection, estimate_id: int, name: str) -> int:
+    """保存済みの見積を複写してテンプレートにする。テンプレートの ID を返す"""
+    with conn:
+        return copy_estimate(conn, estimate_id, project_name=name, is_template=True)
+
+
+def create_estimate_from_template(conn: sqlite3.Connection, template_id: int, project_name: str) -> int:
+    """テンプレートを複写して新しい見積を作る。見積の ID を返す"""
+    with conn:
+        return copy_estimate(conn, template_id, project_name=project_name)
+
+
+def delete_template(conn: sqlite3.Connection, template_id: int):
+    """テンプレートを削除する (テンプレートでない見積は削除しない)"""
+    with conn:
+        deleted = conn.execute("DELETE FROM estimates WHERE id = ? AND is_template = 1", (template_id,)).rowcount
+        if deleted:
+            conn.execute("DELETE FROM details WHERE estimate_id = ?", (template_id,))
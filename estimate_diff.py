@@ -0,0 +1,303 @@
+# estimate_diff.py
+"""2つの見積 (改訂版どうしなど) の明細の比較
+
+- 明細行の対応付けは、まず行のキー (details.line_key。複製・改訂版に引き継がれる) で行う。
+  キーがない行 (キーを付ける前に保存した見積) と、キーが片方にしかない行は、
+  名称・仕様のハッシュで並びを比べて対応付ける (patience diff。一意な行を目印にして区間を分け、
+  目印のない小さな区間だけ LCS を計算する)。並べ替えなどで順序が合わない残りの行は、内容がすべて同じもの、
+  次に名称・仕様が同じものを前から順に対応付ける。
+- 対応付いた行は数量・単位・単価などを比べて「変更」か「変更なし」にする。
+  対応付かなかった行は「追加」「削除」にする。
+- compare_estimates はデータベースの接続をその中で開くので、ワーカースレッドで実行できる
+  (background.run_in_background)。
+"""
+import sqlite3
+from bisect import bisect_left
+from decimal import Decimal
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from number_format import to_decimal
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+# 比べる列 (DiffLine の属性名, 表示名)
+COMPARED_FIELDS = (
+    ("name", "名称"),
+    ("specification", "仕様"),
+    ("quantity", "数量"),
+    ("unit", "単位"),
+    ("unit_price", "単価"),
+    ("summary", "摘要"),
+)
+
+_LCS_CELL_LIMIT = 250_000 # 目印のない区間で LCS を計算する大きさの上限 (超えたら削除と追加として扱う)
+
+
+class DiffLine(NamedTuple):
+    """比較する明細行"""
+    line_key: Optional[str]
+    name: str
+    specification: str
+    quantity: Decimal
+    unit: str
+    unit_price: Decimal
+    amount: Decimal
+    summary: str
+
+    def identity(self) -> Tuple[str, str]:
+        """キーがないときに同じ行とみなす内容 (名称・仕様)"""
+        return (self.name, self.specification)
+
+    def content(self) -> Tuple:
+        """比べる列の内容 (同じなら変更のない行)"""
+        return (self.name, self.specification, self.quantity, self.unit, self.unit_price, self.summary)
+
+
+class DiffEntry(NamedTuple):
+    kind: str                          # ADDED / REMOVED / CHANGED / UNCHANGED
+    old: Optional[DiffLine]
+    new: Optional[DiffLine]
+    changed_fields: Tuple[str, ...] = ()
+
+    @property
+    def amount_delta(self) -> Decimal:
+        return (self.new.amount if self.new else Decimal('0')) - (self.old.amount if self.old else Decimal('0'))
+
+
+class EstimateDiff(NamedTuple):
+    entries: List[DiffEntry]           # 新しい見積の並び (削除した行は元の位置の近く)
+    old_subtotal: Decimal
+    new_subtotal: Decimal
+    matched_by_key: int                # 行のキーで対応付けた行数
+
+    @property
+    def subtotal_delta(self) -> Decimal:
+        return self.new_subtotal - self.old_subtotal
+
+    def count(self, kind: str) -> int:
+        return sum(1 for entry in self.entries if entry.kind == kind)
+
+
+# ----------------------------------------------------------------------
+# 比較
+# ----------------------------------------------------------------------
+def diff_lines(old_lines: Sequence[DiffLine], new_lines: Sequence[DiffLine]) -> EstimateDiff:
+    """明細行の並びを比較する"""
+    old_for_new: Dict[int, int] = {} # 新しい見積の行 -> 対応する元の見積の行
+
+    # 1. 行のキー (どちらの見積でも1行だけにあるもの) で対応付ける
+    old_keys = _unique_key_positions(old_lines)
+    for key, new_index in _unique_key_positions(new_lines).items():
+        old_index = old_keys.get(key)
+        if old_index is not None:
+            old_for_new[new_index] = old_index
+    matched_by_key = len(old_for_new)
+
+    # 2. 残りの行は名称・仕様の並びで対応付ける
+    matched_old = set(old_for_new.values())
+    rest_old = [i for i in range(len(old_lines)) if i not in matched_old]
+    rest_new = [j for j in range(len(new_lines)) if j not in old_for_new]
+    if rest_old and rest_new:
+        for a, b in align_sequences([old_lines[i].identity() for i in rest_old],
+                                    [new_lines[j].identity() for j in rest_new]):
+            old_for_new[rest_new[b]] = rest_old[a]
+        # 並びが変わった行 (並べ替え・移動) は、残った行どうしで内容がすべて同じもの、次に名称・仕様が同じものを
+        # 前から順に対応付ける
+        for line_hash in (DiffLine.content, DiffLine.identity):
+            matched_old = set(old_for_new.values())
+            unmatched_old: Dict[Hashable, List[int]] = {}
+            for i in reversed(rest_old):
+                if i not in matched_old:
+                    unmatched_old.setdefault(line_hash(old_lines[i]), []).append(i)
+            for j in rest_new:
+                if j not in old_for_new:
+                    candidates = unmatched_old.get(line_hash(new_lines[j]))
+                    if candidates:
+                        old_for_new[j] = candidates.pop()
+
+    # 3. 新しい見積の並びに、削除した行を元の位置の近くに挟んで並べる
+    matched_old = set(old_for_new.values())
+    entries: List[DiffEntry] = []
+    old_cursor = 0
+    for new_index, new_line in enumerate(new_lines):
+        old_index = old_for_new.get(new_index)
+        if old_index is None:
+            entries.append(DiffEntry(ADDED, None, new_line))
+            continue
+        while old_cursor <= old_index:
+            if old_cursor not in matched_old:
+                entries.append(DiffEntry(REMOVED, old_lines[old_cursor], None))
+            old_cursor += 1
+        old_line = old_lines[old_index]
+        changed = tuple(field for field, _ in COMPARED_FIELDS if getattr(old_line, field) != getattr(new_line, field))
+        entries.append(DiffEntry(CHANGED if changed else UNCHANGED, old_line, new_line, changed))
+    entries.extend(DiffEntry(REMOVED, old_lines[i], None) for i in range(old_cursor, len(old_lines))
+                   if i not in matched_old)
+
+    return EstimateDiff(entries,
+                        sum((line.amount for line in old_lines), Decimal('0')),
+                        sum((line.amount for line in new_lines), Decimal('0')),
+                        matched_by_key)
+
+
+def _unique_key_positions(lines: Sequence[DiffLine]) -> Dict[str, int]:
+    """行のキー -> 位置 (キーのない行・同じキーが複数ある行は除く)"""
+    positions: Dict[str, int] = {}
+    duplicated = set()
+    for index, line in enumerate(lines):
+        if line.line_key is None:
+            continue
+        if line.line_key in positions:
+            duplicated.add(line.line_key)
+        positions[line.line_key] = index
+    for key in duplicated:
+        del positions[key]
+    return positions
+
+
+def align_sequences(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Tuple[int, int]]:
+    """2つの並びで同じ要素の対応 (a の位置, b の位置) を、どちらの順にも並ぶように返す (patience diff)"""
+    pairs: List[Tuple[int, int]] = []
+    pending = [(0, len(a), 0, len(b))]
+    while pending:
+        a_lo, a_hi, b_lo, b_hi = pending.pop()
+        # 先頭・末尾の同じ要素はそのまま対応付ける
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            pairs.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            pairs.append((a_hi, b_hi))
+        if a_lo >= a_hi or b_lo >= b_hi:
+            continue
+        anchors = _unique_common_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            # 目印の間の区間を同じように比べる
+            prev_a, prev_b = a_lo, b_lo
+            for i, j in anchors:
+                pairs.append((i, j))
+                pending.append((prev_a, i, prev_b, j))
+                prev_a, prev_b = i + 1, j + 1
+            pending.append((prev_a, a_hi, prev_b, b_hi))
+        elif (a_hi - a_lo) * (b_hi - b_lo) <= _LCS_CELL_LIMIT:
+            pairs.extend(_lcs_pairs(a, b, a_lo, a_hi, b_lo, b_hi))
+    pairs.sort()
+    return pairs
+
+
+def _unique_common_anchors(a, b, a_lo, a_hi, b_lo, b_hi) -> List[Tuple[int, int]]:
+    """区間の中でどちらにも1回だけ出てくる要素の対応のうち、最長の増加列 (目印)"""
+    counts: Dict[Hashable, List[int]] = {} # 要素 -> [a での回数, b での回数, a の位置, b の位置]
+    for i in range(a_lo, a_hi):
+        entry = counts.setdefault(a[i], [0, 0, i, -1])
+        entry[0] += 1
+    for j in range(b_lo, b_hi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+    candidates = sorted((i, j) for a_count, b_count, i, j in counts.values() if a_count == 1 and b_count == 1)
+    if not candidates:
+        return []
+    # b の位置の最長増加部分列 (patience sorting)
+    tails: List[int] = []           # 長さ k+1 の増加列の末尾の b の位置
+    tail_indexes: List[int] = []    # その候補の番号
+    previous: List[int] = [-1] * len(candidates)
+    for index, (_, j) in enumerate(candidates):
+        k = bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[k] = j
+            tail_indexes[k] = index
+        previous[index] = tail_indexes[k - 1] if k > 0 else -1
+    anchors = []
+    index = tail_indexes[-1]
+    while index >= 0:
+        anchors.append(candidates[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def _lcs_pairs(a, b, a_lo, a_hi, b_lo, b_hi) -> List[Tuple[int, int]]:
+    """区間の最長共通部分列の対応 (小さい区間用の動的計画法)"""
+    rows, cols = a_hi - a_lo, b_hi - b_lo
+    lengths = [[0] * (cols + 1) for _ in range(rows + 1)]
+    for i in range(rows - 1, -1, -1):
+        row, below = lengths[i], lengths[i + 1]
+        a_item = a[a_lo + i]
+        for j in range(cols - 1, -1, -1):
+            row[j] = below[j + 1] + 1 if a_item == b[b_lo + j] else max(below[j], row[j + 1])
+    pairs = []
+    i = j = 0
+    while i < rows and j < cols:
+        if a[a_lo + i] == b[b_lo + j]:
+            pairs.append((a_lo + i, b_lo + j))
+            i += 1
+            j += 1
+        elif lengths[i + 1][j] >= lengths[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+# ----------------------------------------------------------------------
+# データベース
+# ----------------------------------------------------------------------
+class ComparableEstimate(NamedTuple):
+    """比較の対象に選べる見積"""
+    id: int
+    project_name: str
+    base_id: int                       # 改訂版の元の見積 (第1版なら自分)
+    revision_number: int
+    updated_at: str
+
+    def label(self) -> str:
+        revision = f" 改訂 {self.revision_number}" if self.revision_number else ""
+        return f"{self.project_name or '(工事名なし)'}{revision}  [ID: {self.id}, {self.updated_at}]"
+
+
+def list_comparable_estimates(conn: sqlite3.Connection) -> List[ComparableEstimate]:
+    """テンプレート以外の見積 (改訂版は元の見積の後に版の順に並べる)"""
+    return [ComparableEstimate(estimate_id, project_name or "", base_id, revision_number or 0, updated_at or "")
+            for estimate_id, project_name, base_id, revision_number, updated_at in conn.execute("""
+                SELECT id, project_name, COALESCE(base_estimate_id, id), revision_number, updated_at
+                FROM estimates WHERE is_template = 0
+                ORDER BY COALESCE(base_estimate_id, id), revision_number, id""")]
+
+
+def previous_revision_id(estimates: Sequence[ComparableEstimate], estimate_id: int) -> Optional[int]:
+    """同じ見積の1つ前の版 (なければ None)"""
+    current = next((estimate for estimate in estimates if estimate.id == estimate_id), None)
+    if current is None:
+        return None
+    earlier = [estimate for estimate in estimates if estimate.base_id == current.base_id
+               and (estimate.revision_number, estimate.id) < (current.revision_number, current.id)]
+    return max(earlier, key=lambda estimate: (estimate.revision_number, estimate.id)).id if earlier else None
+
+
+def load_diff_lines(conn: sqlite3.Connection, estimate_id: int) -> List[DiffLine]:
+    return [DiffLine(line_key, name or "", specification or "", to_decimal(quantity), unit or "",
+                     to_decimal(unit_price), to_decimal(amount), summary or "")
+            for line_key, name, specification, quantity, unit, unit_price, amount, summary in conn.execute("""
+                SELECT line_key, name_text, specification_text, quantity, unit_text, unit_price, amount, summary_text
+                FROM details WHERE estimate_id = ? ORDER BY row_order""", (estimate_id,))]
+
+
+def compare_estimates(db_file_path: str, old_estimate_id: int, new_estimate_id: int) -> EstimateDiff:
+    """保存済みの2つの見積を比較する (ワーカースレッドから呼べるように接続はここで開く)"""
+    conn = sqlite3.connect(db_file_path)
+    try:
+        old_lines = load_diff_lines(conn, old_estimate_id)
+        new_lines = load_diff_lines(conn, new_estimate_id)
+    finally:
+        conn.close()
+    return diff_lines(old_lines, new_lines)
@@ -0,0 +1,197 @@
+# estimate_repricing.py
+"""保存済みの見積の単価をデータベース上で一括変更する (明細画面に読み込まずに SQL でまとめて更新する)
+
+- 対象の明細行は details と estimates を結合した1つの WHERE 条件で選ぶ (名称・仕様の一致、最新版のみ など)。
+- 新しい単価は price_adjustment の規則を SQLite の関数として登録して SQL の中で計算する
+  (明細画面の一括調整と丸め方が食い違わないように)。
+- preview_repricing は更新せずに、見積ごとの対象行数と工事金額・合計の変化を返す (ドライラン)。
+- apply_repricing は明細の単価・金額と、見積の工事金額・消費税額・合計を1つのトランザクションで更新する。
+- 単価が計算式の行は変更しない。他の行を参照する計算式 ("R3.数量"、"小計") がある見積は、
+  SQL では計算し直せないので対象から外し、件数だけ返す。
+"""
+import sqlite3
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, NamedTuple, Tuple
+
+from constants import TAX_RATE
+from price_adjustment import PriceAdjustment
+
+FIELD_NAME = "name"                  # 名称で探す
+FIELD_SPECIFICATION = "specification"  # 仕様で探す
+FIELD_ANY = "any"                    # 名称・仕様のどちらかで探す
+_FIELD_COLUMNS = {
+    FIELD_NAME: ("d.name_text",),
+    FIELD_SPECIFICATION: ("d.specification_text",),
+    FIELD_ANY: ("d.name_text", "d.specification_text"),
+}
+_TAX_RATE = Decimal(str(TAX_RATE))
+_YEN = Decimal("0")
+
+# 他の行を参照する計算式 (保存時は "R3.数量" / "小計" の形)
+_REFERENCE_FORMULA_SQL = """
+    EXISTS (SELECT 1 FROM details f
+            WHERE f.estimate_id = e.id
+              AND (f.quantity_formula GLOB '*R[0-9?]*' OR f.quantity_formula LIKE '%小計%'
+                   OR f.unit_price_formula GLOB '*R[0-9?]*' OR f.unit_price_formula LIKE '%小計%'))
+"""
+# 同じ見積の改訂版 (base_estimate_id が同じもの) の中で最新の版
+_LATEST_REVISION_SQL = """
+    NOT EXISTS (SELECT 1 FROM estimates newer
+                WHERE COALESCE(newer.base_estimate_id, newer.id) = COALESCE(e.base_estimate_id, e.id)
+                  AND newer.revision_number > e.revision_number)
+"""
+
+
+class RepricingCriteria(NamedTuple):
+    """単価を変更する明細行の条件"""
+    text: str                          # 探す名称・仕様 (例: "シリコン樹脂塗料")
+    field: str = FIELD_ANY             # FIELD_NAME / FIELD_SPECIFICATION / FIELD_ANY
+    exact: bool = False                # True なら完全一致、False なら部分一致
+    latest_revision_only: bool = True  # True なら各見積の最新版だけを対象にする
+
+
+class RepricingPreviewRow(NamedTuple):
+    """プレビューの1行 (見積ごとの変化)"""
+    estimate_id: int
+    project_name: str
+    client_name: str
+    revision_number: int
+    line_count: int          # 単価が変わる明細行の数
+    old_subtotal: Decimal    # 変更前の工事金額
+    new_subtotal: Decimal
+    old_total: Decimal       # 変更前の合計 (税込)
+    new_total: Decimal
+
+    @property
+    def subtotal_delta(self) -> Decimal:
+        return self.new_subtotal - self.old_subtotal
+
+    @property
+    def total_delta(self) -> Decimal:
+        return self.new_total - self.old_total
+
+
+class RepricingResult(NamedTuple):
+    estimate_count: int   # 更新した見積の数
+    line_count: int       # 更新した明細行の数
+    estimate_ids: Tuple[int, ...]
+
+
+def estimate_totals(amount_sum: Decimal) -> Tuple[Decimal, Decimal, Decimal]:
+    """明細金額の合計から (工事金額, 消費税額, 合計) を求める (明細画面の合計と同じ丸め方)"""
+    subtotal = amount_sum.quantize(_YEN, rounding=ROUND_HALF_UP)
+    tax_exact = amount_sum * _TAX_RATE # 税は丸める前の税抜合計から計算
+    tax = tax_exact.quantize(_YEN, rounding=ROUND_HALF_UP)
+    total = (amount_sum + tax_exact).quantize(_YEN, rounding=ROUND_HALF_UP)
+    return subtotal, tax, total
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(repr(value)) if isinstance(value, float) else Decimal(value or 0)
+
+
+def _register_functions(conn: sqlite3.Connection, adjustment: PriceAdjustment):
+    """SQL の中で使う関数を登録する (adjust_price: 新しい単価、yen_subtotal/yen_tax/yen_total: 合計の丸め)"""
+    def adjust_price(price):
+        return float(adjustment.apply(_decimal(price)))
+
+    conn.create_function("adjust_price", 1, adjust_price, deterministic=True)
+    for index, name in enumerate(("yen_subtotal", "yen_tax", "yen_total")):
+        conn.create_function(name, 1, lambda amount_sum, i=index: float(estimate_totals(_decimal(amount_sum))[i]),
+                             deterministic=True)
+
+
+def _match_sql(criteria: RepricingCriteria) -> Tuple[str, list]:
+    """名称・仕様が条件に合う明細行の WHERE 条件とパラメーター"""
+    columns = _FIELD_COLUMNS[criteria.field]
+    operator_sql = "{} = ?" if criteria.exact else "instr({}, ?) > 0"
+    return " OR ".join(operator_sql.format(column) for column in columns), [criteria.text] * len(columns)
+
+
+def _target_lines_sql(criteria: RepricingCriteria) -> Tuple[str, list]:
+    """単価を変更する明細行を選ぶ SELECT (d.id, d.estimate_id, d.quantity, d.unit_price, 新しい単価)"""
+    match_sql, params = _match_sql(criteria)
+    conditions = [
+        f"({match_sql})",
+        "d.unit_price_formula IS NULL",   # 計算式の単価は変更しない
+        "COALESCE(d.unit_price, 0) <> 0",  # 単価 0 の行 (見出しなど) は変更しない
+        f"NOT {_REFERENCE_FORMULA_SQL}",
+    ]
+    if criteria.latest_revision_only:
+        conditions.append(_LATEST_REVISION_SQL)
+    sql = f"""
+        SELECT d.id, d.estimate_id, d.quantity, d.unit_price, adjust_price(d.unit_price) AS new_price
+        FROM details d JOIN estimates e ON e.id = d.estimate_id
+        WHERE {' AND '.join(conditions)}
+    """
+    return sql, params
+
+
+def count_skipped_estimates(conn: sqlite3.Connection, criteria: RepricingCriteria) -> int:
+    """条件に合う行があるが、他の行を参照する計算式があるので対象から外す見積の数"""
+    match_sql, params = _match_sql(criteria)
+    latest_sql = f"AND {_LATEST_REVISION_SQL}" if criteria.latest_revision_only else ""
+    row = conn.execute(f"""
+        SELECT COUNT(DISTINCT e.id) FROM details d JOIN estimates e ON e.id = d.estimate_id
+        WHERE ({match_sql}) AND {_REFERENCE_FORMULA_SQL} {latest_sql}
+    """, params).fetchone()
+    return row[0] if row else 0
+
+
+def preview_repricing(conn: sqlite3.Connection, criteria: RepricingCriteria,
+                      adjustment: PriceAdjustment) -> List[RepricingPreviewRow]:
+    """更新せずに、単価が変わる見積ごとの対象行数と金額の変化を返す (ドライラン)"""
+    _register_functions(conn, adjustment)
+    target_sql, params = _target_lines_sql(criteria)
+    rows = conn.execute(f"""
+        WITH target AS ({target_sql}),
+             changed AS (SELECT estimate_id, COUNT(*) AS line_count,
+                                SUM(quantity * (new_price - unit_price)) AS amount_delta
+                         FROM target WHERE new_price <> unit_price GROUP BY estimate_id)
+        SELECT e.id, e.project_name, e.client_name, e.revision_number, c.line_count,
+               (SELECT SUM(amount) FROM details WHERE estimate_id = e.id), c.amount_delta
+        FROM changed c JOIN estimates e ON e.id = c.estimate_id
+        ORDER BY e.id
+    """, params).fetchall()
+    preview = []
+    for estimate_id, project_name, client_name, revision_number, line_count, amount_sum, amount_delta in rows:
+        old_subtotal, _, old_total = estimate_totals(_decimal(amount_sum))
+        new_subtotal, _, new_total = estimate_totals(_decimal(amount_sum) + _decimal(amount_delta))
+        preview.append(RepricingPreviewRow(estimate_id, project_name or "", client_name or "", revision_number or 0,
+                                           line_count, old_subtotal, new_subtotal, old_total, new_total))
+    return preview
+
+
+def apply_repricing(conn: sqlite3.Connection, criteria: RepricingCriteria,
+                    adjustment: PriceAdjustment) -> RepricingResult:
+    """条件に合う明細行の単価・金額と、その見積の工事金額・消費税額・合計を1つのトランザクションで更新する"""
+    _register_functions(conn, adjustment)
+    target_sql, params = _target_lines_sql(criteria)
+    now_iso = datetime.now().isoformat(sep=' ', timespec='seconds')
+    with conn: # 途中で失敗したらすべて元に戻す
+        conn.execute("DROP TABLE IF EXISTS temp.repriced")
+        conn.execute(f"""
+            CREATE TEMP TABLE repriced AS
+            SELECT id, estimate_id, new_price FROM ({target_sql}) WHERE new_price <> unit_price
+        """, params)
+        conn.execute("CREATE INDEX temp.idx_repriced_id ON repriced (id)")
+        line_count = conn.execute("""
+            UPDATE details
+            SET unit_price = (SELECT new_price FROM repriced r WHERE r.id = details.id),
+                amount = quantity * (SELECT new_price FROM repriced r WHERE r.id = details.id)
+            WHERE id IN (SELECT id FROM repriced)
+        """).rowcount
+        estimate_ids = tuple(row[0] for row in conn.execute(
+            "SELECT DISTINCT estimate_id FROM repriced ORDER BY estimate_id"))
+        amount_sum_sql = "(SELECT SUM(amount) FROM details WHERE details.estimate_id = estimates.id)"
+        conn.execute(f"""
+            UPDATE estimates
+            SET subtotal_amount = yen_subtotal({amount_sum_sql}),
+                tax_amount = yen_tax({amount_sum_sql}),
+                total_amount = yen_total({amount_sum_sql}),
+                updated_at = ?
+            WHERE id IN (SELECT estimate_id FROM repriced)
+        """, (now_iso,))
+        conn.execute("DROP TABLE temp.repriced")
+    return RepricingResult(len(estimate_ids), line_count, estimate_ids)
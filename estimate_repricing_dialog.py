@@ -0,0 +1,183 @@
+# estimate_repricing_dialog.py
+"""保存済みの見積の単価を一括変更するダイアログ (プレビューで確認してから適用する)"""
+import sqlite3
+from decimal import Decimal
+from typing import Optional
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (
+    QAbstractItemView, QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, QGroupBox, QHBoxLayout,
+    QHeaderView, QLabel, QLineEdit, QMessageBox, QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
+)
+
+from database_setup import migrate_database
+from estimate_repricing import (
+    FIELD_ANY, FIELD_NAME, FIELD_SPECIFICATION, RepricingCriteria, RepricingResult,
+    apply_repricing, count_skipped_estimates, preview_repricing
+)
+from number_format import CURRENCY_FORMAT
+from price_adjustment_dialog import PriceAdjustmentForm
+
+
+def _signed_currency(value) -> str:
+    return ("+" if value > 0 else "-" if value < 0 else "") + CURRENCY_FORMAT.format(abs(value))
+
+
+class EstimateRepricingDialog(QDialog):
+    """名称・仕様で探した明細行の単価を、保存済みの見積にまとめて反映するダイアログ"""
+
+    PREVIEW_HEADERS = ["ID", "工事名", "相手先名", "版", "対象行", "工事金額 (変更前)", "工事金額 (変更後)", "合計の差額"]
+
+    def __init__(self, db_file_path: str, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setWindowTitle("保存済み見積の単価一括変更")
+        self.db_file_path = db_file_path
+        self.result: Optional[RepricingResult] = None
+        self._previewed = False
+        self._build_ui()
+        self._update_buttons()
+
+    def _build_ui(self):
+        self.text_edit = QLineEdit()
+        self.text_edit.setPlaceholderText("例: シリコン樹脂塗料")
+        self.field_combo = QComboBox()
+        self.field_combo.addItem("名称・仕様", FIELD_ANY)
+        self.field_combo.addItem("名称", FIELD_NAME)
+        self.field_combo.addItem("仕様", FIELD_SPECIFICATION)
+        self.exact_check = QCheckBox("完全一致")
+        self.latest_check = QCheckBox("各見積の最新版だけを変更する")
+        self.latest_check.setChecked(True)
+        match_row = QHBoxLayout()
+        match_row.addWidget(self.field_combo)
+        match_row.addWidget(self.exact_check)
+        criteria_form = QFormLayout()
+        criteria_form.addRow("探す文字:", self.text_edit)
+        criteria_form.addRow("探す列:", match_row)
+        criteria_form.addRow("", self.latest_check)
+        criteria_group = QGroupBox("対象の明細行")
+        criteria_group.setLayout(criteria_form)
+
+        self.adjustment_form = PriceAdjustmentForm()
+        adjustment_group = QGroupBox("単価の変更")
+        adjustment_layout = QVBoxLayout(adjustment_group)
+        adjustment_layout.addWidget(self.adjustment_form)
+
+        self.preview_button = QPushButton("プレビュー")
+        self.preview_button.clicked.connect(self.preview)
+        self.preview_table = QTableWidget(0, len(self.PREVIEW_HEADERS))
+        self.preview_table.setHorizontalHeaderLabels(self.PREVIEW_HEADERS)
+        self.preview_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.preview_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.preview_table.verticalHeader().setVisible(False)
+        self.preview_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.summary_label = QLabel("条件を入力して「プレビュー」で対象の見積を確認してください。")
+        self.summary_label.setWordWrap(True)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Cancel)
+        self.apply_button = self.button_box.addButton("適用", QDialogButtonBox.ButtonRole.AcceptRole)
+        self.button_box.accepted.connect(self.apply)
+        self.button_box.rejected.connect(self.reject)
+
+        top_row = QHBoxLayout()
+        top_row.addWidget(criteria_group, 1)
+        top_row.addWidget(adjustment_group, 1)
+        preview_row = QHBoxLayout()
+        preview_row.addWidget(self.summary_label, 1)
+        preview_row.addWidget(self.preview_button)
+        layout = QVBoxLayout(self)
+        layout.addLayout(top_row)
+        layout.addLayout(preview_row)
+        layout.addWidget(self.preview_table, 1)
+        layout.addWidget(self.button_box)
+        self.resize(900, 560)
+
+        # 条件を変えたらプレビューをやり直すまで適用できないようにする
+        self.text_edit.textChanged.connect(self._invalidate_preview)
+        self.field_combo.currentIndexChanged.connect(self._invalidate_preview)
+        self.exact_check.toggled.connect(self._invalidate_preview)
+        self.latest_check.toggled.connect(self._invalidate_preview)
+        self.adjustment_form.changed.connect(self._invalidate_preview)
+
+    def criteria(self) -> RepricingCriteria:
+        return RepricingCriteria(self.text_edit.text().strip(), self.field_combo.currentData(),
+                                 self.exact_check.isChecked(), self.latest_check.isChecked())
+
+    def _can_preview(self) -> bool:
+        return bool(self.criteria().text) and self.adjustment_form.is_valid()
+
+    def _invalidate_preview(self, *args):
+        if self._previewed:
+            self._previewed = False
+            self.summary_label.setText("条件が変わりました。もう一度「プレビュー」で確認してください。")
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.preview_button.setEnabled(self._can_preview())
+        self.apply_button.setEnabled(self._previewed and self.preview_table.rowCount() > 0)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file_path)
+        migrate_database(conn)
+        return conn
+
+    def preview(self):
+        """更新せずに、変更される見積と金額の変化を表示する"""
+        if not self._can_preview():
+            return
+        criteria, adjustment = self.criteria(), self.adjustment_form.adjustment()
+        conn = None
+        try:
+            conn = self._connect()
+            rows = preview_repricing(conn, criteria, adjustment)
+            skipped = count_skipped_estimates(conn, criteria)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"プレビュー中にエラーが発生しました:\n{e}")
+            return
+        finally:
+            if conn:
+                conn.close()
+        table = self.preview_table
+        table.setRowCount(len(rows))
+        for row, preview_row in enumerate(rows):
+            values = [str(preview_row.estimate_id), preview_row.project_name, preview_row.client_name,
+                      str(preview_row.revision_number), str(preview_row.line_count),
+                      CURRENCY_FORMAT.format(preview_row.old_subtotal), CURRENCY_FORMAT.format(preview_row.new_subtotal),
+                      _signed_currency(preview_row.total_delta)]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col not in (1, 2):
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                table.setItem(row, col, item)
+        line_count = sum(preview_row.line_count for preview_row in rows)
+        total_delta = sum((preview_row.total_delta for preview_row in rows), Decimal('0'))
+        summary = (f"{len(rows)} 件の見積・{line_count} 行の単価が変わります "
+                   f"(合計の差額 {_signed_currency(total_delta)}、{adjustment.describe()})。")
+        if skipped:
+            summary += f"\n計算式で他の行を参照している {skipped} 件の見積は対象外です (明細画面で変更してください)。"
+        if not rows:
+            summary = "単価が変わる明細行はありません。" + (summary.split("\n", 1)[1] if skipped else "")
+        self.summary_label.setText(summary)
+        self._previewed = True
+        self._update_buttons()
+
+    def apply(self):
+        """プレビューした内容をデータベースに反映する"""
+        if not self._previewed:
+            return
+        answer = QMessageBox.question(
+            self, "単価の一括変更",
+            f"{self.preview_table.rowCount()} 件の見積の単価と金額を変更します。よろしいですか？\n"
+            "(この変更は「元に戻す」では戻せません)")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        conn = None
+        try:
+            conn = self._connect()
+            self.result = apply_repricing(conn, self.criteria(), self.adjustment_form.adjustment())
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"単価の変更中にエラーが発生しました (変更は反映されていません):\n{e}")
+            return
+        finally:
+            if conn:
+                conn.close()
+        self.accept()
@@ -0,0 +1,296 @@
+# find_replace.py
+"""明細の検索と置換 (テーブルの上に表示する検索バー)
+
+- 一致するセルは TextIndex で探し (全セルの item.text() を読まない)、
+  一致の印はセルの状態 (CellStates) のフラグで付けて、背景はデリゲートで塗る (setBackground でセルのデータを書き換えない)。
+- 「すべて置換」は変わるセルをまとめて1つの Undo コマンド (合計の再計算も1回) で反映する。
+- 対象は文字列の列 (名称・仕様・摘要)。数値の列と単位は対象外。
+"""
+import re
+from bisect import bisect_left, bisect_right
+from typing import TYPE_CHECKING, List, Optional, Set, Tuple
+
+from PySide6.QtCore import QTimer, Qt
+from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6.QtWidgets import (
+    QCheckBox, QComboBox, QHBoxLayout, QLabel, QLineEdit, QPushButton, QToolButton, QVBoxLayout, QWidget
+)
+
+from cell_states import SEARCH_CURRENT, SEARCH_MATCH
+from commands import ChangeMultipleItemsCommand
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+SEARCH_DELAY_MS = 150            # 入力・編集してから検索し直すまでの待ち時間
+
+
+def compile_pattern(text: str, regex: bool, case_sensitive: bool) -> 're.Pattern[str]':
+    """検索文字列を正規表現にする (regex でなければ文字どおりに探す)。誤りなら re.error"""
+    return re.compile(text if regex else re.escape(text), 0 if case_sensitive else re.IGNORECASE)
+
+
+def replace_text(pattern: 're.Pattern[str]', text: str, replacement: str, regex: bool) -> str:
+    """text の中の一致をすべて置き換える (regex なら replacement の \\1 などはグループの内容になる)"""
+    return pattern.sub(replacement if regex else (lambda match: replacement), text)
+
+
+class FindReplaceBar(QWidget):
+    """明細の検索と置換のバー (Ctrl+F で検索だけ、Ctrl+H で置換欄も表示する)"""
+
+    def __init__(self, page: 'DetailPageWidget'):
+        super().__init__(page)
+        self._page = page
+        self._table = page.table
+        self.text_index = page.text_index
+        self._matches: List[Tuple[int, int]] = []        # 一致したセル (行番号, 列番号) を表の順に
+        self._match_cells: Set[Tuple[int, int]] = set()  # 一致したセル (行 ID, 列番号)
+        self._current: Optional[Tuple[int, int]] = None  # 選択中の一致 (行 ID, 列番号)
+        self.cell_states = page.cell_states
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DELAY_MS)
+        self._search_timer.timeout.connect(self.search)
+        self._build_ui()
+        self.text_index.changed.connect(self._schedule_search)
+        self.hide()
+
+    def _build_ui(self):
+        self.find_edit = QLineEdit()
+        self.find_edit.setPlaceholderText("検索する文字")
+        self.find_edit.setClearButtonEnabled(True)
+        self.column_combo = QComboBox()
+        self.column_combo.addItem("すべての列", None)
+        for col in self.text_index.columns:
+            self.column_combo.addItem(self._page.HEADERS[col], col)
+        self.regex_check = QCheckBox("正規表現")
+        self.case_check = QCheckBox("大文字と小文字を区別")
+        self.previous_button = QPushButton("前へ")
+        self.next_button = QPushButton("次へ")
+        self.count_label = QLabel()
+        self.close_button = QToolButton()
+        self.close_button.setText("×")
+        self.close_button.setToolTip("検索を閉じる (Esc)")
+
+        self.replace_edit = QLineEdit()
+        self.replace_edit.setPlaceholderText("置換後の文字 (正規表現なら \\1 でグループを使える)")
+        self.replace_button = QPushButton("置換")
+        self.replace_all_button = QPushButton("すべて置換")
+
+        find_row = QHBoxLayout()
+        find_row.addWidget(QLabel("検索:"))
+        find_row.addWidget(self.find_edit, 1)
+        find_row.addWidget(self.column_combo)
+        find_row.addWidget(self.regex_check)
+        find_row.addWidget(self.case_check)
+        find_row.addWidget(self.previous_button)
+        find_row.addWidget(self.next_button)
+        find_row.addWidget(self.count_label)
+        find_row.addWidget(self.close_button)
+        self.replace_row = QWidget()
+        replace_layout = QHBoxLayout(self.replace_row)
+        replace_layout.setContentsMargins(0, 0, 0, 0)
+        replace_layout.addWidget(QLabel("置換:"))
+        replace_layout.addWidget(self.replace_edit, 1)
+        replace_layout.addWidget(self.replace_button)
+        replace_layout.addWidget(self.replace_all_button)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(find_row)
+        layout.addWidget(self.replace_row)
+
+        self.find_edit.textChanged.connect(self._schedule_search)
+        self.find_edit.returnPressed.connect(self.find_next)
+        self.replace_edit.returnPressed.connect(self.replace_current)
+        self.column_combo.currentIndexChanged.connect(self.search)
+        self.regex_check.toggled.connect(self.search)
+        self.case_check.toggled.connect(self.search)
+        self.previous_button.clicked.connect(self.find_previous)
+        self.next_button.clicked.connect(self.find_next)
+        self.replace_button.clicked.connect(self.replace_current)
+        self.replace_all_button.clicked.connect(self.replace_all)
+        self.close_button.clicked.connect(self.close_bar)
+        shortcuts = ((QKeySequence(Qt.Key.Key_Escape), self.close_bar),
+                     (QKeySequence(QKeySequence.StandardKey.FindNext), self.find_next),
+                     (QKeySequence(QKeySequence.StandardKey.FindPrevious), self.find_previous))
+        for key, slot in shortcuts:
+            shortcut = QShortcut(key, self)
+            shortcut.setContext(Qt.ShortcutContext.WidgetWithChildrenShortcut)
+            shortcut.activated.connect(slot)
+        self._update_buttons()
+
+    # ------------------------------------------------------------------
+    # 表示
+    # ------------------------------------------------------------------
+    def open(self, replace: bool = False):
+        """バーを表示して検索欄にフォーカスする (replace なら置換欄も表示する)"""
+        self.replace_row.setVisible(replace)
+        self.show()
+        self.find_edit.setFocus()
+        self.find_edit.selectAll()
+        self.search()
+
+    def close_bar(self):
+        """バーを閉じて、一致の表示を消す"""
+        self._search_timer.stop()
+        self.hide()
+        self._set_matches([])
+        self._table.setFocus()
+
+    def reset(self):
+        """(読み込み時) 一致の表示を消して、表示中なら検索し直す"""
+        self._set_matches([])
+        self._schedule_search()
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+    def _options(self) -> Tuple[str, Optional[List[int]], bool, bool]:
+        col = self.column_combo.currentData()
+        return (self.find_edit.text(), None if col is None else [col],
+                self.regex_check.isChecked(), self.case_check.isChecked())
+
+    def _schedule_search(self, *args):
+        if not self.isHidden():
+            self._search_timer.start()
+
+    def search(self, *args):
+        """検索し直して、一致したセルの表示を更新する"""
+        self._search_timer.stop()
+        text, columns, regex, case_sensitive = self._options()
+        if self.isHidden() or not text:
+            self._set_matches([])
+            return
+        try:
+            matches = self.text_index.find(text, columns, regex, case_sensitive)
+        except re.error as e:
+            self._set_matches([], f"正規表現の誤り: {e}")
+            return
+        self._set_matches(matches)
+
+    def _set_matches(self, matches: List[Tuple[int, int]], message: str = ""):
+        self._matches = matches
+        row_ids = self._page.formula_engine.row_ids() if matches else []
+        self._match_cells = {(row_ids[row], col) for row, col in matches}
+        if self._current not in self._match_cells:
+            self._current = None
+        self._update_count_label(message)
+        self._update_buttons()
+        self._show_matches()
+
+    def _show_matches(self):
+        """一致・選択中の一致の印を付け直す (再描画は CellStates.changed で1回だけ行う)"""
+        self.cell_states.replace({SEARCH_MATCH: self._match_cells,
+                                  SEARCH_CURRENT: [self._current] if self._current is not None else []})
+
+    def _update_count_label(self, message: str = ""):
+        if message or not self.find_edit.text():
+            self.count_label.setText(message)
+        elif not self._matches:
+            self.count_label.setText("一致なし")
+        elif self._current is not None:
+            row, col = self._current_position()
+            self.count_label.setText(f"{bisect_left(self._matches, (row, col)) + 1} / {len(self._matches)} 件")
+        else:
+            self.count_label.setText(f"{len(self._matches)} 件")
+
+    def _update_buttons(self):
+        has_matches = bool(self._matches)
+        for button in (self.previous_button, self.next_button, self.replace_button, self.replace_all_button):
+            button.setEnabled(has_matches)
+
+    def _current_position(self) -> Tuple[int, int]:
+        row = self._page.formula_engine.row_of(self._current[0])
+        return (row if row is not None else -1), self._current[1]
+
+    def find_next(self):
+        self._move(backward=False)
+
+    def find_previous(self):
+        self._move(backward=True)
+
+    def _move(self, backward: bool):
+        """現在のセルの次 (前) の一致に移る (端まで行ったら反対側から)"""
+        if self._search_timer.isActive():
+            self.search()
+        if not self._matches:
+            return
+        current = self._table.currentIndex()
+        position = (current.row(), current.column()) if current.isValid() else (-1, -1)
+        if backward:
+            index = bisect_left(self._matches, position) - 1
+        else:
+            index = bisect_right(self._matches, position)
+        row, col = self._matches[index % len(self._matches)]
+        self._current = (self._page.formula_engine.row_id(row), col)
+        self._table.setCurrentCell(row, col)
+        item = self._table.item(row, col)
+        if item is not None:
+            self._table.scrollToItem(item)
+        self._update_count_label()
+        self._show_matches()
+
+    # ------------------------------------------------------------------
+    # 置換
+    # ------------------------------------------------------------------
+    def _push(self, changes: List[Tuple[int, int, str, str]], description: str):
+        command = ChangeMultipleItemsCommand(self._table, changes, description)
+        undo_stack = self._page.undo_stack
+        if undo_stack:
+            undo_stack.push(command)
+        else:
+            command.redo()
+
+    def _pattern(self) -> Optional['re.Pattern[str]']:
+        text, _, regex, case_sensitive = self._options()
+        try:
+            return compile_pattern(text, regex, case_sensitive)
+        except re.error as e:
+            self._update_count_label(f"正規表現の誤り: {e}")
+            return None
+
+    def _changes(self, pattern: 're.Pattern[str]', cells: List[Tuple[int, int]]) -> Optional[List[Tuple[int, int, str, str]]]:
+        """セルの文字列を置き換える変更 (行, 列, 変更前, 変更後)。置換後の文字の指定が誤りなら None"""
+        replacement, regex = self.replace_edit.text(), self.regex_check.isChecked()
+        changes = []
+        for row, col in cells:
+            old_text = self.text_index.text(row, col)
+            try:
+                new_text = replace_text(pattern, old_text, replacement, regex)
+            except re.error as e:
+                self._update_count_label(f"置換後の文字の誤り: {e}")
+                return None
+            if new_text != old_text:
+                changes.append((row, col, old_text, new_text))
+        return changes
+
+    def replace_current(self):
+        """選択中の一致を置き換えて、次の一致に移る (まだ一致を選んでいなければ次の一致を選ぶ)"""
+        if self._search_timer.isActive():
+            self.search()
+        current = self._table.currentIndex()
+        if self._current is None or not current.isValid() or (current.row(), current.column()) != self._current_position():
+            self.find_next()
+            return
+        pattern = self._pattern()
+        changes = self._changes(pattern, [(current.row(), current.column())]) if pattern is not None else None
+        if changes is None:
+            return
+        if changes:
+            self._push(changes, f"置換 「{self.find_edit.text()}」→「{self.replace_edit.text()}」")
+        self.search()
+        self.find_next()
+
+    def replace_all(self):
+        """一致したセルをすべて置き換える (1つの Undo コマンドにまとめる)"""
+        self.search()
+        pattern = self._pattern() if self._matches else None
+        changes = self._changes(pattern, self._matches) if pattern is not None else None
+        if changes is None:
+            return
+        if not changes:
+            self._update_count_label("置換する箇所はありません")
+            return
+        self._push(changes, f"すべて置換 「{self.find_edit.text()}」→「{self.replace_edit.text()}」")
+        self._page.status_message_requested.emit(f"{len(changes)} 個のセルを置換しました", 5000)
+        self.search()
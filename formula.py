@@ -0,0 +1,297 @@
+# formula.py
+"""数量・単価セルの計算式 (例: "12.5*2.8*2-1.8*0.9") の解析と評価
+
+- eval は使わず、数値・四則演算・括弧・符号・「%」だけを受け付ける再帰下降パーサーで解析する。
+- 解析結果は評価用のクロージャにコンパイルし、式の文字列ごとに LRU キャッシュする
+  (同じ式が何行にも現れる読み込み・貼り付けでは解析が1回で済む)。定数だけの部分は解析時に計算しておく。
+- 計算は Decimal で行う (浮動小数点の誤差で金額がずれないように)。
+- 全角の数字・演算子 (＊ × ÷ ／ （ ） など) も入力できる。
+- 他の行の値を参照できる。入力・保存時は行番号 ("R3.数量"、列を省略すると同じ列)、
+  メモリ上は行の移動・挿入・削除で変わらない行 ID ("{12.quantity}") で表す。
+  「小計」はその行より上の行の金額の合計を表す。参照の計算は formula_engine が行う。
+"""
+import re
+from decimal import Decimal, DivisionByZero, InvalidOperation
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from number_format import NORMALIZE_MAP
+
+CACHE_SIZE = 4096  # コンパイル済みの式のキャッシュの上限件数
+FORMULA_PREFIX = "="
+SUBTOTAL_KEYWORD = "小計"  # その行より上の行の金額の合計
+# 参照できる列 (メモリ上の名前 -> 入力・保存時の名前)
+FIELD_LABELS = {"quantity": "数量", "unit_price": "単価", "amount": "金額"}
+_FIELDS_BY_LABEL = {label: field for field, label in FIELD_LABELS.items()}
+_HUNDRED = Decimal(100)
+
+# 計算式用の正規化表 (数値の正規化に演算子の全角・記号の置換を加える)
+_FORMULA_TABLE = str.maketrans({
+    **NORMALIZE_MAP,
+    "＝": "=", "＊": "*", "×": "*", "✕": "*", "÷": "/", "／": "/",
+    "（": "(", "）": ")", "％": "%", "Ｒ": "R", "ｒ": "R", "r": "R",
+})
+_TOKEN_RE = re.compile(r"(\d+\.?\d*|\.\d+)|([-+*/()%])|(\{\d+\.[a-z_]+\})|(" + SUBTOTAL_KEYWORD + ")")
+_OPERATOR_CHARS = frozenset("+-*/()%")
+# 入力・保存時の行番号による参照 ("R3" / "R3.数量") と、メモリ上の行 ID による参照 ("{12.quantity}")
+_ROW_REFERENCE_RE = re.compile(r"R(\d+)(?:\.(" + "|".join(FIELD_LABELS.values()) + "))?")
+_ID_REFERENCE_RE = re.compile(r"\{(\d+)\.([a-z_]+)\}")
+_ANY_REFERENCE_RE = re.compile(r"R\d|\{\d|" + SUBTOTAL_KEYWORD)
+
+Reference = Tuple[int, str]  # (行 ID, 列名)
+
+
+class FormulaError(ValueError):
+    """計算式を解釈・計算できない"""
+
+
+def normalize(text: str) -> str:
+    """全角文字・空白・桁区切りを正規化し、先頭の「=」を除いた式を返す"""
+    normalized = text.translate(_FORMULA_TABLE)
+    return normalized[1:] if normalized.startswith(FORMULA_PREFIX) else normalized
+
+
+def is_formula(text) -> bool:
+    """セルへの入力が計算式かどうか (先頭が「=」か、符号以外の演算子・参照を含む)"""
+    if not isinstance(text, str):
+        return False
+    normalized = text.translate(_FORMULA_TABLE)
+    if normalized.startswith(FORMULA_PREFIX) or _ANY_REFERENCE_RE.search(normalized):
+        return True
+    return not _OPERATOR_CHARS.isdisjoint(normalized.lstrip("+-"))
+
+
+def has_references(text) -> bool:
+    """計算式が他の行 (または小計) を参照しているかどうか"""
+    return isinstance(text, str) and _ANY_REFERENCE_RE.search(text.translate(_FORMULA_TABLE)) is not None
+
+
+def to_canonical(text: str, row_id_at: Callable[[int], int], default_field: str) -> str:
+    """行番号による参照 ("R3.数量") を行 ID による参照 ("{12.quantity}") に置き換える
+
+    row_id_at は行番号 (0 始まり) から行 ID を返す。存在しない行なら FormulaError を送出する。
+    """
+    def replace(match):
+        field = _FIELDS_BY_LABEL[match.group(2)] if match.group(2) else default_field
+        return f"{{{row_id_at(int(match.group(1)) - 1)}.{field}}}"
+    return FORMULA_PREFIX + _ROW_REFERENCE_RE.sub(replace, normalize(text))
+
+
+def to_display(text: str, row_of: Callable[[int], Optional[int]]) -> str:
+    """行 ID による参照を、現在の行番号による参照に置き換える (編集・保存用)
+
+    row_of は行 ID から行番号 (0 始まり) を返す。削除された行は None で、"R?" と表示する。
+    """
+    def replace(match):
+        row = row_of(int(match.group(1)))
+        label = FIELD_LABELS.get(match.group(2), match.group(2))
+        return f"R{row + 1 if row is not None else '?'}.{label}"
+    return _ID_REFERENCE_RE.sub(replace, text)
+
+
+# --- コンパイル (構文木の代わりにクロージャを組み立てる) ---
+# 各ノードは (評価関数, 定数値) の組。評価関数は参照の値を返す resolve を受け取る。
+# 部分式が定数だけなら定数値を持ち、評価関数は使わない。
+_Node = tuple
+Resolver = Callable[[object], Decimal]  # 参照 (Reference または SUBTOTAL_KEYWORD) -> 値
+
+
+def _constant(value: Decimal) -> _Node:
+    return (lambda resolve: value), value
+
+
+def _reference(reference) -> _Node:
+    def evaluate_reference(resolve):
+        if resolve is None:
+            raise FormulaError("他の行を参照する式は明細の中でのみ計算できます")
+        return resolve(reference)
+    return evaluate_reference, None
+
+
+def _binary(operator: str, left: _Node, right: _Node) -> _Node:
+    op = _OPERATORS[operator]
+    if left[1] is not None and right[1] is not None:
+        return _constant(_calculate(op, left[1], right[1]))
+    left_eval, right_eval = left[0], right[0]
+    return (lambda resolve: _calculate(op, left_eval(resolve), right_eval(resolve))), None
+
+
+def _calculate(op: Callable[[Decimal, Decimal], Decimal], left: Decimal, right: Decimal) -> Decimal:
+    try:
+        return op(left, right)
+    except (DivisionByZero, InvalidOperation, ZeroDivisionError):
+        raise FormulaError("0 で割ることはできません") from None
+
+
+_OPERATORS = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+}
+
+
+class _Parser:
+    """expression := term (("+" | "-") term)*
+    term       := factor (("*" | "/") factor)*
+    factor     := ("+" | "-") factor | postfix
+    postfix    := primary "%"*
+    primary    := NUMBER | REFERENCE | "小計" | "(" expression ")"
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+        self.references: List[Reference] = []
+        self.uses_subtotal = False
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        tokens = []
+        pos = 0
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if match is None:
+                raise FormulaError(f"計算式に使えない文字があります: '{text[pos]}'")
+            tokens.append(match.group())
+            pos = match.end()
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Optional[str]:
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def parse(self) -> _Node:
+        if not self.tokens:
+            raise FormulaError("計算式が入力されていません")
+        node = self._expression()
+        if self._peek() is not None:
+            raise FormulaError(f"計算式の「{self._peek()}」の位置が正しくありません")
+        return node
+
+    def _expression(self) -> _Node:
+        node = self._term()
+        while self._peek() in ("+", "-"):
+            operator = self._next()
+            node = _binary(operator, node, self._term())
+        return node
+
+    def _term(self) -> _Node:
+        node = self._factor()
+        while self._peek() in ("*", "/"):
+            operator = self._next()
+            node = _binary(operator, node, self._factor())
+        return node
+
+    def _factor(self) -> _Node:
+        token = self._peek()
+        if token == "+":
+            self._next()
+            return self._factor()
+        if token == "-":
+            self._next()
+            operand = self._factor()
+            if operand[1] is not None:
+                return _constant(-operand[1])
+            operand_eval = operand[0]
+            return (lambda resolve: -operand_eval(resolve)), None
+        return self._postfix()
+
+    def _postfix(self) -> _Node:
+        node = self._primary()
+        while self._peek() == "%":
+            self._next()
+            node = _binary("/", node, _constant(_HUNDRED))
+        return node
+
+    def _primary(self) -> _Node:
+        token = self._next()
+        if token is None:
+            raise FormulaError("計算式が途中で終わっています")
+        if token == "(":
+            node = self._expression()
+            if self._next() != ")":
+                raise FormulaError("括弧が閉じられていません")
+            return node
+        if token[0].isdigit() or token[0] == ".":
+            return _constant(Decimal(token))
+        if token[0] == "{":
+            row_id, field = token[1:-1].split(".")
+            if field not in FIELD_LABELS:
+                raise FormulaError(f"参照できない列です: '{field}'")
+            reference = (int(row_id), field)
+            if reference not in self.references:
+                self.references.append(reference)
+            return _reference(reference)
+        if token == SUBTOTAL_KEYWORD:
+            self.uses_subtotal = True
+            return _reference(SUBTOTAL_KEYWORD)
+        raise FormulaError(f"計算式の「{token}」の位置が正しくありません")
+
+
+class Formula:
+    """コンパイル済みの計算式"""
+    __slots__ = ("text", "references", "uses_subtotal", "_evaluate", "_constant")
+
+    def __init__(self, expression: str, node: _Node, references: Tuple[Reference, ...] = (),
+                 uses_subtotal: bool = False):
+        self.text = FORMULA_PREFIX + expression  # Undo・セルに保持する正規化済みの式 (参照は行 ID)
+        self.references = references             # 参照している (行 ID, 列名)
+        self.uses_subtotal = uses_subtotal
+        self._evaluate, self._constant = node
+
+    def __repr__(self):
+        return f"Formula({self.text!r})"
+
+    @property
+    def has_references(self) -> bool:
+        return bool(self.references) or self.uses_subtotal
+
+    def evaluate(self, resolve: Optional[Resolver] = None) -> Decimal:
+        """式を計算する。参照は resolve で値にする。0 で割った場合などは FormulaError"""
+        if self._constant is not None:
+            return self._constant
+        return self._evaluate(resolve)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_formula(text: str) -> Formula:
+    """計算式を解析してコンパイルする (キャッシュ付き)。解釈できない場合は FormulaError"""
+    expression = normalize(text)
+    parser = _Parser(expression)
+    node = parser.parse()
+    return Formula(expression, node, tuple(parser.references), parser.uses_subtotal)
+
+
+def evaluate(text: str) -> Decimal:
+    """計算式を計算する。解釈・計算できない場合は FormulaError"""
+    return compile_formula(text).evaluate()
+
+
+def evaluate_many(texts: Iterable[Optional[str]], default: Optional[Decimal] = None) -> List[Optional[Decimal]]:
+    """複数の計算式をまとめて計算する (読み込み用)。空・解釈できない式・参照を含む式は default にする"""
+    compile_cached = compile_formula
+    result = []
+    append = result.append
+    for text in texts:
+        if not text:
+            append(default)
+            continue
+        try:
+            append(compile_cached(text).evaluate())
+        except FormulaError:
+            append(default)
+    return result
+
+
+def cache_info():
+    return compile_formula.cache_info()
+
+
+def clear_cache():
+    compile_formula.cache_clear()
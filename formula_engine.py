@@ -0,0 +1,305 @@
+# formula_engine.py
+"""明細の行をまたぐ計算式 (例: "=R3.数量*1.1"、"=小計*5%") の再計算
+
+- 行には移動・挿入・削除で変わらない行 ID を振り (名称セルの ROW_ID_ROLE)、参照は行 ID で持つ。
+- 参照を含む計算式のセルだけを DependencyGraph に登録し、セルが変わったら下流のセルだけを
+  トポロジカル順に計算し直す (参照を含む式がなければ何もしない)。循環参照のセルはエラー表示にする。
+- 行の挿入・削除・移動・並べ替えはモデルのシグナルで検知し、次の再計算のときに行番号と行 ID の対応を1回だけ作り直す
+  (行 ID を読むだけで、計算し直すのは削除・復元された行を参照しているセルと「小計」を使うセルに限る)。
+"""
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from PySide6.QtCore import QObject
+from PySide6.QtWidgets import QTableWidgetItem
+
+from constants import FORMULA_ROLE, ROW_ID_ROLE
+from dependency_graph import DependencyGraph
+from formula import Formula, FormulaError, SUBTOTAL_KEYWORD, compile_formula, to_canonical, to_display
+from update_scheduler import UpdateFlag
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+CellNode = Tuple[int, str]  # (行 ID, 列名)
+AMOUNT_FIELD = "amount"
+INPUT_FIELDS = ("quantity", "unit_price")  # 計算式を入力できる列 (金額は数量 × 単価)
+CYCLE_ERROR = "循環参照になっています"
+
+
+class FormulaEngine(QObject):
+    """行 ID の管理と、参照を含む計算式の依存関係に沿った再計算"""
+
+    def __init__(self, page: 'DetailPageWidget'):
+        super().__init__(page)
+        self._page = page
+        self._table = page.table
+        self._fields: Dict[int, str] = page.NUMBER_FORMAT_NAMES  # 列番号 -> 列名
+        self._columns: Dict[str, int] = {field: col for col, field in self._fields.items()}
+        self._graph = DependencyGraph()
+        self._formulas: Dict[CellNode, Formula] = {}  # 参照を含む計算式のセル
+        self._subtotal_users: Set[CellNode] = set()   # 「小計」を使うセル
+        self._changed: Set[CellNode] = set()          # 次の再計算で下流をたどるセル
+        self._row_ids: List[int] = []                 # 行番号 -> 行 ID
+        self._rows: Dict[int, int] = {}               # 行 ID -> 行番号
+        self._next_id = 1
+        self._structure_dirty = False
+        model = self._table.model()
+        for structural_signal in (model.rowsInserted, model.rowsRemoved, model.rowsMoved, model.layoutChanged,
+                                  model.modelReset):
+            structural_signal.connect(self._on_rows_restructured)
+
+    # ------------------------------------------------------------------
+    # 行 ID
+    # ------------------------------------------------------------------
+    def reset(self, row_count: int) -> List[int]:
+        """(読み込み時) 行 ID を 1 から振り直し、登録済みの計算式を消す。各行の行 ID を返す"""
+        self._graph.clear()
+        self._formulas.clear()
+        self._subtotal_users.clear()
+        self._changed.clear()
+        self._row_ids = list(range(1, row_count + 1))
+        self._rows = {row_id: row for row, row_id in enumerate(self._row_ids)}
+        self._next_id = row_count + 1
+        self._structure_dirty = False
+        return self._row_ids
+
+    def assign_row_ids(self, row_ids: Sequence[int]):
+        """(やり直し時) 各行の行 ID を row_ids に揃える (前回の適用後と同じ行 ID にする)。行数が違えば何もしない"""
+        self._ensure_synced()
+        if len(row_ids) != len(self._row_ids) or list(row_ids) == self._row_ids:
+            return
+        table = self._table
+        name_col = self._page.COL_NAME
+        was_blocked = table.signalsBlocked()
+        table.blockSignals(True)
+        for row, row_id in enumerate(row_ids):
+            item = table.item(row, name_col)
+            if item is None:
+                item = QTableWidgetItem("")
+                table.setItem(row, name_col, item)
+            item.setData(ROW_ID_ROLE, row_id)
+        table.blockSignals(was_blocked)
+        self._next_id = max(self._next_id, max(row_ids, default=0) + 1)
+        self._sync_rows()
+        if self._formulas:
+            self._page.request_update(UpdateFlag.FORMULAS)
+
+    def row_id(self, row: int) -> int:
+        """行番号 (0 始まり) の行 ID"""
+        self._ensure_synced()
+        if not 0 <= row < len(self._row_ids):
+            raise FormulaError(f"行 {row + 1} はありません")
+        return self._row_ids[row]
+
+    def row_ids(self) -> List[int]:
+        """全行の行 ID (行番号の順。呼び出し側で変更しないこと)"""
+        self._ensure_synced()
+        return self._row_ids
+
+    def row_of(self, row_id: int) -> Optional[int]:
+        """行 ID の現在の行番号 (削除された行なら None)"""
+        self._ensure_synced()
+        return self._rows.get(row_id)
+
+    def _on_rows_restructured(self, *args):
+        self._structure_dirty = True
+        if self._formulas:
+            self._page.request_update(UpdateFlag.FORMULAS)
+
+    def _ensure_synced(self):
+        if self._structure_dirty:
+            self._sync_rows()
+
+    def _sync_rows(self):
+        """行の挿入・削除・移動の後に、行番号と行 ID の対応を作り直す"""
+        self._structure_dirty = False
+        table = self._table
+        name_col = self._page.COL_NAME
+        old_rows = self._rows
+        row_ids: List[int] = []
+        rows: Dict[int, int] = {}
+        was_blocked = table.signalsBlocked()
+        table.blockSignals(True)
+        for row in range(table.rowCount()):
+            item = table.item(row, name_col)
+            row_id = item.data(ROW_ID_ROLE) if item is not None else None
+            if row_id is None or row_id in rows: # 追加された行・複写された行には新しい ID を振る
+                row_id = self._next_id
+                self._next_id += 1
+                if item is None:
+                    item = QTableWidgetItem("")
+                    table.setItem(row, name_col, item)
+                item.setData(ROW_ID_ROLE, row_id)
+            row_ids.append(row_id)
+            rows[row_id] = row
+        table.blockSignals(was_blocked)
+        self._row_ids = row_ids
+        self._rows = rows
+
+        # 削除された行: その行の計算式を外し、その行を参照しているセルを計算し直す (エラー表示になる)
+        for row_id in old_rows.keys() - rows.keys():
+            for field in self._columns:
+                node = (row_id, field)
+                if node in self._formulas:
+                    self._unregister(node)
+                if self._graph.dependents(node):
+                    self._changed.add(node)
+        # 追加・復元された行: 計算式を登録し、その行を参照しているセルを計算し直す
+        for row_id in rows.keys() - old_rows.keys():
+            self._register_row(row_id)
+        # 「小計」は上の行の並びで決まるので、行の並びが変わったら依存先を作り直す
+        for node in self._subtotal_users:
+            self._graph.set_dependencies(node, self._dependencies_of(node, self._formulas[node]))
+            self._changed.add(node)
+
+    def _register_row(self, row_id: int):
+        row = self._rows[row_id]
+        for field in self._columns:
+            node = (row_id, field)
+            if field in INPUT_FIELDS:
+                item = self._table.item(row, self._columns[field])
+                formula_text = item.data(FORMULA_ROLE) if item is not None else None
+                if formula_text:
+                    try:
+                        formula = compile_formula(formula_text)
+                    except FormulaError:
+                        formula = None
+                    if formula is not None and formula.has_references:
+                        self._register(node, formula)
+                        self._changed.add(node)
+            if self._graph.dependents(node):
+                self._changed.add(node)
+
+    # ------------------------------------------------------------------
+    # 計算式の登録と計算
+    # ------------------------------------------------------------------
+    def _node(self, row: int, col: int) -> CellNode:
+        return (self.row_id(row), self._fields[col])
+
+    def _dependencies_of(self, node: CellNode, formula: Formula) -> Set[CellNode]:
+        dependencies = set(formula.references)
+        if formula.uses_subtotal:
+            row = self._rows.get(node[0], 0)
+            dependencies.update((row_id, AMOUNT_FIELD) for row_id in self._row_ids[:row])
+        return dependencies
+
+    def _register(self, node: CellNode, formula: Formula):
+        self._formulas[node] = formula
+        if formula.uses_subtotal:
+            self._subtotal_users.add(node)
+        else:
+            self._subtotal_users.discard(node)
+        self._graph.set_dependencies(node, self._dependencies_of(node, formula))
+
+    def _unregister(self, node: CellNode):
+        self._formulas.pop(node, None)
+        self._subtotal_users.discard(node)
+        self._graph.set_dependencies(node, ())
+
+    @staticmethod
+    def _implicit_dependents(node: CellNode) -> Iterable[CellNode]:
+        """数量・単価が変わると同じ行の金額が変わる (グラフには辺として持たない)"""
+        return () if node[1] == AMOUNT_FIELD else ((node[0], AMOUNT_FIELD),)
+
+    def compile(self, row: int, col: int, text: str) -> Formula:
+        """入力された計算式の行番号による参照を行 ID に置き換えてコンパイルする"""
+        return compile_formula(to_canonical(text, self.row_id, self._fields[col]))
+
+    def set_formula(self, row: int, col: int, formula: Optional[Formula]):
+        """セルの計算式を登録する (参照を含まない式・数値なら登録を外す)"""
+        if formula is not None and formula.has_references:
+            self._register(self._node(row, col), formula)
+        elif self._formulas:
+            node = self._node(row, col)
+            if node in self._formulas:
+                self._unregister(node)
+
+    def evaluate(self, row: int, col: int, formula: Formula) -> Decimal:
+        """計算式を計算し、列の表示桁数に丸めた値を返す (循環参照・削除された行の参照は FormulaError)"""
+        if formula.has_references and self._graph.is_in_cycle(self._node(row, col), self._implicit_dependents):
+            raise FormulaError(CYCLE_ERROR)
+        return self._evaluate(row, col, formula)
+
+    def _evaluate(self, row: int, col: int, formula: Formula) -> Decimal:
+        if formula.has_references:
+            value = formula.evaluate(lambda reference: self._resolve(reference, row))
+        else:
+            value = formula.evaluate()
+        return self._page._number_format(col).round(value)
+
+    def _resolve(self, reference, row: int) -> Decimal:
+        if reference == SUBTOTAL_KEYWORD:
+            amount_at = self._page._amount_value_at_row
+            return sum((amount_at(above) for above in range(row)), Decimal('0'))
+        row_id, field = reference
+        referenced_row = self._rows.get(row_id)
+        if referenced_row is None:
+            raise FormulaError("参照している行は削除されています")
+        return self._page._cell_value(referenced_row, self._columns[field])
+
+    def display_text(self, formula_text: Optional[str]) -> Optional[str]:
+        """セルに保持している計算式を、現在の行番号による参照の形にする (編集・保存用)"""
+        if not formula_text or "{" not in formula_text:
+            return formula_text
+        return to_display(formula_text, self.row_of)
+
+    def cell_changed(self, row: int, col: int):
+        """セルの値が変わったことを知らせる (参照しているセルは次の再計算で計算し直す)"""
+        if not self._formulas:
+            return
+        self._changed.add(self._node(row, col))
+        self._page.request_update(UpdateFlag.FORMULAS)
+
+    def load_formulas(self, cells: List[Tuple[int, int]]):
+        """(読み込み時) 行番号による参照を含む計算式のセルを登録し、依存関係の順に計算する"""
+        table = self._table
+        was_blocked = table.signalsBlocked()
+        table.blockSignals(True)
+        for row, col in cells:
+            item = table.item(row, col)
+            try:
+                formula = self.compile(row, col, item.data(FORMULA_ROLE))
+            except FormulaError:
+                item.setData(FORMULA_ROLE, None) # 解釈できない式は保存されている値だけを使う
+                continue
+            item.setData(FORMULA_ROLE, formula.text)
+            node = self._node(row, col)
+            self._register(node, formula)
+            self._changed.add(node)
+        table.blockSignals(was_blocked)
+        self.recalculate()
+
+    def recalculate(self):
+        """変更されたセルの下流のセルだけを、依存関係の順に計算し直す"""
+        self._ensure_synced()
+        changed, self._changed = self._changed, set()
+        if not changed or not self._formulas:
+            return
+        order, cyclic = self._graph.affected_order(changed, self._implicit_dependents)
+        # 循環参照の計算式は入力に関係なくエラー (値 0) なので先に確定し、その後で計算順にたどる
+        for node in cyclic:
+            if node in self._formulas:
+                self._recalculate_node(node, CYCLE_ERROR)
+        for node in order:
+            if node not in cyclic or node[1] == AMOUNT_FIELD:
+                self._recalculate_node(node)
+
+    def _recalculate_node(self, node: CellNode, error: Optional[str] = None):
+        row = self._rows.get(node[0])
+        if row is None:
+            return
+        if node[1] == AMOUNT_FIELD:
+            self._page._recalculate_row_amount(row)
+            return
+        formula = self._formulas.get(node)
+        if formula is None:
+            return
+        col = self._columns[node[1]]
+        value = Decimal('0')
+        if error is None:
+            try:
+                value = self._evaluate(row, col, formula)
+            except FormulaError as e:
+                error = str(e)
+        self._page._show_numeric_result(self._table.item(row, col), col, value, formula.text, error)
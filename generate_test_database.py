@@ -0,0 +1,255 @@
+# generate_test_database.py
+"""負荷試験用の大規模な見積データベースを生成する
+
+塗装工事らしい名称・仕様・単位 (units.txt)・単価分布から見積と明細を作り、
+まとめて (バッチで) 挿入する。乱数のシードを固定しているので、同じ引数なら
+毎回同じ内容のデータベースができる。
+
+使い方:
+    python generate_test_database.py                                  # 見積 50,000 件 / 明細 10,000,000 行
+    python generate_test_database.py --estimates 1000 --details 200000 --output bench.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from constants import DATABASE_FILE_NAME, TAX_RATE
+from database_setup import setup_database
+
+DEFAULT_ESTIMATES = 50_000
+DEFAULT_DETAILS = 10_000_000
+DEFAULT_SEED = 20240401
+DEFAULT_BATCH_ROWS = 100_000   # 1トランザクションで挿入する明細行数の目安
+REVISION_RATIO = 0.1           # 既存見積の改訂版 (base_estimate_id あり) として作る割合
+DEFAULT_UNITS = ["式", "個", "m", "m2", "本", "セット"]
+
+# (名称, 仕様の候補, 単位, 単価の中央値 [円])
+WORK_ITEMS: List[Tuple[str, List[str], str, int]] = [
+    ("仮設足場", ["枠組足場 H={h}", "単管足場 H={h}", "くさび緊結式足場"], "m2", 900),
+    ("飛散防止ネット", ["メッシュシート", "防炎メッシュシート"], "m2", 250),
+    ("高圧洗浄", ["外壁面", "屋根面", "トルネード洗浄"], "m2", 200),
+    ("養生", ["窓・サッシ廻り", "植栽・車両", "床面 ビニール養生"], "式", 30000),
+    ("下地調整", ["ケレン 3種", "ケレン 4種", "クラック補修 W={w}"], "m2", 600),
+    ("シーリング打替え", ["変成シリコン W={w}", "ウレタン系 W={w}", "目地 W={w}×D10"], "m", 900),
+    ("シーリング増打ち", ["変成シリコン", "ノンブリードタイプ"], "m", 600),
+    ("外壁 下塗り", ["微弾性フィラー", "シーラー", "カチオン系下地調整材"], "m2", 700),
+    ("外壁 中塗り・上塗り", ["シリコン樹脂塗料 2回塗り", "フッ素樹脂塗料 2回塗り", "ラジカル制御形塗料 2回塗り"], "m2", 2200),
+    ("屋根 塗装", ["遮熱塗料 3回塗り", "ウレタン樹脂塗料 3回塗り", "タスペーサー挿入"], "m2", 2400),
+    ("軒天 塗装", ["ケイカル板 AEP 2回塗り", "防カビ塗料"], "m2", 1200),
+    ("破風板 塗装", ["ウレタン樹脂塗料 H={h}", "シリコン樹脂塗料 H={h}"], "m", 1000),
+    ("雨樋 塗装", ["竪樋 φ60", "軒樋 W={w}", "集水器"], "m", 800),
+    ("鉄部 錆止め塗装", ["変性エポキシ樹脂 錆止め", "鉛・クロムフリー錆止め"], "m2", 1500),
+    ("鉄骨階段 塗装", ["ウレタン樹脂塗料 2回塗り"], "式", 65000),
+    ("ベランダ防水", ["FRP防水 トップコート", "ウレタン防水 通気緩衝工法"], "m2", 4500),
+    ("床 塗装", ["エポキシ樹脂塗床 t=1.0", "水性床用塗料"], "m2", 3500),
+    ("内装 塗装", ["EP 2回塗り", "AEP 2回塗り H={h}×W={w}"], "m2", 1300),
+    ("塗料", ["シリコン樹脂塗料 16kg缶", "錆止め塗料 4kg缶"], "kg", 1800),
+    ("シンナー", ["塗料用シンナー"], "L", 600),
+    ("付帯部 塗装", ["水切り", "換気フード", "シャッターボックス"], "個", 3500),
+    ("既存塗膜 撤去", ["剥離剤 併用", "ディスクサンダー"], "m2", 1800),
+    ("廃材処分", ["産業廃棄物 処分費"], "式", 25000),
+    ("運搬費", ["資材 搬入・搬出"], "式", 15000),
+    ("諸経費", ["現場管理費", "安全対策費"], "式", 40000),
+]
+
+PROJECT_SUFFIXES = ["様邸 外壁塗装工事", "様邸 屋根塗装工事", "ビル 外装改修工事", "アパート 外壁塗装工事",
+                    "工場 鉄骨塗装工事", "マンション 大規模修繕工事", "店舗 内装塗装工事"]
+FAMILY_NAMES = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤",
+                "吉田", "山田", "佐々木", "山口", "松本", "井上", "木村", "林", "斎藤", "清水"]
+CLIENT_SUFFIXES = ["様", "建設株式会社", "不動産株式会社", "管理組合", "工務店"]
+SUMMARIES = ["", "", "", "", "別途", "サービス", "既存品 流用", "色番号 N-85", "2回塗り", "施主支給"]
+
+# 単位ごとの数量の範囲 (最小, 最大, 小数点以下の桁数)
+QUANTITY_RANGES = {
+    "式": (1, 1, 0),
+    "m2": (5, 800, 1),
+    "m3": (1, 30, 1),
+    "m": (2, 300, 1),
+    "kg": (4, 160, 0),
+    "L": (4, 80, 0),
+}
+DEFAULT_QUANTITY_RANGE = (1, 40, 0)
+
+
+def _load_units(units_file: str = "units.txt") -> List[str]:
+    """アプリと同じ units.txt から単位の一覧を読み込む"""
+    try:
+        with open(units_file, "r", encoding="utf-8") as f:
+            units = [line.strip() for line in f if line.strip()]
+        return units or DEFAULT_UNITS
+    except OSError:
+        return DEFAULT_UNITS
+
+
+class TestDataGenerator:
+    """シードから決まる見積・明細の行を生成する"""
+
+    def __init__(self, seed: int, units: List[str]):
+        self.rng = random.Random(seed)
+        self.units = units
+        self.start_date = datetime(2015, 4, 1)
+
+    def _quantity_tenths(self, unit: str) -> int:
+        """数量を 0.1 単位の整数で返す (合計計算で浮動小数点の誤差を出さないため)"""
+        low, high, digits = QUANTITY_RANGES.get(unit, DEFAULT_QUANTITY_RANGE)
+        if digits == 0:
+            return self.rng.randint(low, high) * 10
+        return self.rng.randint(low * 10, high * 10)
+
+    def _unit_price(self, median: int) -> int:
+        """中央値を中心とした対数正規分布の単価 (10円単位)"""
+        price = median * self.rng.lognormvariate(0.0, 0.35)
+        return max(10, int(round(price / 10.0)) * 10)
+
+    def detail_rows(self, count: int) -> Tuple[List[Tuple], int]:
+        """明細行 (row_order, 名称, 仕様, 数量, 単位, 単価, 金額, 摘要) と税抜合計 (0.1円単位) を返す"""
+        rows = []
+        subtotal_tenths = 0
+        rng = self.rng
+        for row_order in range(count):
+            name, specs, unit, median = WORK_ITEMS[rng.randrange(len(WORK_ITEMS))]
+            if unit not in self.units or rng.random() < 0.05:
+                unit = self.units[rng.randrange(len(self.units))]
+            spec = rng.choice(specs).format(h=rng.randrange(300, 3001, 50), w=rng.randrange(10, 31, 5))
+            quantity_tenths = self._quantity_tenths(unit)
+            unit_price = self._unit_price(median)
+            amount_tenths = quantity_tenths * unit_price
+            subtotal_tenths += amount_tenths
+            rows.append((row_order, name, spec, quantity_tenths / 10.0, unit, float(unit_price),
+                         amount_tenths / 10.0, rng.choice(SUMMARIES)))
+        return rows, subtotal_tenths
+
+    def header(self, index: int) -> Tuple[str, str, str, str]:
+        """(工事名, 顧客名, 工期, 作成日時) を返す"""
+        rng = self.rng
+        family = rng.choice(FAMILY_NAMES)
+        project_name = f"{family}{rng.choice(PROJECT_SUFFIXES)} ({index + 1})"
+        client_name = f"{rng.choice(FAMILY_NAMES)}{rng.choice(CLIENT_SUFFIXES)}"
+        start = self.start_date + timedelta(days=rng.randrange(0, 3650))
+        end = start + timedelta(days=rng.randrange(3, 90))
+        period_text = f"{start.year}年{start.month}月{start.day}日 ～ {end.year}年{end.month}月{end.day}日"
+        created = start - timedelta(days=rng.randrange(7, 60), seconds=rng.randrange(0, 86400))
+        return project_name, client_name, period_text, created.isoformat(sep=' ', timespec='seconds')
+
+    def rows_per_estimate(self, estimates: int, details: int) -> List[int]:
+        """明細行数を見積ごとにばらつかせて割り振る (合計は details に一致する)"""
+        base, extra = divmod(details, estimates)
+        counts = [base + (1 if i < extra else 0) for i in range(estimates)]
+        # 2件ずつ組にして片方から他方へ移すことで、合計を変えずにばらつきを持たせる
+        for i in range(0, estimates - 1, 2):
+            delta = self.rng.randint(0, counts[i + 1] // 2)
+            counts[i] += delta
+            counts[i + 1] -= delta
+        return counts
+
+
+def _round_half_up_tenths(value_tenths: int) -> int:
+    """0.1円単位の整数を円単位に四捨五入する"""
+    return (value_tenths + 5) // 10
+
+
+def _estimate_batches(generator: TestDataGenerator, first_id: int, counts: List[int],
+                      batch_rows: int) -> Iterator[Tuple[List[Tuple], List[Tuple]]]:
+    """(見積行のリスト, 明細行のリスト) を batch_rows 行程度ずつ生成する"""
+    tax_per_mille = int(round(TAX_RATE * 1000))
+    estimates_batch: List[Tuple] = []
+    details_batch: List[Tuple] = []
+    for index, count in enumerate(counts):
+        estimate_id = first_id + index
+        project_name, client_name, period_text, created_at = generator.header(index)
+        rows, subtotal_tenths = generator.detail_rows(count)
+
+        # 税は丸める前の税抜合計から計算する (明細画面の計算と同じ)
+        tax_rounded = (subtotal_tenths * tax_per_mille + 5000) // 10000
+        total_rounded = (subtotal_tenths * (1000 + tax_per_mille) + 5000) // 10000
+        base_estimate_id, revision_number = None, 0
+        if index > 0 and generator.rng.random() < REVISION_RATIO:
+            base_estimate_id = first_id + generator.rng.randrange(index)
+            revision_number = generator.rng.randint(1, 3)
+        estimates_batch.append((estimate_id, base_estimate_id, revision_number, project_name, client_name,
+                                period_text, float(_round_half_up_tenths(subtotal_tenths)), float(tax_rounded),
+                                float(total_rounded), created_at, created_at))
+        details_batch.extend((estimate_id,) + row for row in rows)
+
+        if len(details_batch) >= batch_rows:
+            yield estimates_batch, details_batch
+            estimates_batch, details_batch = [], []
+    if estimates_batch:
+        yield estimates_batch, details_batch
+
+
+def generate_database(db_file: str, estimates: int, details: int, seed: int = DEFAULT_SEED,
+                      batch_rows: int = DEFAULT_BATCH_ROWS) -> Tuple[int, int]:
+    """db_file に見積 estimates 件・明細 details 行を追加する。(最初の見積ID, 最後の見積ID) を返す"""
+    setup_database(db_file)
+    generator = TestDataGenerator(seed, _load_units())
+    counts = generator.rows_per_estimate(estimates, details)
+
+    conn = sqlite3.connect(db_file)
+    try:
+        # 生成データなので、途中で落ちたら作り直せばよい。書き込みの安全性より速度を優先する
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")  # 256MB
+        row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM estimates").fetchone()
+        first_id = row[0] + 1
+
+        inserted_details = 0
+        started = time.perf_counter()
+        for estimates_batch, details_batch in _estimate_batches(generator, first_id, counts, batch_rows):
+            with conn:  # バッチごとに1トランザクション
+                conn.executemany("""
+                    INSERT INTO estimates (id, base_estimate_id, revision_number, project_name, client_name,
+                                           period_text, subtotal_amount, tax_amount, total_amount,
+                                           created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, estimates_batch)
+                conn.executemany("""
+                    INSERT INTO details (estimate_id, row_order, name_text, specification_text,
+                                         quantity, unit_text, unit_price, amount, summary_text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, details_batch)
+            inserted_details += len(details_batch)
+            elapsed = time.perf_counter() - started
+            rate = inserted_details / elapsed if elapsed > 0 else 0.0
+            print(f"\r明細 {inserted_details:,} / {details:,} 行 ({rate:,.0f} 行/秒)", end="", flush=True)
+        print()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return first_id, first_id + estimates - 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="負荷試験用の見積データベースを生成する")
+    parser.add_argument("--output", default=DATABASE_FILE_NAME, help="出力先のデータベースファイル")
+    parser.add_argument("--estimates", type=int, default=DEFAULT_ESTIMATES, help="見積の件数")
+    parser.add_argument("--details", type=int, default=DEFAULT_DETAILS, help="明細の総行数")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="乱数のシード")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS,
+                        help="1トランザクションで挿入する明細行数の目安")
+    parser.add_argument("--overwrite", action="store_true", help="出力先が既にあれば削除してから生成する")
+    args = parser.parse_args(argv)
+
+    if args.estimates <= 0 or args.details < 0:
+        parser.error("--estimates は1以上、--details は0以上を指定してください。")
+    if os.path.exists(args.output):
+        if not args.overwrite:
+            print(f"エラー: '{args.output}' は既に存在します。上書きする場合は --overwrite を指定してください。")
+            return 1
+        os.remove(args.output)
+
+    started = time.perf_counter()
+    first_id, last_id = generate_database(args.output, args.estimates, args.details, args.seed, args.batch_rows)
+    print(f"見積 ID {first_id}～{last_id} ({args.estimates:,} 件) / 明細 {args.details:,} 行を "
+          f"'{args.output}' に生成しました ({time.perf_counter() - started:.1f} 秒)。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
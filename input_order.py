@@ -0,0 +1,88 @@
+# input_order.py
+"""明細行の入力順 (並べ替えの「入力順」で戻す順) を行 ID ごとの順位で持つ
+
+- 入力順は、読み込んだときの行の順に、その後の追加・複写・移動を反映した順。名称順などの並べ替えでは変わらない。
+- 行の追加・移動のたびには何もせず、並べ替えの直前 (と入力順を読むとき) に、前回の並べ替えの後の行の並びと
+  今の並びを比べて1回だけ反映する。並びが変わっていなければ比べるだけで済む。
+  前回の並びと同じ順のまま残っている行 (最長増加部分列) はそのまま、それ以外の行 (追加・複写・移動した行) は
+  画面で1つ上にある行の直後に入れる。
+"""
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+
+def _kept_rows(current: List[int], expected_positions: Dict[int, int]) -> Set[int]:
+    """current のうち、前回の並びの位置が増えていく最長の行 (そのまま残っている行) の行 ID"""
+    tails: List[int] = []      # 長さ k+1 の増加列の末尾の位置の最小値
+    tail_ids: List[int] = []   # その行 ID
+    previous: Dict[int, Optional[int]] = {}
+    for row_id in current:
+        position = expected_positions.get(row_id)
+        if position is None: # 追加した行
+            continue
+        k = bisect_left(tails, position)
+        previous[row_id] = tail_ids[k - 1] if k else None
+        if k == len(tails):
+            tails.append(position)
+            tail_ids.append(row_id)
+        else:
+            tails[k] = position
+            tail_ids[k] = row_id
+    kept: Set[int] = set()
+    row_id = tail_ids[-1] if tail_ids else None
+    while row_id is not None:
+        kept.add(row_id)
+        row_id = previous[row_id]
+    return kept
+
+
+class InputOrder:
+    """明細行の入力順 (行 ID -> 順位)"""
+
+    def __init__(self, page: 'DetailPageWidget'):
+        self._page = page
+        self._ranks: Dict[int, int] = {}             # 行 ID -> 入力順での順位
+        self._expected: Optional[List[int]] = None   # 前回反映したときの行 ID の並び (None なら今の並びが入力順)
+
+    def reset(self):
+        """(読み込み時) 今の行の並びを入力順にする"""
+        self._ranks = {}
+        self._expected = None
+
+    def ranks(self) -> Dict[int, int]:
+        """行 ID -> 入力順での順位 (呼び出し側で変更しないこと)"""
+        self.sync()
+        return self._ranks
+
+    def sync(self):
+        """前回からの行の追加・複写・移動を入力順に反映する (並べ替えの前に呼ぶ)"""
+        current = self._page.formula_engine.row_ids()
+        if self._expected is None:
+            self._ranks = {row_id: rank for rank, row_id in enumerate(current)}
+            self._expected = current
+            return
+        if current == self._expected:
+            return
+        kept = _kept_rows(current, {row_id: position for position, row_id in enumerate(self._expected)})
+        # 追加・移動した行は画面で1つ上の行の直後に入れる (連続して追加した行は上の行から順につながる)
+        follower: Dict[Optional[int], int] = {}
+        for index, row_id in enumerate(current):
+            if row_id not in kept:
+                follower[current[index - 1] if index else None] = row_id
+        order: List[int] = []
+        for row_id in [None] + sorted(kept, key=self._ranks.__getitem__):
+            if row_id is not None:
+                order.append(row_id)
+            row_id = follower.get(row_id)
+            while row_id is not None:
+                order.append(row_id)
+                row_id = follower.get(row_id)
+        self._ranks = {row_id: rank for rank, row_id in enumerate(order)}
+        self._expected = current
+
+    def reordered(self):
+        """並べ替えの後に呼ぶ (並べ替えは入力順を変えないので、今の並びを比べる基準にするだけ)"""
+        self._expected = self._page.formula_engine.row_ids()
@@ -1,6 +1,8 @@
 # C:\Users\katuy\OneDrive\Estimate_app\main.py
 import sys
 import os
+import time
+_MODULE_STARTED_AT = time.perf_counter() # 起動時間の計測用 (Qt のインポートを含める)
 from PySide6.QtCore import (
     Qt, Slot, Signal, QStandardPaths, QSettings, QPoint, QSize, QLocale,
     QDate, QMarginsF, QTimer # QTimer をインポート
@@ -15,9 +17,19 @@ from PySide6.QtWidgets import (
     QDateEdit, QPushButton, QTableWidget, QHeaderView, QAbstractItemView,
     QTableWidgetItem, QComboBox, QStyledItemDelegate, QDoubleSpinBox,
     QGridLayout, QSizePolicy, QSpacerItem, QFrame, QDialog,
-    QDialogButtonBox, QPlainTextEdit
+    QDialogButtonBox, QInputDialog, QPlainTextEdit
 )
-from PySide6.QtPrintSupport import QPrinter, QPrintPreviewDialog
+# QtPrintSupport は印刷プレビューを初めて開くときに読み込む (起動時間短縮のため)
+
+from update_scheduler import UpdateFlag
+import perf
+from perf import timed
+from utils import setup_locale
+import theme
+from theme import COLOR_WHITE
+from constants import DATABASE_FILE_NAME, DETAIL_SORT_ORDERS
+
+perf.record_since("startup.imports", _MODULE_STARTED_AT)
 
 
 
@@ -29,15 +41,7 @@ ORGANIZATION_DOMAIN = "mycompany.com" # QSettings用
 WINDOW_TITLE = f"{APP_NAME} v{APP_VERSION}"
 WINDOW_WIDTH = 1024
 WINDOW_HEIGHT = 768
-COLOR_BACKGROUND = "#F0F0F0"
-COLOR_PRIMARY = "#4A90E2"
-COLOR_SECONDARY = "#50E3C2"
-COLOR_TEXT = "#333333" # メニューなどの基本的な文字色
-COLOR_WHITE = "#FFFFFF"
-COLOR_ERROR = "#D0021B"
-COLOR_LIGHT_GRAY = "#D3D3D3" # 非活性時の文字色などに使用
-COLOR_SUCCESS = "#7ED321"
-COLOR_WARNING = "#F5A623"
+DETAIL_PAGE_PREBUILD_DELAY_MS = 500 # 初回描画からこの時間が経ったら、アイドル時に明細ページを組み立てておく
 
 # アイコンディレクトリのパスを設定
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -45,6 +49,8 @@ icon_dir = os.path.join(script_dir, "icons")
 
 
 class MainWindow(QMainWindow):
+    first_painted = Signal() # ウィンドウが初めて描画されたとき (起動時間の計測用)
+
     def __init__(self):
         super().__init__()
         print("--- main.py モジュール読み込み開始 ---") # 起動確認用
@@ -53,21 +59,7 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(WINDOW_TITLE)
         self.setGeometry(100, 100, WINDOW_WIDTH, WINDOW_HEIGHT) # 初期位置とサイズ
 
-        # --- アプリケーション全体のパレット設定 ---
-        main_palette = self.palette()
-        main_palette.setColor(QPalette.ColorRole.Window, QColor(COLOR_BACKGROUND))
-        main_palette.setColor(QPalette.ColorRole.WindowText, QColor(COLOR_TEXT))
-        main_palette.setColor(QPalette.ColorRole.Base, QColor(COLOR_WHITE)) # QLineEditなどの背景
-        main_palette.setColor(QPalette.ColorRole.AlternateBase, QColor(COLOR_SECONDARY)) # QComboBoxのドロップダウンなど
-        main_palette.setColor(QPalette.ColorRole.ToolTipBase, QColor(COLOR_WHITE))
-        main_palette.setColor(QPalette.ColorRole.ToolTipText, QColor(COLOR_TEXT))
-        main_palette.setColor(QPalette.ColorRole.Text, QColor(COLOR_TEXT)) # QLineEditなどのテキスト
-        main_palette.setColor(QPalette.ColorRole.Button, QColor(COLOR_PRIMARY))
-        main_palette.setColor(QPalette.ColorRole.ButtonText, QColor(COLOR_WHITE))
-        main_palette.setColor(QPalette.ColorRole.BrightText, QColor(COLOR_ERROR)) # エラーメッセージなど
-        main_palette.setColor(QPalette.ColorRole.Highlight, QColor(COLOR_PRIMARY)) # 選択時のハイライト
-        main_palette.setColor(QPalette.ColorRole.HighlightedText, QColor(COLOR_WHITE))
-        self.setPalette(main_palette)
+        # パレットとスタイルシートはアプリケーション全体に設定済み (theme.apply_theme)
         self.setAutoFillBackground(True) # パレット背景の描画を有効にする
 
         # --- UNDO スタックの作成 ---
@@ -75,22 +67,18 @@ class MainWindow(QMainWindow):
         self.undo_stack = QUndoStack(self) # QUndoStack を初期化
 
         # --- ウィジェットの作成 ---
+        # 起動時は表紙だけを作る。明細ページは初めて開くとき (または初回描画後のアイドル時) に作る
         try:
-            from detail_page_widget import DetailPageWidget
             from cover_page_widget import CoverPageWidget
         except ModuleNotFoundError as e:
             QMessageBox.critical(self, "エラー", f"必要なモジュールが見つかりません: {e}\nアプリケーションを終了します。")
             sys.exit(1)
 
-
-        self.cover_page = CoverPageWidget()
-        if self.undo_stack:
-            self.detail_page = DetailPageWidget(self.undo_stack)
-        else:
-            pass  # Placeholder to ensure the method has a valid body
-            pass  # Placeholder to ensure the method has a valid body
-            pass  # Placeholder to ensure the method has a valid body
-            self.detail_page = DetailPageWidget(self.undo_stack) # undo_stack (None) を渡す
+        with perf.timer("startup.cover_page"):
+            self.cover_page = CoverPageWidget()
+        self.detail_page = None # _ensure_detail_page() で作成する
+        self._first_paint_done = False
+        self._journal_checked = False # 前回の編集の記録を確かめるまでは、明細ページの編集を記録しない
 
         # --- QStackedWidget の設定 ---
         self.stacked_widget = QStackedWidget()
@@ -99,28 +87,96 @@ class MainWindow(QMainWindow):
         self.stacked_widget.setPalette(stack_palette)
         self.stacked_widget.setAutoFillBackground(True)
         self.stacked_widget.addWidget(self.cover_page)
-        self.stacked_widget.addWidget(self.detail_page)
 
         self.setCentralWidget(self.stacked_widget)
 
-        self._create_actions()
-        self._create_menus()
-        self._create_toolbars()
-        self._create_status_bar()
+        with perf.timer("startup.actions_menus_toolbars"):
+            self._create_actions()
+            self._create_perf_panel()
+            self._create_problems_panel()
+            self._create_menus()
+            self._create_toolbars()
+            self._create_status_bar()
 
         self.cover_page.details_requested.connect(self.show_detail_page)
-        self.detail_page.cover_requested.connect(self.show_cover_page)
         self.stacked_widget.currentChanged.connect(self._on_page_changed)
-        if hasattr(self.detail_page, 'table') and self.detail_page.table: # table属性の存在確認
-            self.detail_page.table.itemSelectionChanged.connect(self._on_detail_selection_changed)
+
+        self.show_cover_page()
+        self.resize(WINDOW_WIDTH, WINDOW_HEIGHT)
+
+    def _ensure_detail_page(self):
+        """明細ページがまだなければ作成し、シグナルを接続する"""
+        if self.detail_page is not None:
+            return self.detail_page
+        from detail_page_widget import DetailPageWidget
+        with perf.timer("detail_page.build"):
+            self.detail_page = DetailPageWidget(self.undo_stack)
+        self.stacked_widget.addWidget(self.detail_page)
+
+        self.detail_page.cover_requested.connect(self.show_cover_page)
+        self.detail_page.totals_changed.connect(self.cover_page.set_totals)
+        self.detail_page.action_states_changed.connect(self._deferred_update_actions_for_selection)
+        if hasattr(self.detail_page, 'selection_summary') and self.detail_page.selection_summary: # 選択集計サービスの存在確認
+            self.detail_page.selection_summary.changed.connect(self._on_detail_selection_changed)
         else:
-            print("WARN: DetailPageWidget does not have 'table' attribute or it is None. itemSelectionChanged signal not connected.")
+            print("WARN: DetailPageWidget does not have 'selection_summary' attribute or it is None. selection signal not connected.")
 
         if hasattr(self.detail_page, 'status_message_requested'): # シグナルの存在確認
             self.detail_page.status_message_requested.connect(self.show_status_message)
+        self.detail_page.set_takeoff_enabled(self.takeoff_action.isChecked())
+        self.problems_panel.set_page(self.detail_page)
+        if self._journal_checked:
+            self.detail_page.edit_journal.activate()
+        # 明細ページの合計を表紙の金額欄に反映しておく
+        self.detail_page.request_update(UpdateFlag.TOTALS | UpdateFlag.COVER_TOTALS)
+        return self.detail_page
 
-        self.show_cover_page()
-        self.resize(WINDOW_WIDTH, WINDOW_HEIGHT)
+    @Slot()
+    def _prebuild_detail_page(self):
+        """アイドル時に明細ページを組み立てておき、初めて開くときの待ち時間をなくす"""
+        if self.detail_page is None:
+            self._ensure_detail_page()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_paint_done:
+            self._first_paint_done = True
+            perf.record_since("startup.first_paint", _MODULE_STARTED_AT)
+            self.first_painted.emit()
+            QTimer.singleShot(0, self._check_edit_journal)
+            QTimer.singleShot(DETAIL_PAGE_PREBUILD_DELAY_MS, self._prebuild_detail_page)
+
+    @Slot()
+    def _check_edit_journal(self):
+        """前回保存されなかった編集の記録があれば、復元するか尋ねる。その後で編集の記録を始める"""
+        if self._journal_checked:
+            return
+        from edit_journal import JOURNAL_SET_ASIDE_SUFFIX, journal_path, read_journal, set_aside_journal
+        path = journal_path()
+        contents = read_journal(path)
+        if os.path.exists(path): # 復元してもしなくても、前回の記録は脇へ置いて残す (今回の記録は新しく書く)
+            set_aside_journal(path)
+        if contents is not None and contents.records:
+            reply = QMessageBox.question(
+                self, "編集の復元",
+                f"前回保存されなかった{contents.describe()}が残っています。\n"
+                f"最後に保存した内容に重ねて復元しますか？\n\n"
+                f"(前回の記録は {os.path.basename(path)}{JOURNAL_SET_ASIDE_SUFFIX} として残します)",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes)
+            if reply == QMessageBox.StandardButton.Yes:
+                page = self._ensure_detail_page()
+                applied, total = page.edit_journal.recover(contents)
+                if applied == 0:
+                    QMessageBox.warning(self, "編集の復元", "記録した編集を復元できませんでした。")
+                else:
+                    self.show_detail_page()
+                    message = f"保存されなかった編集を {applied} 件復元しました。保存すると確定します。"
+                    if applied < total:
+                        message += f" ({total - applied} 件は復元できませんでした)"
+                    self.show_status_message(message, 10000)
+        self._journal_checked = True
+        if self.detail_page is not None:
+            self.detail_page.edit_journal.activate()
 
     def _create_actions(self):
         """アクションを作成する"""
@@ -157,6 +213,54 @@ class MainWindow(QMainWindow):
         self.duplicate_row_action.setToolTip("選択した行を複製します")
         self.duplicate_row_action.triggered.connect(self._duplicate_detail_row)
 
+        self.adjust_prices_action = QAction("単価の一括調整...", self)
+        self.adjust_prices_action.setToolTip("選択した行の単価を率 (%) または金額でまとめて調整します")
+        self.adjust_prices_action.triggered.connect(self._adjust_unit_prices)
+
+        self.fill_down_action = QAction("下へコピー", self)
+        self.fill_down_action.setShortcut(QKeySequence("Ctrl+D"))
+        self.fill_down_action.setToolTip("選択した行の先頭のセルを、ほかの選択行の同じ列にコピーします")
+        self.fill_down_action.triggered.connect(self._fill_down)
+
+        self.set_selection_value_action = QAction("選択行に一括入力...", self)
+        self.set_selection_value_action.setToolTip("選択した行の現在の列 (単位・仕様など) に同じ値を入力します")
+        self.set_selection_value_action.triggered.connect(self._set_selection_value)
+
+        self.insert_assembly_action = QAction("組み合わせ項目を挿入...", self)
+        self.insert_assembly_action.setToolTip("カタログの組み合わせ項目 (例: 外壁シリコン塗装) を明細に入れます")
+        self.insert_assembly_action.triggered.connect(self._insert_assembly)
+
+        self.register_assembly_action = QAction("選択行を組み合わせ項目に登録...", self)
+        self.register_assembly_action.setToolTip("選択した行を構成要素として、組み合わせ項目をカタログに登録します")
+        self.register_assembly_action.triggered.connect(self._register_assembly)
+
+        self.find_action = QAction("検索...", self)
+        self.find_action.setShortcut(QKeySequence.StandardKey.Find)
+        self.find_action.setToolTip("明細の名称・仕様・摘要から文字を探します")
+        self.find_action.triggered.connect(lambda: self._show_find_replace(False))
+
+        self.replace_action = QAction("置換...", self)
+        self.replace_action.setShortcut(QKeySequence.StandardKey.Replace)
+        self.replace_action.setToolTip("明細の名称・仕様・摘要の文字をまとめて置き換えます")
+        self.replace_action.triggered.connect(lambda: self._show_find_replace(True))
+
+        self.filter_action = QAction("絞り込み表示...", self)
+        self.filter_action.setShortcut(QKeySequence("Ctrl+Shift+L"))
+        self.filter_action.setToolTip("条件 (例: 防水、単価=0) に合う明細行だけを表示します")
+        self.filter_action.triggered.connect(self._show_row_filter)
+
+        # 並べ替え (DETAIL_SORT_ORDERS の種類ごと)
+        self.sort_actions = []
+        for (sort_key, descending), label in DETAIL_SORT_ORDERS.items():
+            sort_action = QAction(f"{label}に戻す" if sort_key == "input" else label, self)
+            sort_action.triggered.connect(lambda checked=False, k=sort_key, d=descending: self._sort_detail_rows(k, d))
+            self.sort_actions.append(sort_action)
+
+        self.takeoff_action = QAction("寸法から数量を拾い出す", self)
+        self.takeoff_action.setCheckable(True)
+        self.takeoff_action.setToolTip("仕様の寸法 (H=1000, W=2000 など) と個数から数量を自動で入力します")
+        self.takeoff_action.toggled.connect(self._toggle_takeoff_mode)
+
         self.go_to_detail_action = QAction("明細編集へ", self)
         self.go_to_detail_action.setToolTip("明細編集画面に移動します")
         self.go_to_detail_action.setIcon(QIcon(os.path.join(icon_dir, "go_to_detail.png")))
@@ -180,6 +284,30 @@ class MainWindow(QMainWindow):
         self.save_as_action.triggered.connect(self._save_data_as)
 
 
+        self.duplicate_estimate_action = QAction("見積を複製", self)
+        self.duplicate_estimate_action.setToolTip("保存済みの見積を、別の見積として複製して開きます")
+        self.duplicate_estimate_action.triggered.connect(lambda: self._copy_current_estimate(False))
+
+        self.create_revision_action = QAction("改訂版を作成", self)
+        self.create_revision_action.setToolTip("保存済みの見積の改訂版 (版番号を1つ進めた写し) を作って開きます")
+        self.create_revision_action.triggered.connect(lambda: self._copy_current_estimate(True))
+
+        self.compare_revisions_action = QAction("版の比較...", self)
+        self.compare_revisions_action.setToolTip("2つの見積 (前の版と新しい版など) の明細を比べて、変わった行と金額の差を表示します")
+        self.compare_revisions_action.triggered.connect(self._compare_revisions)
+
+        self.save_as_template_action = QAction("テンプレートとして保存...", self)
+        self.save_as_template_action.setToolTip("明細の内容を、新しい見積のひな形 (テンプレート) として保存します")
+        self.save_as_template_action.triggered.connect(self._save_as_template)
+
+        self.new_from_template_action = QAction("テンプレートから新規作成...", self)
+        self.new_from_template_action.setToolTip("保存したテンプレートを複写して新しい見積を作ります")
+        self.new_from_template_action.triggered.connect(self._new_from_template)
+
+        self.reprice_estimates_action = QAction("保存済み見積の単価一括変更...", self)
+        self.reprice_estimates_action.setToolTip("保存済みの見積の中から名称・仕様で明細行を探し、単価をまとめて変更します")
+        self.reprice_estimates_action.triggered.connect(self._reprice_saved_estimates)
+
         self.print_action = QAction("印刷プレビュー", self)
         self.print_action.setIcon(QIcon(os.path.join(icon_dir, "print.png")))
         self.print_action.setToolTip("印刷プレビューを表示します")
@@ -189,12 +317,41 @@ class MainWindow(QMainWindow):
         self.exit_action.setShortcut(QKeySequence.StandardKey.Quit)
         self.exit_action.triggered.connect(self.close)
 
+    def _create_perf_panel(self):
+        """計測結果表示用のドックパネルを作成する (初期状態は非表示)"""
+        from perf_panel import PerfPanel
+        self.perf_panel = PerfPanel(self)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.perf_panel)
+        self.perf_panel.hide()
+        self.perf_panel_action = self.perf_panel.toggleViewAction()
+        self.perf_panel_action.setText("パフォーマンス計測")
+        self.perf_panel_action.setToolTip("処理時間の計測結果パネルを表示します")
+
+    def _create_problems_panel(self):
+        """明細の検査結果を表示するドックパネルを作成する (初期状態は非表示)"""
+        from problems_panel import ProblemsPanel
+        self.problems_panel = ProblemsPanel(self)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.problems_panel)
+        self.problems_panel.hide()
+        self.problems_panel_action = self.problems_panel.toggleViewAction()
+        self.problems_panel_action.setText("明細の問題")
+        self.problems_panel_action.setToolTip("入力漏れ・数量 0・単価の外れ値・重複行の一覧を表示します")
+
     def _create_menus(self):
         file_menu = self.menuBar().addMenu("ファイル")
         file_menu.addAction(self.save_action)
         file_menu.addAction(self.save_as_action) # メニューに追加
         file_menu.addAction(self.print_action)
         file_menu.addSeparator()
+        file_menu.addAction(self.duplicate_estimate_action)
+        file_menu.addAction(self.create_revision_action)
+        file_menu.addAction(self.compare_revisions_action)
+        file_menu.addSeparator()
+        file_menu.addAction(self.new_from_template_action)
+        file_menu.addAction(self.save_as_template_action)
+        file_menu.addSeparator()
+        file_menu.addAction(self.reprice_estimates_action)
+        file_menu.addSeparator()
         file_menu.addAction(self.exit_action)
 
         edit_menu = self.menuBar().addMenu("編集")
@@ -204,6 +361,28 @@ class MainWindow(QMainWindow):
         edit_menu.addAction(self.add_row_action)
         edit_menu.addAction(self.remove_row_action)
         edit_menu.addAction(self.duplicate_row_action)
+        edit_menu.addAction(self.fill_down_action)
+        edit_menu.addAction(self.set_selection_value_action)
+        edit_menu.addSeparator()
+        edit_menu.addAction(self.find_action)
+        edit_menu.addAction(self.replace_action)
+        edit_menu.addAction(self.filter_action)
+        self.sort_menu = edit_menu.addMenu("並べ替え")
+        for sort_action in self.sort_actions:
+            if sort_action is self.sort_actions[-1]:
+                self.sort_menu.addSeparator()
+            self.sort_menu.addAction(sort_action)
+        edit_menu.addSeparator()
+        edit_menu.addAction(self.adjust_prices_action)
+        edit_menu.addSeparator()
+        edit_menu.addAction(self.insert_assembly_action)
+        edit_menu.addAction(self.register_assembly_action)
+        edit_menu.addSeparator()
+        edit_menu.addAction(self.takeoff_action)
+
+        view_menu = self.menuBar().addMenu("表示")
+        view_menu.addAction(self.problems_panel_action)
+        view_menu.addAction(self.perf_panel_action)
 
     def _create_toolbars(self):
         self.main_toolbar = self.addToolBar("メイン操作")
@@ -230,24 +409,14 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage("準備完了", 3000)
 
     @Slot()
+    @timed()
     def show_cover_page(self):
-        if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
-            # 明細ページが表示されていた場合、合計金額を表紙に反映
-            current_subtotal_str = "￥0" # デフォルト値
-            current_tax_str = "￥0"     # デフォルト値
-            current_total_str = "￥0"   # デフォルト値
+        if self.detail_page is not None and self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
+            # 明細ページが表示されていた場合、保留中の合計を確定させて表紙に反映
+            # (表紙への反映は DetailPageWidget.totals_changed -> CoverPageWidget.set_totals で行われる)
             try:
-                if hasattr(self.detail_page, 'get_current_subtotal'):
-                    current_subtotal_str = self.detail_page.get_current_subtotal()
-                if hasattr(self.detail_page, 'get_current_tax'):
-                    current_tax_str = self.detail_page.get_current_tax()
-                if hasattr(self.detail_page, 'get_current_total'):
-                    current_total_str = self.detail_page.get_current_total()
-                
-                if hasattr(self.cover_page, 'set_totals'):
-                    self.cover_page.set_totals(current_subtotal_str, current_tax_str, current_total_str)
-                else:
-                    print("WARN: CoverPageWidget does not have 'set_totals' method.")
+                if hasattr(self.detail_page, 'flush_updates'):
+                    self.detail_page.flush_updates()
             except Exception as e:
                 print(f"Error updating totals on cover page from detail page: {e}")
         
@@ -256,8 +425,10 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(WINDOW_TITLE + " - 表紙")
 
     @Slot()
+    @timed()
     def show_detail_page(self):
         """明細ページを表示する"""
+        self._ensure_detail_page()
         project_name = ""
         client_name = ""
         period_text = ""
@@ -298,8 +469,9 @@ class MainWindow(QMainWindow):
                 "---"   # tax (明細ページで計算)
             )
             # 明細ページが表示される際に、現在のテーブル内容に基づいて合計を強制的に再計算・表示させる
-            if hasattr(self.detail_page, '_update_detail_totals'):
-                self.detail_page._update_detail_totals()
+            if hasattr(self.detail_page, 'request_update'):
+                self.detail_page.request_update(UpdateFlag.TOTALS | UpdateFlag.HEADER)
+                self.detail_page.flush_updates()
         else:
             print("WARN: DetailPageWidget does not have 'update_header' method.")
 
@@ -311,12 +483,13 @@ class MainWindow(QMainWindow):
     def _on_detail_selection_changed(self):
 
         # itemSelectionChanged が短時間に複数回発行されることがあるため、
-        # QTimer.singleShot を使って実際の更新処理を遅延させ、
-        # イベントが落ち着いた後の状態でアクションを更新します。
-        QTimer.singleShot(0, self._deferred_update_actions_for_selection)
+        # 明細ページの更新スケジューラにアクション状態の更新を予約し、
+        # イベントが落ち着いた後に1回だけアクションを更新します。
+        self.detail_page.request_update(UpdateFlag.ACTION_STATES)
 
+    @Slot()
     def _deferred_update_actions_for_selection(self):
-        """ _on_detail_selection_changed から遅延実行されるアクション更新処理 """
+        """ 明細ページの更新スケジューラから遅延実行されるアクション更新処理 """
         if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
             self._update_action_states(self.stacked_widget.currentIndex())
 
@@ -329,7 +502,7 @@ class MainWindow(QMainWindow):
         if not self.stacked_widget: # stacked_widget が None の場合は何もしない
             return
 
-        is_detail_page = (self.stacked_widget.currentWidget() == self.detail_page)
+        is_detail_page = self.detail_page is not None and (self.stacked_widget.currentWidget() == self.detail_page)
         is_cover_page = (self.stacked_widget.currentWidget() == self.cover_page)
 
         if self.undo_stack:
@@ -346,15 +519,20 @@ class MainWindow(QMainWindow):
         self.add_row_action.setEnabled(is_detail_page)
 
         can_remove_or_duplicate = False
-        if is_detail_page and hasattr(self.detail_page, 'table') and self.detail_page.table:
-                    # selectedItems() は QList<QTableWidgetItem*> を返すので、空かどうかで判断
-                    if self.detail_page.table.selectionModel() and self.detail_page.table.selectionModel().hasSelection():
-                         # 選択されている行があるかどうかも確認するとより確実
-                        can_remove_or_duplicate = bool(list(set(idx.row() for idx in self.detail_page.table.selectedIndexes())))
-        else:
-            pass
+        if is_detail_page and hasattr(self.detail_page, 'selection_summary') and self.detail_page.selection_summary:
+            # 選択行は差分で集計済みなので、ここでは O(1) で問い合わせるだけ
+            can_remove_or_duplicate = self.detail_page.selection_summary.has_selection()
         self.remove_row_action.setEnabled(is_detail_page and can_remove_or_duplicate)
         self.duplicate_row_action.setEnabled(is_detail_page and can_remove_or_duplicate)
+        self.adjust_prices_action.setEnabled(is_detail_page and can_remove_or_duplicate)
+        self.fill_down_action.setEnabled(is_detail_page and can_remove_or_duplicate)
+        self.set_selection_value_action.setEnabled(is_detail_page and can_remove_or_duplicate)
+        self.insert_assembly_action.setEnabled(is_detail_page)
+        self.register_assembly_action.setEnabled(is_detail_page and can_remove_or_duplicate)
+        self.find_action.setEnabled(is_detail_page)
+        self.replace_action.setEnabled(is_detail_page)
+        self.filter_action.setEnabled(is_detail_page)
+        self.sort_menu.setEnabled(is_detail_page)
 
 
         self.go_to_detail_action.setVisible(is_cover_page)
@@ -364,6 +542,9 @@ class MainWindow(QMainWindow):
 
         self.save_action.setEnabled(is_detail_page)
         self.save_as_action.setEnabled(is_detail_page) # Save As も明細ページでのみ有効
+        self.save_as_template_action.setEnabled(is_detail_page)
+        self.duplicate_estimate_action.setEnabled(is_detail_page)
+        self.create_revision_action.setEnabled(is_detail_page)
         self.print_action.setEnabled(True)
 
     @Slot()
@@ -391,6 +572,217 @@ class MainWindow(QMainWindow):
             else:
                 print("WARN: DetailPageWidget does not have 'duplicate_row' method.")
 
+    @Slot()
+    def _adjust_unit_prices(self):
+        if not (self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page):
+            return
+        from price_adjustment_dialog import PriceAdjustmentDialog
+        dialog = PriceAdjustmentDialog(self, message="選択した行の単価を調整します。")
+        if dialog.exec() == QDialog.DialogCode.Accepted and dialog.adjustment() is not None:
+            self.detail_page.adjust_unit_prices(dialog.adjustment())
+
+    @Slot()
+    def _fill_down(self):
+        if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
+            self.detail_page.fill_down()
+
+    @Slot()
+    def _set_selection_value(self):
+        if not (self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page):
+            return
+        col = self.detail_page.fill_target_column()
+        if col is None:
+            self.statusBar().showMessage("入力する列のセルを選択してください (金額の列には入力できません)", 5000)
+            return
+        label = f"選択行の「{self.detail_page.HEADERS[col]}」に入力する値:"
+        if col == self.detail_page.COL_UNIT:
+            text, ok = QInputDialog.getItem(self, "選択行に一括入力", label, self.detail_page.unit_list, 0, True)
+        else:
+            text, ok = QInputDialog.getText(self, "選択行に一括入力", label)
+        if ok:
+            self.detail_page.set_selection_value(text.strip())
+
+    @Slot()
+    def _insert_assembly(self):
+        if not (self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page):
+            return
+        import sqlite3
+        from assembly_catalog import AssemblyError
+        from assembly_dialog import AssemblyDialog
+        try:
+            catalog = self.detail_page.assembly_catalog()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"組み合わせ項目のカタログを読み込めませんでした:\n{e}")
+            return
+        dialog = AssemblyDialog(catalog, self.detail_page.db_file_path, self)
+        accepted = dialog.exec() == QDialog.DialogCode.Accepted
+        try:
+            if dialog.changed_assembly_ids: # カタログで単価を変えた項目の、1行にまとめた行を更新する
+                self.detail_page.refresh_assembly_rows(dialog.changed_assembly_ids)
+            if accepted and dialog.selected_assembly_id() is not None and dialog.quantity() is not None:
+                self.detail_page.insert_assembly(dialog.selected_assembly_id(), dialog.quantity(), dialog.is_collapsed())
+        except AssemblyError as e:
+            QMessageBox.warning(self, "組み合わせ項目", str(e))
+
+    @Slot()
+    def _register_assembly(self):
+        if not (self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page):
+            return
+        import sqlite3
+        from assembly_catalog import AssemblyError
+        from assembly_dialog import AssemblyRegisterDialog
+        row_count = len(self.detail_page._selected_rows())
+        if not row_count:
+            QMessageBox.warning(self, "組み合わせ項目の登録", "登録する行が選択されていません。")
+            return
+        dialog = AssemblyRegisterDialog(row_count, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        try:
+            self.detail_page.register_assembly_from_selection(*dialog.values())
+        except AssemblyError as e:
+            QMessageBox.warning(self, "組み合わせ項目の登録", str(e))
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"組み合わせ項目の保存中にエラーが発生しました:\n{e}")
+
+    def _show_find_replace(self, replace: bool):
+        if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
+            self.detail_page.show_find_replace(replace)
+
+    @Slot()
+    def _show_row_filter(self):
+        if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
+            self.detail_page.show_row_filter()
+
+    def _sort_detail_rows(self, sort_key: str, descending: bool):
+        if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
+            self.detail_page.sort_rows(sort_key, descending)
+
+    @Slot()
+    def _reprice_saved_estimates(self):
+        from estimate_repricing_dialog import EstimateRepricingDialog
+        db_file_path = self.detail_page.db_file_path if self.detail_page is not None else os.path.join(os.getcwd(), DATABASE_FILE_NAME)
+        dialog = EstimateRepricingDialog(db_file_path, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted or dialog.result is None:
+            return
+        result = dialog.result
+        message = f"{result.estimate_count} 件の見積・{result.line_count} 行の単価を変更しました。"
+        detail_page = self.detail_page
+        if detail_page is not None and detail_page.current_estimate_id in result.estimate_ids:
+            # 開いている見積も変更された。編集中の内容がなければ読み込み直す
+            if not detail_page.has_unsaved_changes():
+                detail_page.load_estimate(detail_page.current_estimate_id)
+                message += " 開いている見積を読み込み直しました。"
+            else:
+                message += " 開いている見積も変更されています (画面の内容を保存すると上書きされます)。"
+        self.show_status_message(message, 10000)
+
+    def _copy_current_estimate(self, revision: bool):
+        """開いている見積の複製・改訂版をデータベースの中で作って開く"""
+        if not (self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page):
+            return
+        import sqlite3
+        from estimate_copy import create_revision, duplicate_estimate
+        detail_page = self.detail_page
+        title = "改訂版を作成" if revision else "見積を複製"
+        # 複写するのは保存済みの内容。保存していない見積・編集は、先に保存するかを確かめる
+        if detail_page.current_estimate_id is None:
+            answer = QMessageBox.question(self, title, "この見積はまだ保存されていません。保存してから続けますか？")
+            if answer != QMessageBox.StandardButton.Yes or not detail_page._execute_save_to_db():
+                return
+        elif detail_page.has_unsaved_changes():
+            answer = QMessageBox.question(
+                self, title, "未保存の編集があります。保存してから続けますか？\n(「破棄」なら保存済みの内容を複写します)",
+                QMessageBox.StandardButton.Save | QMessageBox.StandardButton.Discard | QMessageBox.StandardButton.Cancel)
+            if answer == QMessageBox.StandardButton.Cancel:
+                return
+            if answer == QMessageBox.StandardButton.Save and not detail_page._execute_save_to_db():
+                return
+        source_id = detail_page.current_estimate_id
+        conn = None
+        try:
+            conn = detail_page._connect_database()
+            if revision:
+                new_id, revision_number = create_revision(conn, source_id)
+                label = f"改訂版 (改訂 {revision_number})"
+            else:
+                new_id = duplicate_estimate(conn, source_id)
+                label = "複製"
+            project_name, client_name = conn.execute(
+                "SELECT project_name, client_name FROM estimates WHERE id = ?", (new_id,)).fetchone()
+        except (sqlite3.Error, ValueError) as e:
+            QMessageBox.critical(self, "データベースエラー", f"見積の複写中にエラーが発生しました:\n{e}")
+            return
+        finally:
+            if conn:
+                conn.close()
+        if not detail_page.open_copied_estimate(new_id, project_name):
+            return
+        if hasattr(self.cover_page, 'set_project_info'): # 表紙の工事名も複写した見積に合わせる
+            self.cover_page.set_project_info(project_name, client_name)
+        self.show_status_message(f"見積 (ID: {source_id}) の{label}を作成して開きました (ID: {new_id})", 5000)
+
+    @Slot()
+    def _compare_revisions(self):
+        from revision_diff_dialog import RevisionDiffDialog
+        db_file_path = self.detail_page.db_file_path if self.detail_page is not None else os.path.join(os.getcwd(), DATABASE_FILE_NAME)
+        estimate_id = self.detail_page.current_estimate_id if self.detail_page is not None else None
+        dialog = RevisionDiffDialog(db_file_path, estimate_id, self)
+        dialog.exec()
+
+    @Slot()
+    def _save_as_template(self):
+        if not (self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page):
+            return
+        default_name = self.cover_page.get_project_name() if hasattr(self.cover_page, 'get_project_name') else ""
+        name, ok = QInputDialog.getText(self, "テンプレートとして保存", "テンプレート名:", text=default_name)
+        if ok and name.strip():
+            self.detail_page.save_as_template(name.strip())
+
+    @Slot()
+    def _new_from_template(self):
+        import sqlite3
+        from database_setup import migrate_database
+        from estimate_copy import create_estimate_from_template
+        from template_dialog import TemplateDialog
+        if self.detail_page is not None and self.detail_page.has_unsaved_changes():
+            answer = QMessageBox.question(self, "テンプレートから新規作成",
+                                          "編集中の内容は保存されていません。破棄して新しい見積を作りますか？")
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+        db_file_path = self.detail_page.db_file_path if self.detail_page is not None else os.path.join(os.getcwd(), DATABASE_FILE_NAME)
+        dialog = TemplateDialog(db_file_path, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted or dialog.selected_template() is None:
+            return
+        template = dialog.selected_template()
+        project_name = dialog.project_name()
+        conn = None
+        try:
+            # 見出しと明細は SQLite の中で複写する (明細行を1行ずつ読み書きしない)
+            conn = sqlite3.connect(db_file_path)
+            migrate_database(conn)
+            estimate_id = create_estimate_from_template(conn, template.id, project_name)
+            client_name = conn.execute("SELECT client_name FROM estimates WHERE id = ?", (estimate_id,)).fetchone()[0]
+        except (sqlite3.Error, ValueError) as e:
+            QMessageBox.critical(self, "データベースエラー", f"テンプレートからの作成中にエラーが発生しました:\n{e}")
+            return
+        finally:
+            if conn:
+                conn.close()
+        detail_page = self._ensure_detail_page()
+        if not detail_page.load_estimate(estimate_id):
+            return
+        if hasattr(self.cover_page, 'set_project_info'): # show_detail_page は見出しを表紙から取る
+            self.cover_page.set_project_info(project_name, client_name)
+        self.show_detail_page()
+        self.show_status_message(f"テンプレート「{template.name}」から見積を作成しました ({template.line_count} 行)", 5000)
+
+    @Slot(bool)
+    def _toggle_takeoff_mode(self, checked: bool):
+        # 明細ページがまだなければ、作成時にこの状態を引き継ぐ
+        if self.detail_page is not None:
+            self.detail_page.set_takeoff_enabled(checked)
+
     @Slot()
     def _save_data(self):
         if self.stacked_widget and self.stacked_widget.currentWidget() == self.detail_page:
@@ -413,6 +805,7 @@ class MainWindow(QMainWindow):
 
     @Slot()
     def _print_preview(self):
+        from PySide6.QtPrintSupport import QPrinter, QPrintPreviewDialog
         printer = QPrinter(QPrinter.PrinterMode.HighResolution)
         preview_dialog = QPrintPreviewDialog(printer, self)
         preview_dialog.paintRequested.connect(self._handle_paint_request)
@@ -431,91 +824,38 @@ class MainWindow(QMainWindow):
             print(f"Status: {message}")
 
     def closeEvent(self, event):
+        if self.detail_page is not None: # 未保存の編集があれば記録を残す (次の起動で復元できる)
+            self.detail_page.edit_journal.close()
         event.accept()
 
 
+def create_application(argv) -> QApplication:
+    """QApplication を作成し、アプリ全体のスタイルシートとロケールを設定する"""
+    with perf.timer("startup.qapplication"):
+        app = QApplication(argv)
+    with perf.timer("startup.locale"):
+        setup_locale()
+
+    with perf.timer("startup.theme"):
+        theme.apply_theme(app) # パレットとスタイルシートはここで1回だけ設定する
+    return app
+
+
+def create_main_window() -> MainWindow:
+    """メインウィンドウを作成して表示する"""
+    with perf.timer("startup.main_window"):
+        main_window = MainWindow()
+    with perf.timer("startup.show"):
+        main_window.show()
+    # 最初のイベントループ周回までを起動時間として記録する (初回描画は startup.first_paint)
+    QTimer.singleShot(0, lambda: perf.record_since("startup.total", _MODULE_STARTED_AT))
+    return main_window
+
+
 if __name__ == '__main__':
     print("--- main.py モジュール読み込み開始 ---")
     print("--- インポート完了 ---")
-    app = QApplication(sys.argv)
-
-    # --- スタイルシートの適用例 ---
-    # メニューの文字色を COLOR_TEXT (濃い灰色) に設定
-    # 背景色や選択時の色も調整しています。環境によって微調整が必要な場合があります。
-    app.setStyleSheet(f"""
-        QMainWindow {{
-            background-color: {COLOR_BACKGROUND};
-        }}
-        QMenuBar {{
-            background-color: {COLOR_BACKGROUND}; /* メニューバー自体の背景色 */
-            color: {COLOR_TEXT}; /* メニューバーのトップレベル項目の文字色 */
-        }}
-        QMenuBar::item {{
-            background-color: transparent; /* 通常時のアイテム背景は透明に */
-            color: {COLOR_TEXT}; /* 通常時のアイテム文字色 */
-            padding: 4px 8px; /* 少し余白を調整 */
-        }}
-        QToolButton:disabled {{ /* 非活性時のツールバーボタン */
-            color: {COLOR_LIGHT_GRAY}; /* 文字色を薄いグレーに */
-            /* background-color: transparent; */ /* 背景は通常時と同じでよければ */
-        }}
-        QMenuBar::item:selected {{ /* マウスオーバー時や選択時 */
-            background-color: {COLOR_PRIMARY}; /* 選択時の背景色 */
-            color: {COLOR_WHITE}; /* 選択時の文字色 */
-        }}
-        QMenuBar::item:pressed {{ /* クリック時 */
-            background-color: {COLOR_SECONDARY};
-        }}
-        QMenu {{
-            background-color: {COLOR_WHITE}; /* ドロップダウンメニューの背景色 */
-            color: {COLOR_TEXT}; /* ドロップダウンメニューの文字色 */
-            border: 1px solid #CCCCCC; /* メニューの境界線 */
-        }}
-        QMenu::item {{
-            padding: 4px 20px; /* アイテムの余白 */
-        }}
-        QMenu::item:selected {{
-            background-color: {COLOR_PRIMARY};
-            color: {COLOR_WHITE};
-        }}
-        QToolBar {{
-            background-color: {COLOR_BACKGROUND};
-            border: none;
-        }}
-        QToolButton {{ /* ツールバー上のボタン */
-            color: {COLOR_TEXT}; /* 通常時の文字色 */
-            background-color: transparent; /* 通常時は背景透明 */
-            padding: 4px;
-            margin: 1px;
-        }}
-        QPushButton {{
-            background-color: {COLOR_PRIMARY};
-            color: {COLOR_WHITE};
-            border-radius: 5px;
-            padding: 5px;
-        }}
-        QPushButton:hover {{
-            background-color: #3a80d2; /* 少し暗い青 */
-        }}
-        QLineEdit, QDateEdit, QDoubleSpinBox, QComboBox {{
-            border: 1px solid #CCCCCC;
-            padding: 5px;
-            border-radius: 3px;
-            background-color: {COLOR_WHITE};
-            color: {COLOR_TEXT};
-        }}
-        QTableWidget {{
-            gridline-color: #DDDDDD;
-        }}
-        QStatusBar {{ /* ★★★ ここから追加 ★★★ */
-            color: {COLOR_TEXT}; /* 文字色を constants.py の COLOR_TEXT (例: #333333) に設定 */
-            background-color: {COLOR_LIGHT_GRAY}; /* 背景色を薄いグレーに (お好みで調整) */
-            /* font-weight: bold; */ /* 必要であれば太字に */
-            padding: 2px 5px;      /* 少しパディングを追加して見やすく */
-        }}                         /* ★★★ ここまで追加 ★★★ */
-    """)
-
-    main_window = MainWindow()
-    main_window.show()
+    app = create_application(sys.argv)
+    main_window = create_main_window()
     print("--- アプリケーション開始 ---")
     sys.exit(app.exec())
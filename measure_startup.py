@@ -0,0 +1,108 @@
+# measure_startup.py
+"""起動時間 (初回描画まで) の計測
+
+新しい Python プロセスでアプリを起動し、ウィンドウが初めて描画されるまでの時間と
+起動フェーズごとの内訳を計測する。毎回別プロセスで起動するので、モジュールの
+インポートを含むコールドスタートの時間になる。
+
+目標: 初回描画まで (プロセス起動から) 中央値 TARGET_FIRST_PAINT_MS 以内。
+      表紙だけを作って表示し、明細ページ・印刷サポート・DB 接続は初めて使うとき
+      (明細ページは初回描画後のアイドル時) まで遅らせることで達成する。
+
+使い方:
+    python measure_startup.py                 # 5回起動して中央値を表示
+    python measure_startup.py --runs 10 --check   # 目標を超えたら終了コード 1
+    QT_QPA_PLATFORM=offscreen python measure_startup.py   # 画面のない環境で計測
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+TARGET_FIRST_PAINT_MS = 1000.0
+DEFAULT_RUNS = 5
+CHILD_TIMEOUT_SECONDS = 60
+RESULT_PREFIX = "STARTUP_RESULT "
+
+
+def _run_child() -> int:
+    """(子プロセス) アプリを起動し、初回描画の時点で計測結果を出力して終了する"""
+    started_at = time.perf_counter()
+    os.environ["ESTIMATE_APP_PERF"] = "1"  # perf のインポート前に計測を有効にする
+    import main
+    import perf
+    from PySide6.QtCore import QTimer
+
+    app = main.create_application(sys.argv[:1])
+    window = main.create_main_window()
+
+    def on_first_paint():
+        result = {
+            "first_paint_ms": (time.perf_counter() - started_at) * 1000.0,
+            "phases": {stat["name"]: stat["total_ms"] for stat in perf.recorder.snapshot()
+                       if stat["total_ms"] is not None},
+        }
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        QTimer.singleShot(0, app.quit)
+
+    window.first_painted.connect(on_first_paint)
+    QTimer.singleShot(CHILD_TIMEOUT_SECONDS * 1000, app.quit)  # 描画されない環境での保険
+    return app.exec()
+
+
+def _measure_once() -> Dict:
+    """子プロセスを1回起動し、プロセス起動からの時間を含む計測結果を返す"""
+    started_at = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, encoding="utf-8", timeout=CHILD_TIMEOUT_SECONDS + 10,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            # 子プロセスが出力した時点までの経過時間 (インタープリターの起動を含む)
+            result = json.loads(line[len(RESULT_PREFIX):])
+            result["process_ms"] = (time.perf_counter() - started_at) * 1000.0
+            return result
+    raise RuntimeError(f"起動時間を取得できませんでした (終了コード {completed.returncode}):\n{completed.stderr}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="起動時間 (初回描画まで) を計測する")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="起動する回数")
+    parser.add_argument("--target-ms", type=float, default=TARGET_FIRST_PAINT_MS, help="初回描画までの目標 (ms)")
+    parser.add_argument("--check", action="store_true", help="中央値が目標を超えたら終了コード 1 で終わる")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return _run_child()
+
+    results = []
+    for run in range(args.runs):
+        result = _measure_once()
+        results.append(result)
+        print(f"{run + 1}回目: 初回描画 {result['process_ms']:.0f} ms "
+              f"(アプリ内 {result['first_paint_ms']:.0f} ms)", flush=True)
+
+    process_median = statistics.median(r["process_ms"] for r in results)
+    print(f"\n初回描画まで (プロセス起動から) の中央値: {process_median:.0f} ms  目標: {args.target_ms:.0f} ms")
+    print("\nフェーズ別の中央値 (ms):")
+    phase_names = sorted({name for r in results for name in r["phases"]})
+    for name in phase_names:
+        values = [r["phases"][name] for r in results if name in r["phases"]]
+        print(f"  {name:<32} {statistics.median(values):>8.1f}")
+
+    if process_median > args.target_ms:
+        print("\n目標を超えています。")
+        return 1 if args.check else 0
+    print("\n目標を達成しています。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# number_format.py
+"""数値の解析 (文字列 -> Decimal) と表示用の整形 (Decimal -> 文字列)
+
+- 解析は str.translate 1回で全角数字・全角カンマ・「￥」「円」・空白などを正規化してから Decimal にする。
+- 整形は列ごとの NumberFormat (小数点以下の桁数・接頭辞・桁区切り) に従い、四捨五入で丸める。
+- 同じ値の解析・整形は繰り返し行われるので、上限付きのメモ化キャッシュ (LRU) を使う。
+- 取り込みや貼り付けのような大量の値は parse_many / format_many でまとめて処理する。
+"""
+import math
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List
+
+CACHE_SIZE = 4096  # 解析・整形それぞれのキャッシュの上限件数
+ZERO = Decimal("0")
+
+# 解析前の正規化 (1回の str.translate で全角→半角の置換と記号の除去を行う。計算式の解析でも使う)
+NORMALIZE_MAP = {
+    **{chr(ord("０") + i): str(i) for i in range(10)},  # 全角数字
+    "．": ".", "－": "-", "−": "-", "‐": "-", "‑": "-", "＋": "+",
+    ",": None, "，": None, "、": None,                    # 桁区切り
+    "￥": None, "¥": None, "\\": None, "円": None,         # 通貨記号・単位
+    " ": None, "　": None, "\t": None,                # 空白 (全角空白を含む)
+}
+_NORMALIZE_TABLE = str.maketrans(NORMALIZE_MAP)
+
+
+class NumberFormat:
+    """列ごとの表示形式 (小数点以下の桁数・接頭辞・桁区切りの有無)"""
+    __slots__ = ("decimals", "prefix", "grouping", "_quantum", "_spec")
+
+    def __init__(self, decimals: int = 0, prefix: str = "", grouping: bool = True):
+        self.decimals = decimals
+        self.prefix = prefix
+        self.grouping = grouping
+        self._quantum = Decimal(1).scaleb(-decimals)  # 例: 1桁なら Decimal('0.1')
+        self._spec = f"{',' if grouping else ''}.{decimals}f"
+
+    def __repr__(self):
+        return f"NumberFormat(decimals={self.decimals}, prefix={self.prefix!r}, grouping={self.grouping})"
+
+    def round(self, value: Decimal) -> Decimal:
+        """表示桁数に四捨五入した値 (表示と保持値を一致させるために使う)"""
+        try:
+            rounded = value.quantize(self._quantum, rounding=ROUND_HALF_UP)
+        except InvalidOperation:  # 桁数が大きすぎる場合は丸めない
+            return value
+        return rounded if rounded else rounded.copy_abs()  # "-0.0" を "0.0" にする
+
+    def format(self, value: Any) -> str:
+        """値を表示用の文字列にする (キャッシュ付き)"""
+        return _format_cached(to_decimal(value), self)
+
+
+QUANTITY_FORMAT = NumberFormat(decimals=1, grouping=False)   # 数量: "12.5"
+CURRENCY_FORMAT = NumberFormat(decimals=0, prefix="￥")       # 金額: "￥1,235"
+
+# 列ごとの表示形式 (set_column_format で変更できる)
+_column_formats: Dict[str, NumberFormat] = {
+    "quantity": QUANTITY_FORMAT,
+    "unit_price": CURRENCY_FORMAT,
+    "amount": CURRENCY_FORMAT,
+}
+
+
+def column_format(name: str) -> NumberFormat:
+    """列名 (quantity / unit_price / amount) の表示形式を返す"""
+    return _column_formats[name]
+
+
+def set_column_format(name: str, number_format: NumberFormat):
+    """列の表示形式を変更する (例: 単価を小数点以下2桁まで表示する)"""
+    _column_formats[name] = number_format
+    _format_cached.cache_clear()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_cached(text: str) -> Decimal:
+    normalized = text.translate(_NORMALIZE_TABLE)
+    if not normalized:
+        raise ValueError("数値が入力されていません")
+    try:
+        value = Decimal(normalized)
+    except InvalidOperation:
+        raise ValueError(f"数値として解釈できません: '{text}'") from None
+    if not value.is_finite():
+        raise ValueError(f"数値として解釈できません: '{text}'")
+    return value
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_cached(value: Decimal, number_format: NumberFormat) -> str:
+    rounded = number_format.round(value)
+    return f"{number_format.prefix}{format(rounded, number_format._spec)}"
+
+
+def parse_decimal(text: str) -> Decimal:
+    """文字列を Decimal に変換する。解釈できない (空を含む) 場合は ValueError"""
+    return _parse_cached(text)
+
+
+def to_decimal(value: Any, default: Decimal = ZERO) -> Decimal:
+    """文字列・数値を Decimal に変換する。解釈できない場合は default を返す"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, str):
+        try:
+            return _parse_cached(value)
+        except ValueError:
+            return default
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        return Decimal(repr(value)) if math.isfinite(value) else default
+    return default
+
+
+def format_number(value: Any, number_format: NumberFormat) -> str:
+    """値を number_format に従って整形する"""
+    return _format_cached(to_decimal(value), number_format)
+
+
+def parse_many(texts: Iterable[Any], default: Decimal = ZERO) -> List[Decimal]:
+    """複数の値をまとめて Decimal に変換する (取り込み・貼り付け用)"""
+    parse = _parse_cached
+    result = []
+    append = result.append
+    for text in texts:
+        if isinstance(text, str):
+            try:
+                append(parse(text))
+            except ValueError:
+                append(default)
+        else:
+            append(to_decimal(text, default))
+    return result
+
+
+def format_many(values: Iterable[Any], number_format: NumberFormat) -> List[str]:
+    """複数の値をまとめて整形する"""
+    fmt = _format_cached
+    convert = to_decimal
+    return [fmt(value if isinstance(value, Decimal) else convert(value), number_format) for value in values]
+
+
+def cache_info() -> Dict[str, Any]:
+    """キャッシュの利用状況 (ヒット数など)"""
+    return {"parse": _parse_cached.cache_info(), "format": _format_cached.cache_info()}
+
+
+def clear_caches():
+    _parse_cached.cache_clear()
+    _format_cached.cache_clear()
@@ -0,0 +1,194 @@
+# perf.py
+"""ホットパスの計測 (タイマー / カウンター)
+
+無効時のオーバーヘッドを最小にするため、計測の有無は recorder.enabled の
+真偽値1つで判定する。無効時の timed() は元の関数を呼ぶだけ、timer() は
+何もしない共有オブジェクトを返すだけになる。
+
+起動時から計測する場合は環境変数 ESTIMATE_APP_PERF=1 を設定する
+(ESTIMATE_APP_PERF_LOG=1 でローテーションするログファイルにも記録する)。
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Deque, Dict, List, Optional
+
+PERF_ENV_VAR = "ESTIMATE_APP_PERF"
+PERF_LOG_ENV_VAR = "ESTIMATE_APP_PERF_LOG"
+PERF_LOG_FILE_NAME = "perf.log"
+PERF_LOG_MAX_BYTES = 1024 * 1024  # 1ファイルあたり 1MB
+PERF_LOG_BACKUP_COUNT = 3
+SAMPLE_WINDOW = 1000  # パーセンタイル計算に使う直近のサンプル数
+
+
+class _Stat:
+    """1つの計測項目の集計値"""
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=SAMPLE_WINDOW)
+
+
+def _percentile(sorted_values: List[float], ratio: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class PerfRecorder:
+    """計測結果を名前ごとに集計する"""
+
+    def __init__(self):
+        self.enabled = os.environ.get(PERF_ENV_VAR, "") not in ("", "0")
+        self._stats: Dict[str, _Stat] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._logger: Optional[logging.Logger] = None
+        if os.environ.get(PERF_LOG_ENV_VAR, "") not in ("", "0"):
+            self.set_log_enabled(True)
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+
+    def record(self, name: str, seconds: float):
+        """経過時間 (秒) を記録する"""
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = _Stat()
+            stat.count += 1
+            stat.total += seconds
+            if seconds > stat.max:
+                stat.max = seconds
+            stat.samples.append(seconds)
+        if self._logger is not None:
+            self._logger.info("%s\t%.3f", name, seconds * 1000.0)
+
+    def increment(self, name: str, amount: int = 1):
+        """カウンターを加算する"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self) -> List[Dict[str, float]]:
+        """計測項目ごとの回数・p50・p95・最大・合計 (いずれもミリ秒) を名前順で返す"""
+        with self._lock:
+            items = [(name, stat.count, stat.total, stat.max, sorted(stat.samples))
+                     for name, stat in self._stats.items()]
+            counters = dict(self._counters)
+        rows = []
+        for name, count, total, max_value, samples in sorted(items):
+            rows.append({
+                "name": name,
+                "count": count,
+                "p50_ms": _percentile(samples, 0.50) * 1000.0,
+                "p95_ms": _percentile(samples, 0.95) * 1000.0,
+                "max_ms": max_value * 1000.0,
+                "total_ms": total * 1000.0,
+            })
+        for name, count in sorted(counters.items()):
+            rows.append({"name": name, "count": count, "p50_ms": None, "p95_ms": None,
+                         "max_ms": None, "total_ms": None})
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._counters.clear()
+
+    def is_log_enabled(self) -> bool:
+        return self._logger is not None
+
+    def set_log_enabled(self, enabled: bool, log_path: Optional[str] = None):
+        """計測結果をローテーションするローカルログに書き出すかどうかを切り替える"""
+        logger = logging.getLogger("estimate_app.perf")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        if not enabled:
+            self._logger = None
+            return
+        path = log_path or os.path.join(os.getcwd(), PERF_LOG_FILE_NAME)
+        handler = RotatingFileHandler(path, maxBytes=PERF_LOG_MAX_BYTES,
+                                      backupCount=PERF_LOG_BACKUP_COUNT, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s\t%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self._logger = logger
+
+
+recorder = PerfRecorder()
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        recorder.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str):
+    """with 文で囲んだ区間の経過時間を記録する (無効時は何もしない)"""
+    if recorder.enabled:
+        return _Timer(name)
+    return _NULL_TIMER
+
+
+def increment(name: str, amount: int = 1):
+    """カウンターを加算する (無効時は何もしない)"""
+    if recorder.enabled:
+        recorder.increment(name, amount)
+
+
+def record_since(name: str, start: float):
+    """start (time.perf_counter() の値) からの経過時間を記録する (無効時は何もしない)"""
+    if recorder.enabled:
+        recorder.record(name, time.perf_counter() - start)
+
+
+def timed(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """関数の実行時間を記録するデコレーター。name 省略時は関数の __qualname__ を使う"""
+    def decorator(func: Callable) -> Callable:
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recorder.record(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,102 @@
+# perf_panel.py
+from PySide6.QtCore import Qt, QTimer, Slot
+from PySide6.QtWidgets import (
+    QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+    QCheckBox, QPushButton, QHeaderView, QAbstractItemView
+)
+
+import perf
+
+
+class PerfPanel(QDockWidget):
+    """計測結果 (回数 / p50 / p95 / 最大) を表示するドックパネル"""
+
+    HEADERS = ["計測項目", "回数", "p50 (ms)", "p95 (ms)", "最大 (ms)", "合計 (ms)"]
+    REFRESH_INTERVAL_MS = 1000
+
+    def __init__(self, parent=None):
+        super().__init__("パフォーマンス", parent)
+        self.setObjectName("perfPanel") # saveState/restoreState 用
+        self.setAllowedAreas(Qt.DockWidgetArea.BottomDockWidgetArea | Qt.DockWidgetArea.RightDockWidgetArea)
+
+        self.enable_check = QCheckBox("計測を有効にする")
+        self.enable_check.setChecked(perf.recorder.enabled)
+        self.enable_check.toggled.connect(self._on_enable_toggled)
+        self.log_check = QCheckBox("ログファイルに記録")
+        self.log_check.setChecked(perf.recorder.is_log_enabled())
+        self.log_check.toggled.connect(self._on_log_toggled)
+        reset_button = QPushButton("リセット")
+        reset_button.clicked.connect(self._on_reset_clicked)
+
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.enable_check)
+        controls.addWidget(self.log_check)
+        controls.addStretch(1)
+        controls.addWidget(reset_button)
+
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addLayout(controls)
+        layout.addWidget(self.table)
+        self.setWidget(container)
+
+        # パネルが表示されている間だけ定期的に更新する
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(self.REFRESH_INTERVAL_MS)
+        self._refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self._on_visibility_changed)
+
+    @Slot(bool)
+    def _on_visibility_changed(self, visible: bool):
+        if visible:
+            self.refresh()
+            self._refresh_timer.start()
+        else:
+            self._refresh_timer.stop()
+
+    @Slot(bool)
+    def _on_enable_toggled(self, checked: bool):
+        perf.recorder.set_enabled(checked)
+
+    @Slot(bool)
+    def _on_log_toggled(self, checked: bool):
+        try:
+            perf.recorder.set_log_enabled(checked)
+        except OSError as e:
+            print(f"エラー: 計測ログファイルを開けませんでした: {e}")
+            self.log_check.blockSignals(True)
+            self.log_check.setChecked(False)
+            self.log_check.blockSignals(False)
+
+    @Slot()
+    def _on_reset_clicked(self):
+        perf.recorder.reset()
+        self.refresh()
+
+    @Slot()
+    def refresh(self):
+        """計測結果をテーブルに反映する"""
+        rows = perf.recorder.snapshot()
+        self.table.setUpdatesEnabled(False)
+        self.table.setRowCount(len(rows))
+        for row, stat in enumerate(rows):
+            values = [stat["name"], f"{stat['count']:,}"]
+            for key in ("p50_ms", "p95_ms", "max_ms", "total_ms"):
+                values.append("" if stat[key] is None else f"{stat[key]:.2f}")
+            for col, text in enumerate(values):
+                item = self.table.item(row, col)
+                if item is None:
+                    item = QTableWidgetItem()
+                    if col > 0:
+                        item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                    self.table.setItem(row, col, item)
+                if item.text() != text:
+                    item.setText(text)
+        self.table.setUpdatesEnabled(True)
@@ -0,0 +1,68 @@
+# price_adjustment.py
+"""単価の一括調整 (率 (%) または金額の増減・丸め・下限) の計算
+
+明細画面の選択行の調整と、保存済みの見積の一括調整 (SQL) の両方で同じ規則を使う。
+"""
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP, ROUND_UP
+from typing import Iterable, List, NamedTuple, Optional
+
+from number_format import CURRENCY_FORMAT
+
+MODE_PERCENT = "percent"  # 率 (%) で増減する
+MODE_DELTA = "delta"      # 金額 (円) で増減する
+MODE_SET = "set"          # 指定した単価にする
+# 丸め方 (表示名 -> decimal の丸めモード)
+ROUNDING_METHODS = {"四捨五入": ROUND_HALF_UP, "切り捨て": ROUND_DOWN, "切り上げ": ROUND_UP}
+ROUNDING_UNITS = (Decimal(1), Decimal(10), Decimal(100), Decimal(1000))  # 丸める単位 (円)
+_HUNDRED = Decimal(100)
+_ONE = Decimal(1)
+
+
+class PriceAdjustment(NamedTuple):
+    """単価の調整規則"""
+    mode: str                          # MODE_PERCENT / MODE_DELTA / MODE_SET
+    amount: Decimal                    # 増減する率 (%) または金額 (円)。減らすなら負の値。MODE_SET なら新しい単価
+    rounding_unit: Decimal = _ONE      # この単位 (円) に丸める
+    rounding: str = ROUND_HALF_UP      # 丸めモード (ROUNDING_METHODS の値)
+    floor: Optional[Decimal] = None    # 調整後の単価の下限
+
+    def apply(self, price: Decimal) -> Decimal:
+        """1つの単価に調整を適用する"""
+        if self.mode == MODE_PERCENT:
+            adjusted = price * (_HUNDRED + self.amount) / _HUNDRED
+        elif self.mode == MODE_SET:
+            adjusted = self.amount
+        else:
+            adjusted = price + self.amount
+        unit = self.rounding_unit
+        adjusted = (adjusted / unit).quantize(_ONE, rounding=self.rounding) * unit
+        if self.floor is not None and adjusted < self.floor:
+            adjusted = self.floor
+        return adjusted.quantize(_ONE) if unit >= _ONE else adjusted
+
+    def apply_many(self, prices: Iterable[Decimal]) -> List[Decimal]:
+        """複数の単価にまとめて調整を適用する (同じ単価は1回だけ計算する)"""
+        results = {}
+        adjusted = []
+        for price in prices:
+            result = results.get(price)
+            if result is None:
+                result = results[price] = self.apply(price)
+            adjusted.append(result)
+        return adjusted
+
+    def describe(self) -> str:
+        """Undo 履歴・確認表示用の説明 (例: "単価 +5% (10円単位で四捨五入, 下限 ￥100)")"""
+        sign = "+" if self.amount >= 0 else "-"
+        magnitude = format(abs(self.amount).normalize(), "f")
+        if self.mode == MODE_PERCENT:
+            change = f"{sign}{magnitude}%"
+        elif self.mode == MODE_SET:
+            change = f"→ {CURRENCY_FORMAT.format(self.amount)}"
+        else:
+            change = f"{sign}{CURRENCY_FORMAT.format(abs(self.amount))}"
+        method = next((name for name, rounding in ROUNDING_METHODS.items() if rounding == self.rounding), self.rounding)
+        details = [f"{format(self.rounding_unit.normalize(), 'f')}円単位で{method}"]
+        if self.floor is not None:
+            details.append(f"下限 {CURRENCY_FORMAT.format(self.floor)}")
+        return f"単価 {change} ({', '.join(details)})"
@@ -0,0 +1,117 @@
+# price_adjustment_dialog.py
+"""単価の一括調整の条件を入力するダイアログ"""
+from decimal import Decimal
+from typing import Optional
+
+from PySide6.QtCore import Signal
+from PySide6.QtWidgets import (
+    QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, QHBoxLayout, QLabel, QLineEdit, QVBoxLayout, QWidget
+)
+
+from number_format import CURRENCY_FORMAT, to_decimal
+from price_adjustment import MODE_DELTA, MODE_PERCENT, MODE_SET, ROUNDING_METHODS, ROUNDING_UNITS, PriceAdjustment
+
+PREVIEW_PRICE = Decimal(1000)  # 入力例の表示に使う単価
+
+
+class PriceAdjustmentForm(QWidget):
+    """率 (%) または金額の増減・丸め・下限の入力欄 (明細の調整と保存済み見積の調整で共用する)"""
+    changed = Signal()
+
+    def __init__(self, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItem("率 (%)", MODE_PERCENT)
+        self.mode_combo.addItem("金額 (円)", MODE_DELTA)
+        self.mode_combo.addItem("単価を指定 (円)", MODE_SET)
+        self.amount_edit = QLineEdit("5")
+        self.amount_edit.setPlaceholderText("例: 5 (値下げは -5)")
+        self.unit_combo = QComboBox()
+        for unit in ROUNDING_UNITS:
+            self.unit_combo.addItem(f"{unit}円", unit)
+        self.method_combo = QComboBox()
+        for name, rounding in ROUNDING_METHODS.items():
+            self.method_combo.addItem(name, rounding)
+        self.floor_check = QCheckBox("下限")
+        self.floor_edit = QLineEdit()
+        self.floor_edit.setPlaceholderText("例: 100")
+        self.floor_edit.setEnabled(False)
+        floor_row = QHBoxLayout()
+        floor_row.addWidget(self.floor_check)
+        floor_row.addWidget(self.floor_edit, 1)
+        self.preview_label = QLabel()
+
+        form = QFormLayout(self)
+        form.setContentsMargins(0, 0, 0, 0)
+        form.addRow("調整方法:", self.mode_combo)
+        form.addRow("増減:", self.amount_edit)
+        form.addRow("丸める単位:", self.unit_combo)
+        form.addRow("丸め方:", self.method_combo)
+        form.addRow("単価の下限:", floor_row)
+        form.addRow("例:", self.preview_label)
+
+        self.floor_check.toggled.connect(self.floor_edit.setEnabled)
+        for combo in (self.mode_combo, self.unit_combo, self.method_combo):
+            combo.currentIndexChanged.connect(self._on_changed)
+        for edit in (self.amount_edit, self.floor_edit):
+            edit.textChanged.connect(self._on_changed)
+        self.floor_check.toggled.connect(self._on_changed)
+        self._update_preview()
+
+    def adjustment(self) -> Optional[PriceAdjustment]:
+        """入力された調整規則 (入力が正しくなければ None)"""
+        amount = to_decimal(self.amount_edit.text(), None)
+        floor = None
+        if self.floor_check.isChecked():
+            floor = to_decimal(self.floor_edit.text(), None)
+            if floor is None:
+                return None
+        if amount is None:
+            return None
+        return PriceAdjustment(self.mode_combo.currentData(), amount, self.unit_combo.currentData(),
+                               self.method_combo.currentData(), floor)
+
+    def is_valid(self) -> bool:
+        """調整として意味のある入力か (増減 0 で下限もなければ何も変わらない)"""
+        adjustment = self.adjustment()
+        return adjustment is not None and (
+            adjustment.amount != 0 or adjustment.mode == MODE_SET or adjustment.floor is not None)
+
+    def _on_changed(self, *args):
+        self._update_preview()
+        self.changed.emit()
+
+    def _update_preview(self):
+        adjustment = self.adjustment()
+        if adjustment is None:
+            self.preview_label.setText("数値を入力してください")
+            return
+        self.preview_label.setText(
+            f"{CURRENCY_FORMAT.format(PREVIEW_PRICE)} → {CURRENCY_FORMAT.format(adjustment.apply(PREVIEW_PRICE))}")
+
+
+class PriceAdjustmentDialog(QDialog):
+    """選択行の単価の一括調整の条件を入力するダイアログ"""
+
+    def __init__(self, parent: Optional[QWidget] = None, title: str = "単価の一括調整", message: str = ""):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.form = PriceAdjustmentForm()
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        if message:
+            layout.addWidget(QLabel(message))
+        layout.addWidget(self.form)
+        layout.addWidget(self.button_box)
+
+        self.form.changed.connect(self._update_buttons)
+        self._update_buttons()
+
+    def adjustment(self) -> Optional[PriceAdjustment]:
+        return self.form.adjustment()
+
+    def _update_buttons(self):
+        self.button_box.button(QDialogButtonBox.StandardButton.Ok).setEnabled(self.form.is_valid())
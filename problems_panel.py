@@ -0,0 +1,112 @@
+# problems_panel.py
+from typing import List, Optional, Tuple
+
+from PySide6.QtCore import Qt, Slot
+from PySide6.QtWidgets import (
+    QAbstractItemView, QCheckBox, QDockWidget, QHBoxLayout, QHeaderView, QLabel, QTableWidget, QTableWidgetItem,
+    QVBoxLayout, QWidget
+)
+
+from validation import ERROR, SEVERITY_LABELS, WARNING, Problem
+
+
+class ProblemsPanel(QDockWidget):
+    """明細の検査結果 (RowValidator) を一覧するドックパネル。行をダブルクリックするとそのセルに移動する"""
+
+    HEADERS = ["区分", "行", "列", "内容"]
+    MAX_ROWS = 1000 # 一覧に出す件数の上限 (検査のたびに作り直すので、多すぎると編集の妨げになる)
+
+    def __init__(self, parent=None):
+        super().__init__("明細の問題", parent)
+        self.setObjectName("problemsPanel") # saveState/restoreState 用
+        self.setAllowedAreas(Qt.DockWidgetArea.BottomDockWidgetArea | Qt.DockWidgetArea.RightDockWidgetArea)
+        self._page = None
+        self._cells: List[Tuple[int, int]] = [] # 一覧の行 -> (行 ID, 列)
+
+        self.summary_label = QLabel()
+        self.warnings_check = QCheckBox("警告も表示する")
+        self.warnings_check.setChecked(True)
+        self.warnings_check.toggled.connect(self.refresh)
+
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        self.table.cellDoubleClicked.connect(self._on_cell_double_clicked)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.summary_label, 1)
+        controls.addWidget(self.warnings_check)
+
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addLayout(controls)
+        layout.addWidget(self.table)
+        self.setWidget(container)
+        self.visibilityChanged.connect(self._on_visibility_changed)
+        self.refresh()
+
+    def set_page(self, page):
+        """検査結果を表示する明細ページ (DetailPageWidget) を設定する"""
+        self._page = page
+        page.row_validator.changed.connect(self._on_validation_changed)
+        self.refresh()
+
+    @Slot()
+    def _on_validation_changed(self):
+        if self.isVisible(): # 隠れている間は一覧を作らない (表示したときに作る)
+            self.refresh()
+
+    @Slot(bool)
+    def _on_visibility_changed(self, visible: bool):
+        if visible:
+            self.refresh()
+
+    @Slot()
+    def refresh(self, *args):
+        page = self._page
+        if page is None:
+            self.summary_label.setText("明細を開くと検査結果を表示します。")
+            return
+        result = page.row_validator.result
+        show_warnings = self.warnings_check.isChecked()
+        entries: List[Tuple[int, int, Problem]] = []
+        for row_id, problems in result.problems.items():
+            row = page.formula_engine.row_of(row_id)
+            if row is None:
+                continue
+            entries.extend((row, row_id, problem) for problem in problems
+                           if show_warnings or problem.severity == ERROR)
+        entries.sort(key=lambda entry: (entry[0], entry[2].column))
+        summary = f"エラー {result.count(ERROR)} 件・警告 {result.count(WARNING)} 件"
+        if len(entries) > self.MAX_ROWS:
+            summary += f" (先頭の {self.MAX_ROWS} 件を表示)"
+            del entries[self.MAX_ROWS:]
+        self.summary_label.setText(summary)
+        table = self.table
+        table.setUpdatesEnabled(False)
+        try:
+            table.setRowCount(len(entries))
+            self._cells = []
+            for index, (row, row_id, problem) in enumerate(entries):
+                values = [SEVERITY_LABELS[problem.severity], str(row + 1), page.HEADERS[problem.column], problem.message]
+                for col, value in enumerate(values):
+                    item = QTableWidgetItem(value)
+                    if col == 1:
+                        item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                    table.setItem(index, col, item)
+                self._cells.append((row_id, problem.column))
+        finally:
+            table.setUpdatesEnabled(True)
+
+    @Slot(int, int)
+    def _on_cell_double_clicked(self, index: int, col: int):
+        if self._page is None or not 0 <= index < len(self._cells):
+            return
+        row_id, column = self._cells[index]
+        row: Optional[int] = self._page.formula_engine.row_of(row_id)
+        if row is not None:
+            self._page.go_to_cell(row, column)
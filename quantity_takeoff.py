@@ -0,0 +1,163 @@
+# quantity_takeoff.py
+"""拾い出しモード: 仕様の寸法から数量を求めて数量セルに入力する
+
+- 読み込み時・モードを有効にしたときは全行を CHUNK_ROWS 行ずつイベントループに戻りながら走査し
+  (入力を止めない)、変わる行をまとめて1つの Undo コマンドで反映する。
+- 仕様・単位を編集した行は次のイベントループでその行だけ拾い出す。
+- 手入力した数量は上書きしない。上書きするのは数量が 0 (未入力) の行と、
+  数量が編集前の仕様から拾い出した値のままの行だけ。
+- 走査中に行が移動・削除されても困らないように、変更は行 ID で持ち、反映するときに行番号に戻す。
+"""
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from PySide6.QtCore import QObject, QTimer
+
+from commands import ChangeMultipleItemsCommand
+from constants import FORMULA_ROLE
+from number_format import to_decimal
+from perf import timed
+from takeoff import quantity_text, quantity_texts
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+TAKEOFF_DESCRIPTION = "寸法から数量を拾い出し"
+
+
+class QuantityTakeoff(QObject):
+    """仕様の寸法からの数量の拾い出し (有効なときだけ動く)"""
+
+    CHUNK_ROWS = 2000  # 全行の走査で、1回のイベントループで処理する行数
+
+    def __init__(self, page: 'DetailPageWidget'):
+        super().__init__(page)
+        self._page = page
+        self._table = page.table
+        self._enabled = False
+        self._pending: Dict[int, Optional[str]] = {}  # 行 ID -> 上書きしてよい編集前の拾い出し結果
+        self._scan_row: Optional[int] = None           # 全行の走査中なら次に読む行
+        self._scan_changes: Dict[int, Tuple[str, str]] = {}  # 行 ID -> (変更前, 変更後)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._process)
+
+    def is_enabled(self) -> bool:
+        return self._enabled
+
+    def set_enabled(self, enabled: bool):
+        """拾い出しモードを切り替える (有効にしたら全行を拾い出す)"""
+        if enabled == self._enabled:
+            return
+        self._enabled = enabled
+        if enabled:
+            self.request_all()
+        else:
+            self._pending.clear()
+            self._scan_row = None
+            self._scan_changes.clear()
+            self._timer.stop()
+
+    def is_busy(self) -> bool:
+        return self._scan_row is not None or bool(self._pending)
+
+    def request_all(self):
+        """全行の拾い出しを予約する (読み込み・一括貼り付けの後に呼ぶ)"""
+        if not self._enabled:
+            return
+        self._scan_row = 0
+        self._scan_changes.clear()
+        self._timer.start()
+
+    def request_row(self, row: int, previous_spec: Optional[str] = None, previous_unit: Optional[str] = None):
+        """仕様・単位を編集した行の拾い出しを予約する (previous_* は編集前の値)"""
+        if not self._enabled:
+            return
+        spec, unit = self._row_spec_and_unit(row)
+        previous = quantity_text(previous_spec if previous_spec is not None else spec,
+                                 previous_unit if previous_unit is not None else unit)
+        self._pending[self._page.formula_engine.row_id(row)] = previous
+        self._timer.start()
+
+    def finish(self):
+        """予約済みの拾い出しを直ちに終わらせる"""
+        while self.is_busy():
+            self._process()
+
+    # ------------------------------------------------------------------
+    def _row_spec_and_unit(self, row: int) -> Tuple[str, str]:
+        spec_item = self._table.item(row, self._page.COL_SPECIFICATION)
+        return (spec_item.text() if spec_item else ""), self._page._unit_text(row)
+
+    @timed()
+    def _process(self):
+        engine = self._page.formula_engine
+        if self._pending:
+            pending, self._pending = self._pending, {}
+            changes = {}
+            for row_id, previous in pending.items():
+                row = engine.row_of(row_id)
+                if row is None:
+                    continue
+                spec, unit = self._row_spec_and_unit(row)
+                change = self._change(row, quantity_text(spec, unit) if spec else None, previous)
+                if change is not None:
+                    changes[row_id] = change
+            self._push(changes)
+        elif self._scan_row is not None:
+            start = self._scan_row
+            end = min(start + self.CHUNK_ROWS, self._table.rowCount())
+            rows = range(start, end)
+            specs_and_units = [self._row_spec_and_unit(row) for row in rows]
+            texts = quantity_texts((spec for spec, _ in specs_and_units), (unit for _, unit in specs_and_units))
+            for row, text in zip(rows, texts):
+                change = self._change(row, text, None)
+                if change is not None:
+                    self._scan_changes[engine.row_id(row)] = change
+            if end >= self._table.rowCount():
+                self._scan_row = None
+                changes, self._scan_changes = self._scan_changes, {}
+                self._push(changes)
+            else:
+                self._scan_row = end
+        if self.is_busy():
+            self._timer.start()
+
+    def _change(self, row: int, new_text: Optional[str], previous: Optional[str]) -> Optional[Tuple[str, str]]:
+        """数量セルを new_text にする変更 (変更前, 変更後) を返す。上書きしない・変わらないなら None"""
+        if new_text is None:
+            return None
+        item = self._table.item(row, self._page.COL_QUANTITY)
+        if item is None:
+            return None
+        formula = item.data(FORMULA_ROLE)
+        value = self._page._cell_value(row, self._page.COL_QUANTITY)
+        if formula == new_text or (not formula and not new_text.startswith("=") and value == to_decimal(new_text)):
+            return None
+        is_empty = not formula and not value
+        is_previous_takeoff = previous is not None and (
+            formula == previous or (not formula and not previous.startswith("=") and value == to_decimal(previous)))
+        if not (is_empty or is_previous_takeoff):
+            return None # 手入力した数量は上書きしない
+        return (formula or item.text(), new_text)
+
+    def _push(self, changes: Dict[int, Tuple[str, str]]):
+        """変更を1つの Undo コマンドで反映する (走査中に編集されたセルは反映しない)"""
+        engine = self._page.formula_engine
+        col = self._page.COL_QUANTITY
+        cell_changes: List[Tuple[int, int, str, str]] = []
+        for row_id, (old_text, new_text) in changes.items():
+            row = engine.row_of(row_id)
+            item = self._table.item(row, col) if row is not None else None
+            if item is None or (item.data(FORMULA_ROLE) or item.text()) != old_text:
+                continue
+            cell_changes.append((row, col, old_text, new_text))
+        if not cell_changes:
+            return
+        command = ChangeMultipleItemsCommand(self._table, cell_changes, TAKEOFF_DESCRIPTION)
+        undo_stack = self._page.undo_stack
+        if undo_stack:
+            undo_stack.push(command)
+        else:
+            command.redo()
+        self._page.status_message_requested.emit(f"{len(cell_changes)} 行の数量を仕様の寸法から拾い出しました", 5000)
@@ -0,0 +1,180 @@
+# revision_diff_dialog.py
+"""2つの見積 (改訂版どうしなど) の明細を比べて、追加・削除・変更した行と金額の差を表示するダイアログ"""
+import sqlite3
+from typing import List, Optional
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QColor
+from PySide6.QtWidgets import (
+    QAbstractItemView, QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, QHeaderView, QLabel, QMessageBox,
+    QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
+)
+
+from background import BackgroundTask, run_in_background
+from constants import COLOR_DIFF_ADDED_BG, COLOR_DIFF_CHANGED_BG, COLOR_DIFF_REMOVED_BG
+from database_setup import migrate_database
+from estimate_diff import (
+    ADDED, CHANGED, REMOVED, UNCHANGED, ComparableEstimate, DiffEntry, EstimateDiff,
+    compare_estimates, list_comparable_estimates, previous_revision_id
+)
+from number_format import CURRENCY_FORMAT, QUANTITY_FORMAT
+
+
+def _signed_currency(value) -> str:
+    return ("+" if value > 0 else "-" if value < 0 else "") + CURRENCY_FORMAT.format(abs(value))
+
+
+_KIND_LABELS = {ADDED: "追加", REMOVED: "削除", CHANGED: "変更", UNCHANGED: ""}
+_KIND_COLORS = {ADDED: COLOR_DIFF_ADDED_BG, REMOVED: COLOR_DIFF_REMOVED_BG, CHANGED: COLOR_DIFF_CHANGED_BG}
+
+
+class RevisionDiffDialog(QDialog):
+    """比較元と比較先の見積を選んで、明細の違いを表示するダイアログ (比較はワーカースレッドで行う)"""
+
+    HEADERS = ["区分", "名称", "仕様", "数量", "単位", "単価", "金額", "差額"]
+    # 列 -> (DiffLine の属性名, 表示形式)
+    _COLUMN_FIELDS = {1: ("name", None), 2: ("specification", None), 3: ("quantity", QUANTITY_FORMAT),
+                      4: ("unit", None), 5: ("unit_price", CURRENCY_FORMAT), 6: ("amount", CURRENCY_FORMAT)}
+
+    def __init__(self, db_file_path: str, estimate_id: Optional[int] = None, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setWindowTitle("版の比較")
+        self.db_file_path = db_file_path
+        self._estimates: List[ComparableEstimate] = []
+        self._task: Optional[BackgroundTask] = None
+        self._diff: Optional[EstimateDiff] = None
+        self._build_ui()
+        self._load_estimates(estimate_id)
+
+    def _build_ui(self):
+        self.old_combo = QComboBox()
+        self.new_combo = QComboBox()
+        self.show_unchanged_check = QCheckBox("変更のない行も表示する")
+        form = QFormLayout()
+        form.addRow("比較元 (前の版):", self.old_combo)
+        form.addRow("比較先 (新しい版):", self.new_combo)
+        form.addRow("", self.show_unchanged_check)
+
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+        self.diff_table = QTableWidget(0, len(self.HEADERS))
+        self.diff_table.setHorizontalHeaderLabels(self.HEADERS)
+        self.diff_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.diff_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.diff_table.verticalHeader().setVisible(False)
+        self.diff_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.diff_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        button_box.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(form)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.diff_table, 1)
+        layout.addWidget(button_box)
+        self.resize(980, 620)
+
+        self.old_combo.currentIndexChanged.connect(self.compare)
+        self.new_combo.currentIndexChanged.connect(self.compare)
+        self.show_unchanged_check.toggled.connect(self._show_diff)
+
+    def _load_estimates(self, estimate_id: Optional[int]):
+        """選べる見積を読み込み、比較先を estimate_id、比較元をその1つ前の版にする"""
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_file_path)
+            migrate_database(conn)
+            self._estimates = list_comparable_estimates(conn)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"見積の一覧の読み込み中にエラーが発生しました:\n{e}")
+            self._estimates = []
+        finally:
+            if conn:
+                conn.close()
+        ids = [estimate.id for estimate in self._estimates]
+        new_id = estimate_id if estimate_id in ids else (ids[-1] if ids else None)
+        old_id = previous_revision_id(self._estimates, new_id) if new_id is not None else None
+        if old_id is None and len(ids) > 1:
+            old_id = ids[ids.index(new_id) - 1] if ids.index(new_id) > 0 else ids[1]
+        for combo, selected_id in ((self.old_combo, old_id), (self.new_combo, new_id)):
+            combo.blockSignals(True)
+            for estimate in self._estimates:
+                combo.addItem(estimate.label(), estimate.id)
+            if selected_id is not None:
+                combo.setCurrentIndex(ids.index(selected_id))
+            combo.blockSignals(False)
+        if len(ids) < 2:
+            self.summary_label.setText("比較できる保存済みの見積が2件以上ありません。")
+            return
+        self.compare()
+
+    def compare(self, *args):
+        """選んだ2つの見積の比較をワーカースレッドで始める (前の比較の結果は捨てる)"""
+        old_id, new_id = self.old_combo.currentData(), self.new_combo.currentData()
+        if old_id is None or new_id is None:
+            return
+        if self._task is not None:
+            self._task.cancel()
+        self.summary_label.setText("比較しています...")
+        self._task = run_in_background(compare_estimates, self.db_file_path, old_id, new_id,
+                                       on_finished=self._on_compared, on_failed=self._on_compare_failed)
+
+    def is_comparing(self) -> bool:
+        return self._task is not None
+
+    def _on_compared(self, diff: EstimateDiff):
+        self._task = None
+        self._diff = diff
+        self._show_diff()
+
+    def _on_compare_failed(self, message: str):
+        self._task = None
+        self.summary_label.setText(f"比較できませんでした: {message}")
+
+    def _show_diff(self, *args):
+        diff = self._diff
+        if diff is None:
+            return
+        counts = {kind: diff.count(kind) for kind in (ADDED, REMOVED, CHANGED)}
+        self.summary_label.setText(
+            f"追加 {counts[ADDED]} 行・削除 {counts[REMOVED]} 行・変更 {counts[CHANGED]} 行　"
+            f"工事金額 {CURRENCY_FORMAT.format(diff.old_subtotal)} → {CURRENCY_FORMAT.format(diff.new_subtotal)} "
+            f"(差額 {_signed_currency(diff.subtotal_delta)})")
+        show_unchanged = self.show_unchanged_check.isChecked()
+        entries = [entry for entry in diff.entries if show_unchanged or entry.kind != UNCHANGED]
+        table = self.diff_table
+        table.setUpdatesEnabled(False)
+        try:
+            table.setRowCount(0)
+            table.setRowCount(len(entries))
+            for row, entry in enumerate(entries):
+                self._fill_row(row, entry)
+        finally:
+            table.setUpdatesEnabled(True)
+
+    def _fill_row(self, row: int, entry: DiffEntry):
+        line = entry.new if entry.new is not None else entry.old
+        values = [_KIND_LABELS[entry.kind]]
+        for col in range(1, 7):
+            field, number_format = self._COLUMN_FIELDS[col]
+            text = number_format.format(getattr(line, field)) if number_format else getattr(line, field)
+            if field in entry.changed_fields or (field == "amount" and entry.kind == CHANGED and entry.amount_delta):
+                old_value = getattr(entry.old, field)
+                text = f"{number_format.format(old_value) if number_format else old_value} → {text}"
+            values.append(text)
+        values.append(_signed_currency(entry.amount_delta) if entry.amount_delta else "")
+        color = _KIND_COLORS.get(entry.kind)
+        for col, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            if col in (3, 5, 6, 7):
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            if color:
+                item.setBackground(QColor(color))
+            self.diff_table.setItem(row, col, item)
+
+    def done(self, result: int):
+        if self._task is not None: # 閉じた後に結果が届いても使わない
+            self._task.cancel()
+            self._task = None
+        super().done(result)
@@ -0,0 +1,235 @@
+# row_filter.py
+"""明細の絞り込み表示 (行そのものは変えずに、条件に合わない行を隠す)
+
+- 条件は空白区切りの語の AND:
+    "防水"                   名称・仕様・摘要のどれかに含む
+    "仕様:防水"              指定した列 (名称・仕様・単位・摘要) に含む。"単位=m2" なら一致
+    "単価=0"、"金額>=10000"  数値の列 (数量・単価・金額) の比較 (=, !=, <>, <, <=, >, >=)
+    "-防水"                  先頭の "-" は否定 (含まない)
+- 条件は TextIndex の列ごとの配列 (文字列・数値) に対してまとめて評価し、
+  表示が変わる行だけ setRowHidden する (打鍵ごとに全行のウィジェットを触らない)。入力は少し待ってから評価する。
+- 行は隠すだけで並びも行番号も変わらないので、編集・Undo・ドラッグでの並べ替えはそのまま元の行に対して働く。
+  絞り込み中に追加・移動した行と、編集で条件に合わなくなった行は、条件を入力し直すまで表示したままにする。
+- 明細の合計は全行のまま。表示中の行の小計はバーに表示する。
+"""
+import operator
+import re
+from decimal import Decimal
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Union
+
+from PySide6.QtCore import QModelIndex, QTimer, Qt
+from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QToolButton, QWidget
+
+from constants import ROW_ID_ROLE
+from number_format import to_decimal
+from perf import timed
+from utils import format_currency
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+FILTER_DELAY_MS = 250  # 入力してから絞り込み直すまでの待ち時間
+
+_FULL_WIDTH_TABLE = str.maketrans({"＝": "=", "＜": "<", "＞": ">", "：": ":", "！": "!", "　": " ", "－": "-"})
+_OPERATOR_SPACES_RE = re.compile(r"\s*(!=|<>|<=|>=|=|<|>|:)\s*")
+_TERM_RE = re.compile(r"(?P<negate>-)?(?:(?P<column>[^=<>!:]+?)(?P<operator>!=|<>|<=|>=|=|<|>|:))?(?P<value>.*)")
+_COMPARISONS: Dict[str, Callable[[Decimal, Decimal], bool]] = {
+    "=": operator.eq, ":": operator.eq, "!=": operator.ne, "<>": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+CONTAINS = ":"  # 文字列の列に「含む」
+
+
+class FilterError(ValueError):
+    """絞り込み条件の誤り"""
+    pass
+
+
+class FilterTerm(NamedTuple):
+    """絞り込み条件の1語"""
+    column: Optional[int]          # 列番号 (None なら名称・仕様・摘要のどれか)
+    operator: str                  # CONTAINS または比較演算子
+    value: Union[str, Decimal]     # 文字列の列なら文字列、数値の列なら数値
+    negate: bool = False
+
+
+def parse_filter(text: str, column_names: Dict[str, int], numeric_columns: Sequence[int]) -> List[FilterTerm]:
+    """絞り込み条件の文字列を語に分ける (例: "防水 単価=0")。誤りなら FilterError"""
+    text = _OPERATOR_SPACES_RE.sub(r"\1", text.translate(_FULL_WIDTH_TABLE).strip())
+    terms = []
+    for word in text.split():
+        match = _TERM_RE.fullmatch(word)
+        negate = bool(match.group("negate"))
+        column_name, operator_text, value = match.group("column"), match.group("operator"), match.group("value")
+        if column_name is not None and column_name not in column_names:
+            # "H=1000" のように列名でなければ、全体を文字列として探す
+            column_name, operator_text, value = None, None, word[1:] if negate else word
+        if not value:
+            continue
+        if column_name is None:
+            terms.append(FilterTerm(None, CONTAINS, value.casefold(), negate))
+            continue
+        col = column_names[column_name]
+        if col in numeric_columns:
+            number = to_decimal(value, None)
+            if number is None:
+                raise FilterError(f"「{column_name}」は数値と比べてください (例: {column_name}>=1000)")
+            terms.append(FilterTerm(col, operator_text, number, negate))
+        elif operator_text in (CONTAINS, "=", "!=", "<>"):
+            if operator_text in ("!=", "<>"):
+                operator_text, negate = "=", not negate
+            terms.append(FilterTerm(col, operator_text, value.casefold(), negate))
+        else:
+            raise FilterError(f"「{column_name}」は文字の列なので {operator_text} では比べられません (例: {column_name}:防水)")
+    return terms
+
+
+class RowFilterBar(QWidget):
+    """明細の絞り込み表示のバー (Ctrl+Shift+L で表示する。閉じると全行を表示する)"""
+
+    def __init__(self, page: 'DetailPageWidget'):
+        super().__init__(page)
+        self._page = page
+        self._table = page.table
+        self._text_index = page.text_index
+        self._column_names = {page.HEADERS[col]: col for col in range(page.NUM_COLS)}
+        self._hidden_ids: Set[int] = set()  # 隠している行の行 ID
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DELAY_MS)
+        self._filter_timer.timeout.connect(self.apply_filter)
+        self._build_ui()
+        self._table.model().rowsAboutToBeRemoved.connect(self._on_rows_about_to_be_removed)
+        self.hide()
+
+    def _build_ui(self):
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("例: 防水　単価=0　金額>=10000　仕様:シリコン　-撤去")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.summary_label = QLabel()
+        self.close_button = QToolButton()
+        self.close_button.setText("×")
+        self.close_button.setToolTip("絞り込みを解除する (Esc)")
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QLabel("絞り込み:"))
+        layout.addWidget(self.filter_edit, 1)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.close_button)
+
+        self.filter_edit.textChanged.connect(self._schedule_filter)
+        self.filter_edit.returnPressed.connect(self.apply_filter)
+        self.close_button.clicked.connect(self.close_bar)
+        shortcut = QShortcut(QKeySequence(Qt.Key.Key_Escape), self)
+        shortcut.setContext(Qt.ShortcutContext.WidgetWithChildrenShortcut)
+        shortcut.activated.connect(self.close_bar)
+
+    # ------------------------------------------------------------------
+    # 表示
+    # ------------------------------------------------------------------
+    def open(self):
+        self.show()
+        self.filter_edit.setFocus()
+        self.filter_edit.selectAll()
+
+    def close_bar(self):
+        """絞り込みを解除してバーを閉じる"""
+        self._filter_timer.stop()
+        self._set_hidden(set())
+        self.hide()
+        self.summary_label.clear()
+        self._table.setFocus()
+
+    def is_active(self) -> bool:
+        """隠している行があるか"""
+        return bool(self._hidden_ids)
+
+    def reset(self):
+        """(読み込みの前に) 全行を表示に戻す。条件が入力されていれば読み込み後に絞り込み直す"""
+        self._set_hidden(set())
+        self._schedule_filter()
+
+    def visible_rows(self, rows: Sequence[int]) -> List[int]:
+        """rows のうち隠していない行 (選択行に対する操作で、隠れている行を対象にしないために使う)"""
+        if not self._hidden_ids:
+            return list(rows)
+        row_ids = self._page.formula_engine.row_ids()
+        return [row for row in rows if row_ids[row] not in self._hidden_ids]
+
+    # ------------------------------------------------------------------
+    # 絞り込み
+    # ------------------------------------------------------------------
+    def _schedule_filter(self, *args):
+        if not self.isHidden():
+            self._filter_timer.start()
+
+    @timed()
+    def apply_filter(self):
+        """入力された条件で絞り込み直す"""
+        self._filter_timer.stop()
+        try:
+            terms = parse_filter(self.filter_edit.text(), self._column_names, self._text_index.value_columns)
+        except FilterError as e:
+            self.summary_label.setText(str(e))
+            return
+        row_ids = self._text_index.row_ids()
+        mask = [True] * len(row_ids)
+        for term in terms:
+            matches = self._term_matches(term, len(row_ids))
+            mask = [shown and matched != term.negate for shown, matched in zip(mask, matches)]
+        self._set_hidden({row_id for row_id, shown in zip(row_ids, mask) if not shown})
+        self.update_summary()
+
+    def _term_matches(self, term: FilterTerm, row_count: int) -> List[bool]:
+        """1語の条件に合うかを全行分まとめて求める"""
+        index = self._text_index
+        if term.operator == CONTAINS and term.column in (None, *index.columns):
+            # 文字列の「含む」は検索用インデックスの連結文字列から探す
+            columns = index.columns if term.column is None else [term.column]
+            found = [False] * row_count
+            for row, _ in index.find(term.value, columns):
+                found[row] = True
+            return found
+        if term.column in index.value_columns:
+            compare = _COMPARISONS[term.operator]
+            return [compare(value, term.value) for value in index.column_values(term.column)]
+        if term.column == self._page.COL_UNIT: # 単位は TextIndex の対象の列ではないので、その都度読む
+            texts = [self._page._unit_text(row).casefold() for row in range(row_count)]
+        else:
+            texts = [text.casefold() for text in index.column_texts(term.column)]
+        if term.operator == CONTAINS:
+            return [term.value in text for text in texts]
+        return [text == term.value for text in texts]
+
+    def _set_hidden(self, hidden_ids: Set[int]):
+        """隠す行を hidden_ids にする (表示が変わる行だけ setRowHidden する)"""
+        engine = self._page.formula_engine
+        table = self._table
+        for row_ids, hidden in ((self._hidden_ids - hidden_ids, False), (hidden_ids - self._hidden_ids, True)):
+            for row_id in row_ids:
+                row = engine.row_of(row_id)
+                if row is not None:
+                    table.setRowHidden(row, hidden)
+        self._hidden_ids = hidden_ids
+
+    def update_summary(self):
+        """表示中の行数と小計を表示する (合計の再計算のたびに呼ばれる)"""
+        if self.isHidden() or not self.filter_edit.text().strip():
+            self.summary_label.clear()
+            return
+        row_ids = self._text_index.row_ids()
+        amounts = self._text_index.column_values(self._page.COL_AMOUNT)
+        hidden_ids = self._hidden_ids
+        subtotal = sum((amount for row_id, amount in zip(row_ids, amounts) if row_id not in hidden_ids), Decimal('0'))
+        shown = len(row_ids) - len(hidden_ids)
+        self.summary_label.setText(f"{shown:,} / {len(row_ids):,} 行を表示　表示中の小計: {format_currency(subtotal)}")
+
+    def _on_rows_about_to_be_removed(self, parent: QModelIndex, first: int, last: int):
+        # 削除される行は隠した行から外す (元に戻すで戻った行は表示する)
+        if not self._hidden_ids:
+            return
+        for row in range(first, last + 1):
+            item = self._table.item(row, self._page.COL_NAME)
+            if item is not None:
+                self._hidden_ids.discard(item.data(ROW_ID_ROLE))
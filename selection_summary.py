@@ -0,0 +1,147 @@
+# selection_summary.py
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+from PySide6.QtCore import QObject, QItemSelection, QModelIndex, Signal, Slot
+from PySide6.QtWidgets import QAbstractItemView
+
+
+class SelectionSummary(QObject):
+    """テーブルの選択状態を QItemSelection の差分から逐次集計するサービス
+
+    selectedIndexes() で全選択セル (行数 × 列数) を毎回作り直す代わりに、
+    selectionChanged の差分だけを反映して「選択の有無 / 選択行数 / 選択行の合計値」
+    を O(1) で返す。行の挿入・削除・並べ替えが起きたときは印を付けるだけにし、次に集計を読むときに
+    選択範囲 (ranges) から1回だけ数え直す (一括の削除・複写で行ごとに数え直さない。
+    選択行数に比例するコストで、全セルの走査は行わない)。
+    """
+    changed = Signal()
+
+    def __init__(self, view: QAbstractItemView, value_column: int,
+                 value_getter: Callable[[int], Decimal], parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._view = view
+        self._value_column = value_column
+        self._value_getter = value_getter
+        # 行番号 -> その行で選択されているセル数
+        self._row_cells: Dict[int, int] = {}
+        # 行番号 -> 集計に加算済みの値 (値の変更時に差分で加減算するため保持する)
+        self._row_values: Dict[int, Decimal] = {}
+        self._sum = Decimal('0')
+        self._dirty = False # 行の構造が変わり、次に読むときに数え直す
+
+        selection_model = view.selectionModel()
+        selection_model.selectionChanged.connect(self._on_selection_changed)
+        model = view.model()
+        model.dataChanged.connect(self._on_data_changed)
+        for structural_signal in (model.rowsInserted, model.rowsRemoved, model.rowsMoved):
+            structural_signal.connect(self._on_rows_restructured)
+        model.layoutChanged.connect(self._on_rows_restructured)
+        model.modelReset.connect(self._on_rows_restructured)
+        # ビュー破棄時にモデルが行削除を通知してくることがあるため、参照を切っておく
+        view.destroyed.connect(self._on_view_destroyed)
+
+    # ------------------------------------------------------------------
+    # 参照用 API (いずれも O(1)。行の構造が変わった後の最初の1回だけ数え直す)
+    # ------------------------------------------------------------------
+    def has_selection(self) -> bool:
+        self._ensure_synced()
+        return bool(self._row_cells)
+
+    def row_count(self) -> int:
+        self._ensure_synced()
+        return len(self._row_cells)
+
+    def selected_sum(self) -> Decimal:
+        self._ensure_synced()
+        return self._sum
+
+    def is_row_selected(self, row: int) -> bool:
+        self._ensure_synced()
+        return row in self._row_cells
+
+    def selected_rows(self) -> List[int]:
+        """選択されている行番号を昇順で返す"""
+        self._ensure_synced()
+        return sorted(self._row_cells)
+
+    # ------------------------------------------------------------------
+    # 内部処理
+    # ------------------------------------------------------------------
+    def _add_row(self, row: int):
+        value = self._value_getter(row)
+        self._row_values[row] = value
+        self._sum += value
+
+    def _remove_row(self, row: int):
+        self._sum -= self._row_values.pop(row, Decimal('0'))
+
+    def _apply_ranges(self, selection: QItemSelection, sign: int):
+        row_cells = self._row_cells
+        for selection_range in selection:
+            width = selection_range.width()
+            for row in range(selection_range.top(), selection_range.bottom() + 1):
+                count = row_cells.get(row, 0) + sign * width
+                if count > 0:
+                    if row not in row_cells:
+                        self._add_row(row)
+                    row_cells[row] = count
+                elif row in row_cells:
+                    del row_cells[row]
+                    self._remove_row(row)
+
+    @Slot(QItemSelection, QItemSelection)
+    def _on_selection_changed(self, selected: QItemSelection, deselected: QItemSelection):
+        if self._dirty: # 数え直すときに今の選択範囲から集計する
+            self.changed.emit()
+            return
+        self._apply_ranges(deselected, -1)
+        self._apply_ranges(selected, +1)
+        self.changed.emit()
+
+    def _on_data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex, roles=None):
+        if self._dirty or not self._row_cells:
+            return
+        if not (top_left.column() <= self._value_column <= bottom_right.column()):
+            return
+        updated = False
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            if row in self._row_cells:
+                new_value = self._value_getter(row)
+                self._sum += new_value - self._row_values.get(row, Decimal('0'))
+                self._row_values[row] = new_value
+                updated = True
+        if updated:
+            self.changed.emit()
+
+    @Slot()
+    def _on_rows_restructured(self, *args):
+        if self._dirty:
+            return
+        self._dirty = True
+        self.changed.emit()
+
+    def _ensure_synced(self):
+        if self._dirty:
+            self._recount() # 印を付けたときに changed は出している
+
+    @Slot()
+    def _on_view_destroyed(self):
+        self._view = None
+
+    @Slot()
+    def resync(self):
+        """選択範囲から集計を作り直す"""
+        self._recount()
+        self.changed.emit()
+
+    def _recount(self):
+        self._dirty = False
+        self._row_cells.clear()
+        self._row_values.clear()
+        self._sum = Decimal('0')
+        if self._view is None:
+            return
+        selection_model = self._view.selectionModel()
+        if selection_model is not None:
+            self._apply_ranges(selection_model.selection(), +1)
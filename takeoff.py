@@ -0,0 +1,138 @@
+# takeoff.py
+"""仕様の寸法 (例: "H=1000, W=2000"、"W900×H2100 3箇所") から数量を拾い出す
+
+- 寸法は H・W・L・D (高さ・幅・長さ・奥行) を mm で読む ("2.5m"、"90cm" のように単位を付けてもよい)。
+  記号のない "1800×900" は W×H (3つなら W×H×D) と読む。
+- 個数は "N=3"、"×3"、"3箇所"・"3枚"・"3本" などで書く (なければ 1)。
+- 単位が m2 なら面積、m3 なら体積、m なら長さ (L、なければ W・H・D の順) に個数を掛ける。
+  それ以外の単位は個数が書かれているときだけ個数を数量にする。
+- 結果は数量セルに入力する計算式 ("=0.9*2.1*3") で返すので、どう拾い出したかが式として残る。
+- 正規表現はモジュール読み込み時に1回だけコンパイルし、拾い出しの結果は (仕様, 単位) ごとに
+  LRU キャッシュする (同じ仕様が何行にも現れる読み込み・貼り付けでは解析が1回で済む)。
+"""
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+CACHE_SIZE = 4096  # 拾い出し結果のキャッシュの上限件数
+
+# 拾い出し用の正規化表 (全角の英数字・記号を半角にする。区切りの空白・カンマは残す)
+_TAKEOFF_TABLE = str.maketrans({
+    **{chr(ord("０") + i): str(i) for i in range(10)},
+    **{chr(ord("Ａ") + i): chr(ord("A") + i) for i in range(26)},
+    **{chr(ord("ａ") + i): chr(ord("a") + i) for i in range(26)},
+    "．": ".", "＝": "=", "：": ":", "，": ",", "　": " ",
+    "×": "x", "✕": "x", "＊": "x", "*": "x", "Ｘ": "x", "ｘ": "x", "X": "x",
+    "²": "2", "³": "3",
+})
+
+# 寸法の名前 -> 記号
+DIMENSION_KEYS = {"H": "H", "W": "W", "L": "L", "D": "D",
+                  "高さ": "H", "幅": "W", "長さ": "L", "奥行": "D", "奥行き": "D"}
+_LENGTH_UNITS_MM = {None: Decimal(1), "mm": Decimal(1), "cm": Decimal(10), "m": Decimal(1000)}
+COUNT_SUFFIXES = ("箇所", "ヶ所", "ケ所", "カ所", "か所", "枚", "本", "個", "台", "基", "組", "面", "セット")
+
+_DIMENSION_RE = re.compile(
+    r"(?<![A-Za-wyz])(?P<key>奥行き?|高さ|長さ|幅|[HWLDhwld])\s*[=:]?\s*"
+    r"(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>mm|cm|m)?")
+_PLAIN_DIMENSIONS_RE = re.compile(
+    r"(?<![\w.=:])(\d+(?:\.\d+)?)\s*x\s*(\d+(?:\.\d+)?)(?:x(\d+(?:\.\d+)?))?")
+_THOUSANDS_SEPARATOR_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")  # "1,000" の桁区切り
+_COUNT_RE = re.compile(
+    r"(?<![A-Za-z])[Nn]\s*[=:]\s*(?P<n>\d+)"
+    r"|(?:^|(?<=[\s,、;/(]))x\s*(?P<x>\d+)(?![\d.]|\s*x)"
+    r"|(?P<suffixed>\d+)\s*(?:" + "|".join(COUNT_SUFFIXES) + ")")
+
+# 単位 (正規化・小文字化した文字列) -> 拾い出す量の種類
+UNIT_KINDS = {
+    "m": "length", "メートル": "length",
+    "m2": "area", "㎡": "area", "m^2": "area", "平米": "area",
+    "m3": "volume", "㎥": "volume", "m^3": "volume", "立米": "volume",
+}
+_DIMENSION_ORDER = ("W", "H", "L", "D")   # 面積・体積で使う寸法の優先順
+_LENGTH_ORDER = ("L", "W", "H", "D")      # 長さで使う寸法の優先順
+_KIND_DIMENSIONS = {"length": 1, "area": 2, "volume": 3}
+_MM_PER_M = Decimal(1000)
+
+
+class SpecDimensions(NamedTuple):
+    """仕様から読み取った寸法 (mm) と個数"""
+    dimensions: Dict[str, Decimal]
+    count: int
+    has_count: bool   # 個数が書かれていたかどうか
+
+
+def _normalize(text: str) -> str:
+    return _THOUSANDS_SEPARATOR_RE.sub("", text.translate(_TAKEOFF_TABLE))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_spec(spec: str) -> Optional[SpecDimensions]:
+    """仕様の文字列から寸法と個数を読み取る (どちらもなければ None)"""
+    if not spec:
+        return None
+    text = _normalize(spec)
+    dimensions: Dict[str, Decimal] = {}
+    for match in _DIMENSION_RE.finditer(text):
+        key = DIMENSION_KEYS[match.group("key").upper()]
+        dimensions.setdefault(key, Decimal(match.group("value")) * _LENGTH_UNITS_MM[match.group("unit")])
+    if not dimensions:
+        match = _PLAIN_DIMENSIONS_RE.search(text)
+        if match is not None:
+            text = text[:match.start()] + text[match.end():]  # "1800x900" の "x900" を個数と読まないように除く
+            for key, value in zip(("W", "H", "D"), match.groups()):
+                if value is not None:
+                    dimensions[key] = Decimal(value)
+    count = 1
+    has_count = False
+    for match in _COUNT_RE.finditer(text):
+        count *= int(match.group("n") or match.group("x") or match.group("suffixed"))
+        has_count = True
+    if not dimensions and not has_count:
+        return None
+    return SpecDimensions(dimensions, count, has_count)
+
+
+def unit_kind(unit: str) -> Optional[str]:
+    """単位から拾い出す量の種類 ("length" / "area" / "volume") を返す (個数で数える単位なら None)"""
+    return UNIT_KINDS.get(_normalize(unit or "").strip().lower())
+
+
+def _meters(value_mm: Decimal) -> str:
+    return format((value_mm / _MM_PER_M).normalize(), "f")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def quantity_text(spec: str, unit: str) -> Optional[str]:
+    """仕様と単位から数量セルへの入力 (計算式または個数) を求める。拾い出せなければ None"""
+    parsed = parse_spec(spec)
+    if parsed is None:
+        return None
+    kind = unit_kind(unit)
+    if kind is None:
+        return str(parsed.count) if parsed.has_count else None
+    order = _LENGTH_ORDER if kind == "length" else _DIMENSION_ORDER
+    factors = [_meters(parsed.dimensions[key]) for key in order if key in parsed.dimensions]
+    needed = _KIND_DIMENSIONS[kind]
+    if len(factors) < needed:
+        return None
+    factors = factors[:needed]
+    if parsed.count != 1:
+        factors.append(str(parsed.count))
+    return "=" + "*".join(factors)
+
+
+def quantity_texts(specs: Iterable[Optional[str]], units: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """複数行の仕様と単位から、まとめて数量セルへの入力を求める (読み込み・貼り付け用)"""
+    cached = quantity_text
+    return [cached(spec, unit or "") if spec else None for spec, unit in zip(specs, units)]
+
+
+def cache_info() -> Tuple:
+    return parse_spec.cache_info(), quantity_text.cache_info()
+
+
+def clear_cache():
+    parse_spec.cache_clear()
+    quantity_text.cache_clear()
@@ -0,0 +1,130 @@
+# template_dialog.py
+"""テンプレートを選んで新しい見積を作るダイアログ"""
+import sqlite3
+from typing import List, Optional
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (
+    QAbstractItemView, QDialog, QDialogButtonBox, QFormLayout, QHeaderView, QLabel, QLineEdit, QMessageBox,
+    QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
+)
+
+from database_setup import migrate_database
+from estimate_copy import TemplateInfo, delete_template, list_templates
+from number_format import CURRENCY_FORMAT
+
+
+class TemplateDialog(QDialog):
+    """テンプレートの一覧から1つ選び、新しい見積の工事名を入力するダイアログ"""
+
+    HEADERS = ["テンプレート名", "行数", "工事金額", "更新日時"]
+
+    def __init__(self, db_file_path: str, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setWindowTitle("テンプレートから新規作成")
+        self.db_file_path = db_file_path
+        self._templates: List[TemplateInfo] = []
+        self._build_ui()
+        self._load()
+
+    def _build_ui(self):
+        self.template_table = QTableWidget(0, len(self.HEADERS))
+        self.template_table.setHorizontalHeaderLabels(self.HEADERS)
+        self.template_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.template_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.template_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.template_table.verticalHeader().setVisible(False)
+        self.template_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.project_name_edit = QLineEdit()
+        self.project_name_edit.setPlaceholderText("例: 山田様邸 外壁塗装工事")
+        self.message_label = QLabel()
+        self.message_label.setWordWrap(True)
+        self.delete_button = QPushButton("テンプレートを削除")
+        form = QFormLayout()
+        form.addRow("新しい見積の工事名:", self.project_name_edit)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Cancel)
+        self.create_button = self.button_box.addButton("作成", QDialogButtonBox.ButtonRole.AcceptRole)
+        self.button_box.addButton(self.delete_button, QDialogButtonBox.ButtonRole.ActionRole)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.template_table, 1)
+        layout.addWidget(self.message_label)
+        layout.addLayout(form)
+        layout.addWidget(self.button_box)
+        self.resize(640, 420)
+
+        self.template_table.itemSelectionChanged.connect(self._on_selection_changed)
+        self.template_table.itemDoubleClicked.connect(lambda item: self.create_button.isEnabled() and self.accept())
+        self.project_name_edit.textChanged.connect(self._update_buttons)
+        self.delete_button.clicked.connect(self._delete_selected)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file_path)
+        migrate_database(conn)
+        return conn
+
+    def _load(self):
+        conn = None
+        try:
+            conn = self._connect()
+            self._templates = list_templates(conn)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"テンプレートの読み込み中にエラーが発生しました:\n{e}")
+            self._templates = []
+        finally:
+            if conn:
+                conn.close()
+        table = self.template_table
+        table.setRowCount(len(self._templates))
+        for row, template in enumerate(self._templates):
+            values = [template.name, f"{template.line_count:,}", CURRENCY_FORMAT.format(template.subtotal_amount),
+                      template.updated_at]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col in (1, 2):
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                table.setItem(row, col, item)
+        self.message_label.setText("" if self._templates else
+                                   "テンプレートがありません。明細画面で「テンプレートとして保存」を使うと登録できます。")
+        if self._templates:
+            table.selectRow(0)
+        self._update_buttons()
+
+    def selected_template(self) -> Optional[TemplateInfo]:
+        row = self.template_table.currentRow()
+        return self._templates[row] if 0 <= row < len(self._templates) and self.template_table.selectedItems() else None
+
+    def project_name(self) -> str:
+        return self.project_name_edit.text().strip()
+
+    def _on_selection_changed(self):
+        template = self.selected_template()
+        if template is not None and not self.project_name_edit.isModified():
+            self.project_name_edit.setText(template.name) # 工事名を入力するまではテンプレート名を入れておく
+        self._update_buttons()
+
+    def _update_buttons(self, *args):
+        has_template = self.selected_template() is not None
+        self.create_button.setEnabled(has_template and bool(self.project_name()))
+        self.delete_button.setEnabled(has_template)
+
+    def _delete_selected(self):
+        template = self.selected_template()
+        if template is None:
+            return
+        answer = QMessageBox.question(self, "テンプレートの削除", f"テンプレート「{template.name}」を削除します。よろしいですか？")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        conn = None
+        try:
+            conn = self._connect()
+            delete_template(conn, template.id)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "データベースエラー", f"テンプレートの削除中にエラーが発生しました:\n{e}")
+        finally:
+            if conn:
+                conn.close()
+        self._load()
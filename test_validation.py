@@ -0,0 +1,57 @@
+# test_validation.py
+"""validation.load_reference_prices のテスト (python -m unittest test_validation)"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from decimal import Decimal
+
+from validation import load_reference_prices
+
+# is_template などを追加する前の estimates・details (migrate_database の対象になる古いデータベース)
+_OLD_SCHEMA = [
+    """CREATE TABLE estimates (
+           id INTEGER PRIMARY KEY AUTOINCREMENT, base_estimate_id INTEGER,
+           revision_number INTEGER NOT NULL DEFAULT 0, project_name TEXT, client_name TEXT, period_text TEXT,
+           subtotal_amount REAL, tax_amount REAL, total_amount REAL, created_at TEXT, updated_at TEXT)""",
+    """CREATE TABLE details (
+           id INTEGER PRIMARY KEY AUTOINCREMENT, estimate_id INTEGER NOT NULL, row_order INTEGER NOT NULL,
+           name_text TEXT, specification_text TEXT, quantity REAL, unit_text TEXT, unit_price REAL,
+           amount REAL, summary_text TEXT)""",
+]
+
+
+class LoadReferencePricesTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.db_file_path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        conn = sqlite3.connect(self.db_file_path)
+        for create_sql in _OLD_SCHEMA:
+            conn.execute(create_sql)
+        for estimate_id, unit_price in enumerate((1000, 1200, 5000), start=1):
+            conn.execute("INSERT INTO estimates (id, project_name) VALUES (?, 'x')", (estimate_id,))
+            conn.execute("INSERT INTO details (estimate_id, row_order, name_text, specification_text, unit_price) "
+                         "VALUES (?, 0, '塗装', 'S', ?)", (estimate_id, unit_price))
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        os.remove(self.db_file_path)
+
+    def test_unmigrated_database(self):
+        """is_template の列がない古いデータベースでも、移行してから単価の目安を求める"""
+        self.assertEqual(load_reference_prices(self.db_file_path), {("塗装", "S"): Decimal("1200")})
+        conn = sqlite3.connect(self.db_file_path)
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(estimates)")}
+        finally:
+            conn.close()
+        self.assertIn("is_template", columns)
+
+    def test_excludes_open_estimate(self):
+        """開いている見積の行は目安に含めない (件数が足りなければ目安なし)"""
+        self.assertEqual(load_reference_prices(self.db_file_path, exclude_estimate_id=3), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
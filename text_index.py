@@ -0,0 +1,220 @@
+# text_index.py
+"""明細の文字列の列 (名称・仕様・摘要) の検索用インデックス (と数値の列の値の配列)
+
+- セルの文字列は行 ID ごとに保持し、検索のたびに全セルの item.text() を読まない。
+  数値の列 (数量・単価・金額) は保持値 (VALUE_ROLE) を同じように行 ID ごとに保持する (絞り込み表示で使う)。
+  セルが変わったら dataChanged でその行に印を付け、次の検索のときにその行だけ読み直す。
+- 行の挿入・削除・移動・並べ替えでは文字列は読み直さず、行 ID の並びだけを取り直す (新しい行 ID の行だけ読む)。
+- 列ごとに全行の文字列を区切り文字でつないだ1つの文字列 (と各行の開始位置) を作っておき、
+  文字列の検索は str.find で行う (正規表現は行ごと)。連結した文字列は変更があったときだけ作り直す。
+- 最初に検索するまではモデルのシグナルにつながない。読み込み時 (clear) は捨てて、次の検索で全行を読む。
+"""
+import re
+from bisect import bisect_right
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from PySide6.QtCore import QModelIndex, QObject, Qt, Signal
+
+from constants import ROW_ID_ROLE, VALUE_ROLE
+from perf import timed
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+_SEPARATOR = "\x00"  # 連結文字列での行の区切り (セルの文字列には含まれない)
+_WATCHED_ROLES = {Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole, VALUE_ROLE}
+
+
+class TextIndex(QObject):
+    """明細の文字列の列の検索用インデックス (変わった行だけ読み直す)"""
+    changed = Signal()  # インデックスの対象のセルが変わった (検索結果が古くなった)
+
+    def __init__(self, page: 'DetailPageWidget', columns: Iterable[int], value_columns: Iterable[int] = ()):
+        super().__init__(page)
+        self._page = page
+        self._table = page.table
+        self._columns: Tuple[int, ...] = tuple(columns)
+        self._value_columns: Tuple[int, ...] = tuple(value_columns)
+        self._texts: Dict[int, Dict[int, str]] = {col: {} for col in self._columns}  # 列 -> 行 ID -> 文字列
+        self._values: Dict[int, Dict[int, Decimal]] = {col: {} for col in self._value_columns}  # 列 -> 行 ID -> 数値
+        self._row_ids: List[int] = []       # 行番号 -> 行 ID (最後に同期したときの並び)
+        self._dirty_ids: Set[int] = set()   # 読み直す行
+        self._structure_dirty = True        # 行の並びを取り直す
+        # (列, 大文字と小文字を区別するか) -> (連結した文字列, 各行の開始位置)
+        self._haystacks: Dict[Tuple[int, bool], Tuple[str, List[int]]] = {}
+        self._connected = False
+
+    @property
+    def columns(self) -> Tuple[int, ...]:
+        return self._columns
+
+    @property
+    def value_columns(self) -> Tuple[int, ...]:
+        return self._value_columns
+
+    def clear(self):
+        """(読み込み時) インデックスを捨てる。次の検索で全行を読み直す"""
+        self._set_connected(False)
+        for cells in self._cell_maps():
+            cells.clear()
+        self._row_ids = []
+        self._dirty_ids.clear()
+        self._structure_dirty = True
+        self._haystacks.clear()
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+    @timed()
+    def find(self, text: str, columns: Optional[Iterable[int]] = None,
+             regex: bool = False, case_sensitive: bool = False) -> List[Tuple[int, int]]:
+        """text を含むセル (行番号, 列番号) を表の順に返す。regex なら正規表現 (誤りなら re.error)"""
+        if not text:
+            return []
+        self._refresh()
+        target_columns = [col for col in self._columns if columns is None or col in columns]
+        hits: List[Tuple[int, int]] = []
+        if regex:
+            pattern = re.compile(text, 0 if case_sensitive else re.IGNORECASE)
+            for col in target_columns:
+                texts = self._texts[col]
+                hits.extend((row, col) for row, row_id in enumerate(self._row_ids) if pattern.search(texts[row_id]))
+        else:
+            needle = text if case_sensitive else text.casefold()
+            for col in target_columns:
+                haystack, starts = self._haystack(col, case_sensitive)
+                last_row = len(starts) - 1
+                position = haystack.find(needle)
+                while position >= 0:
+                    row = bisect_right(starts, position) - 1
+                    hits.append((row, col))
+                    if row >= last_row:
+                        break
+                    position = haystack.find(needle, starts[row + 1]) # 同じ行の2つ目以降の一致は飛ばす
+        hits.sort()
+        return hits
+
+    def text(self, row: int, col: int) -> str:
+        """(find の直後に) セルの文字列"""
+        return self._texts[col][self._row_ids[row]]
+
+    def column_texts(self, col: int) -> List[str]:
+        """文字列の列の全行の文字列 (行番号の順)"""
+        self._refresh()
+        texts = self._texts[col]
+        return [texts[row_id] for row_id in self._row_ids]
+
+    def column_values(self, col: int) -> List[Decimal]:
+        """数値の列の全行の数値 (行番号の順)"""
+        self._refresh()
+        values = self._values[col]
+        return [values[row_id] for row_id in self._row_ids]
+
+    def row_ids(self) -> List[int]:
+        """column_texts / column_values の各要素の行 ID"""
+        self._refresh()
+        return self._row_ids
+
+    # ------------------------------------------------------------------
+    # 同期
+    # ------------------------------------------------------------------
+    def _refresh(self):
+        """前回の検索からの変更を反映する (変わった行・新しい行だけ読む)"""
+        self._set_connected(True)
+        if not (self._structure_dirty or self._dirty_ids):
+            return
+        if self._structure_dirty:
+            self._structure_dirty = False
+            self._row_ids = list(self._page.formula_engine.row_ids())
+            known = self._texts[self._columns[0]] if self._columns else {}
+            self._dirty_ids.update(row_id for row_id in self._row_ids if row_id not in known)
+        engine = self._page.formula_engine
+        table = self._table
+        for row_id in self._dirty_ids:
+            row = engine.row_of(row_id)
+            if row is None:
+                for cells in self._cell_maps():
+                    cells.pop(row_id, None)
+                continue
+            for col, texts in self._texts.items():
+                item = table.item(row, col)
+                texts[row_id] = item.text() if item is not None else ""
+            for col, values in self._values.items():
+                values[row_id] = self._page._cell_value(row, col)
+        self._dirty_ids.clear()
+        self._haystacks.clear()
+
+    def _haystack(self, col: int, case_sensitive: bool) -> Tuple[str, List[int]]:
+        key = (col, case_sensitive)
+        cached = self._haystacks.get(key)
+        if cached is None:
+            texts = self._texts[col]
+            row_texts = [texts[row_id] for row_id in self._row_ids]
+            if not case_sensitive:
+                row_texts = [row_text.casefold() for row_text in row_texts]
+            starts = []
+            position = 0
+            for row_text in row_texts:
+                starts.append(position)
+                position += len(row_text) + 1
+            cached = self._haystacks[key] = (_SEPARATOR.join(row_texts), starts)
+        return cached
+
+    def _set_connected(self, connected: bool):
+        if connected == self._connected:
+            return
+        model = self._table.model()
+        connections = [(model.dataChanged, self._on_data_changed),
+                       (model.rowsAboutToBeRemoved, self._on_rows_about_to_be_removed),
+                       (model.modelReset, self._on_model_reset)]
+        connections += [(signal, self._on_rows_restructured) for signal in (model.rowsInserted, model.rowsMoved, model.layoutChanged)]
+        for signal, slot in connections:
+            if connected:
+                signal.connect(slot)
+            else:
+                signal.disconnect(slot)
+        self._connected = connected
+
+    def _cell_maps(self) -> List[dict]:
+        return list(self._texts.values()) + list(self._values.values())
+
+    def _row_id_at(self, row: int) -> Optional[int]:
+        item = self._table.item(row, self._page.COL_NAME)
+        return item.data(ROW_ID_ROLE) if item is not None else None
+
+    def _mark_changed(self):
+        self._haystacks.clear()
+        self.changed.emit()
+
+    def _on_data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex, roles=None):
+        if roles and not _WATCHED_ROLES.intersection(roles):
+            return # 行 ID・計算式などの変更 (文字列・数値は変わらない)
+        if not any(top_left.column() <= col <= bottom_right.column() for col in self._columns + self._value_columns):
+            return
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            row_id = self._row_id_at(row)
+            if row_id is None: # 行 ID がまだない行 (追加中の行) は、並びを取り直すときに読む
+                self._structure_dirty = True
+            else:
+                self._dirty_ids.add(row_id)
+        self._mark_changed()
+
+    def _on_rows_about_to_be_removed(self, parent: QModelIndex, first: int, last: int):
+        # 削除される行の文字列を捨てる (元に戻すで同じ行 ID の行が戻ったら読み直す)
+        for row in range(first, last + 1):
+            row_id = self._row_id_at(row)
+            if row_id is not None:
+                for cells in self._cell_maps():
+                    cells.pop(row_id, None)
+        self._structure_dirty = True
+        self._mark_changed()
+
+    def _on_rows_restructured(self, *args):
+        self._structure_dirty = True
+        self._mark_changed()
+
+    def _on_model_reset(self):
+        self.clear()
+        self._set_connected(True)
+        self._mark_changed()
@@ -0,0 +1,275 @@
+# theme.py
+"""アプリ全体のスタイルシートとパレット
+
+スタイルシートはアプリケーションに1回だけ設定し、ウィジェットごとの setStyleSheet は使わない
+(ウィジェットごとに設定すると、そのたびに Qt がスタイルシートを解析し直して再ポリッシュする)。
+個別の見た目は objectName と動的プロパティ (themeRole など) のセレクターで指定し、
+入力エラーなどの状態の切り替えは set_state() でプロパティを変えて1回だけ再ポリッシュする。
+"""
+from typing import Any
+
+from PySide6.QtGui import QColor, QPalette
+from PySide6.QtWidgets import QApplication, QWidget
+
+from constants import (
+    APP_FONT_FAMILY, APP_FONT_SIZE, STYLE_BORDER_BLACK, STYLE_NO_BORDER,
+    COLOR_WHITE, COLOR_LIGHT_GRAY, COLOR_LIGHT_BLUE, COLOR_EDIT_DISABLED, COLOR_ERROR_BG
+)
+
+# --- メインウィンドウ (メニュー・ツールバーなど) の色 ---
+COLOR_BACKGROUND = "#F0F0F0"
+COLOR_PRIMARY = "#4A90E2"
+COLOR_SECONDARY = "#50E3C2"
+COLOR_TEXT = "#333333" # メニューなどの基本的な文字色
+COLOR_ERROR = "#D0021B"
+COLOR_SUCCESS = "#7ED321"
+COLOR_WARNING = "#F5A623"
+
+# ページのルートウィジェットの objectName (ページ内のスタイルはこの名前で範囲を限定する)
+COVER_PAGE_NAME = "coverPage"
+DETAIL_PAGE_NAME = "detailPage"
+
+# 個別の見た目を指定する動的プロパティ名 (値は下のスタイルシートのセレクターと対応)
+ROLE_PROPERTY = "themeRole"
+
+# メインウィンドウ全体 (メニューの文字色は COLOR_TEXT (濃い灰色)、選択時は COLOR_PRIMARY)
+_APP_STYLE = f"""
+    QMainWindow {{
+        background-color: {COLOR_BACKGROUND};
+    }}
+    QMenuBar {{
+        background-color: {COLOR_BACKGROUND}; /* メニューバー自体の背景色 */
+        color: {COLOR_TEXT}; /* メニューバーのトップレベル項目の文字色 */
+    }}
+    QMenuBar::item {{
+        background-color: transparent; /* 通常時のアイテム背景は透明に */
+        color: {COLOR_TEXT}; /* 通常時のアイテム文字色 */
+        padding: 4px 8px; /* 少し余白を調整 */
+    }}
+    QToolButton:disabled {{ /* 非活性時のツールバーボタン */
+        color: {COLOR_LIGHT_GRAY}; /* 文字色を薄いグレーに */
+    }}
+    QMenuBar::item:selected {{ /* マウスオーバー時や選択時 */
+        background-color: {COLOR_PRIMARY}; /* 選択時の背景色 */
+        color: {COLOR_WHITE}; /* 選択時の文字色 */
+    }}
+    QMenuBar::item:pressed {{ /* クリック時 */
+        background-color: {COLOR_SECONDARY};
+    }}
+    QMenu {{
+        background-color: {COLOR_WHITE}; /* ドロップダウンメニューの背景色 */
+        color: {COLOR_TEXT}; /* ドロップダウンメニューの文字色 */
+        border: 1px solid #CCCCCC; /* メニューの境界線 */
+    }}
+    QMenu::item {{
+        padding: 4px 20px; /* アイテムの余白 */
+    }}
+    QMenu::item:selected {{
+        background-color: {COLOR_PRIMARY};
+        color: {COLOR_WHITE};
+    }}
+    QToolBar {{
+        background-color: {COLOR_BACKGROUND};
+        border: none;
+    }}
+    QToolButton {{ /* ツールバー上のボタン */
+        color: {COLOR_TEXT}; /* 通常時の文字色 */
+        background-color: transparent; /* 通常時は背景透明 */
+        padding: 4px;
+        margin: 1px;
+    }}
+    QPushButton {{
+        background-color: {COLOR_PRIMARY};
+        color: {COLOR_WHITE};
+        border-radius: 5px;
+        padding: 5px;
+    }}
+    QPushButton:hover {{
+        background-color: #3a80d2; /* 少し暗い青 */
+    }}
+    QLineEdit, QDateEdit, QDoubleSpinBox, QComboBox {{
+        border: 1px solid #CCCCCC;
+        padding: 5px;
+        border-radius: 3px;
+        background-color: {COLOR_WHITE};
+        color: {COLOR_TEXT};
+    }}
+    QTableWidget {{
+        gridline-color: #DDDDDD;
+    }}
+    QStatusBar {{
+        color: {COLOR_TEXT};
+        background-color: {COLOR_LIGHT_GRAY};
+        padding: 2px 5px;
+    }}
+"""
+
+# 表紙・明細ページ共通のスタイル ({page} はページの objectName セレクター)
+_PAGE_STYLE_TEMPLATE = """
+    {page}, {page} QWidget {{
+        font-family: '{font_family}';
+        background-color: {white}; /* デフォルト背景を白に */
+        font-size: {font_size}pt;
+    }}
+    {page} QTableWidget {{
+        background-color: {white};
+        {no_border}
+        gridline-color: transparent; /* グリッド線が見えないように */
+    }}
+    {page} QTableWidget::item {{
+        color: black; /* テーブルアイテムのデフォルト文字色を黒に再指定 */
+    }}
+    {page} QTableWidget::item:selected {{
+        background-color: #cceeff; /* 選択行の背景色 (薄い水色) */
+    }}
+    {page} QTableWidget::item:selected:focus {{ /* 選択かつフォーカスがある場合 */
+        background-color: #cceeff; /* 選択行と同じ背景色を指定 */
+    }}
+    {page} QLineEdit, {page} QDateEdit {{
+        background-color: {white};
+        color: black;
+        border-top: none;
+        border-left: none;
+        border-right: none;
+        border-bottom: 2px solid gray; /* 下線のみ表示 */
+        padding: 2px;
+    }}
+    {page} QLabel {{
+        color: black; /* 文字色を黒に再指定 */
+        background-color: transparent; /* デフォルト背景を透明に */
+    }}
+    {page} QTextEdit {{ /* QTextEdit (備考欄など) は枠線ありのままにする */
+        background-color: {white};
+        color: black;
+        border: 1px solid gray;
+    }}
+    {page} QDateEdit::drop-down {{
+        border: none;
+    }}
+    {page} QCheckBox::indicator {{
+         width: 15px;
+         height: 15px;
+         border: 1px solid gray;
+         background-color: {light_gray}; /* チェックなしのデフォルト */
+    }}
+    {page} QCheckBox::indicator:checked {{
+         background-color: {white}; /* チェックあり */
+    }}
+    {page} QHeaderView::section {{ /* テーブルヘッダーのスタイル */
+        background-color: #f0f0f0;
+        color: black;
+        padding: 4px;
+        border: 1px solid #d0d0d0;
+        font-weight: bold;
+    }}
+"""
+
+# 表紙の個別ウィジェット (themeRole) と必須項目の状態 (required / has_error)
+_COVER_STYLE = f"""
+    #{COVER_PAGE_NAME} QLabel[themeRole="title"] {{
+        font-family: '{APP_FONT_FAMILY}'; font-size: 26pt; font-weight: bold;
+    }}
+    #{COVER_PAGE_NAME} QLabel[themeRole="totalLabel"] {{
+        font-family: '{APP_FONT_FAMILY}'; font-size: 20pt; font-weight: bold;
+        background-color: {COLOR_LIGHT_BLUE};
+        border: {STYLE_BORDER_BLACK};
+        padding: 2px;
+    }}
+    #{COVER_PAGE_NAME} QLineEdit[themeRole="totalEdit"] {{
+        font-family: '{APP_FONT_FAMILY}'; font-size: 24pt; font-weight: bold;
+        background-color: {COLOR_EDIT_DISABLED};
+        border: {STYLE_BORDER_BLACK};
+        padding: 2px;
+    }}
+    #{COVER_PAGE_NAME} QLineEdit[themeRole="amount"] {{
+        font-family: '{APP_FONT_FAMILY}'; font-size: 12pt; padding: 1px;
+    }}
+    #{COVER_PAGE_NAME} QLineEdit[themeRole="client"] {{
+        font-family: '{APP_FONT_FAMILY}'; font-size: 18pt; font-weight: bold;
+        color: black;
+    }}
+    #{COVER_PAGE_NAME} QTextEdit[themeRole="remarks"] {{
+        border: 1px solid black;
+    }}
+    #{COVER_PAGE_NAME} QFrame[themeRole="borderCell"] {{
+        background-color: {COLOR_WHITE};
+        border: {STYLE_BORDER_BLACK};
+    }}
+    #{COVER_PAGE_NAME} QLineEdit[required="true"][has_error="true"] {{
+        border: 1px solid {COLOR_ERROR_BG}; /* 未入力の必須項目は枠線で示す */
+    }}
+    #{COVER_PAGE_NAME} QLineEdit[themeRole="client"][has_error="true"] {{
+        color: lightgray;
+    }}
+"""
+
+# 明細ページの個別ウィジェット
+_DETAIL_STYLE = f"""
+    #{DETAIL_PAGE_NAME} QTableWidget {{
+        alternate-background-color: {COLOR_LIGHT_GRAY};
+    }}
+    #{DETAIL_PAGE_NAME} QLabel[themeRole="headerValue"] {{
+        font-weight: bold;
+    }}
+    #{DETAIL_PAGE_NAME} QComboBox, #{DETAIL_PAGE_NAME} QMenu {{
+        color: black;
+    }}
+    #{DETAIL_PAGE_NAME} QComboBox QAbstractItemView {{
+        color: black;
+        background-color: white;
+    }}
+"""
+
+
+def _page_style(page_name: str) -> str:
+    return _PAGE_STYLE_TEMPLATE.format(
+        page=f"#{page_name}", font_family=APP_FONT_FAMILY, font_size=APP_FONT_SIZE,
+        white=COLOR_WHITE, light_gray=COLOR_LIGHT_GRAY, no_border=STYLE_NO_BORDER,
+    )
+
+
+def build_stylesheet() -> str:
+    """アプリケーション全体のスタイルシートを組み立てる"""
+    return "".join([_APP_STYLE, _page_style(COVER_PAGE_NAME), _page_style(DETAIL_PAGE_NAME),
+                    _COVER_STYLE, _DETAIL_STYLE])
+
+
+def build_palette(base: QPalette) -> QPalette:
+    """アプリケーション全体のパレットを作成する"""
+    palette = QPalette(base)
+    palette.setColor(QPalette.ColorRole.Window, QColor(COLOR_BACKGROUND))
+    palette.setColor(QPalette.ColorRole.WindowText, QColor(COLOR_TEXT))
+    palette.setColor(QPalette.ColorRole.Base, QColor(COLOR_WHITE)) # QLineEditなどの背景
+    palette.setColor(QPalette.ColorRole.AlternateBase, QColor(COLOR_SECONDARY)) # QComboBoxのドロップダウンなど
+    palette.setColor(QPalette.ColorRole.ToolTipBase, QColor(COLOR_WHITE))
+    palette.setColor(QPalette.ColorRole.ToolTipText, QColor(COLOR_TEXT))
+    palette.setColor(QPalette.ColorRole.Text, QColor(COLOR_TEXT)) # QLineEditなどのテキスト
+    palette.setColor(QPalette.ColorRole.Button, QColor(COLOR_PRIMARY))
+    palette.setColor(QPalette.ColorRole.ButtonText, QColor(COLOR_WHITE))
+    palette.setColor(QPalette.ColorRole.BrightText, QColor(COLOR_ERROR)) # エラーメッセージなど
+    palette.setColor(QPalette.ColorRole.Highlight, QColor(COLOR_PRIMARY)) # 選択時のハイライト
+    palette.setColor(QPalette.ColorRole.HighlightedText, QColor(COLOR_WHITE))
+    return palette
+
+
+def apply_theme(app: QApplication):
+    """アプリケーションにパレットとスタイルシートを1回だけ設定する"""
+    app.setPalette(build_palette(app.palette()))
+    app.setStyleSheet(build_stylesheet())
+
+
+def set_role(widget: QWidget, role: str):
+    """スタイルシートで個別の見た目を指定するための役割を設定する (ポリッシュ前に呼ぶ)"""
+    widget.setProperty(ROLE_PROPERTY, role)
+
+
+def set_state(widget: QWidget, name: str, value: Any) -> bool:
+    """状態を表す動的プロパティを変更し、値が変わったときだけ1回再ポリッシュする"""
+    if widget.property(name) == value:
+        return False
+    widget.setProperty(name, value)
+    style = widget.style()
+    style.unpolish(widget)
+    style.polish(widget)
+    widget.update()
+    return True
@@ -0,0 +1,85 @@
+# update_scheduler.py
+from contextlib import contextmanager
+from enum import IntFlag
+from typing import Callable, Iterator, List, Tuple
+
+from PySide6.QtCore import QObject, QTimer
+
+
+class UpdateFlag(IntFlag):
+    """再描画・再計算が必要な対象を表すフラグ"""
+    NONE = 0
+    TOTALS = 1          # 明細合計の再計算
+    HEADER = 2          # 明細ページヘッダーの金額ラベル
+    COVER_TOTALS = 4    # 表紙の金額欄
+    ACTION_STATES = 8   # ツールバー/メニューのアクション状態
+    SELECTION_STATUS = 16  # ステータスバーの選択範囲集計
+    FORMULAS = 32       # 他の行を参照する計算式の再計算 (合計より先に処理する)
+    CHANGED_CELLS = 64  # 保存後に変えたセルの印 (変更のあった範囲を行 ID に直して付ける)
+    ALL = TOTALS | HEADER | COVER_TOTALS | ACTION_STATES | SELECTION_STATUS | FORMULAS | CHANGED_CELLS
+
+
+class UpdateScheduler(QObject):
+    """更新要求をまとめ、イベントループ1周 (またはバッチ終了時) に1回だけ反映する"""
+
+    # flush 中にハンドラーが新たなフラグを立てた場合の再処理上限 (無限ループ防止)
+    MAX_FLUSH_PASSES = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._dirty = UpdateFlag.NONE
+        self._batch_depth = 0
+        self._flushing = False
+        # (対象フラグ, ハンドラー) を登録順に保持。登録順がそのまま実行順になる
+        self._handlers: List[Tuple[UpdateFlag, Callable[[], None]]] = []
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.flush)
+
+    def add_handler(self, flags: UpdateFlag, handler: Callable[[], None]):
+        """指定フラグが立っているときに flush で呼ばれるハンドラーを登録する"""
+        self._handlers.append((flags, handler))
+
+    def mark_dirty(self, flags: UpdateFlag):
+        """更新対象としてマークし、次のイベントループで flush されるよう予約する"""
+        if not flags:
+            return
+        self._dirty |= flags
+        if self._batch_depth == 0 and not self._flushing and not self._timer.isActive():
+            self._timer.start()
+
+    def is_dirty(self, flags: UpdateFlag = UpdateFlag.ALL) -> bool:
+        return bool(self._dirty & flags)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """バッチ中の更新要求はまとめられ、最も外側のバッチ終了時に1回だけ反映される"""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self.flush()
+
+    def flush(self):
+        """保留中の更新をすべて反映する"""
+        self._timer.stop()
+        if self._flushing:
+            return
+        self._flushing = True
+        try:
+            for _ in range(self.MAX_FLUSH_PASSES):
+                dirty = self._dirty
+                if not dirty:
+                    break
+                self._dirty = UpdateFlag.NONE
+                for flags, handler in self._handlers:
+                    if dirty & flags:
+                        handler()
+        finally:
+            self._flushing = False
+        if self._dirty and self._batch_depth == 0:
+            # 上限に達しても残っている分は次のイベントループへ回す
+            self._timer.start()
@@ -0,0 +1,232 @@
+# validation.py
+"""明細の検査 (入力漏れ・数量 0・単価の外れ値・重複行) をワーカースレッドで行う
+
+- 検査の規則:
+    名称が空 (ほかの列に入力がある行)               エラー
+    数量が 0                                      エラー
+    数量がマイナス                                 警告 (値引きの行なら問題ない)
+    単位が空                                      警告
+    単価が過去の見積の同じ名称・仕様の中央値から大きく外れている   警告
+    名称・仕様・数量・単位・単価が同じ行がほかにある     警告
+  何も入力していない行は検査しない。
+- 単価の比較に使う中央値 (単価の目安) は、保存済みの見積 (テンプレートと開いている見積を除く) の明細から
+  名称・仕様ごとに求める。データベースはワーカースレッドで最初の検査のときに読む。
+- 行ごとの検査結果は行の内容 (名称・仕様・数量・単位・単価) をキーにしてキャッシュし、
+  内容が変わった行だけ検査し直す。重複行の検査は全行の内容の数を数えるだけなので毎回行う。
+- RowValidator は編集・Undo・行の追加削除のたびに少し待ってから検査を始める。GUI スレッドでは
+  行の内容を集めるだけで (文字列・数値は TextIndex が変わった行だけ読み直し、単位のコンボボックスは
+  単位か行の並びが変わったときだけ読み直す)、検査はワーカースレッドで行う。
+  検査中に編集されたら、終わった後にもう一度検査する。
+"""
+import os
+import sqlite3
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from PySide6.QtCore import QModelIndex, QObject, QTimer, Signal
+
+from background import BackgroundTask, run_in_background
+from database_setup import migrate_database
+from number_format import CURRENCY_FORMAT, to_decimal
+
+if TYPE_CHECKING:
+    from detail_page_widget import DetailPageWidget # 循環参照を避けるための型チェック用インポート
+
+ERROR = "error"
+WARNING = "warning"
+SEVERITY_LABELS = {ERROR: "エラー", WARNING: "警告"}
+
+VALIDATION_DELAY_MS = 400        # 編集してから検査を始めるまでの待ち時間
+REFERENCE_MIN_SAMPLES = 3        # 単価の目安にする過去の明細行の最少件数
+PRICE_OUTLIER_RATIO = Decimal(2) # 目安の何倍より高い (何分の1より安い) 単価を外れ値とするか
+
+# 行の内容 (名称, 仕様, 数量, 単位, 単価)。検査結果のキャッシュのキー
+RowContent = Tuple[str, str, Decimal, str, Decimal]
+
+
+class Problem(NamedTuple):
+    """検査で見つかった問題"""
+    column: int          # 問題のある列 (DetailPageWidget の列番号)
+    severity: str        # ERROR / WARNING
+    message: str
+
+
+class ValidationResult(NamedTuple):
+    problems: Dict[int, Tuple[Problem, ...]]  # 行 ID -> 問題 (問題のない行は含まない)
+    checked_rows: int                         # キャッシュになく検査し直した行数
+
+    def count(self, severity: str) -> int:
+        return sum(1 for problems in self.problems.values() for problem in problems if problem.severity == severity)
+
+
+class RowChecker:
+    """行の検査 (ワーカースレッドで使う。結果は行の内容ごとにキャッシュする)"""
+
+    def __init__(self, columns: Dict[str, int], db_file_path: Optional[str] = None,
+                 exclude_estimate_id: Optional[int] = None):
+        self._columns = columns  # "name" / "specification" / "quantity" / "unit" / "unit_price" -> 列番号
+        self._db_file_path = db_file_path
+        self._exclude_estimate_id = exclude_estimate_id
+        self._reference_prices: Optional[Dict[Tuple[str, str], Decimal]] = None
+        self._cache: Dict[RowContent, Tuple[Problem, ...]] = {}
+
+    def check(self, rows: Sequence[Tuple[int, RowContent]]) -> ValidationResult:
+        """(行 ID, 行の内容) の並びを検査する"""
+        if self._reference_prices is None:
+            self._reference_prices = load_reference_prices(self._db_file_path, self._exclude_estimate_id)
+        if len(self._cache) > 4 * len(rows) + 1000: # 消した行・書き換えた行の結果がたまりすぎたら捨てる
+            self._cache.clear()
+        cache = self._cache
+        content_counts: Dict[RowContent, int] = {}
+        for _, content in rows:
+            content_counts[content] = content_counts.get(content, 0) + 1
+        problems: Dict[int, Tuple[Problem, ...]] = {}
+        checked_rows = 0
+        for row_id, content in rows:
+            row_problems = cache.get(content)
+            if row_problems is None:
+                row_problems = cache[content] = self._check_row(content)
+                checked_rows += 1
+            duplicates = content_counts[content]
+            if duplicates > 1 and any(content[:2]):
+                row_problems += (Problem(self._columns["name"], WARNING, f"同じ内容の行がほかに {duplicates - 1} 行あります"),)
+            if row_problems:
+                problems[row_id] = row_problems
+        return ValidationResult(problems, checked_rows)
+
+    def check_columns(self, row_ids: Sequence[int], columns: Sequence[Sequence]) -> ValidationResult:
+        """列ごとの値の並び (名称, 仕様, 数量, 単位, 単価) で検査する"""
+        return self.check(list(zip(row_ids, zip(*columns))))
+
+    def _check_row(self, content: RowContent) -> Tuple[Problem, ...]:
+        name, specification, quantity, unit, unit_price = content
+        if not (name or specification or quantity or unit or unit_price):
+            return () # 何も入力していない行
+        columns = self._columns
+        problems = []
+        if not name:
+            problems.append(Problem(columns["name"], ERROR, "名称が入力されていません"))
+        if quantity == 0:
+            problems.append(Problem(columns["quantity"], ERROR, "数量が 0 です"))
+        elif quantity < 0:
+            problems.append(Problem(columns["quantity"], WARNING, "数量がマイナスです (値引きの行なら問題ありません)"))
+        if not unit:
+            problems.append(Problem(columns["unit"], WARNING, "単位が入力されていません"))
+        reference_price = self._reference_prices.get((name, specification)) if name else None
+        if reference_price and unit_price > 0 and (unit_price > reference_price * PRICE_OUTLIER_RATIO
+                                                   or unit_price * PRICE_OUTLIER_RATIO < reference_price):
+            problems.append(Problem(columns["unit_price"], WARNING,
+                                    f"単価が過去の見積の目安 ({CURRENCY_FORMAT.format(reference_price)}) から大きく外れています"))
+        return tuple(problems)
+
+
+def load_reference_prices(db_file_path: Optional[str], exclude_estimate_id: Optional[int] = None
+                          ) -> Dict[Tuple[str, str], Decimal]:
+    """保存済みの見積の明細から、名称・仕様ごとの単価の中央値を求める (件数が少ないものは除く)"""
+    if not db_file_path or not os.path.exists(db_file_path):
+        return {}
+    prices: Dict[Tuple[str, str], List[Decimal]] = {}
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file_path)
+        migrate_database(conn) # 古いデータベースには is_template の列がない
+        for name, specification, unit_price in conn.execute("""
+                SELECT d.name_text, COALESCE(d.specification_text, ''), d.unit_price
+                FROM details d JOIN estimates e ON e.id = d.estimate_id
+                WHERE COALESCE(e.is_template, 0) = 0 AND e.id IS NOT ? AND d.unit_price > 0
+                  AND d.name_text IS NOT NULL AND d.name_text != ''""", (exclude_estimate_id,)):
+            prices.setdefault((name, specification), []).append(to_decimal(unit_price))
+    except sqlite3.Error as e: # 目安がなくても他の検査はできる
+        print(f"警告: 単価の目安を読み込めませんでした: {e}")
+        return {}
+    finally:
+        if conn:
+            conn.close()
+    reference_prices = {}
+    for key, values in prices.items():
+        if len(values) >= REFERENCE_MIN_SAMPLES:
+            values.sort()
+            middle = len(values) // 2
+            reference_prices[key] = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+    return reference_prices
+
+
+class RowValidator(QObject):
+    """明細の変更を待って、全行の検査をワーカースレッドで行う"""
+    changed = Signal()  # 検査結果が変わった
+
+    def __init__(self, page: 'DetailPageWidget'):
+        super().__init__(page)
+        self._page = page
+        self._columns = {"name": page.COL_NAME, "specification": page.COL_SPECIFICATION, "quantity": page.COL_QUANTITY,
+                         "unit": page.COL_UNIT, "unit_price": page.COL_UNIT_PRICE}
+        self._checker = RowChecker(self._columns)
+        self.estimate_id: Optional[int] = None # 単価の目安から除いている見積
+        self._task: Optional[BackgroundTask] = None
+        self._pending = False
+        self._units: List[str] = []   # 行番号の順の単位 (検査のたびに全行のセルを読まないように持っておく)
+        self._units_dirty = True
+        self.result = ValidationResult({}, 0)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(VALIDATION_DELAY_MS)
+        self._timer.timeout.connect(self._start)
+        model = page.table.model()
+        model.dataChanged.connect(self._on_data_changed)
+        for signal in (model.rowsInserted, model.rowsRemoved, model.rowsMoved, model.layoutChanged, model.modelReset):
+            signal.connect(self.mark_units_changed)
+        if page.undo_stack is not None: # Undo/Redo のたびにも検査する
+            page.undo_stack.indexChanged.connect(self.schedule)
+
+    def reset(self, db_file_path: Optional[str], estimate_id: Optional[int]):
+        """(見積の読み込み・保存の後) 単価の目安を読み直し、キャッシュを捨てて検査し直す"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._checker = RowChecker(self._columns, db_file_path, estimate_id)
+        self.estimate_id = estimate_id
+        self.schedule()
+
+    def mark_units_changed(self, *args):
+        """単位の変更・行の並びの変更の後、次の検査で全行の単位を読み直す"""
+        self._units_dirty = True
+        self._timer.start()
+
+    def _on_data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex, roles=None):
+        if top_left.column() <= self._page.COL_UNIT <= bottom_right.column():
+            self._units_dirty = True
+        self._timer.start()
+
+    def schedule(self, *args):
+        """少し待ってから検査する (続けて編集している間は待ち続ける)"""
+        self._timer.start()
+
+    def problems_at(self, row_id: int) -> Tuple[Problem, ...]:
+        return self.result.problems.get(row_id, ())
+
+    def _start(self):
+        if self._task is not None: # 検査中。終わったらもう一度検査する
+            self._pending = True
+            return
+        page = self._page
+        text_index = page.text_index
+        row_ids = list(text_index.row_ids()) # ワーカースレッドに渡すので写しにする
+        if self._units_dirty or len(self._units) != len(row_ids):
+            self._units = [page._unit_text(row) for row in range(len(row_ids))]
+            self._units_dirty = False
+        columns = (text_index.column_texts(page.COL_NAME), text_index.column_texts(page.COL_SPECIFICATION),
+                   text_index.column_values(page.COL_QUANTITY), self._units, text_index.column_values(page.COL_UNIT_PRICE))
+        self._pending = False
+        self._task = run_in_background(self._checker.check_columns, row_ids, columns,
+                                       on_finished=self._on_checked, on_failed=self._on_failed)
+
+    def _on_checked(self, result: ValidationResult):
+        self._task = None
+        self.result = result
+        self.changed.emit()
+        if self._pending:
+            self._start()
+
+    def _on_failed(self, message: str):
+        self._task = None
+        print(f"エラー: 明細の検査中にエラーが発生しました: {message}")